@@ -0,0 +1,69 @@
+"""
+    Benchmark the adaptive quadrature of partial cross-sections against the fixed grid.
+
+    Computes hydrogenic K-shell partial cross-sections for a set of edges and experimental parameters with the fixed
+    theta and energy grid of EELS_CrossSections.partial_cross_section_nm2 and with
+    EELS_CrossSections.adaptive_partial_cross_section_nm2 at the given tolerance, and reports the wall time, the number of
+    double differential cross-section evaluations, the error estimate and the error of each relative to an adaptive
+    integral converged to a much tighter tolerance.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/adaptive_quadrature_benchmark.py --tolerance 1e-3
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import typing
+
+from nion.eels_analysis import EELS_CrossSections
+
+
+# atomic number, edge onset, edge delta, beam energy, convergence angle, collection angle.
+CASES: typing.List[typing.Tuple[int, float, float, float, float, float]] = [
+    (3, 55.0, 20.0, 60000.0, 0.005, 0.01),
+    (5, 188.0, 30.0, 200000.0, 0.02, 0.03),
+    (6, 284.0, 100.0, 200000.0, 0.0, 0.02),
+    (6, 284.0, 50.0, 100000.0, 0.01, 0.03),
+    (8, 532.0, 150.0, 200000.0, 0.04, 0.005),
+    (14, 1839.0, 200.0, 200000.0, 0.02, 0.05),
+    (26, 7112.0, 500.0, 300000.0, 0.03, 0.1),
+    (40, 17998.0, 1000.0, 300000.0, 0.03, 0.2),
+]
+
+
+def measure(fn: typing.Callable[[], float], repeat: int) -> typing.Tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return value, (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    total_fixed_time = 0.0
+    total_adaptive_time = 0.0
+    print(f"{'edge':>24} {'fixed ms':>9} {'fixed err':>10} {'adapt ms':>9} {'adapt err':>10} {'estimate':>9} {'evals':>7} {'speedup':>8}")
+    for atomic_number, edge_onset_eV, edge_delta_eV, beam_energy_eV, convergence_angle_rad, collection_angle_rad in CASES:
+        arguments = (atomic_number, 1, 1, edge_onset_eV, edge_delta_eV, beam_energy_eV, convergence_angle_rad, collection_angle_rad)
+        converged = EELS_CrossSections.adaptive_partial_cross_section_nm2(*arguments, tolerance=1e-9).cross_section_nm2
+        fixed, fixed_time = measure(lambda: EELS_CrossSections.partial_cross_section_nm2(*arguments), args.repeat)
+        adaptive, adaptive_time = measure(lambda: EELS_CrossSections.adaptive_partial_cross_section_nm2(*arguments, tolerance=args.tolerance).cross_section_nm2, args.repeat)
+        result = EELS_CrossSections.adaptive_partial_cross_section_nm2(*arguments, tolerance=args.tolerance)
+        total_fixed_time += fixed_time
+        total_adaptive_time += adaptive_time
+        label = f"Z={atomic_number} {edge_onset_eV:g}+{edge_delta_eV:g} eV {beam_energy_eV / 1000:g} kV"
+        print(f"{label:>24} {fixed_time * 1e3:9.2f} {abs(fixed / converged - 1):10.2e} {adaptive_time * 1e3:9.2f} "
+              f"{abs(adaptive / converged - 1):10.2e} {result.error_estimate_nm2 / converged:9.1e} {result.evaluation_count:7d} "
+              f"{fixed_time / adaptive_time:7.1f}x")
+    print(f"total speedup {total_fixed_time / total_adaptive_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+    Benchmark the registered background models.
+
+    Runs fit_background, subtract_background and integrate_signal of every background-model component on synthetic
+    spectrum images of increasing size and reports the spectra per second, the wall time and the peak memory of each
+    operation. Results are written as JSON so that runs can be compared.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/background_model_benchmark.py --sizes 32x32 64x64 128x128 --output benchmark.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import typing
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.eels_analysis import BackgroundModel
+from nion.utils import Registry
+
+
+FIT_INTERVALS = [(0.1, 0.2), (0.25, 0.3)]
+SIGNAL_INTERVAL = (0.35, 0.6)
+
+
+def generate_spectrum_image(navigation_shape: typing.Tuple[int, ...], length: int, seed: int = 0) -> DataAndMetadata.DataAndMetadata:
+    # a power law background with Poisson noise and a step edge in the signal interval.
+    rng = numpy.random.default_rng(seed)
+    energies = 200.0 + 0.5 * numpy.arange(length)
+    amplitudes = rng.uniform(0.5, 2.0, navigation_shape + (1,)) * 1E9
+    exponents = rng.uniform(2.5, 3.5, navigation_shape + (1,))
+    data = amplitudes * energies ** -exponents
+    data[..., int(length * 0.4):] *= 1.2
+    data = rng.poisson(data).astype(numpy.float32) + 1
+    dimensional_calibrations = [Calibration.Calibration() for _ in navigation_shape] + [Calibration.Calibration(offset=200.0, scale=0.5, units="eV")]
+    return DataAndMetadata.new_data_and_metadata(data,
+                                                 intensity_calibration=Calibration.Calibration(units="counts"),
+                                                 dimensional_calibrations=dimensional_calibrations,
+                                                 data_descriptor=DataAndMetadata.DataDescriptor(False, len(navigation_shape), 1))
+
+
+def run_operation(background_model: BackgroundModel.AbstractBackgroundModel, operation: str,
+                  spectrum_image_xdata: DataAndMetadata.DataAndMetadata, chunk_size: typing.Optional[int],
+                  precision: typing.Optional[str] = None) -> None:
+    if operation == "fit_background":
+        background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=FIT_INTERVALS, background_interval=SIGNAL_INTERVAL, chunk_size=chunk_size, precision=precision)
+    elif operation == "subtract_background":
+        background_model.subtract_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=FIT_INTERVALS, chunk_size=chunk_size, precision=precision)
+    elif operation == "integrate_signal":
+        background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=FIT_INTERVALS, signal_interval=SIGNAL_INTERVAL, chunk_size=chunk_size, fused=True, precision=precision)
+    else:
+        raise ValueError(operation)
+
+
+def measure(background_model: BackgroundModel.AbstractBackgroundModel, operation: str,
+            spectrum_image_xdata: DataAndMetadata.DataAndMetadata, chunk_size: typing.Optional[int],
+            repeat: int, precision: typing.Optional[str] = None) -> typing.Dict[str, typing.Any]:
+    # the wall time is the best of repeat runs; the peak memory is measured in a separate traced run since tracing
+    # slows the allocations down.
+    run_operation(background_model, operation, spectrum_image_xdata, chunk_size, precision)  # warm up caches
+    wall_times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_operation(background_model, operation, spectrum_image_xdata, chunk_size, precision)
+        wall_times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run_operation(background_model, operation, spectrum_image_xdata, chunk_size, precision)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    spectrum_count = int(numpy.prod(spectrum_image_xdata.navigation_dimension_shape))
+    wall_time = min(wall_times)
+    return {
+        "background_model_id": background_model.background_model_id,
+        "operation": operation,
+        "navigation_shape": list(spectrum_image_xdata.navigation_dimension_shape),
+        "length": spectrum_image_xdata.datum_dimension_shape[0],
+        "chunk_size": chunk_size,
+        "precision": precision,
+        "wall_time": wall_time,
+        "wall_times": wall_times,
+        "spectra_per_second": spectrum_count / wall_time if wall_time > 0 else None,
+        "peak_memory": peak_memory,
+    }
+
+
+def parse_shape(text: str) -> typing.Tuple[int, ...]:
+    return tuple(int(s) for s in text.lower().split("x"))
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the registered background models.")
+    parser.add_argument("--sizes", nargs="+", default=["16x16", "64x64", "128x128"], help="navigation shapes, such as 64x64")
+    parser.add_argument("--length", type=int, default=1024, help="number of channels per spectrum")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement; the best is reported")
+    parser.add_argument("--chunk-size", type=int, default=None, help="spectra per block; all spectra at once if not given")
+    parser.add_argument("--precision", default=None, choices=["float64", "float32", "data"], help="precision policy of the fits; float64 if not given")
+    parser.add_argument("--models", nargs="*", default=None, help="background model ids to run; all registered models if not given")
+    parser.add_argument("--operations", nargs="*", default=["fit_background", "subtract_background", "integrate_signal"])
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    background_models = [typing.cast(BackgroundModel.AbstractBackgroundModel, component) for component in Registry.get_components_by_type("background-model")]
+    if args.models:
+        background_models = [background_model for background_model in background_models if background_model.background_model_id in args.models]
+
+    results = list()
+    for size in args.sizes:
+        spectrum_image_xdata = generate_spectrum_image(parse_shape(size), args.length)
+        for background_model in background_models:
+            for operation in args.operations:
+                result = measure(background_model, operation, spectrum_image_xdata, args.chunk_size, args.repeat, args.precision)
+                results.append(result)
+                print(f"{size:>10} {background_model.background_model_id:<40} {operation:<20} "
+                      f"{result['wall_time'] * 1000:10.1f} ms {result['spectra_per_second']:14.0f} spectra/s "
+                      f"{result['peak_memory'] / 1E6:10.1f} MB", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "date": datetime.datetime.now().isoformat(),
+                "python": sys.version,
+                "numpy": numpy.__version__,
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
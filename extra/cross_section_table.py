@@ -0,0 +1,68 @@
+"""
+    Generate a hydrogenic K-shell cross-section table and compare it with the direct computation.
+
+    Writes the table for the default grid, or the grid given on the command line, reports its size and validated
+    accuracy, and times partial cross-sections at random parameters inside the table computed directly by
+    EELS_CrossSections and interpolated from the table.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/cross_section_table.py cross_sections.bin --validation-count 256
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import time
+
+import numpy
+
+from nion.eels_analysis import CrossSectionTable
+from nion.eels_analysis import EELS_CrossSections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="the table file to write")
+    default_grid = CrossSectionTable.CrossSectionTableGrid()
+    parser.add_argument("--theta-log-count", type=int, default=default_grid.theta_log_count)
+    parser.add_argument("--theta-linear-count", type=int, default=default_grid.theta_linear_count)
+    parser.add_argument("--energy-count", type=int, default=default_grid.energy_count)
+    parser.add_argument("--validation-count", type=int, default=64)
+    parser.add_argument("--count", type=int, default=200, help="the number of partial cross-sections to time")
+    args = parser.parse_args()
+
+    grid = CrossSectionTable.CrossSectionTableGrid(theta_log_count=args.theta_log_count,
+                                                   theta_linear_count=args.theta_linear_count,
+                                                   energy_count=args.energy_count)
+    start = time.perf_counter()
+    table = CrossSectionTable.write_cross_section_table(args.path, grid, validation_count=args.validation_count)
+    print(f"wrote {args.path}: shape {grid.shape}, {os.path.getsize(args.path) / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
+    if table.accuracy is not None:
+        print(f"largest relative error at {args.validation_count} points: {table.accuracy:.2%}")
+
+    rng = numpy.random.default_rng(1)
+    parameters = list()
+    for _ in range(args.count):
+        atomic_number = int(rng.choice(grid.atomic_numbers))
+        beam_energy_eV = float(numpy.exp(rng.uniform(math.log(grid.beam_energies_eV[0]), math.log(grid.beam_energies_eV[-1]))))
+        edge_energy_eV = CrossSectionTable.get_hydrogenic_edge_energy_eV(atomic_number)
+        edge_delta_eV = 0.1 * edge_energy_eV
+        parameters.append((atomic_number, edge_energy_eV, edge_delta_eV, beam_energy_eV, rng.uniform(0.0, 0.03), rng.uniform(0.01, 0.1)))
+
+    start = time.perf_counter()
+    direct = [EELS_CrossSections.partial_cross_section_nm2(z, 1, 1, onset, delta, e0, alpha, beta) for z, onset, delta, e0, alpha, beta in parameters]
+    direct_time = time.perf_counter() - start
+    start = time.perf_counter()
+    interpolated = [table.partial_cross_section_nm2(*p) for p in parameters]
+    table_time = time.perf_counter() - start
+    differences = numpy.abs(numpy.array(interpolated, dtype=float) / numpy.array(direct) - 1)
+    print(f"direct: {direct_time / args.count * 1e3:.2f} ms, table: {table_time / args.count * 1e3:.2f} ms per partial cross-section, "
+          f"speedup {direct_time / table_time:.1f}x")
+    print(f"difference from direct computation: median {numpy.median(differences):.2%}, largest {numpy.amax(differences):.2%}")
+
+
+if __name__ == "__main__":
+    main()
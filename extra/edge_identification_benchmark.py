@@ -0,0 +1,55 @@
+"""
+    Time the automatic edge identification of a synthetic spectrum image.
+
+    Each spectrum has a power law background with Poisson noise and, at random, carbon and oxygen K edges. Reports the
+    time to identify the edges of all spectra and the fraction of spectra whose edges are identified exactly.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/edge_identification_benchmark.py --shape 128 128 --channels 1024
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy
+
+from nion.eels_analysis import EELS_EdgeIdentification
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=2, default=(64, 64), help="the navigation shape of the spectrum image")
+    parser.add_argument("--channels", type=int, default=1024)
+    parser.add_argument("--counts", type=float, default=1e4, help="the counts in the first channel")
+    parser.add_argument("--smoothing", type=float, default=None, help="the smoothing of the spectra in eV")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    energy_offset_eV, energy_scale_eV = 200.0, 500.0 / args.channels
+    energies = energy_offset_eV + numpy.arange(args.channels) * energy_scale_eV
+    edges = rng.random(tuple(args.shape) + (2,)) > 0.5
+    background = args.counts * (energies / energy_offset_eV) ** -3
+    spectra = background * (1 + 0.4 * edges[..., 0:1] * (energies > 284.2) + 0.3 * edges[..., 1:2] * (energies > 543.1))
+    data = rng.poisson(spectra).astype(numpy.float32)
+
+    start = time.perf_counter()
+    edge_identification = EELS_EdgeIdentification.identify_edges(data, energy_offset_eV, energy_scale_eV, smoothing_eV=args.smoothing,
+                                                                  min_relative_jump=0.1, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    spectrum_count = int(numpy.prod(args.shape))
+    correct_count = 0
+    for navigation_index in numpy.ndindex(*args.shape):
+        expected = [atomic_number for atomic_number, present in zip((6, 8), edges[navigation_index]) if present]
+        identified = [edge_onset.candidates[0].electron_shell.atomic_number for edge_onset in edge_identification.get_edge_onsets(navigation_index) if edge_onset.candidates]
+        correct_count += expected == identified
+    print(f"{spectrum_count} spectra of {args.channels} channels: {elapsed:.3f} s, {elapsed / spectrum_count * 1e6:.1f} us per spectrum, "
+          f"{edge_identification.onset_count} onsets")
+    print(f"spectra identified exactly: {correct_count / spectrum_count:.1%}; spectra per element {edge_identification.get_element_counts()}")
+
+
+if __name__ == "__main__":
+    main()
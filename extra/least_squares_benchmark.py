@@ -0,0 +1,126 @@
+"""
+    Benchmark the batched least squares engine against the per-spectrum least squares loop.
+
+    Fits a linear background to every spectrum of synthetic spectrum images of increasing size with the former
+    per-spectrum numpy.linalg.lstsq loop, the former SVD and einsum implementation, and BatchedLeastSquares, with and
+    without non-finite channels, and reports the wall time and the speedup over the loop. Results are written as JSON so
+    that runs can be compared.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/least_squares_benchmark.py --sizes 32x32 128x128 --output least_squares.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import typing
+
+import numpy
+
+from nion.eels_analysis import LeastSquares
+
+
+DataArrayType = numpy.typing.NDArray[typing.Any]
+
+
+def get_linear_basis(length: int) -> DataArrayType:
+    return numpy.vstack([numpy.arange(length), numpy.ones((length,))]).T
+
+
+def fit_lstsq_loop(yss: DataArrayType) -> DataArrayType:
+    # the former slow_fit_linear_background.
+    basis = get_linear_basis(yss.shape[-1])
+    return numpy.array([numpy.linalg.lstsq(basis, ys, rcond=-1)[0] for ys in yss])
+
+
+def fit_svd_einsum(yss: DataArrayType) -> DataArrayType:
+    # the former stacked_fit_linear_background.
+    u, s, v = numpy.linalg.svd(get_linear_basis(yss.shape[-1]), full_matrices=False)
+    return typing.cast(DataArrayType, numpy.einsum('...ji,...j->...i', v, (1 / s) * numpy.einsum('...ji,...j->...i', u, yss)))
+
+
+def fit_batched(yss: DataArrayType) -> DataArrayType:
+    return LeastSquares.BatchedLeastSquares(get_linear_basis(yss.shape[-1])).fit(yss)
+
+
+def fit_batched_non_finite(yss: DataArrayType) -> DataArrayType:
+    # one non-finite channel per spectrum moves every spectrum to the batched normal equations.
+    yss = yss.copy()
+    yss[:, 0] = numpy.nan
+    return LeastSquares.BatchedLeastSquares(get_linear_basis(yss.shape[-1])).fit(yss)
+
+
+METHODS: typing.Dict[str, typing.Callable[[DataArrayType], DataArrayType]] = {
+    "lstsq_loop": fit_lstsq_loop,
+    "svd_einsum": fit_svd_einsum,
+    "batched": fit_batched,
+    "batched_non_finite": fit_batched_non_finite,
+}
+
+
+def measure(method: str, yss: DataArrayType, repeat: int) -> float:
+    fn = METHODS[method]
+    fn(yss)  # warm up
+    wall_times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(yss)
+        wall_times.append(time.perf_counter() - start)
+    return min(wall_times)
+
+
+def parse_shape(text: str) -> typing.Tuple[int, ...]:
+    return tuple(int(s) for s in text.lower().split("x"))
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the batched least squares engine.")
+    parser.add_argument("--sizes", nargs="+", default=["16x16", "64x64", "128x128"], help="navigation shapes, such as 64x64")
+    parser.add_argument("--length", type=int, default=100, help="number of channels in the fit window")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement; the best is reported")
+    parser.add_argument("--methods", nargs="*", default=list(METHODS.keys()))
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    rng = numpy.random.default_rng(0)
+    results = list()
+    for size in args.sizes:
+        navigation_shape = parse_shape(size)
+        spectrum_count = int(numpy.prod(navigation_shape))
+        yss = 100.0 + rng.uniform(-1, 1, (spectrum_count, 1)) * numpy.arange(args.length) + rng.standard_normal((spectrum_count, args.length))
+        baseline: typing.Optional[float] = None
+        for method in args.methods:
+            wall_time = measure(method, yss, args.repeat)
+            baseline = wall_time if method == "lstsq_loop" else baseline
+            speedup = baseline / wall_time if baseline else None
+            results.append({
+                "method": method,
+                "navigation_shape": list(navigation_shape),
+                "length": args.length,
+                "wall_time": wall_time,
+                "spectra_per_second": spectrum_count / wall_time if wall_time > 0 else None,
+                "speedup": speedup,
+            })
+            speedup_text = f"{speedup:8.1f}x" if speedup else ""
+            print(f"{size:>10} {method:<20} {wall_time * 1000:10.2f} ms {spectrum_count / wall_time:14.0f} spectra/s {speedup_text}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "date": datetime.datetime.now().isoformat(),
+                "python": sys.version,
+                "numpy": numpy.__version__,
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+    Time the import of the EELS analysis Swift plug-in.
+
+    Each run imports the plug-in in a fresh interpreter with -X importtime, after the modules Swift itself loads before
+    it loads plug-ins, or alone with --standalone. Reports the median time of the plug-in import over the runs, the
+    modules it imported taking the most time, and the time of the first use of the modules it defers, given with
+    --first-use. Compiled bytecode is cached in a temporary directory, as it is for an installed package, after a first
+    run which is not counted.
+
+    Example, from the repository root with the package installed or on the path:
+
+        PYTHONPATH=. python extra/plugin_import_benchmark.py --runs 10 --first-use BackgroundSubtraction ElementalMappingPanel
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import typing
+
+PLUGIN_MODULE = "nionswift_plugin.nion_eels_analysis"
+
+# the modules Swift has loaded when it loads plug-ins.
+SWIFT_MODULES = ["nion.swift.Application", "nion.swift.Facade", "nion.swift.model.DocumentModel", "nion.data.Core", "nion.data.xdata_1_0"]
+
+
+def run_importtime(imports: typing.Sequence[str], environment: typing.Mapping[str, str]) -> typing.Dict[str, typing.Tuple[int, int]]:
+    # return the self and cumulative import time, in microseconds, of each module imported at the top level.
+    code = "; ".join(f"import {module}" for module in imports)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True, env=environment)
+    times = dict()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and not line.startswith("import time: self"):
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(self_us), int(cumulative_us)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--standalone", action="store_true", help="import the plug-in without the modules Swift loads first")
+    parser.add_argument("--first-use", nargs="*", default=list(), help="plug-in modules to import after the plug-in, as a menu item or computation does")
+    parser.add_argument("--top", type=int, default=10, help="the number of slowest modules to list")
+    args = parser.parse_args()
+
+    preloaded = list() if args.standalone else SWIFT_MODULES
+    first_use = [f"{PLUGIN_MODULE}.{module_name}" for module_name in args.first_use]
+    with tempfile.TemporaryDirectory() as pycache_prefix:
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONPYCACHEPREFIX=pycache_prefix)
+        environment.pop("PYTHONDONTWRITEBYTECODE", None)
+        run_importtime(preloaded + [PLUGIN_MODULE] + first_use, environment)
+        runs = [run_importtime(preloaded + [PLUGIN_MODULE] + first_use, environment) for _ in range(args.runs)]
+
+    plugin_times_ms = [run[PLUGIN_MODULE][1] / 1e3 for run in runs]
+    print(f"{PLUGIN_MODULE}{' standalone' if args.standalone else ' after Swift'}: median {statistics.median(plugin_times_ms):.1f} ms "
+          f"(min {min(plugin_times_ms):.1f} ms, max {max(plugin_times_ms):.1f} ms) over {args.runs} runs")
+    for module in first_use:
+        first_use_times_ms = [run[module][1] / 1e3 if module in run else 0.0 for run in runs]
+        print(f"first use of {module}: median {statistics.median(first_use_times_ms):.1f} ms")
+    # the modules imported by the plug-in, which are those listed after the preloaded modules and before its first use.
+    names = list(runs[-1].keys())
+    start = max((names.index(module) for module in preloaded), default=-1) + 1
+    stop = names.index(PLUGIN_MODULE) + 1
+    imported = sorted(names[start:stop], key=lambda name: runs[-1][name][0], reverse=True)
+    print("modules imported with the plug-in, slowest first, self time:")
+    for name in imported[:args.top]:
+        print(f"    {runs[-1][name][0] / 1e3:7.2f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
 # imports
+import collections
 import copy
+import dataclasses
 import functools
 import gettext
 import numpy
 import scipy
 import scipy.integrate
+import scipy.special
+import threading
 import typing
 
 # local libraries
+from nion.data import Calibration
 from nion.data import Core
 from nion.data import DataAndMetadata
+from nion.eels_analysis import BuiltInModels
+from nion.eels_analysis import FitExecutor
+from nion.eels_analysis import LeastSquares
+from nion.eels_analysis import ModelCapabilities
 from nion.utils import Registry
 
 
@@ -21,6 +30,7 @@ _ = gettext.gettext
 BackgroundModelParameters = typing.Dict
 BackgroundInterval = typing.Tuple[float, float]
 DataArrayType = numpy.typing.NDArray[typing.Any]
+FitFunctionType = typing.Callable[[DataArrayType, DataArrayType, DataArrayType, typing.Optional[DataArrayType]], DataArrayType]
 
 
 def get_calibrated_interval_slice(spectrum: DataAndMetadata.DataAndMetadata,
@@ -43,25 +53,212 @@ def get_calibrated_interval_domain(spectrum: DataAndMetadata.DataAndMetadata,
         dimensional_calibrations=[calibration])
 
 
+def get_interval_pixel_range(datum_length: int, interval: BackgroundInterval) -> typing.Tuple[int, int]:
+    return round(datum_length * interval[0]), round(datum_length * interval[1])
+
+
+def iterate_navigation_chunks(navigation_size: int, chunk_size: typing.Optional[int] = None) -> typing.Iterator[slice]:
+    """Return slices covering the flattened navigation indexes in blocks of at most chunk_size spectra.
+
+    A chunk_size of None produces a single block covering the entire navigation range.
+    """
+    step = max(1, min(chunk_size, navigation_size) if chunk_size else navigation_size)
+    for start in range(0, navigation_size, step):
+        yield slice(start, min(start + step, navigation_size))
+
+
+def get_float_dtype(dtype: numpy.typing.DTypeLike) -> numpy.dtype[typing.Any]:
+    # the dtype in which models compute fits of data of dtype: float32 for float32 data, float64 otherwise.
+    return numpy.dtype(numpy.float32) if numpy.dtype(dtype) == numpy.float32 else numpy.dtype(numpy.float64)
+
+
+def get_trapezoid_weights(n: int) -> DataArrayType:
+    """Return the weights with shape (n) for which data @ weights is the trapezoid integral of data with unit spacing."""
+    ws = numpy.ones((n,), dtype=numpy.float64)
+    ws[0:1] = 0.5
+    ws[-1:] = 0.5 if n > 1 else 0.0
+    return ws
+
+
+def gather_fit_windows(spectra: DataArrayType, fit_ranges: typing.Sequence[typing.Tuple[int, int]],
+                       out: typing.Optional[DataArrayType] = None) -> DataArrayType:
+    # spectra will be an array of y-values with shape (m,L)
+    # return the fit windows concatenated along the last axis; a single fit window is returned as a view
+    # out, if given, receives the concatenated fit windows of several fit ranges and is returned
+    if len(fit_ranges) > 1:
+        return numpy.concatenate([spectra[..., start:stop] for start, stop in fit_ranges], axis=-1, out=out)
+    start, stop = fit_ranges[0]
+    if out is not None:
+        out[...] = spectra[..., start:stop]
+        return out
+    return spectra[..., start:stop]
+
+
+class FitWindowBuffer:
+    """Gather the fit windows of blocks of spectra into one contiguous buffer reused from block to block.
+
+    A single fit window is returned as a view of the spectra. Several fit windows are copied into a buffer allocated
+    for the largest block seen, so chunked fits allocate the gathered fit windows once rather than once per block. The
+    returned array is only valid until the next call to gather; models must not keep a reference to it.
+    """
+
+    def __init__(self, fit_ranges: typing.Sequence[typing.Tuple[int, int]], dtype: typing.Optional[numpy.typing.DTypeLike] = None) -> None:
+        # dtype, if given, is the dtype of the gathered fit windows; the spectra are converted while they are copied.
+        self.fit_ranges = list(fit_ranges)
+        self.length = sum(stop - start for start, stop in self.fit_ranges)
+        self.dtype = numpy.dtype(dtype) if dtype is not None else None
+        self.__buffer: typing.Optional[DataArrayType] = None
+
+    def gather(self, spectra: DataArrayType) -> DataArrayType:
+        # spectra will be an array of y-values with shape (b,L)
+        dtype = self.dtype or spectra.dtype
+        if len(self.fit_ranges) == 1 and dtype == spectra.dtype:
+            return gather_fit_windows(spectra, self.fit_ranges)
+        buffer = self.__buffer
+        if buffer is None or buffer.shape[0] < spectra.shape[0] or buffer.dtype != dtype:
+            buffer = numpy.empty((spectra.shape[0], self.length), dtype=dtype)
+            self.__buffer = buffer
+        return gather_fit_windows(spectra, self.fit_ranges, out=buffer[:spectra.shape[0]])
+
+
+FIT_QUALITY_KEYS = ("chi_squared", "r_squared", "residual_rms")
+
+
+def get_bin_indexes(navigation_shape: typing.Sequence[int], binning: int) -> DataArrayType:
+    # return the index of the bin of each pixel, with shape (m), into the flattened bins of binning pixels along each
+    # navigation axis. bins at the ends of an axis may be partial.
+    binned_shape = tuple(-(-n // binning) for n in navigation_shape)
+    bin_coordinates = numpy.meshgrid(*[numpy.arange(n) // binning for n in navigation_shape], indexing="ij")
+    return typing.cast(DataArrayType, numpy.ravel_multi_index(tuple(numpy.ravel(c) for c in bin_coordinates), binned_shape))
+
+
+def get_binned_fit_windows(spectra: DataArrayType, fit_ranges: typing.Sequence[typing.Tuple[int, int]],
+                           binning: int) -> typing.Tuple[DataArrayType, DataArrayType]:
+    """Return the mean fit windows of bins of binning pixels along each navigation axis and the fit window sums.
+
+    spectra has shape (navigation shape) + (L). The mean fit windows have shape (bins, fit window length), with the
+    bins flattened in the order of get_bin_indexes, and partial bins at the ends of an axis are the mean of the pixels
+    they contain. The fit window sums of the pixels have shape (m). The spectra are read binning rows at a time.
+    """
+    navigation_shape = spectra.shape[:-1]
+    binned_shape = tuple(-(-n // binning) for n in navigation_shape)
+    fit_window_buffer = FitWindowBuffer(fit_ranges, numpy.float64)
+    binned = numpy.empty(binned_shape + (fit_window_buffer.length,), dtype=numpy.float64)
+    pixel_sums = numpy.empty(navigation_shape, dtype=numpy.float64)
+    for row, start in enumerate(range(0, navigation_shape[0], binning)):
+        rows = spectra[start:start + binning]
+        yss = numpy.reshape(fit_window_buffer.gather(numpy.reshape(rows, (-1, rows.shape[-1]))), rows.shape[:-1] + (-1,))
+        pixel_sums[start:start + binning] = numpy.sum(yss, axis=-1)
+        binned_row = numpy.mean(yss, axis=0)
+        for axis, n in enumerate(navigation_shape[1:]):
+            starts = numpy.arange(0, n, binning)
+            counts = numpy.diff(numpy.append(starts, n))
+            binned_row = numpy.add.reduceat(binned_row, starts, axis=axis) / numpy.reshape(counts, (-1,) + (1,) * (binned_row.ndim - axis - 1))
+        binned[row] = binned_row
+    return numpy.reshape(binned, (-1, binned.shape[-1])), numpy.ravel(pixel_sums)
+
+
+def get_fit_quality(yss: DataArrayType, fits: DataArrayType) -> DataArrayType:
+    """Return the goodness of fit of fits to the fit window data yss, both with shape (...,L).
+
+    The result has shape (...,3) holding the values listed in FIT_QUALITY_KEYS: the chi-squared per channel using the
+    fit as the Poisson variance (at least 1), the coefficient of determination, and the root mean square residual.
+    """
+    yss = numpy.asarray(yss, dtype=numpy.float64)
+    residuals = yss - fits
+    residual_squares = numpy.sum(numpy.square(residuals), axis=-1)
+    total_squares = numpy.sum(numpy.square(yss - numpy.mean(yss, axis=-1, keepdims=True)), axis=-1)
+    fit_quality = numpy.empty(yss.shape[:-1] + (len(FIT_QUALITY_KEYS),), dtype=numpy.float64)
+    fit_quality[..., 0] = numpy.mean(numpy.square(residuals) / numpy.maximum(fits, 1), axis=-1)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        fit_quality[..., 1] = numpy.where(total_squares > 0, 1 - residual_squares / total_squares, numpy.nan)
+    fit_quality[..., 2] = numpy.sqrt(residual_squares / yss.shape[-1])
+    return fit_quality
+
+
+def _perform_fit_for_spectrum(background_model: AbstractBackgroundModel, xs: DataArrayType, fs: DataArrayType, ys: DataArrayType) -> DataArrayType:
+    return background_model._perform_fit(xs, ys, fs)
+
+
 class AbstractBackgroundModel:
+    # models for which the fit of one spectrum depends on the other spectra (for instance through the mean spectrum)
+    # set this to False. chunked execution then passes the reference from _get_fit_reference, computed over all
+    # spectra and from the reference spectrum given by the caller if any, as es.
+    fits_are_independent = True
+
+    # the number of spectra for which the fit is evaluated at once when integrating the background.
+    integration_block_size = 4096
+
+    # models implementing only _perform_fit can declare these to have their spectra fitted on a thread pool.
+    # see FitExecutor.FitModelLike.
+    thread_safe = False
+    releases_gil = False
+
+    # models which fit float32 data in float32 set this to True.
+    computes_in_float32 = False
+
     def __init__(self, background_model_id: str, title: typing.Optional[str] = None) -> None:
         self.background_model_id = background_model_id
         self.title = title
-        self.package_title = _("EELS Analysis")
+        self.package_title = BuiltInModels.PACKAGE_TITLE
+        # the executor for the per-spectrum _perform_fit fallback. None uses the shared default executor.
+        self.fit_executor: typing.Optional[FitExecutor.FitExecutor] = None
+
+    @property
+    def capabilities(self) -> ModelCapabilities.ModelCapabilities:
+        # derived from the class attributes and the hooks the model overrides.
+        model_class = type(self)
+        return ModelCapabilities.ModelCapabilities(
+            batched=model_class._perform_fits is not AbstractBackgroundModel._perform_fits,
+            chunked=self.fits_are_independent,
+            float32=self.computes_in_float32,
+            analytic_integrals=model_class._perform_integrals is not AbstractBackgroundModel._perform_integrals,
+            coefficient_maps=model_class._perform_coefficient_fits is not AbstractBackgroundModel._perform_coefficient_fits,
+            thread_safe=self.thread_safe,
+            releases_gil=self.releases_gil)
 
     def fit_background(self, *, spectrum_xdata: DataAndMetadata.DataAndMetadata,
                        fit_intervals: typing.Sequence[BackgroundInterval],
-                       background_interval: BackgroundInterval, **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+                       background_interval: BackgroundInterval,
+                       chunk_size: typing.Optional[int] = None,
+                       fit_quality: bool = False,
+                       precision: typing.Optional[str] = None,
+                       binning: int = 1,
+                       **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        # chunk_size limits the number of spectra fitted at once for navigable data. None fits all spectra at once.
+        # fit_quality adds the goodness of fit in the fit windows to the result; see FIT_QUALITY_KEYS.
+        # precision is the dtype policy of the fit; see ModelCapabilities.PRECISIONS. the default is float64.
+        # binning greater than 1 fits bins of binning x binning spectra and scales the fit of the bin to each spectrum by
+        # its fit window sum. only used for navigable data.
+        dtype = ModelCapabilities.get_precision_dtype(precision, spectrum_xdata.data_dtype)
+        background_xdata, fit_quality_data = self.__fit_background(spectrum_xdata, None, fit_intervals, background_interval, chunk_size, fit_quality, dtype, binning)
         return {
-            "background_model": self.__fit_background(spectrum_xdata, None, fit_intervals, background_interval),
-        }
+            "background_model": background_xdata,
+        } | self.__get_fit_quality_results(spectrum_xdata, fit_quality_data)
 
     def subtract_background(self, *, spectrum_xdata: DataAndMetadata.DataAndMetadata,
-                            fit_intervals: typing.Sequence[BackgroundInterval], **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+                            fit_intervals: typing.Sequence[BackgroundInterval],
+                            chunk_size: typing.Optional[int] = None,
+                            precision: typing.Optional[str] = None,
+                            binning: int = 1,
+                            **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        # see fit_background for chunk_size, precision and binning.
+        dtype = ModelCapabilities.get_precision_dtype(precision, spectrum_xdata.data_dtype)
         # set up initial values
         fit_minimum = min([fit_interval[0] for fit_interval in fit_intervals])
         signal_interval = fit_minimum, 1.0
-        subtracted_xdata = Core.calibrated_subtract_spectrum(spectrum_xdata, self.__fit_background(spectrum_xdata, None, fit_intervals, signal_interval))
+        if spectrum_xdata.is_navigable:
+            calibration = self.__get_background_domain(spectrum_xdata, signal_interval)[1]
+            start, stop = get_interval_pixel_range(spectrum_xdata.data_shape[-1], signal_interval)
+            subtracted_data: typing.Optional[DataArrayType] = None
+            for navigation_slice, spectra, fit, _ in self.__iterate_fits(spectrum_xdata, None, fit_intervals, signal_interval, chunk_size, dtype=dtype, binning=binning):
+                subtracted = spectra[..., start:stop] - fit
+                if subtracted_data is None:
+                    subtracted_data = numpy.empty((numpy.prod(spectrum_xdata.navigation_dimension_shape, dtype=numpy.uint64),) + subtracted.shape[-1:], subtracted.dtype)
+                subtracted_data[navigation_slice] = subtracted
+            assert subtracted_data is not None
+            return {"subtracted": self.__new_navigable_xdata(spectrum_xdata, subtracted_data, calibration)}
+        subtracted_xdata = Core.calibrated_subtract_spectrum(spectrum_xdata, self.__fit_background(spectrum_xdata, None, fit_intervals, signal_interval, chunk_size, dtype=dtype)[0])
         assert subtracted_xdata
         return {"subtracted": subtracted_xdata}
 
@@ -70,48 +267,130 @@ class AbstractBackgroundModel:
                          fit_intervals: typing.Sequence[BackgroundInterval],
                          signal_interval: BackgroundInterval,
                          eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata] = None,
+                         chunk_size: typing.Optional[int] = None,
+                         fused: bool = False,
+                         fit_quality: bool = False,
+                         precision: typing.Optional[str] = None,
+                         binning: int = 1,
                          **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
-        # set up initial values
-        subtracted_xdata = Core.calibrated_subtract_spectrum(spectrum_xdata,
-                                                             self.__fit_background(spectrum_xdata, eels_spectrum_xdata,
-                                                                                   fit_intervals, signal_interval))
-        assert subtracted_xdata
-        subtracted_data = subtracted_xdata.data
-        assert subtracted_data is not None
+        # fused integrates the raw data and the background separately, using _perform_integrals for the background,
+        # so that the background over the signal interval is never stored for all spectra at once.
+        # see fit_background for fit_quality, precision and binning.
+        dtype = ModelCapabilities.get_precision_dtype(precision, spectrum_xdata.data_dtype)
         if spectrum_xdata.is_navigable:
+            start, stop = get_interval_pixel_range(spectrum_xdata.data_shape[-1], signal_interval)
+            ws = get_trapezoid_weights(stop - start).astype(dtype)
+            integrated_data: typing.Optional[DataArrayType] = None
+            fit_quality_data: typing.Optional[DataArrayType] = None
+            fit_fn = functools.partial(self._perform_integrals, ws=ws) if fused else self._perform_fits
+            for navigation_slice, spectra, fit, fit_quality_block in self.__iterate_fits(spectrum_xdata, eels_spectrum_xdata, fit_intervals, signal_interval, chunk_size, fit_fn, fit_quality, dtype, binning):
+                integrated = spectra[..., start:stop] @ ws - fit if fused else scipy.integrate.trapezoid(spectra[..., start:stop] - fit)
+                if integrated_data is None:
+                    integrated_data = numpy.empty((numpy.prod(spectrum_xdata.navigation_dimension_shape, dtype=numpy.uint64),), integrated.dtype)
+                integrated_data[navigation_slice] = integrated
+                fit_quality_data = self.__store_fit_quality(spectrum_xdata, fit_quality_data, navigation_slice, fit_quality_block)
+            assert integrated_data is not None
             return {
                 "integrated": DataAndMetadata.new_data_and_metadata(
-                    scipy.integrate.trapezoid(subtracted_data),
+                    numpy.reshape(integrated_data, spectrum_xdata.navigation_dimension_shape),
                     dimensional_calibrations=spectrum_xdata.navigation_dimensional_calibrations)
-            }
-        else:
-            return {
-                "integrated_value": scipy.integrate.trapezoid(subtracted_data),
-            }
+            } | self.__get_fit_quality_results(spectrum_xdata, fit_quality_data)
+        # set up initial values
+        background_xdata, fit_quality_data = self.__fit_background(spectrum_xdata, eels_spectrum_xdata, fit_intervals,
+                                                                   signal_interval, chunk_size, fit_quality, dtype)
+        subtracted_xdata = Core.calibrated_subtract_spectrum(spectrum_xdata, background_xdata)
+        assert subtracted_xdata
+        subtracted_data = subtracted_xdata.data
+        assert subtracted_data is not None
+        return {
+            "integrated_value": scipy.integrate.trapezoid(subtracted_data),
+        } | self.__get_fit_quality_results(spectrum_xdata, fit_quality_data)
 
-    def __fit_background(self,
-                         spectrum_xdata: DataAndMetadata.DataAndMetadata,
-                         eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
-                         fit_intervals: typing.Sequence[BackgroundInterval],
-                         background_interval: BackgroundInterval) -> DataAndMetadata.DataAndMetadata:
-        # fit polynomial to the data
-        xs: DataArrayType = numpy.concatenate([get_calibrated_interval_domain(spectrum_xdata, fit_interval) for fit_interval in fit_intervals], dtype=numpy.float32)
-        ys: DataArrayType
-        if len(fit_intervals) > 1:
-            ys = numpy.concatenate([get_calibrated_interval_slice(spectrum_xdata, fit_interval)._data_ex for fit_interval in fit_intervals], axis=-1)
+    def fit_coefficient_map(self, *, spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                            fit_intervals: typing.Sequence[BackgroundInterval],
+                            background_interval: BackgroundInterval,
+                            eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata] = None,
+                            chunk_size: typing.Optional[int] = None,
+                            binning: int = 1,
+                            **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        # fit the background and return the per-spectrum model parameters as a BackgroundCoefficientMap instead of the
+        # background spectra. only models implementing _perform_coefficient_fits support this.
+        # binning greater than 1 fits bins of binning x binning spectra; each spectrum takes the coefficients of its bin
+        # and a scale, the ratio of its fit window sum to that of its bin, is applied to the background.
+        fs, calibration = self.__get_background_domain(spectrum_xdata, background_interval)
+        coefficients_data: typing.Optional[DataArrayType] = None
+        scales: typing.Optional[DataArrayType] = None
+        m = int(numpy.prod(spectrum_xdata.navigation_dimension_shape, dtype=numpy.uint64))
+        if binning > 1:
+            xs, _, es, binned_yss, bin_indexes, scales = self.__get_binned_fit_inputs(spectrum_xdata, eels_spectrum_xdata, fit_intervals, None, binning)
+            coefficients_data = self._perform_coefficient_fits(xs, binned_yss, es)[bin_indexes]
         else:
-            ys = get_calibrated_interval_slice(spectrum_xdata, fit_intervals[0])._data_ex
-        es: typing.Optional[DataArrayType]
-        if eels_spectrum_xdata:
-            if len(fit_intervals) > 1:
-                es = numpy.concatenate([get_calibrated_interval_slice(eels_spectrum_xdata, fit_interval).data for fit_interval in fit_intervals])
-            else:
-                es = get_calibrated_interval_slice(eels_spectrum_xdata, fit_intervals[0]).data
-        else:
-            es = None
-        # generate background model data from the series
-        background_interval_start_pixel = round(spectrum_xdata.data_shape[-1] * background_interval[0])
-        background_interval_end_pixel = round(spectrum_xdata.data_shape[-1] * background_interval[1])
+            fit_fn = lambda xs, yss, fs, es: self._perform_coefficient_fits(xs, yss, es)
+            for navigation_slice, spectra, coefficients, _ in self.__iterate_fits(spectrum_xdata, eels_spectrum_xdata, fit_intervals, background_interval, chunk_size, fit_fn):
+                if coefficients_data is None:
+                    coefficients_data = numpy.empty((m,) + coefficients.shape[-1:], coefficients.dtype)
+                coefficients_data[navigation_slice] = coefficients
+        assert coefficients_data is not None
+        navigation_shape = tuple(spectrum_xdata.navigation_dimension_shape)
+        return {
+            "coefficient_map": BackgroundCoefficientMap(self.background_model_id,
+                                                        numpy.reshape(coefficients_data, navigation_shape + coefficients_data.shape[-1:]),
+                                                        fs, calibration, spectrum_xdata.navigation_dimensional_calibrations,
+                                                        spectrum_xdata.intensity_calibration,
+                                                        numpy.reshape(scales, navigation_shape) if scales is not None else None)
+        }
+
+    def integrate_signals(self, *,
+                          spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                          jobs: typing.Sequence[typing.Tuple[typing.Sequence[BackgroundInterval], BackgroundInterval]],
+                          eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata] = None,
+                          chunk_size: typing.Optional[int] = None,
+                          precision: typing.Optional[str] = None,
+                          **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        """Integrate the background subtracted signal of several (fit intervals, signal interval) jobs in one pass.
+
+        Jobs with the same fit intervals share a background fit, evaluated once over the union of their signal
+        intervals. Each block of chunk_size spectra is read once for all jobs. The result "integrated" is a sequence of
+        maps with shape (k,) + the navigation shape, one map per job, matching integrate_signal with fused=True.
+        """
+        assert spectrum_xdata.is_navigable
+        dtype = ModelCapabilities.get_precision_dtype(precision, spectrum_xdata.data_dtype)
+        datum_length = spectrum_xdata.data_shape[-1]
+        spectra = numpy.reshape(spectrum_xdata._data_ex, (-1, datum_length))
+        navigation_slices = list(iterate_navigation_chunks(spectra.shape[0], chunk_size))
+        job_indexes_by_fit_intervals: typing.Dict[typing.Tuple[BackgroundInterval, ...], typing.List[int]] = dict()
+        for index, (fit_intervals, signal_interval) in enumerate(jobs):
+            job_indexes_by_fit_intervals.setdefault(tuple((fit_interval[0], fit_interval[1]) for fit_interval in fit_intervals), list()).append(index)
+        fit_groups = list()
+        for fit_intervals, job_indexes in job_indexes_by_fit_intervals.items():
+            signal_intervals = [jobs[index][1] for index in job_indexes]
+            union_interval = min(signal_interval[0] for signal_interval in signal_intervals), max(signal_interval[1] for signal_interval in signal_intervals)
+            start, stop = get_interval_pixel_range(datum_length, union_interval)
+            # ws has shape (n,k) holding the trapezoid weights of each signal interval within the union interval.
+            ws = numpy.zeros((stop - start, len(job_indexes)), dtype=dtype)
+            for column, signal_interval in enumerate(signal_intervals):
+                signal_start, signal_stop = get_interval_pixel_range(datum_length, signal_interval)
+                ws[signal_start - start:signal_stop - start, column] = get_trapezoid_weights(signal_stop - signal_start)
+            fs = self.__get_background_domain(spectrum_xdata, union_interval)[0]
+            xs, fit_ranges, es = self.__get_fit_inputs(spectrum_xdata, eels_spectrum_xdata, fit_intervals, spectra, navigation_slices, dtype)
+            fit_groups.append((job_indexes, start, stop, ws, fs, xs, FitWindowBuffer(fit_ranges, dtype), es))
+        integrated_data = numpy.empty((len(jobs), spectra.shape[0]), dtype=numpy.result_type(spectra.dtype, dtype))
+        for navigation_slice in navigation_slices:
+            spectra_block = spectra[navigation_slice]
+            for job_indexes, start, stop, ws, fs, xs, fit_window_buffer, es in fit_groups:
+                integrated = spectra_block[..., start:stop] @ ws - self._perform_integrals(xs, fit_window_buffer.gather(spectra_block), fs, es, ws)
+                integrated_data[job_indexes, navigation_slice] = integrated.T
+        return {
+            "integrated": DataAndMetadata.new_data_and_metadata(
+                numpy.reshape(integrated_data, (len(jobs),) + tuple(spectrum_xdata.navigation_dimension_shape)),
+                dimensional_calibrations=[Calibration.Calibration()] + list(spectrum_xdata.navigation_dimensional_calibrations),
+                data_descriptor=DataAndMetadata.DataDescriptor(True, 0, spectrum_xdata.navigation_dimension_count))
+        }
+
+    def __get_background_domain(self, spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                                background_interval: BackgroundInterval) -> typing.Tuple[DataArrayType, Calibration.Calibration]:
+        # generate background model domain and calibration from the interval
+        background_interval_start_pixel, background_interval_end_pixel = get_interval_pixel_range(spectrum_xdata.data_shape[-1], background_interval)
         n = background_interval_end_pixel - background_interval_start_pixel
         calibration = copy.deepcopy(spectrum_xdata.dimensional_calibrations[-1])
         interval_start = calibration.convert_to_calibrated_value(background_interval_start_pixel)
@@ -119,21 +398,180 @@ class AbstractBackgroundModel:
         interval_end -= (interval_end - interval_start) / n  # n samples at the left edges of each pixel
         calibration.offset = interval_start
         fs = numpy.linspace(interval_start, interval_end, n, dtype=numpy.float32)
+        return fs, calibration
+
+    def __new_navigable_xdata(self, spectrum_xdata: DataAndMetadata.DataAndMetadata, data: DataArrayType,
+                              calibration: Calibration.Calibration) -> DataAndMetadata.DataAndMetadata:
+        # data will be an array with shape (m,n) where m is the flattened navigation size
+        calibrations = list(copy.deepcopy(spectrum_xdata.navigation_dimensional_calibrations)) + [calibration]
+        data_descriptor = DataAndMetadata.DataDescriptor(False, spectrum_xdata.navigation_dimension_count,
+                                                         spectrum_xdata.datum_dimension_count)
+        return DataAndMetadata.new_data_and_metadata(numpy.reshape(data, tuple(spectrum_xdata.navigation_dimension_shape) + data.shape[-1:]),
+                                                     data_descriptor=data_descriptor,
+                                                     dimensional_calibrations=calibrations,
+                                                     intensity_calibration=spectrum_xdata.intensity_calibration)
+
+    def __store_fit_quality(self, spectrum_xdata: DataAndMetadata.DataAndMetadata, fit_quality_data: typing.Optional[DataArrayType],
+                            navigation_slice: slice, fit_quality_block: typing.Optional[DataArrayType]) -> typing.Optional[DataArrayType]:
+        # write a block of fit quality values into the (m,3) output, allocating it with the first block.
+        if fit_quality_block is None:
+            return fit_quality_data
+        if fit_quality_data is None:
+            fit_quality_data = numpy.empty((numpy.prod(spectrum_xdata.navigation_dimension_shape, dtype=numpy.uint64),) + fit_quality_block.shape[-1:], fit_quality_block.dtype)
+        fit_quality_data[navigation_slice] = fit_quality_block
+        return fit_quality_data
+
+    def __get_fit_quality_results(self, spectrum_xdata: DataAndMetadata.DataAndMetadata, fit_quality_data: typing.Optional[DataArrayType]) -> typing.Dict[str, typing.Any]:
+        # return a map for each fit quality value of navigable data, or a float for a single spectrum.
+        if fit_quality_data is None:
+            return dict()
+        if not spectrum_xdata.is_navigable:
+            return {key: float(fit_quality_data[i]) for i, key in enumerate(FIT_QUALITY_KEYS)}
+        return {key: DataAndMetadata.new_data_and_metadata(
+                    numpy.reshape(fit_quality_data[:, i], spectrum_xdata.navigation_dimension_shape),
+                    dimensional_calibrations=spectrum_xdata.navigation_dimensional_calibrations)
+                for i, key in enumerate(FIT_QUALITY_KEYS)}
+
+    def __get_fit_inputs(self,
+                         spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                         eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
+                         fit_intervals: typing.Sequence[BackgroundInterval],
+                         spectra: DataArrayType,
+                         navigation_slices: typing.Sequence[slice],
+                         dtype: typing.Optional[numpy.typing.DTypeLike] = None) -> typing.Tuple[DataArrayType, typing.List[typing.Tuple[int, int]], typing.Optional[DataArrayType]]:
+        # return the fit energies xs, the fit window pixel ranges, and the reference spectrum es in dtype for fitting
+        # the spectra, with shape (m,L), in blocks given by navigation_slices.
+        xs: DataArrayType = numpy.concatenate([get_calibrated_interval_domain(spectrum_xdata, fit_interval) for fit_interval in fit_intervals], dtype=numpy.float32)
+        fit_ranges = [get_interval_pixel_range(spectra.shape[-1], fit_interval) for fit_interval in fit_intervals]
+        es: typing.Optional[DataArrayType] = None
+        if eels_spectrum_xdata:
+            es = gather_fit_windows(eels_spectrum_xdata._data_ex, fit_ranges).astype(dtype or eels_spectrum_xdata.data_dtype, copy=False)
+        if not self.fits_are_independent and len(navigation_slices) > 1:
+            # the fits depend on the whole data set; pass the reference computed over the blocks, from the reference
+            # spectrum if there is one, so that each block is fitted with the same reference.
+            fit_window_buffer = FitWindowBuffer(fit_ranges)
+            es = self._get_fit_reference(lambda: (fit_window_buffer.gather(spectra[navigation_slice]) for navigation_slice in navigation_slices), es)
+            es = es.astype(dtype or numpy.float64, copy=False)
+        return xs, fit_ranges, es
+
+    def __iterate_fits(self,
+                       spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                       eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
+                       fit_intervals: typing.Sequence[BackgroundInterval],
+                       background_interval: BackgroundInterval,
+                       chunk_size: typing.Optional[int],
+                       fit_fn: typing.Optional[FitFunctionType] = None,
+                       fit_quality: bool = False,
+                       dtype: typing.Optional[numpy.typing.DTypeLike] = None,
+                       binning: int = 1) -> typing.Iterator[typing.Tuple[slice, DataArrayType, DataArrayType, typing.Optional[DataArrayType]]]:
+        # fit the navigable data in blocks of at most chunk_size spectra. yield the flattened navigation slice, the
+        # source spectra with shape (b,L), the background fit with shape (b,n), and the fit quality with shape (b,3)
+        # if fit_quality is requested for each block. fit_fn replaces _perform_fits when the caller needs something
+        # other than the background fit, such as its integral. the fit windows are passed to the model in dtype.
+        # binning greater than 1 fits the mean fit windows of bins of binning pixels along each navigation axis once,
+        # and the fit of each pixel is that of its bin scaled by the ratio of the fit window sums of the pixel and bin.
+        fit_fn = fit_fn or self._perform_fits
+        spectra = numpy.reshape(spectrum_xdata._data_ex, (-1, spectrum_xdata.data_shape[-1]))
+        navigation_slices = list(iterate_navigation_chunks(spectra.shape[0], chunk_size))
+        if binning > 1:
+            yield from self.__iterate_binned_fits(spectrum_xdata, eels_spectrum_xdata, fit_intervals, background_interval, navigation_slices, fit_fn, fit_quality, dtype, binning)
+            return
+        xs, fit_ranges, es = self.__get_fit_inputs(spectrum_xdata, eels_spectrum_xdata, fit_intervals, spectra, navigation_slices, dtype)
+        fs = self.__get_background_domain(spectrum_xdata, background_interval)[0]
+        fit_window_buffer = FitWindowBuffer(fit_ranges, dtype)
+        for navigation_slice in navigation_slices:
+            spectra_block = spectra[navigation_slice]
+            yss = fit_window_buffer.gather(spectra_block)
+            if not fit_quality:
+                yield navigation_slice, spectra_block, fit_fn(xs, yss, fs, es), None
+            elif fit_fn == self._perform_fits:
+                # evaluate the background and the fit window model in one fit by extending the domain with xs.
+                fit = fit_fn(xs, yss, numpy.concatenate([fs, xs]), es)
+                yield navigation_slice, spectra_block, fit[..., :fs.shape[-1]], get_fit_quality(yss, fit[..., fs.shape[-1]:])
+            else:
+                yield navigation_slice, spectra_block, fit_fn(xs, yss, fs, es), get_fit_quality(yss, self._perform_fits(xs, yss, xs, es))
+
+    def __get_binned_fit_inputs(self,
+                                spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                                eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
+                                fit_intervals: typing.Sequence[BackgroundInterval],
+                                dtype: typing.Optional[numpy.typing.DTypeLike],
+                                binning: int) -> typing.Tuple[DataArrayType, typing.List[typing.Tuple[int, int]], typing.Optional[DataArrayType], DataArrayType, DataArrayType, DataArrayType]:
+        # return the fit energies xs, the fit window pixel ranges, the reference spectrum es, the mean fit windows of
+        # the bins with shape (bins,L) in dtype, the bin index of each pixel with shape (m), and the scale of each pixel
+        # with shape (m) relative to its bin.
+        spectra = numpy.reshape(spectrum_xdata._data_ex, (-1, spectrum_xdata.data_shape[-1]))
+        xs, fit_ranges, es = self.__get_fit_inputs(spectrum_xdata, eels_spectrum_xdata, fit_intervals, spectra, [slice(None)], dtype)
+        binned_yss, pixel_sums = get_binned_fit_windows(spectrum_xdata._data_ex, fit_ranges, binning)
+        bin_indexes = get_bin_indexes(spectrum_xdata.navigation_dimension_shape, binning)
+        bin_sums = numpy.sum(binned_yss, axis=-1)[bin_indexes]
+        scales = numpy.divide(pixel_sums, bin_sums, out=numpy.ones_like(pixel_sums), where=bin_sums != 0)
+        return xs, fit_ranges, es, binned_yss.astype(dtype or numpy.float64, copy=False), bin_indexes, scales
+
+    def __iterate_binned_fits(self,
+                              spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                              eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
+                              fit_intervals: typing.Sequence[BackgroundInterval],
+                              background_interval: BackgroundInterval,
+                              navigation_slices: typing.Sequence[slice],
+                              fit_fn: FitFunctionType,
+                              fit_quality: bool,
+                              dtype: typing.Optional[numpy.typing.DTypeLike],
+                              binning: int) -> typing.Iterator[typing.Tuple[slice, DataArrayType, DataArrayType, typing.Optional[DataArrayType]]]:
+        # the binned version of __iterate_fits. fit_fn must be linear in the intensity, as fits and integrals are.
+        spectra = numpy.reshape(spectrum_xdata._data_ex, (-1, spectrum_xdata.data_shape[-1]))
+        xs, fit_ranges, es, binned_yss, bin_indexes, scales = self.__get_binned_fit_inputs(spectrum_xdata, eels_spectrum_xdata, fit_intervals, dtype, binning)
+        fs = self.__get_background_domain(spectrum_xdata, background_interval)[0]
+        binned_fit = fit_fn(xs, binned_yss, fs, es)
+        binned_fit_window_fit = self._perform_fits(xs, binned_yss, xs, es) if fit_quality else None
+        fit_window_buffer = FitWindowBuffer(fit_ranges, dtype)
+        for navigation_slice in navigation_slices:
+            spectra_block = spectra[navigation_slice]
+            block_bin_indexes = bin_indexes[navigation_slice]
+            block_scales = scales[navigation_slice].astype(binned_fit.dtype, copy=False)
+            fit = binned_fit[block_bin_indexes] * numpy.reshape(block_scales, (-1,) + (1,) * (binned_fit.ndim - 1))
+            quality = None
+            if binned_fit_window_fit is not None:
+                fit_window_fit = binned_fit_window_fit[block_bin_indexes] * block_scales[:, numpy.newaxis]
+                quality = get_fit_quality(fit_window_buffer.gather(spectra_block), fit_window_fit)
+            yield navigation_slice, spectra_block, fit, quality
+
+    def __fit_background(self,
+                         spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                         eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata],
+                         fit_intervals: typing.Sequence[BackgroundInterval],
+                         background_interval: BackgroundInterval,
+                         chunk_size: typing.Optional[int] = None,
+                         fit_quality: bool = False,
+                         dtype: typing.Optional[numpy.typing.DTypeLike] = None,
+                         binning: int = 1) -> typing.Tuple[DataAndMetadata.DataAndMetadata, typing.Optional[DataArrayType]]:
+        # return the background and, if fit_quality is requested, the fit quality with shape (m,3), or (3) for a spectrum.
+        fs, calibration = self.__get_background_domain(spectrum_xdata, background_interval)
+        fit_quality_data: typing.Optional[DataArrayType] = None
         if spectrum_xdata.is_navigable:
-            calibrations = list(copy.deepcopy(spectrum_xdata.navigation_dimensional_calibrations)) + [calibration]
-            yss = numpy.reshape(ys, (numpy.prod(ys.shape[:-1], dtype=numpy.uint64),) + (ys.shape[-1],))
-            fit_data = self._perform_fits(xs, yss, fs, es)
-            data_descriptor = DataAndMetadata.DataDescriptor(False, spectrum_xdata.navigation_dimension_count,
-                                                             spectrum_xdata.datum_dimension_count)
-            background_xdata = DataAndMetadata.new_data_and_metadata(numpy.reshape(fit_data, ys.shape[:-1] + (n,)),
-                                                                     data_descriptor=data_descriptor,
-                                                                     dimensional_calibrations=calibrations,
-                                                                     intensity_calibration=spectrum_xdata.intensity_calibration)
+            # write each block into a preallocated output so that the peak memory is set by the chunk size.
+            fit_data: typing.Optional[DataArrayType] = None
+            for navigation_slice, spectra, fit, fit_quality_block in self.__iterate_fits(spectrum_xdata, eels_spectrum_xdata, fit_intervals, background_interval, chunk_size, fit_quality=fit_quality, dtype=dtype, binning=binning):
+                if fit_data is None:
+                    fit_data = numpy.empty((numpy.prod(spectrum_xdata.navigation_dimension_shape, dtype=numpy.uint64),) + fs.shape, fit.dtype)
+                fit_data[navigation_slice] = fit
+                fit_quality_data = self.__store_fit_quality(spectrum_xdata, fit_quality_data, navigation_slice, fit_quality_block)
+            assert fit_data is not None
+            background_xdata = self.__new_navigable_xdata(spectrum_xdata, fit_data, calibration)
         else:
-            poly_data = self._perform_fit(xs, ys, fs)
+            # fit polynomial to the data
+            xs: DataArrayType = numpy.concatenate([get_calibrated_interval_domain(spectrum_xdata, fit_interval) for fit_interval in fit_intervals], dtype=numpy.float32)
+            fit_ranges = [get_interval_pixel_range(spectrum_xdata.data_shape[-1], fit_interval) for fit_interval in fit_intervals]
+            ys = gather_fit_windows(spectrum_xdata._data_ex, fit_ranges).astype(dtype or spectrum_xdata.data_dtype, copy=False)
+            if fit_quality:
+                fit = self._perform_fit(xs, ys, numpy.concatenate([fs, xs]))
+                poly_data = fit[:fs.shape[-1]]
+                fit_quality_data = get_fit_quality(ys, fit[fs.shape[-1]:])
+            else:
+                poly_data = self._perform_fit(xs, ys, fs)
             background_xdata = DataAndMetadata.new_data_and_metadata(poly_data, dimensional_calibrations=[calibration],
                                                                      intensity_calibration=spectrum_xdata.intensity_calibration)
-        return background_xdata
+        return background_xdata, fit_quality_data
 
     def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
         # xs will be a set of x-values with shape (L) representing the energies at which to fit
@@ -141,11 +579,52 @@ class AbstractBackgroundModel:
         # fs will be an array of x-values with shape (n) representing energies at which to generate fitted data
         # return an ndarray of the fit with shape (m,n)
         # implement at least one of _perform_fits and _perform_fit
-        yss_shape = yss.shape[:-1]
-        fit = numpy.empty(yss_shape + fs.shape)
-        for index in numpy.ndindex(*yss_shape):
-            fit[index] = self._perform_fit(xs, yss[index], fs)
-        return fit
+        fit_executor = self.fit_executor or FitExecutor.get_default_executor()
+        return fit_executor.map_spectra(self, functools.partial(_perform_fit_for_spectrum, self, xs, fs), yss, fs.shape, get_float_dtype(yss.dtype))
+
+    def _perform_integrals(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType], ws: DataArrayType) -> DataArrayType:
+        # xs, yss, fs, es are the same as for _perform_fits
+        # ws will be an array of quadrature weights with shape (n) to apply to the fit at fs, or (n,k) for k integrals
+        # return an ndarray of the integrated fit with shape (m), or (m,k)
+        # the default evaluates _perform_fits in blocks of integration_block_size spectra so memory is bounded by the
+        # block; override with a closed form where the model allows it.
+        integrals = numpy.empty(yss.shape[:1] + ws.shape[1:], dtype=numpy.result_type(yss.dtype, ws.dtype))
+        navigation_slices = list(iterate_navigation_chunks(yss.shape[0], self.integration_block_size))
+        if (es is None or es.ndim == 1) and not self.fits_are_independent and len(navigation_slices) > 1:
+            # the fit of each block must depend on all of the spectra, not only those of the block.
+            es = self._get_fit_reference(lambda: (yss[navigation_slice] for navigation_slice in navigation_slices), es).astype(yss.dtype, copy=False)
+        for navigation_slice in navigation_slices:
+            integrals[navigation_slice] = self._perform_fits(xs, yss[navigation_slice], fs, es) @ ws
+        return integrals
+
+    def _get_fit_reference(self, iterate_fit_windows: typing.Callable[[], typing.Iterator[DataArrayType]], es: typing.Optional[DataArrayType] = None) -> DataArrayType:
+        # iterate_fit_windows returns an iterator over the fit windows of all spectra in blocks with shape (b,L); it may
+        # be called for several passes over the data.
+        # es is the fit windows of the reference spectrum given by the caller with shape (L), if any.
+        # return the reference passed as es to _perform_fits when the spectra are fitted in blocks. only used by models
+        # which are not fits_are_independent. the default is es, or the mean fit window spectrum with shape (L).
+        if es is not None:
+            return es
+        es_sum: typing.Optional[DataArrayType] = None
+        count = 0
+        for yss in iterate_fit_windows():
+            block_sum = numpy.asarray(numpy.sum(yss, axis=0, dtype=numpy.float64))
+            es_sum = es_sum + block_sum if es_sum is not None else block_sum
+            count += yss.shape[0]
+        assert es_sum is not None
+        return es_sum / count
+
+    def _perform_coefficient_fits(self, xs: DataArrayType, yss: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # xs, yss, es are the same as for _perform_fits
+        # return an ndarray of the model parameters with shape (m,p) from which _evaluate_coefficients generates the fit
+        # implement both _perform_coefficient_fits and _evaluate_coefficients to support coefficient maps
+        raise NotImplementedError()
+
+    def _evaluate_coefficients(self, coefficients: DataArrayType, fs: DataArrayType) -> DataArrayType:
+        # coefficients will be an array of model parameters with shape (m,p) from _perform_coefficient_fits
+        # fs will be an array of x-values with shape (n) representing energies at which to generate fitted data
+        # return an ndarray of the fit with shape (m,n)
+        raise NotImplementedError()
 
     def _perform_fit(self, xs: DataArrayType, ys: DataArrayType, fs: DataArrayType) -> DataArrayType:
         # xs will be a set of x-values with shape (L) representing the energies at which to fit
@@ -157,24 +636,270 @@ class AbstractBackgroundModel:
         return numpy.reshape(self._perform_fits(xs, numpy.reshape(ys, (1,) + ys.shape), fs, None), fs.shape)
 
 
+class BackgroundCoefficientMap:
+    """The per-spectrum parameters of a background fit, from which the background spectra are generated on demand.
+
+    A linear or power law background needs two or three parameters per spectrum instead of a value for every channel
+    of the background interval. The coefficients have shape (navigation shape) + (p). The background domain fs and its
+    calibration are those of the background returned by fit_background. The optional scales, with the navigation
+    shape, multiply the background of each spectrum, as for binned fits.
+    """
+
+    def __init__(self, background_model_id: str, coefficients: DataArrayType, fs: DataArrayType,
+                 calibration: Calibration.Calibration,
+                 navigation_dimensional_calibrations: typing.Sequence[Calibration.Calibration],
+                 intensity_calibration: typing.Optional[Calibration.Calibration] = None,
+                 scales: typing.Optional[DataArrayType] = None) -> None:
+        self.background_model_id = background_model_id
+        self.coefficients = coefficients
+        self.scales = scales
+        self.fs = fs
+        self.calibration = copy.deepcopy(calibration)
+        self.navigation_dimensional_calibrations = list(copy.deepcopy(navigation_dimensional_calibrations))
+        self.intensity_calibration = copy.deepcopy(intensity_calibration) if intensity_calibration else Calibration.Calibration()
+
+    @property
+    def background_model(self) -> AbstractBackgroundModel:
+        return find_background_model_by_id(self.background_model_id)
+
+    @property
+    def navigation_dimension_shape(self) -> typing.Tuple[int, ...]:
+        return typing.cast(typing.Tuple[int, ...], self.coefficients.shape[:-1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.coefficients.nbytes + self.fs.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def __evaluate(self, navigation_key: typing.Any) -> DataArrayType:
+        # evaluate the coefficients selected by navigation_key in blocks, returning backgrounds with shape (...,n).
+        background_model = self.background_model
+        coefficients = self.coefficients[navigation_key]
+        coefficients_2d = numpy.reshape(coefficients, (-1, coefficients.shape[-1]))
+        background_data = numpy.empty((coefficients_2d.shape[0],) + self.fs.shape, dtype=numpy.float64)
+        for navigation_slice in iterate_navigation_chunks(coefficients_2d.shape[0], background_model.integration_block_size):
+            background_data[navigation_slice] = background_model._evaluate_coefficients(coefficients_2d[navigation_slice], self.fs)
+        if self.scales is not None:
+            background_data *= numpy.reshape(self.scales[navigation_key], (-1, 1))
+        return numpy.reshape(background_data, coefficients.shape[:-1] + self.fs.shape)
+
+    def get_background(self, navigation_slices: typing.Sequence[typing.Union[int, slice]] = ()) -> DataAndMetadata.DataAndMetadata:
+        """Return the background for the navigation region given by an integer index or a slice per navigation axis.
+
+        Missing trailing axes are taken whole. Integer indexes remove the axis, like numpy indexing.
+        """
+        navigation_shape = self.navigation_dimension_shape
+        assert len(navigation_slices) <= len(navigation_shape)
+        navigation_key = tuple(navigation_slices) + (slice(None),) * (len(navigation_shape) - len(navigation_slices))
+        calibrations = list()
+        for navigation_index, length, calibration in zip(navigation_key, navigation_shape, self.navigation_dimensional_calibrations):
+            if isinstance(navigation_index, slice):
+                start, stop, step = navigation_index.indices(length)
+                calibrations.append(Calibration.Calibration(calibration.convert_to_calibrated_value(start), calibration.scale * step, calibration.units))
+        background_data = self.__evaluate(navigation_key)
+        return DataAndMetadata.new_data_and_metadata(background_data,
+                                                     intensity_calibration=self.intensity_calibration,
+                                                     dimensional_calibrations=calibrations + [self.calibration],
+                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, len(calibrations), 1))
+
+    def get_masked_background(self, mask: DataArrayType) -> DataAndMetadata.DataAndMetadata:
+        """Return the sum of the backgrounds in the navigation mask, matching a pick of the background by the mask."""
+        assert mask.shape == self.navigation_dimension_shape
+        background_data = numpy.sum(self.__evaluate(mask.astype(bool)), axis=0)
+        return DataAndMetadata.new_data_and_metadata(background_data, intensity_calibration=self.intensity_calibration,
+                                                     dimensional_calibrations=[self.calibration])
+
+
+PlanType = typing.TypeVar("PlanType")
+
+
+class FitPlanCache(typing.Generic[PlanType]):
+    """A thread safe cache of fit plans with least-recently-used eviction.
+
+    Fit plans hold the matrices which depend only on the fit abscissae and model parameters, so that repeated fits with
+    the same fit windows (for instance while the user drags the signal interval) skip the setup.
+    """
+
+    def __init__(self, max_size: int = 16) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__plans: collections.OrderedDict[typing.Hashable, PlanType] = collections.OrderedDict()
+        self.__lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.__plans)
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # locks are not picklable; models sent to a worker process start with an empty cache.
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        self.__init__(**state)  # type: ignore[misc]
+
+    def get_plan(self, key: typing.Hashable, plan_fn: typing.Callable[[], PlanType]) -> PlanType:
+        with self.__lock:
+            plan = self.__plans.get(key)
+            if plan is not None:
+                self.__plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+            plan = plan_fn()
+            self.__plans[key] = plan
+            while len(self.__plans) > self.max_size:
+                self.__plans.popitem(last=False)
+            return plan
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__plans.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def get_array_key(array: DataArrayType) -> typing.Tuple[str, typing.Tuple[int, ...], bytes]:
+    return array.dtype.str, array.shape, array.tobytes()
+
+
+class PolynomialFitPlan:
+    """The pseudo-inverse and evaluation matrices of a polynomial fit with fixed fit and evaluation abscissae.
+
+    The polynomial is fitted in the abscissa u = (transform(x) - center) / scale, where center and scale map the
+    transformed fit energies onto [-1, 1]. The log of the energies spans a small range far from zero, so this keeps the
+    Vandermonde matrix well conditioned and the fit accurate in float32. The coefficients are those of u, lowest
+    degree first; power_basis_matrix converts them to coefficients of transform(x). The pseudo-inverse is computed on
+    the column scaled Vandermonde matrix, in the same way as numpy.polynomial.polynomial.polyfit.
+
+    Weighted fits cannot share a pseudo-inverse since the weights differ per spectrum. For those the plan holds a
+    batched least squares solver of the scaled Vandermonde matrix, which solves the normal equations of each spectrum.
+    """
+
+    def __init__(self, xs: DataArrayType, fs: DataArrayType, deg: int,
+                 transform: typing.Optional[typing.Callable[[DataArrayType], DataArrayType]] = None) -> None:
+        transform_data = transform or (lambda x: x)
+        txs = numpy.asarray(transform_data(xs), dtype=numpy.float64)
+        self.center = float((numpy.amax(txs) + numpy.amin(txs)) / 2)
+        self.scale = float((numpy.amax(txs) - numpy.amin(txs)) / 2) or 1.0
+        # power_basis_matrix has shape (deg+1,deg+1) such that coefficients @ power_basis_matrix are the coefficients
+        # of transform(x): u**k = sum over j of binomial(k, j) * (-center)**(k-j) / scale**k * transform(x)**j
+        self.power_basis_matrix: DataArrayType = numpy.zeros((deg + 1, deg + 1))
+        for k in range(deg + 1):
+            for j in range(k + 1):
+                self.power_basis_matrix[k, j] = scipy.special.comb(k, j) * (-self.center) ** (k - j) / self.scale ** k
+        vandermonde = numpy.polynomial.polynomial.polyvander((txs - self.center) / self.scale, deg)
+        column_scale = numpy.sqrt(numpy.sum(numpy.square(vandermonde), axis=0))
+        column_scale[column_scale == 0] = 1
+        self.column_scale: DataArrayType = column_scale
+        self.scaled_vandermonde: DataArrayType = vandermonde / column_scale
+        self.weighted_solver = LeastSquares.BatchedLeastSquares(self.scaled_vandermonde)
+        rcond = xs.shape[-1] * numpy.finfo(numpy.float64).eps
+        # fit_matrix has shape (L,deg+1) such that coefficients = ys @ fit_matrix
+        self.fit_matrix: DataArrayType = numpy.transpose(numpy.linalg.pinv(vandermonde / column_scale, rcond=rcond) / column_scale[:, numpy.newaxis])
+        # evaluation_matrix has shape (deg+1,n) such that fit = coefficients @ evaluation_matrix
+        tfs = numpy.asarray(transform_data(fs), dtype=numpy.float64)
+        self.evaluation_matrix: DataArrayType = numpy.transpose(numpy.polynomial.polynomial.polyvander((tfs - self.center) / self.scale, deg))
+        # projection_matrix has shape (L,n) such that fit = ys @ projection_matrix, a single matmul over all spectra
+        self.projection_matrix: DataArrayType = self.fit_matrix @ self.evaluation_matrix
+        # power_fit_matrix has shape (L,deg+1) such that ys @ power_fit_matrix are the coefficients of transform(x)
+        self.power_fit_matrix: DataArrayType = self.fit_matrix @ self.power_basis_matrix
+        self.__matrices_by_dtype: typing.Dict[typing.Tuple[str, numpy.dtype[typing.Any]], DataArrayType] = dict()
+
+    def get_matrix(self, name: str, dtype: numpy.typing.DTypeLike) -> DataArrayType:
+        # return the named matrix in dtype, converting it once. the matrices are computed in float64.
+        key = (name, numpy.dtype(dtype))
+        matrix = self.__matrices_by_dtype.get(key)
+        if matrix is None:
+            matrix = numpy.asarray(getattr(self, name), dtype=dtype)
+            self.__matrices_by_dtype[key] = matrix
+        return matrix
+
+    def get_weighted_coefficients(self, ys: DataArrayType, weights: DataArrayType) -> DataArrayType:
+        # ys and weights will be arrays with shape (m,L)
+        # return the coefficients with shape (m,deg+1) minimizing the weighted squared residuals of each spectrum
+        # the weights are the square roots of the inverse variances. the normal equations are formed and solved in the
+        # dtype of ys. non-finite channels are excluded, and spectra with fewer positive weights than coefficients
+        # have NaN coefficients.
+        coefficients = self.weighted_solver.fit(ys, weights, dtype=ys.dtype)
+        return typing.cast(DataArrayType, coefficients / self.get_matrix("column_scale", ys.dtype))
+
+
 class PolynomialBackgroundModel(AbstractBackgroundModel):
+    # weighted fits use Poisson statistics for the weights: the inverse variance of log(y) is y when the data is
+    # transformed (the log transform), and the inverse variance of y is 1 / y otherwise. the fit is computed in the
+    # centered and scaled abscissa of the fit plan, which keeps the normal equations well conditioned in float32.
+    computes_in_float32 = True
 
     def __init__(self, background_model_id: str, deg: int,
                  transform: typing.Optional[typing.Callable[[DataArrayType], DataArrayType]] = None,
                  untransform: typing.Optional[typing.Callable[[DataArrayType], DataArrayType]] = None,
-                 title: typing.Optional[str] = None) -> None:
+                 title: typing.Optional[str] = None, weighted: bool = False) -> None:
         super().__init__(background_model_id, title)
         self.deg = deg
         self.transform = transform
         self.untransform = untransform
+        self.weighted = weighted
+        self.fit_plan_cache = FitPlanCache[PolynomialFitPlan]()
+
+    @property
+    def capabilities(self) -> ModelCapabilities.ModelCapabilities:
+        # the integral is only closed form for the unweighted fit with a linear untransform.
+        return dataclasses.replace(super().capabilities, analytic_integrals=not (self.untransform or self.weighted))
+
+    def get_fit_plan(self, xs: DataArrayType, fs: DataArrayType) -> PolynomialFitPlan:
+        key = (get_array_key(xs), get_array_key(fs), self.deg, self.transform)
+        return self.fit_plan_cache.get_plan(key, functools.partial(PolynomialFitPlan, xs, fs, self.deg, self.transform))
 
     def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # the fit is computed in the dtype of yss (float32 or float64).
+        dtype = get_float_dtype(yss.dtype)
         transform_data = self.transform or (lambda x: x)
         untransform_data = self.untransform or (lambda x: x)
-        coefficients = numpy.polynomial.polynomial.polyfit(transform_data(xs), transform_data(yss.transpose()), self.deg)  # type: ignore
-        fit = untransform_data(numpy.polynomial.polynomial.polyval(transform_data(fs), coefficients))  # type: ignore
+        fit_plan = self.get_fit_plan(xs, fs)
+        with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if self.weighted:
+                fit = untransform_data(self.get_weighted_coefficients(xs, yss, fit_plan) @ fit_plan.get_matrix("evaluation_matrix", dtype))
+            else:
+                fit = untransform_data(transform_data(yss.astype(dtype, copy=False)) @ fit_plan.get_matrix("projection_matrix", dtype))
         return numpy.where(numpy.isfinite(fit), fit, 0)
 
+    def get_weighted_coefficients(self, xs: DataArrayType, yss: DataArrayType, fit_plan: typing.Optional[PolynomialFitPlan] = None) -> DataArrayType:
+        # return the Poisson weighted coefficients of the fit plan abscissa with shape (m,deg+1), in the dtype of yss.
+        # the weights are the square roots of the inverse variances; channels without a finite transform get no weight.
+        transform_data = self.transform or (lambda x: x)
+        fit_plan = fit_plan or self.get_fit_plan(xs, xs[:1])
+        yss = yss.astype(get_float_dtype(yss.dtype), copy=False)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            weights = numpy.sqrt(numpy.maximum(yss, 0)) if self.transform else 1 / numpy.sqrt(numpy.maximum(yss, 1))
+            return fit_plan.get_weighted_coefficients(transform_data(yss), weights)
+
+    def _perform_coefficient_fits(self, xs: DataArrayType, yss: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # the coefficients are those of the polynomial in the transformed space, lowest degree first. they are always
+        # float64 since the power basis is poorly conditioned in float32.
+        fit_plan = self.get_fit_plan(xs, xs[:1])
+        if self.weighted:
+            return self.get_weighted_coefficients(xs, yss, fit_plan).astype(numpy.float64) @ fit_plan.power_basis_matrix
+        transform_data = self.transform or (lambda x: x)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return typing.cast(DataArrayType, transform_data(yss.astype(numpy.float64)) @ fit_plan.power_fit_matrix)
+
+    def _evaluate_coefficients(self, coefficients: DataArrayType, fs: DataArrayType) -> DataArrayType:
+        transform_data = self.transform or (lambda x: x)
+        untransform_data = self.untransform or (lambda x: x)
+        evaluation_matrix = numpy.transpose(numpy.polynomial.polynomial.polyvander(numpy.asarray(transform_data(fs), dtype=numpy.float64), self.deg))
+        with numpy.errstate(invalid="ignore", over="ignore"):
+            fit = untransform_data(coefficients @ evaluation_matrix)
+        return numpy.where(numpy.isfinite(fit), fit, 0)
+
+    def _perform_integrals(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType], ws: DataArrayType) -> DataArrayType:
+        if self.untransform or self.weighted:
+            return super()._perform_integrals(xs, yss, fs, es, ws)
+        # the fit is linear in the data, so the integral is the data projected onto a single vector with shape (L), or (L,k).
+        dtype = get_float_dtype(yss.dtype)
+        transform_data = self.transform or (lambda x: x)
+        with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            integrals = transform_data(yss.astype(dtype, copy=False)) @ (self.get_fit_plan(xs, fs).projection_matrix @ ws).astype(dtype)
+        return numpy.where(numpy.isfinite(integrals), integrals, 0)
+
     def __unused_perform_fit(self, xs: DataArrayType, ys: DataArrayType, fs: DataArrayType) -> DataArrayType:
         # here an an example of using numpy.polynomial.polynomial.Polynomial.fit for when it supports evaluating arrays
         transform_data = self.transform or (lambda x: x)
@@ -186,6 +911,7 @@ class PolynomialBackgroundModel(AbstractBackgroundModel):
 class TwoAreaBackgroundModel(AbstractBackgroundModel):
     # Fit power law or exponential background model using the two-area method described in Egerton chapter 4.
     # This approximation is slightly faster than the polynomial fit for mapping large SI, and may perform better for high-noise spectra.
+    computes_in_float32 = True
 
     def __init__(self,
                  background_model_id: str,
@@ -198,7 +924,8 @@ class TwoAreaBackgroundModel(AbstractBackgroundModel):
         self.model_func = model_func
         self.params_func = params_func
 
-    def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+    def _perform_coefficient_fits(self, xs: DataArrayType, yss: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # the coefficients are the parameters of model_func, such as the amplitude and exponent of the power law.
         half_interval = len(xs) // 2
         x_interval_1 = xs[:half_interval]
         x_interval_2 = xs[half_interval:2 * half_interval]
@@ -208,9 +935,13 @@ class TwoAreaBackgroundModel(AbstractBackgroundModel):
         x_center = xs[half_interval]
         x_end = xs[-1]
         params = self.params_func(x_interval_1, x_interval_2, y_interval_1, y_interval_2, x_start, x_center, x_end)
-        xs_tiled = numpy.transpose(numpy.tile(fs, (len(yss), 1)))
-        series = numpy.transpose(self.model_func(xs_tiled, *params))
-        return series
+        return numpy.stack(params, axis=-1)
+
+    def _evaluate_coefficients(self, coefficients: DataArrayType, fs: DataArrayType) -> DataArrayType:
+        return self.model_func(fs, *(coefficients[:, i:i + 1] for i in range(coefficients.shape[-1])))
+
+    def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        return self._evaluate_coefficients(self._perform_coefficient_fits(xs, yss, es), fs)
 
 
 def power_law(e0: float, x: DataArrayType, a: float, b: float) -> DataArrayType:
@@ -218,6 +949,8 @@ def power_law(e0: float, x: DataArrayType, a: float, b: float) -> DataArrayType:
 
 
 class FittedPowerLawBackgroundModel(AbstractBackgroundModel):
+    # the power law exponent is fitted to the mean spectrum
+    fits_are_independent = False
 
     def __init__(self, background_model_id: str, title: typing.Optional[str] = None) -> None:
         super().__init__(background_model_id, title)
@@ -236,9 +969,184 @@ class FittedPowerLawBackgroundModel(AbstractBackgroundModel):
         amplitudes = numpy.sum(global_model_fit_normed * yss, axis=1)  # this is the "fit"
         fit = numpy.reshape(numpy.tile(global_model_normed, yss.shape[0]), [yss.shape[0], fs.shape[0]])
         fit = numpy.transpose(amplitudes*numpy.transpose(fit))
+        return numpy.where(numpy.isfinite(fit), fit, 0).astype(get_float_dtype(yss.dtype), copy=False)
+
+
+class NonlinearPowerLawBackgroundModel(AbstractBackgroundModel):
+    """Fit the power law A * E^-r to each spectrum by least squares on the intensities (not their logarithms).
+
+    All spectra are solved together with a vectorized Levenberg-Marquardt iteration seeded from the log-log linear fit.
+    Each spectrum has its own damping factor and leaves the iteration once its cost stops decreasing by more than the
+    relative tolerance. The amplitude is parameterized as a logarithm at the first fit energy to keep it positive and
+    well conditioned.
+    """
+
+    def __init__(self, background_model_id: str, max_iterations: int = 50, tolerance: float = 1E-9,
+                 title: typing.Optional[str] = None) -> None:
+        super().__init__(background_model_id, title)
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.fit_plan_cache = FitPlanCache[PolynomialFitPlan]()
+
+    def fit_power_law_parameters(self, xs: DataArrayType, yss: DataArrayType) -> typing.Tuple[DataArrayType, DataArrayType, float]:
+        # xs will be a set of x-values with shape (L) representing the energies at which to fit
+        # yss will be an array of y-values with shape (m,L)
+        # return the log amplitudes at e0 with shape (m), the exponents r with shape (m), and the reference energy e0.
+        # spectra which cannot be fitted have non-finite parameters.
+        e0 = float(xs[0])
+        lx = numpy.log(numpy.asarray(xs, dtype=numpy.float64) / e0)
+        ys = numpy.asarray(yss, dtype=numpy.float64)
+        # seed from the linear fit of log(y) against log(x)
+        fit_plan = self.fit_plan_cache.get_plan((get_array_key(xs), 1, numpy.log), functools.partial(PolynomialFitPlan, xs, xs[:1], 1, numpy.log))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            coefficients = numpy.log(ys) @ fit_plan.power_fit_matrix
+        log_amplitudes = coefficients[:, 0] + coefficients[:, 1] * numpy.log(e0)
+        exponents = -coefficients[:, 1]
+        active = numpy.isfinite(log_amplitudes) & numpy.isfinite(exponents)
+        log_amplitudes[~active] = numpy.nan
+        exponents[~active] = numpy.nan
+        damping = numpy.full(ys.shape[:1], 1E-3)
+        cost = numpy.full(ys.shape[:1], numpy.inf)
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            indexes = numpy.flatnonzero(active)
+            cost[indexes] = numpy.sum(numpy.square(ys[indexes] - numpy.exp(log_amplitudes[indexes, numpy.newaxis] - exponents[indexes, numpy.newaxis] * lx)), axis=-1)
+            for _ in range(self.max_iterations):
+                indexes = numpy.flatnonzero(active)
+                if not indexes.size:
+                    break
+                b = log_amplitudes[indexes]
+                r = exponents[indexes]
+                d = damping[indexes]
+                y = ys[indexes]
+                f = numpy.exp(b[:, numpy.newaxis] - r[:, numpy.newaxis] * lx)
+                residuals = y - f
+                # jacobian of f with respect to (b, r) is (f, -f * lx). solve the damped 2x2 normal equations directly.
+                f2 = numpy.square(f)
+                h00 = numpy.sum(f2, axis=-1)
+                h01 = -numpy.sum(f2 * lx, axis=-1)
+                h11 = numpy.sum(f2 * numpy.square(lx), axis=-1)
+                g0 = numpy.sum(f * residuals, axis=-1)
+                g1 = -numpy.sum(f * lx * residuals, axis=-1)
+                a00 = h00 * (1 + d)
+                a11 = h11 * (1 + d)
+                determinant = a00 * a11 - numpy.square(h01)
+                next_b = b + (a11 * g0 - h01 * g1) / determinant
+                next_r = r + (a00 * g1 - h01 * g0) / determinant
+                next_cost = numpy.sum(numpy.square(y - numpy.exp(next_b[:, numpy.newaxis] - next_r[:, numpy.newaxis] * lx)), axis=-1)
+                improved = numpy.isfinite(next_cost) & (next_cost < cost[indexes])
+                converged = (cost[indexes] - numpy.where(improved, next_cost, cost[indexes])) <= self.tolerance * cost[indexes]
+                accepted = indexes[improved]
+                log_amplitudes[accepted] = next_b[improved]
+                exponents[accepted] = next_r[improved]
+                cost[accepted] = next_cost[improved]
+                damping[indexes] = numpy.where(improved, d / 10, d * 10)
+                # a rejected step only means the damping was too small, unless the damping is already very large.
+                active[indexes[(improved & converged) | (damping[indexes] > 1E12)]] = False
+        return log_amplitudes, exponents, e0
+
+    def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # the parameters are always fitted in float64; the fit is returned in the dtype of yss.
+        log_amplitudes, exponents, e0 = self.fit_power_law_parameters(xs, yss)
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            fit = numpy.exp(log_amplitudes[:, numpy.newaxis] - exponents[:, numpy.newaxis] * numpy.log(numpy.asarray(fs, dtype=numpy.float64) / e0))
+        return numpy.where(numpy.isfinite(fit), fit, 0).astype(get_float_dtype(yss.dtype), copy=False)
+
+    def _perform_coefficient_fits(self, xs: DataArrayType, yss: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        # the coefficients are the log amplitude at 1 eV and the exponent, independent of the fit energies.
+        log_amplitudes, exponents, e0 = self.fit_power_law_parameters(xs, yss)
+        return numpy.stack([log_amplitudes + exponents * numpy.log(e0), exponents], axis=-1)
+
+    def _evaluate_coefficients(self, coefficients: DataArrayType, fs: DataArrayType) -> DataArrayType:
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            fit = numpy.exp(coefficients[:, :1] - coefficients[:, 1:] * numpy.log(numpy.asarray(fs, dtype=numpy.float64)))
         return numpy.where(numpy.isfinite(fit), fit, 0)
 
 
+def get_principal_components(iterate_blocks: typing.Callable[[], typing.Iterator[DataArrayType]], length: int, count: int,
+                             oversampling: int = 8, power_iterations: int = 2, seed: int = 0) -> typing.Tuple[DataArrayType, DataArrayType]:
+    """Return the first count principal axes, with shape (count,length), and their singular values, with shape (count).
+
+    The axes are those of the rows of the (centered) blocks returned by iterate_blocks, each with shape (b,length). The
+    truncated SVD is randomized: the range of the Gram matrix is found from a random subspace of count + oversampling
+    vectors refined by power iterations, and the axes are its Ritz vectors. The Gram matrix is never formed, so the
+    memory is set by the block size and each iteration is one pass over the blocks.
+    """
+    rank = min(count + oversampling, length)
+    basis = numpy.random.default_rng(seed).standard_normal((length, rank))
+    for _ in range(power_iterations + 1):
+        gram_basis = numpy.zeros((length, rank))
+        for yss in iterate_blocks():
+            gram_basis += yss.T @ (yss @ basis)
+        basis = numpy.linalg.qr(gram_basis)[0]
+    projected_gram = numpy.zeros((rank, rank))
+    for yss in iterate_blocks():
+        projected = yss @ basis
+        projected_gram += projected.T @ projected
+    eigenvalues, eigenvectors = numpy.linalg.eigh(projected_gram)
+    order = numpy.argsort(eigenvalues)[::-1][:count]
+    return numpy.transpose(basis @ eigenvectors[:, order]), numpy.sqrt(numpy.maximum(eigenvalues[order], 0))
+
+
+class PrincipalComponentBackgroundModel(AbstractBackgroundModel):
+    """Fit the background of the first principal components of the fit windows instead of each spectrum.
+
+    The fit window spectra are approximated by their mean plus a combination of the first component_count principal
+    components. The base model fits the mean and, by central differences, the change of the background along each
+    component. The background of each spectrum is the background of the mean plus the combination of the component
+    backgrounds given by its scores, so the base model fits 2 * component_count + 1 spectra however many spectra there
+    are, and the noise outside the components does not reach the background. The combination is exact for models
+    linear in the intensities and a linearization about the mean spectrum otherwise.
+
+    The reference passed as es holds the mean in the first row and the components in the others, each scaled by the
+    standard deviation of its scores. A reference with shape (L), such as the sum of a pick region, is a reference
+    spectrum used in place of the mean, scaled to the intensity of the mean.
+    """
+    fits_are_independent = False
+
+    def __init__(self, background_model_id: str, base_background_model: AbstractBackgroundModel, component_count: int = 4,
+                 title: typing.Optional[str] = None) -> None:
+        super().__init__(background_model_id, title)
+        self.base_background_model = base_background_model
+        self.component_count = component_count
+
+    def _get_fit_reference(self, iterate_fit_windows: typing.Callable[[], typing.Iterator[DataArrayType]], es: typing.Optional[DataArrayType] = None) -> DataArrayType:
+        mean = super()._get_fit_reference(iterate_fit_windows)
+        if es is not None:
+            # the reference spectrum scaled to the mean, so that a sum of spectra can be given.
+            es = numpy.asarray(es, dtype=numpy.float64)
+            es_total = numpy.sum(es)
+            mean = es * (numpy.sum(mean) / es_total) if es_total != 0 else mean
+        return self.__get_reference(iterate_fit_windows, mean)
+
+    def __get_reference(self, iterate_fit_windows: typing.Callable[[], typing.Iterator[DataArrayType]], mean: DataArrayType) -> DataArrayType:
+        count = sum(yss.shape[0] for yss in iterate_fit_windows())
+        component_count = min(self.component_count, count, mean.shape[-1])
+        mean = numpy.asarray(mean, dtype=numpy.float64)
+        components, singular_values = get_principal_components(lambda: (yss - mean for yss in iterate_fit_windows()), mean.shape[-1], component_count)
+        return numpy.vstack([mean, components * (singular_values / numpy.sqrt(count))[:, numpy.newaxis]])
+
+    def _perform_fits(self, xs: DataArrayType, yss: DataArrayType, fs: DataArrayType, es: typing.Optional[DataArrayType]) -> DataArrayType:
+        if es is None or es.ndim == 1:
+            reference = self._get_fit_reference(lambda: iter((yss,)), es)
+        else:
+            reference = numpy.asarray(es, dtype=numpy.float64)
+        mean, components = reference[0], reference[1:]
+        # the scores are the coefficients of the scaled components; components with no variance have no scores.
+        variances = numpy.sum(numpy.square(components), axis=-1)
+        scores = (yss - mean) @ (components / numpy.where(variances > 0, variances, numpy.inf)[:, numpy.newaxis]).T
+        # step along each component by one standard deviation of its scores, but keep the probe spectra positive for
+        # models fitted to the logarithm of the intensities.
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            steps = numpy.minimum(1.0, 0.5 * numpy.nan_to_num(numpy.amin(numpy.abs(mean) / numpy.abs(components), axis=-1), nan=1.0, posinf=1.0))
+        steps = numpy.where(steps > 0, steps, 1.0)
+        probes = numpy.vstack([mean, mean + steps[:, numpy.newaxis] * components, mean - steps[:, numpy.newaxis] * components])
+        probe_fits = numpy.asarray(self.base_background_model._perform_fits(xs, probes, fs, None), dtype=numpy.float64)
+        k = components.shape[0]
+        component_backgrounds = (probe_fits[1:k + 1] - probe_fits[k + 1:]) / (2 * steps[:, numpy.newaxis])
+        fit = probe_fits[0] + scores @ component_backgrounds
+        return numpy.where(numpy.isfinite(fit), fit, 0).astype(get_float_dtype(yss.dtype), copy=False)
+
+
 def power_law_params(x_interval_1: DataArrayType,
                      x_interval_2: DataArrayType,
                      y_interval_1: DataArrayType,
@@ -267,8 +1175,8 @@ def exponential_params(x_interval_1: DataArrayType,
                        x_end: float) -> typing.Tuple[DataArrayType, DataArrayType]:
     y_log_1 = numpy.log(y_interval_1)
     y_log_2 = numpy.log(y_interval_2)
-    geo_mean_1 = numpy.exp(numpy.mean(y_log_1))
-    geo_mean_2 = numpy.exp(numpy.mean(y_log_2))
+    geo_mean_1 = numpy.exp(numpy.mean(y_log_1, axis=-1))
+    geo_mean_2 = numpy.exp(numpy.mean(y_log_2, axis=-1))
     x1 = (x_start + x_center) / 2
     x2 = (x_center + x_end) / 2
     A = numpy.exp((numpy.log(geo_mean_1) - (x1 / x2) * numpy.log(geo_mean_2)) / (1 - x1 / x2))
@@ -281,33 +1189,56 @@ def exponential_func(x: DataArrayType, A: DataArrayType, tau: DataArrayType) ->
 
 
 # register background models with the registry.
+_background_model_titles = BuiltInModels.BUILT_IN_BACKGROUND_MODEL_TITLES
+
 Registry.register_component(PolynomialBackgroundModel("constant_background_model", 0,
-                                                      title=_("Constant")), {"background-model"})
+                                                      title=_background_model_titles["constant_background_model"]), {"background-model"})
 
 Registry.register_component(PolynomialBackgroundModel("linear_background_model", 1,
-                                                      title=_("Linear")), {"background-model"})
+                                                      title=_background_model_titles["linear_background_model"]), {"background-model"})
 
 Registry.register_component(PolynomialBackgroundModel("power_law_background_model", 1,
-                                                      transform=numpy.log, untransform=numpy.exp, title=_("Power Law")), {"background-model"})
+                                                      transform=numpy.log, untransform=numpy.exp, title=_background_model_titles["power_law_background_model"]), {"background-model"})
+
+Registry.register_component(PolynomialBackgroundModel("power_law_weighted_background_model", 1,
+                                                      transform=numpy.log, untransform=numpy.exp, title=_background_model_titles["power_law_weighted_background_model"],
+                                                      weighted=True), {"background-model"})
 
 Registry.register_component(FittedPowerLawBackgroundModel("power_law_fit_background_model",
-                                                          title=_("Power Law (Uniform)")), {"background-model"})
+                                                          title=_background_model_titles["power_law_fit_background_model"]), {"background-model"})
+
+Registry.register_component(NonlinearPowerLawBackgroundModel("power_law_nonlinear_background_model",
+                                                             title=_background_model_titles["power_law_nonlinear_background_model"]), {"background-model"})
 
 Registry.register_component(PolynomialBackgroundModel("poly2_background_model", 2,
-                                                      title=_("2nd Order Polynomial")), {"background-model"})
+                                                      title=_background_model_titles["poly2_background_model"]), {"background-model"})
 
 Registry.register_component(PolynomialBackgroundModel("poly2_log_background_model", 2, transform=numpy.log, untransform=numpy.exp,
-                                                      title=_("2nd Order Power Law")), {"background-model"})
+                                                      title=_background_model_titles["poly2_log_background_model"]), {"background-model"})
+
+Registry.register_component(PolynomialBackgroundModel("poly2_log_weighted_background_model", 2, transform=numpy.log, untransform=numpy.exp,
+                                                      title=_background_model_titles["poly2_log_weighted_background_model"], weighted=True), {"background-model"})
+
+Registry.register_component(PrincipalComponentBackgroundModel("power_law_pca_background_model",
+                                                              PolynomialBackgroundModel("power_law_background_model", 1, transform=numpy.log, untransform=numpy.exp),
+                                                              title=_background_model_titles["power_law_pca_background_model"]), {"background-model"})
 
 Registry.register_component(TwoAreaBackgroundModel("power_law_two_area_background_model", params_func=power_law_params, model_func=power_law_func,
-                                                   title=_("Power Law Two Area")), {"background-model"})
+                                                   title=_background_model_titles["power_law_two_area_background_model"]), {"background-model"})
 
 Registry.register_component(TwoAreaBackgroundModel("exponential_two_area_background_model", params_func=exponential_params, model_func=exponential_func,
-                                                   title=_("Exponential Two Area")), {"background-model"})
+                                                   title=_background_model_titles["exponential_two_area_background_model"]), {"background-model"})
+
+
+_background_model_index = ModelCapabilities.ModelIndex("background-model", "background_model_id")
+
+
+def get_background_model(background_model_id: str) -> typing.Optional[AbstractBackgroundModel]:
+    return typing.cast(typing.Optional[AbstractBackgroundModel], _background_model_index.get_model(background_model_id))
 
 
 def find_background_model_by_id(background_model_id: str) -> AbstractBackgroundModel:
-    for component in Registry.get_components_by_type("background-model"):
-        if background_model_id == component.background_model_id:
-            return typing.cast(AbstractBackgroundModel, component)
-    raise IndexError()
+    background_model = get_background_model(background_model_id)
+    if background_model is None:
+        raise IndexError()
+    return background_model
@@ -0,0 +1,44 @@
+"""
+    Built-In Models
+
+    The ids and titles of the background and zero loss peak models of this package, declared without importing the
+    models so that they can be listed, for instance to register their Swift entities, before the models are used.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import gettext
+import typing
+
+# third party libraries
+# None
+
+# local libraries
+# None
+
+_ = gettext.gettext
+
+
+# the package title of the models of this package.
+PACKAGE_TITLE = _("EELS Analysis")
+
+# the ids and titles of the models registered by BackgroundModel and PeakModel.
+BUILT_IN_BACKGROUND_MODEL_TITLES: typing.Mapping[str, str] = {
+    "constant_background_model": _("Constant"),
+    "linear_background_model": _("Linear"),
+    "power_law_background_model": _("Power Law"),
+    "power_law_weighted_background_model": _("Power Law (Weighted)"),
+    "power_law_fit_background_model": _("Power Law (Uniform)"),
+    "power_law_nonlinear_background_model": _("Power Law (Nonlinear)"),
+    "poly2_background_model": _("2nd Order Polynomial"),
+    "poly2_log_background_model": _("2nd Order Power Law"),
+    "poly2_log_weighted_background_model": _("2nd Order Power Law (Weighted)"),
+    "power_law_pca_background_model": _("Power Law (Principal Components)"),
+    "power_law_two_area_background_model": _("Power Law Two Area"),
+    "exponential_two_area_background_model": _("Exponential Two Area"),
+}
+
+BUILT_IN_ZERO_LOSS_PEAK_MODEL_TITLES: typing.Mapping[str, str] = {
+    "simple_peak_model": _("Simple"),
+}
@@ -0,0 +1,164 @@
+"""
+    Cross Section Cache
+
+    A bounded least recently used cache of cross-sections keyed on the shell, energy window and beam parameters.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import collections
+import dataclasses
+import math
+import threading
+import typing
+
+# third party libraries
+# None
+
+# local libraries
+# None
+
+
+_ValueType = typing.TypeVar("_ValueType")
+
+CacheKeyType = typing.Tuple[typing.Hashable, ...]
+
+
+@dataclasses.dataclass(frozen=True)
+class CrossSectionCacheStatistics:
+    """The hit and miss counts and the occupancy of a cross-section cache."""
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def round_to_tolerance(value: float, tolerance: float) -> typing.Tuple[int, int]:
+    """Return a hashable key for value rounded to the relative tolerance.
+
+    Values which differ by less than about tolerance times their magnitude give the same key, so that recalibrated or
+    re-entered parameters still hit the cache. A tolerance of zero keys on the exact value.
+    """
+    value = float(value)
+    if value == 0.0 or not math.isfinite(value) or tolerance <= 0.0:
+        return 0, hash(value)
+    # quantize the logarithm of the magnitude so that the rounding is relative over the whole range of values.
+    return (1 if value > 0.0 else -1), round(math.log(abs(value)) / math.log1p(tolerance))
+
+
+class CrossSectionCache:
+    """A thread safe least recently used cache of cross-sections.
+
+    Keys are the atomic number, shell number and subshell index followed by the edge onset, edge delta, beam energy,
+    convergence angle and collection angle; the floating point parameters are rounded to the relative tolerance. Values
+    are computed by the function passed to get_value on a miss. At most max_size values are kept; the least recently
+    used value is dropped when the cache is full.
+
+    The value of a miss is computed outside the lock, so concurrent misses of the same key may compute it more than once.
+    """
+
+    def __init__(self, max_size: int = 256, tolerance: float = 1e-6) -> None:
+        assert max_size >= 0
+        assert tolerance >= 0.0
+        self.__max_size = max_size
+        self.__tolerance = tolerance
+        self.__lock = threading.RLock()
+        self.__values: collections.OrderedDict[CacheKeyType, typing.Any] = collections.OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def tolerance(self) -> float:
+        return self.__tolerance
+
+    def configure(self, *, max_size: typing.Optional[int] = None, tolerance: typing.Optional[float] = None) -> None:
+        """Change the size or the tolerance of the cache.
+
+        Changing the tolerance clears the cache, since existing keys were rounded to the old tolerance.
+        """
+        with self.__lock:
+            if tolerance is not None and tolerance != self.__tolerance:
+                assert tolerance >= 0.0
+                self.__tolerance = tolerance
+                self.__values.clear()
+            if max_size is not None:
+                assert max_size >= 0
+                self.__max_size = max_size
+                self.__trim()
+
+    def make_key(self, kind: str, atomic_number: int, shell_number: int, subshell_index: int,
+                 parameters: typing.Sequence[float]) -> CacheKeyType:
+        return (kind, int(atomic_number), int(shell_number), int(subshell_index)) + tuple(round_to_tolerance(parameter, self.__tolerance) for parameter in parameters)
+
+    def get_value(self, key: CacheKeyType, compute_fn: typing.Callable[[], _ValueType]) -> _ValueType:
+        """Return the value for key, calling compute_fn to compute it if it is not in the cache."""
+        with self.__lock:
+            if key in self.__values:
+                self.__hits += 1
+                self.__values.move_to_end(key)
+                return typing.cast(_ValueType, self.__values[key])
+            self.__misses += 1
+        value = compute_fn()
+        with self.__lock:
+            if self.__max_size > 0:
+                self.__values[key] = value
+                self.__values.move_to_end(key)
+                self.__trim()
+        return value
+
+    def get_values(self, keys: typing.Sequence[CacheKeyType], compute_fn: typing.Callable[[typing.Sequence[int]], typing.Sequence[_ValueType]]) -> typing.List[_ValueType]:
+        """Return the values for keys, calling compute_fn once with the positions of the keys not in the cache.
+
+        compute_fn returns the values for those positions, in the same order, so that they can be computed together.
+        """
+        values: typing.List[typing.Any] = [None] * len(keys)
+        missing_indexes: typing.List[int] = list()
+        with self.__lock:
+            for index, key in enumerate(keys):
+                if key in self.__values:
+                    self.__hits += 1
+                    self.__values.move_to_end(key)
+                    values[index] = self.__values[key]
+                else:
+                    self.__misses += 1
+                    missing_indexes.append(index)
+        if missing_indexes:
+            missing_values = compute_fn(missing_indexes)
+            assert len(missing_values) == len(missing_indexes)
+            with self.__lock:
+                for index, value in zip(missing_indexes, missing_values):
+                    values[index] = value
+                    if self.__max_size > 0:
+                        self.__values[keys[index]] = value
+                        self.__values.move_to_end(keys[index])
+                self.__trim()
+        return values
+
+    def clear(self) -> None:
+        """Drop the cached values. The statistics are kept."""
+        with self.__lock:
+            self.__values.clear()
+
+    def reset_statistics(self) -> None:
+        with self.__lock:
+            self.__hits = 0
+            self.__misses = 0
+
+    @property
+    def statistics(self) -> CrossSectionCacheStatistics:
+        with self.__lock:
+            return CrossSectionCacheStatistics(self.__hits, self.__misses, len(self.__values), self.__max_size)
+
+    def __trim(self) -> None:
+        while len(self.__values) > self.__max_size:
+            self.__values.popitem(last=False)
@@ -0,0 +1,333 @@
+"""
+    Cross Section Table
+
+    Tabulate hydrogenic K-shell double differential cross-sections on a grid of atomic numbers, beam energies,
+    scattering angles and energy losses, store the table in a binary file, and interpolate partial cross-sections from
+    the memory-mapped file.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import dataclasses
+import json
+import math
+import pathlib
+import struct
+import typing
+
+# third party libraries
+import numpy
+import numpy.typing
+import scipy.integrate
+
+# local libraries
+from nion.eels_analysis import EELS_CrossSections
+
+
+DataArrayType = numpy.typing.NDArray[typing.Any]
+
+PathLike = typing.Union[str, pathlib.Path]
+
+# the file starts with the magic bytes and the length of the JSON header, which is followed by the table values
+# aligned to DATA_ALIGNMENT bytes.
+MAGIC = b"NEELSCST"
+FORMAT_VERSION = 1
+DATA_ALIGNMENT = 64
+
+# the Rydberg energy of the hydrogenic model, which scales the energy loss axis of the table.
+RYDBERG_ENERGY_EV = 0.5 * 510999.0 / 137.036 ** 2
+
+ELECTRON_REST_ENERGY_EV = 510999.0
+
+
+def get_hydrogenic_edge_energy_eV(atomic_number: int) -> float:
+    """Return the hydrogenic K-shell ionization energy, Zs^2 Ry, used to scale the energy loss axis of the table."""
+    screenedZ2 = (atomic_number - 0.5) ** 2 if atomic_number > 1 else 1.0
+    return screenedZ2 * RYDBERG_ENERGY_EV
+
+
+def get_beam_momentum(beam_energy_eV: float) -> float:
+    """Return the relativistic momentum of the beam electrons, gamma * beta, in units of the electron rest mass times c."""
+    return math.sqrt(beam_energy_eV * (beam_energy_eV + 2 * ELECTRON_REST_ENERGY_EV)) / ELECTRON_REST_ENERGY_EV
+
+
+@dataclasses.dataclass(frozen=True)
+class CrossSectionTableGrid:
+    """The grid of a cross-section table.
+
+    The scattering angle axis combines theta_log_count angles evenly spaced in their logarithm over theta_range_rad,
+    which resolve the peak of the angular distribution at the characteristic angle, with theta_linear_count angles
+    evenly spaced from 0 to the end of the range, which resolve the Bethe ridge at large angles. These are the angles
+    at the highest beam energy; at lower beam energies the angles are scaled by the inverse of the beam momentum, so
+    that each sample of the axis has the same transverse momentum transfer at every beam energy and the angular
+    structure does not shift between the beam energies being interpolated. The table covers maximum scattering angles
+    (convergence plus collection angle) up to the end of the range at any beam energy. The energy loss axis
+    has energy_count samples evenly spaced in the logarithm of the energy loss relative to the hydrogenic K-shell
+    ionization energy, over energy_ratios. Beam energies are interpolated in their logarithm.
+    """
+    atomic_numbers: typing.Tuple[int, ...] = tuple(range(3, 41))
+    beam_energies_eV: typing.Tuple[float, ...] = (60000.0, 80000.0, 100000.0, 120000.0, 150000.0, 200000.0, 250000.0, 300000.0)
+    theta_range_rad: typing.Tuple[float, float] = (1e-5, 0.25)
+    theta_log_count: int = 96
+    theta_linear_count: int = 300
+    energy_ratios: typing.Tuple[float, float] = (0.5, 8.0)
+    energy_count: int = 64
+
+    def __post_init__(self) -> None:
+        assert len(self.atomic_numbers) > 0 and min(self.atomic_numbers) >= 1
+        assert len(self.beam_energies_eV) > 0 and min(self.beam_energies_eV) > 0
+        assert list(self.beam_energies_eV) == sorted(set(self.beam_energies_eV)), "beam energies must be increasing"
+        assert 0 < self.theta_range_rad[0] < self.theta_range_rad[1]
+        assert self.theta_log_count > 1 and self.theta_linear_count > 1
+        assert 0 < self.energy_ratios[0] < self.energy_ratios[1]
+        assert self.energy_count > 1
+
+    @property
+    def shape(self) -> typing.Tuple[int, ...]:
+        return len(self.atomic_numbers), len(self.beam_energies_eV), self.theta_rad.shape[0], self.energy_count
+
+    @property
+    def theta_rad(self) -> DataArrayType:
+        return numpy.unique(numpy.concatenate([numpy.geomspace(self.theta_range_rad[0], self.theta_range_rad[1], self.theta_log_count),
+                                               numpy.linspace(0.0, self.theta_range_rad[1], self.theta_linear_count)]))
+
+    def get_theta_rad(self, beam_energy_eV: float) -> DataArrayType:
+        """Return the scattering angles of the table at the beam energy."""
+        return typing.cast(DataArrayType, self.theta_rad * (get_beam_momentum(self.beam_energies_eV[-1]) / get_beam_momentum(beam_energy_eV)))
+
+    @property
+    def log_energy_ratios(self) -> DataArrayType:
+        return numpy.linspace(math.log(self.energy_ratios[0]), math.log(self.energy_ratios[1]), self.energy_count)
+
+
+def generate_cross_section_table(grid: CrossSectionTableGrid) -> DataArrayType:
+    """Return the logarithm of the double differential cross sections, in nm * nm / (eV * steradian), on the grid.
+
+    The returned float32 array has the shape of the grid: atomic number, beam energy, scattering angle and energy
+    loss. Energy losses the beam cannot lose are NaN.
+    """
+    values = numpy.empty(grid.shape, dtype=numpy.float32)
+    energy_ratios = numpy.exp(grid.log_energy_ratios)
+    for z_index, atomic_number in enumerate(grid.atomic_numbers):
+        energies_eV = energy_ratios * get_hydrogenic_edge_energy_eV(atomic_number)
+        for e_index, beam_energy_eV in enumerate(grid.beam_energies_eV):
+            theta_rad = grid.get_theta_rad(beam_energy_eV)
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                double_diff_sigma = EELS_CrossSections.k_shell_double_diff_cross_section_nm2_per_ev_sr(atomic_number, energies_eV, beam_energy_eV, theta_rad)
+                values[z_index, e_index] = numpy.log(double_diff_sigma)
+    return values
+
+
+def write_cross_section_table(path: PathLike, grid: CrossSectionTableGrid, validation_count: int = 64,
+                              seed: int = 0) -> CrossSectionTable:
+    """Generate the table for the grid, write it to path, and return the loaded table.
+
+    The table is validated by comparing interpolated partial cross-sections at validation_count random points inside
+    the grid with reference partial cross-sections; the largest relative error is stored in the file as the accuracy
+    of the table. See validate_cross_section_table.
+    """
+    values = generate_cross_section_table(grid)
+    accuracy = validate_cross_section_table(CrossSectionTable(grid, values, None), validation_count, seed) if validation_count > 0 else None
+    header = {
+        "format": "nion.eels_analysis.cross_section_table",
+        "version": FORMAT_VERSION,
+        "grid": dataclasses.asdict(grid),
+        "dtype": numpy.dtype("<f4").str,
+        "shape": list(values.shape),
+        "accuracy": accuracy,
+        "validation_count": validation_count,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    padding = -(len(MAGIC) + 8 + len(header_bytes)) % DATA_ALIGNMENT
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes) + padding))
+        f.write(header_bytes)
+        f.write(b" " * padding)
+        f.write(numpy.ascontiguousarray(values, dtype=numpy.dtype("<f4")).tobytes())
+    return load_cross_section_table(path)
+
+
+def load_cross_section_table(path: PathLike) -> CrossSectionTable:
+    """Return the table in the file at path. The values are memory-mapped rather than read."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a cross-section table.")
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has unsupported cross-section table version {header.get('version')}.")
+    grid_dict = header["grid"]
+    grid = CrossSectionTableGrid(atomic_numbers=tuple(grid_dict["atomic_numbers"]),
+                                 beam_energies_eV=tuple(grid_dict["beam_energies_eV"]),
+                                 theta_range_rad=(grid_dict["theta_range_rad"][0], grid_dict["theta_range_rad"][1]),
+                                 theta_log_count=grid_dict["theta_log_count"],
+                                 theta_linear_count=grid_dict["theta_linear_count"],
+                                 energy_ratios=(grid_dict["energy_ratios"][0], grid_dict["energy_ratios"][1]),
+                                 energy_count=grid_dict["energy_count"])
+    shape = tuple(header["shape"])
+    if shape != grid.shape:
+        raise ValueError(f"{path} has inconsistent cross-section table shape {shape}.")
+    values = numpy.memmap(path, dtype=numpy.dtype(header["dtype"]), mode="r", offset=len(MAGIC) + 8 + header_length, shape=shape)
+    return CrossSectionTable(grid, values, header.get("accuracy"))
+
+
+def get_reference_partial_cross_section_nm2(atomic_number: int, edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
+                                            convergence_angle_rad: float, collection_angle_rad: float,
+                                            theta_count: int = 2001) -> float:
+    """Return the hydrogenic partial cross-section integrated over a fine logarithmic scattering angle grid.
+
+    EELS_CrossSections.partial_cross_section_nm2 integrates over a uniform grid of at most 401 scattering angles,
+    which under-resolves the peak of the angular distribution at the characteristic angle and changes the result by up
+    to a few percent; this reference is converged to well below that.
+    """
+    max_scattering_angle_rad = convergence_angle_rad + collection_angle_rad
+    energySampleCount = EELS_CrossSections.get_sample_counts(edge_delta_eV, max_scattering_angle_rad)[0]
+    energies_eV = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount)
+    theta_rad = numpy.concatenate([[0.0], numpy.geomspace(max_scattering_angle_rad * 1e-5, max_scattering_angle_rad, theta_count - 1)])
+    dSigma = EELS_CrossSections.k_shell_double_diff_cross_section_nm2_per_ev_sr(atomic_number, energies_eV, beam_energy_eV, theta_rad)
+    dSigma *= 2 * numpy.pi * theta_rad[:, numpy.newaxis]
+    weights = EELS_CrossSections.get_solid_angle_weights(theta_rad, convergence_angle_rad, collection_angle_rad)
+    energyDiffSigma = (weights @ dSigma)[0]
+    return float(scipy.integrate.trapezoid(energyDiffSigma, dx=edge_delta_eV / (energySampleCount - 1)))
+
+
+def validate_cross_section_table(table: CrossSectionTable, count: int, seed: int = 0) -> float:
+    """Return the largest relative error of the partial cross-sections of the table at count random points.
+
+    The points are drawn uniformly over the atomic numbers, the logarithm of the beam energy, convergence angles up to
+    50 mrad and collection angles from 5 mrad, with windows from 20 to 300 eV inside the energy range of the table.
+    The reference is get_reference_partial_cross_section_nm2.
+    """
+    grid = table.grid
+    rng = numpy.random.default_rng(seed)
+    max_error = 0.0
+    for _ in range(count):
+        atomic_number = int(rng.choice(grid.atomic_numbers))
+        beam_energy_eV = float(numpy.exp(rng.uniform(math.log(grid.beam_energies_eV[0]), math.log(grid.beam_energies_eV[-1]))))
+        edge_energy_eV = get_hydrogenic_edge_energy_eV(atomic_number)
+        low_eV = grid.energy_ratios[0] * edge_energy_eV
+        high_eV = min(grid.energy_ratios[1] * edge_energy_eV, 0.5 * beam_energy_eV)
+        edge_delta_eV = min(rng.uniform(20.0, 300.0), 0.5 * (high_eV - low_eV))
+        edge_onset_eV = rng.uniform(low_eV, high_eV - edge_delta_eV)
+        max_scattering_angle_rad = grid.theta_range_rad[1]
+        convergence_angle_rad = rng.uniform(0.0, min(0.05, 0.5 * max_scattering_angle_rad))
+        collection_angle_rad = rng.uniform(min(0.005, 0.5 * max_scattering_angle_rad), max_scattering_angle_rad - convergence_angle_rad)
+        cross_section = table.partial_cross_section_nm2(atomic_number, edge_onset_eV, edge_delta_eV, beam_energy_eV,
+                                                        convergence_angle_rad, collection_angle_rad)
+        assert cross_section is not None
+        expected = get_reference_partial_cross_section_nm2(atomic_number, edge_onset_eV, edge_delta_eV, beam_energy_eV,
+                                                           convergence_angle_rad, collection_angle_rad)
+        max_error = max(max_error, abs(cross_section - expected) / expected)
+    return max_error
+
+
+class CrossSectionTable:
+    """A table of hydrogenic K-shell double differential cross-sections.
+
+    The logarithm of the double differential cross-section is interpolated linearly in the logarithm of the beam
+    energy and of the energy loss, at fixed transverse momentum transfer. The angular integration, including the Kohl collection efficiency, is carried out
+    on the scattering angle axis of the table for any convergence and collection angles, so those are not
+    interpolated. Partial cross-sections are integrated at the energy samples used by
+    EELS_CrossSections.partial_cross_section_nm2.
+
+    accuracy is the largest relative error of the partial cross-sections measured when the table was generated, or
+    None if the table was not validated. For the default grid it is about 1%, with a median of about 0.1%; EELS_CrossSections itself differs from
+    the converged reference by up to a few percent, due to its coarser angular integration.
+    """
+
+    def __init__(self, grid: CrossSectionTableGrid, values: DataArrayType, accuracy: typing.Optional[float]) -> None:
+        assert values.shape == grid.shape
+        self.grid = grid
+        self.values = values
+        self.accuracy = accuracy
+        self.__atomic_number_indexes = {atomic_number: index for index, atomic_number in enumerate(grid.atomic_numbers)}
+        self.__log_energy_ratios = grid.log_energy_ratios
+        self.__log_beam_energies = numpy.log(grid.beam_energies_eV)
+
+    def contains(self, atomic_number: int, edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
+                 convergence_angle_rad: float, collection_angle_rad: float) -> bool:
+        """Return whether the table covers the parameters."""
+        if int(atomic_number) not in self.__atomic_number_indexes:
+            return False
+        if not self.grid.beam_energies_eV[0] <= beam_energy_eV <= self.grid.beam_energies_eV[-1]:
+            return False
+        if convergence_angle_rad + collection_angle_rad > self.grid.theta_range_rad[1]:
+            return False
+        edge_energy_eV = get_hydrogenic_edge_energy_eV(int(atomic_number))
+        return bool(self.grid.energy_ratios[0] * edge_energy_eV <= edge_onset_eV and edge_onset_eV + edge_delta_eV <= self.grid.energy_ratios[1] * edge_energy_eV)
+
+    def double_diff_cross_section_nm2_per_ev_sr(self, atomic_number: int, energies_eV: numpy.typing.ArrayLike,
+                                                beam_energy_eV: float) -> DataArrayType:
+        """Return the interpolated double differential cross-section on the scattering angles of the table.
+
+        The map has the scattering angles of the table at the beam energy, see CrossSectionTableGrid.get_theta_rad,
+        along the 0-axis and energies_eV along the 1-axis, in units of nm * nm / (eV * steradian). The parameters must
+        be inside the table.
+        """
+        log_energy_ratios = numpy.log(numpy.asarray(energies_eV, dtype=numpy.float64) / get_hydrogenic_edge_energy_eV(int(atomic_number)))
+        energy_indexes, energy_fractions = self.__get_interpolation(self.__log_energy_ratios, log_energy_ratios)
+        start = int(numpy.amin(energy_indexes))
+        log_double_diff_sigma = self.__get_log_double_diff_sigma(atomic_number, beam_energy_eV, start, int(numpy.amax(energy_indexes)) + 2)
+        energy_indexes = energy_indexes - start
+        log_double_diff_sigma = log_double_diff_sigma[:, energy_indexes] * (1 - energy_fractions) + log_double_diff_sigma[:, energy_indexes + 1] * energy_fractions
+        return typing.cast(DataArrayType, numpy.exp(log_double_diff_sigma))
+
+    def energy_diff_cross_section_nm2_per_ev(self, atomic_number: int, energies_eV: numpy.typing.ArrayLike, beam_energy_eV: float,
+                                             convergence_angle_rad: float, collection_angle_rad: float) -> typing.Optional[DataArrayType]:
+        """Return the interpolated differential cross-section, in nm * nm / eV, at the energy losses.
+
+        The angular integration is carried out on the energy losses of the table bracketing energies_eV and the
+        logarithm of the result is interpolated to energies_eV, so the cost does not depend on the number of energies.
+
+        Returns None if the parameters or energy losses are outside the table.
+        """
+        energies_eV = numpy.asarray(energies_eV, dtype=numpy.float64)
+        if not self.contains(atomic_number, float(numpy.amin(energies_eV)), float(numpy.ptp(energies_eV)), beam_energy_eV,
+                             convergence_angle_rad, collection_angle_rad):
+            return None
+        log_energy_ratios = numpy.log(energies_eV / get_hydrogenic_edge_energy_eV(int(atomic_number)))
+        energy_indexes = self.__get_interpolation(self.__log_energy_ratios, log_energy_ratios)[0]
+        start, stop = int(numpy.amin(energy_indexes)), int(numpy.amax(energy_indexes)) + 2
+        theta_rad = self.grid.get_theta_rad(beam_energy_eV)
+        dSigma = numpy.exp(self.__get_log_double_diff_sigma(atomic_number, beam_energy_eV, start, stop))
+        dSigma *= 2 * numpy.pi * theta_rad[:, numpy.newaxis]
+        weights = EELS_CrossSections.get_solid_angle_weights(theta_rad, convergence_angle_rad, collection_angle_rad)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            log_energy_diff_sigma = numpy.log((weights @ dSigma)[0])
+        if not numpy.all(numpy.isfinite(log_energy_diff_sigma)):
+            return None
+        energyDiffSigma = numpy.exp(numpy.interp(log_energy_ratios, self.__log_energy_ratios[start:stop], log_energy_diff_sigma))
+        return typing.cast(DataArrayType, energyDiffSigma)
+
+    def partial_cross_section_nm2(self, atomic_number: int, edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
+                                  convergence_angle_rad: float, collection_angle_rad: float) -> typing.Optional[float]:
+        """Return the interpolated partial cross-section, in nm * nm, or None if the parameters are outside the table."""
+        energySampleCount = EELS_CrossSections.get_sample_counts(edge_delta_eV, convergence_angle_rad + collection_angle_rad)[0]
+        energies_eV = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount)
+        energyDiffSigma = self.energy_diff_cross_section_nm2_per_ev(atomic_number, energies_eV, beam_energy_eV,
+                                                                    convergence_angle_rad, collection_angle_rad)
+        if energyDiffSigma is None:
+            return None
+        return float(scipy.integrate.trapezoid(energyDiffSigma, dx=edge_delta_eV / (energySampleCount - 1)))
+
+    def __get_log_double_diff_sigma(self, atomic_number: int, beam_energy_eV: float, start: int, stop: int) -> DataArrayType:
+        # return the logarithm of the double differential cross-section interpolated to the beam energy, on the
+        # scattering angles of the table and its energy losses from start to stop. only those are read from the table.
+        z_index = self.__atomic_number_indexes[int(atomic_number)]
+        beam_indexes, beam_fractions = self.__get_interpolation(self.__log_beam_energies, numpy.array([math.log(beam_energy_eV)]))
+        log_double_diff_sigma = numpy.zeros((self.values.shape[2], stop - start), dtype=numpy.float64)
+        for beam_index, beam_weight in ((beam_indexes[0], 1 - beam_fractions[0]), (beam_indexes[0] + 1, beam_fractions[0])):
+            if beam_weight > 0.0:
+                log_double_diff_sigma += beam_weight * self.values[z_index, beam_index, :, start:stop]
+        return log_double_diff_sigma
+
+    @staticmethod
+    def __get_interpolation(axis: DataArrayType, values: DataArrayType) -> typing.Tuple[DataArrayType, DataArrayType]:
+        # return the index of the axis interval containing each value and the fraction of the interval at the value.
+        if axis.shape[0] == 1:
+            return numpy.zeros(values.shape, dtype=int), numpy.zeros(values.shape)
+        indexes = numpy.clip(numpy.searchsorted(axis, values, side="right") - 1, 0, axis.shape[0] - 2)
+        fractions = numpy.clip((values - axis[indexes]) / (axis[indexes + 1] - axis[indexes]), 0.0, 1.0)
+        return indexes, fractions
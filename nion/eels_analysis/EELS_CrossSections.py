@@ -4,10 +4,15 @@
     A library of functions for computing EELS edge cross-sections.
 """
 
+from __future__ import annotations
+
 import numpy
+import numpy.typing
 import scipy.integrate
 import typing
 
+from nion.eels_analysis import GOSDatabase
+
 
 DataArrayType = numpy.typing.NDArray[typing.Any]
 
@@ -31,19 +36,11 @@ def k_shell_hydrogenic_gos(atomic_number: int, edge_onset_eV: float, edge_delta_
     """
     electronRestEnergy_eV = 510999.0
     fineStructureConstant = 1 / 137.036
-    rydbergEnergy_eV = 0.5 * electronRestEnergy_eV * fineStructureConstant ** 2
 
     beamGamma = 1 + beam_energy_eV / electronRestEnergy_eV
     beamBeta2 = 1 - 1 / beamGamma ** 2
 
-    energySampleCount = int(numpy.fmin(numpy.fmax(50, 100 * numpy.round(edge_delta_eV / 100)), 1000) + 1)
-    thetaSampleCount = int(numpy.fmin(numpy.fmax(50, 100 * numpy.round(collection_angle_rad / 0.050)), 400) + 1)
-
-    screenedZ2 = 1.
-    shellOccupancy = 1
-    if atomic_number > 1:
-        screenedZ2 = (atomic_number - 0.5) ** 2
-        shellOccupancy = 2
+    energySampleCount, thetaSampleCount = get_sample_counts(edge_delta_eV, collection_angle_rad)
 
     # Generate epsilon array (scaled energy-loss) = E/m0c^2 = E/Me over requested energy loss range
     epsilon = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount, dtype = numpy.float64) / electronRestEnergy_eV
@@ -64,6 +61,36 @@ def k_shell_hydrogenic_gos(atomic_number: int, edge_onset_eV: float, edge_delta_
     # Generate epsilonR array (energy-loss in Rydbergs) = E/Ry = 2*epsilon/alpha^2
     epsilonR = 2 * epsilon / fineStructureConstant ** 2
 
+    return k_shell_hydrogenic_gos_q2(atomic_number, epsilonR, Q2)
+
+
+def get_sample_counts(edge_delta_eV: float, max_scattering_angle_rad: float) -> typing.Tuple[int, int]:
+    """Return the number of energy loss and scattering angle samples of the GOS table.
+
+    The energy loss is sampled at about 1 eV and the scattering angle at about 0.5 mrad, within fixed limits.
+    """
+    energySampleCount = int(numpy.fmin(numpy.fmax(50, 100 * numpy.round(edge_delta_eV / 100)), 1000) + 1)
+    thetaSampleCount = int(numpy.fmin(numpy.fmax(50, 100 * numpy.round(max_scattering_angle_rad / 0.050)), 400) + 1)
+    return energySampleCount, thetaSampleCount
+
+
+def k_shell_hydrogenic_gos_q2(atomic_number: int, epsilonR: DataArrayType, Q2: DataArrayType) -> DataArrayType:
+    """Return the K-shell hydrogenic generalized oscillator strength (GOS) at the given energy losses and momentum transfers.
+
+    epsilonR is the 1-d array of energy losses in Rydbergs and Q2 the squared dimensionless momentum transfer (qa0)^2,
+    with the energy loss as its last axis. The intensity is in units of 1 / (eV * steradian). See k_shell_hydrogenic_gos
+    for the formulation.
+    """
+    electronRestEnergy_eV = 510999.0
+    fineStructureConstant = 1 / 137.036
+    rydbergEnergy_eV = 0.5 * electronRestEnergy_eV * fineStructureConstant ** 2
+
+    screenedZ2 = 1.
+    shellOccupancy = 1
+    if atomic_number > 1:
+        screenedZ2 = (atomic_number - 0.5) ** 2
+        shellOccupancy = 2
+
     # Generate common GOS pre-factor map = 128*Ne(E/Ry)(Q^2+(E/Ry)/3)/[((Q^2-E/Ry)/Zs)^2+4*Q^2]^3/Ry
     # This is an exact reformulation of the common factor in Egerton's equations 3.125 and 3.126.
     # His equations assume 2 electrons (Ne = 2) occupy the 1s shell, which is not true for hydrogen.
@@ -76,33 +103,31 @@ def k_shell_hydrogenic_gos(atomic_number: int, edge_onset_eV: float, edge_delta_
     # This yields the correct kH -> 0 limiting value of the exponential factor in 3.125 and 3.126: exp(-4*Zs^2/(Q^2-E/Ry+2Zs^2))
     kH = numpy.fmax(numpy.sqrt(numpy.fabs(epsilonR / screenedZ2 - 1)), 0.01)
 
-    # Determine energy array index at which "free" states begin
-    boundStateMask = numpy.zeros_like(epsilonR)
-    boundStateMask[epsilonR < screenedZ2] = 1
-    freeStateStartIndex = int(boundStateMask.sum())
+    # Determine the energy losses of the bound states; the "free" states are the others.
+    boundStateMask = epsilonR < screenedZ2
+    freeStateMask = ~boundStateMask
 
     # Generate GOS 'exponential' factor map, i.e. the exponential factors in Egerton's equations 3.125 and 3.126
-    gosFactor = numpy.zeros_like(Q2)
-
-    # Compute bound-state portion = exp(-y), as in 3.126.
-    # Note that -y has been reformulated as log[(Q^2-E/Ry+2(1-kH)Zs^2)/(Q^2-E/Ry+2(1+kH)Zs^2))/kH.
-    epsilonR_bound = epsilonR[:freeStateStartIndex]
-    kH_bound = kH[:freeStateStartIndex]
-    Q2_bound = Q2[:, :freeStateStartIndex]
-    gosFactor_bound = gosFactor[:, :freeStateStartIndex]
-    gosFactor_bound[...] = Q2_bound - epsilonR_bound + 2 * screenedZ2 * (1 - kH_bound)
-    gosFactor_bound[...] /= Q2_bound - epsilonR_bound + 2 * screenedZ2 * (1 + kH_bound)
-    gosFactor_bound[...] = numpy.exp(numpy.log(gosFactor_bound) / kH_bound)
-
-    if freeStateStartIndex < energySampleCount:
+    gosFactor = numpy.zeros_like(gos)
+
+    if numpy.any(boundStateMask):
+        # Compute bound-state portion = exp(-y), as in 3.126.
+        # Note that -y has been reformulated as log[(Q^2-E/Ry+2(1-kH)Zs^2)/(Q^2-E/Ry+2(1+kH)Zs^2))/kH.
+        epsilonR_bound = epsilonR[boundStateMask]
+        kH_bound = kH[boundStateMask]
+        Q2_bound = Q2[..., boundStateMask]
+        gosFactor_bound = Q2_bound - epsilonR_bound + 2 * screenedZ2 * (1 - kH_bound)
+        gosFactor_bound /= Q2_bound - epsilonR_bound + 2 * screenedZ2 * (1 + kH_bound)
+        gosFactor[..., boundStateMask] = numpy.exp(numpy.log(gosFactor_bound) / kH_bound)
+
+    if numpy.any(freeStateMask):
         # Compute free-state portion = exp(-2*betaPrime/kH)/[1-exp(-2*pi/kH)], as in 3.125.
         # Note that betaPrime has been reformulated as arctan(2*Zs^2kH/(Q^2 - E/Ry + 2*Zs^2).
-        epsilonR_free = epsilonR[freeStateStartIndex:]
-        kH_free = kH[freeStateStartIndex:]
-        Q2_free = Q2[:, freeStateStartIndex:]
-        gosFactor_free = gosFactor[:, freeStateStartIndex:]
-        gosFactor_free[...] = numpy.arctan2(2 * screenedZ2 * kH_free, Q2_free - epsilonR_free + 2 * screenedZ2)
-        gosFactor_free[...] = numpy.exp(-2 * gosFactor_free / kH_free) / (1 - numpy.exp(-2 * numpy.pi / kH_free))
+        epsilonR_free = epsilonR[freeStateMask]
+        kH_free = kH[freeStateMask]
+        Q2_free = Q2[..., freeStateMask]
+        gosFactor_free = numpy.arctan2(2 * screenedZ2 * kH_free, Q2_free - epsilonR_free + 2 * screenedZ2)
+        gosFactor[..., freeStateMask] = numpy.exp(-2 * gosFactor_free / kH_free) / (1 - numpy.exp(-2 * numpy.pi / kH_free))
 
     gos *= gosFactor
 
@@ -110,9 +135,13 @@ def k_shell_hydrogenic_gos(atomic_number: int, edge_onset_eV: float, edge_delta_
 
 
 def generalized_oscillator_strength(atomic_number: int, shell_number: int, subshell_index: int, edge_onset_eV: float, edge_delta_eV: float,
-                                        beam_energy_eV: float, collection_angle_rad: float) -> DataArrayType:
+                                        beam_energy_eV: float, collection_angle_rad: float,
+                                        gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> DataArrayType:
     """Return the generalized oscillator strength (GOS) for the specified electron shell as an ndarray.
 
+    The GOS is interpolated from the table of the shell in gos_database, if it has one, or else computed on the
+    hydrogenic model, which is only available for K shells.
+
     In order for the angular portion of any subsequent cross-section computation to be carried out via straightforward
     NumPy array integration with fixed limits of integration, the GOS table is computed versus scattering angle, theta,
     rather than (dimensionless) momentum transfer, qa0.
@@ -123,15 +152,30 @@ def generalized_oscillator_strength(atomic_number: int, shell_number: int, subsh
       intensity is in units of 1 / (eV * steradian)
     """
     assert atomic_number >= 1
-    assert shell_number == 1
-    assert subshell_index == 1
 
-    if shell_number == 1:
-        gos = k_shell_hydrogenic_gos(atomic_number, edge_onset_eV, edge_delta_eV, beam_energy_eV, collection_angle_rad)
-    else:
-        print("No GOS routine available for L, M, N, and O electron shells.")
+    gos_table = gos_database.get_table(atomic_number, shell_number, subshell_index) if gos_database is not None else None
+    if gos_table is not None:
+        energySampleCount, thetaSampleCount = get_sample_counts(edge_delta_eV, collection_angle_rad)
+        energies_eV = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount, dtype = numpy.float64)
+        theta_rad = numpy.linspace(0, collection_angle_rad, thetaSampleCount, dtype = numpy.float64)
+        return gos_table.get_gos(energies_eV, get_momentum_transfer_q2(energies_eV, beam_energy_eV, theta_rad))
+
+    assert shell_number == 1 and subshell_index == 1, "No GOS routine available for L, M, N, and O electron shells."
+    return k_shell_hydrogenic_gos(atomic_number, edge_onset_eV, edge_delta_eV, beam_energy_eV, collection_angle_rad)
 
-    return gos
+
+def get_momentum_transfer_q2(energies_eV: numpy.typing.ArrayLike, beam_energy_eV: float, theta_rad: numpy.typing.ArrayLike) -> DataArrayType:
+    """Return the squared dimensionless momentum transfer (q a0)^2 with the scattering angles theta_rad along the 0-axis
+    and the energy losses energies_eV along the 1-axis. See k_shell_hydrogenic_gos for the formulation."""
+    electronRestEnergy_eV = 510999.0
+    fineStructureConstant = 1 / 137.036
+
+    beamGamma = 1 + beam_energy_eV / electronRestEnergy_eV
+    beamBeta2 = 1 - 1 / beamGamma ** 2
+    epsilon = numpy.asarray(energies_eV, dtype = numpy.float64) / electronRestEnergy_eV
+    phiE = 1 - numpy.sqrt(1 - 2 * epsilon * (beamGamma - epsilon / 2) / (beamGamma ** 2 * beamBeta2))
+    thetaTerm = 4 * numpy.sin(numpy.asarray(theta_rad, dtype = numpy.float64).reshape(-1, 1) / 2) ** 2
+    return typing.cast(DataArrayType, (phiE ** 2 + (1 - phiE) * thetaTerm) * beamBeta2 * (beamGamma / fineStructureConstant) ** 2)
 
 
 def kohl_collection_efficiency(theta_rad: DataArrayType, alpha_rad: float, beta_rad: float) -> DataArrayType:
@@ -149,48 +193,58 @@ def kohl_collection_efficiency(theta_rad: DataArrayType, alpha_rad: float, beta_
     """
     assert theta_rad.ndim == 1
 
+    return kohl_collection_efficiencies(theta_rad, alpha_rad, beta_rad)
+
+
+def kohl_collection_efficiencies(theta_rad: DataArrayType, alpha_rad: numpy.typing.ArrayLike, beta_rad: numpy.typing.ArrayLike) -> DataArrayType:
+    """Return the Kohl collection efficiencies for arrays of scattering angles and aperture semi-angles.
+
+    theta_rad has shape (...,n) and the semi-angles alpha_rad and beta_rad broadcast against its leading axes, so the
+    efficiencies of several convergence and collection angles are computed at once. See kohl_collection_efficiency.
+    """
+    theta_rad = numpy.asarray(theta_rad, dtype=numpy.float64)
+    alpha_rad = numpy.expand_dims(numpy.asarray(alpha_rad, dtype=numpy.float64), -1)
+    beta_rad = numpy.expand_dims(numpy.asarray(beta_rad, dtype=numpy.float64), -1)
+
     sum_angle = alpha_rad + beta_rad
     diff_angle = numpy.fabs(alpha_rad - beta_rad)
 
     # Bypass the (negligible) overlap area correction if either aperture has an angular radius 1% or less of the other.
     # In this case, the expressions below are not well-conditioned against round-off error anyway, so best not to apply them.
-    if alpha_rad <= beta_rad / 100:
-        sum_angle = beta_rad
-        diff_angle = beta_rad
-    elif beta_rad <= alpha_rad / 100:
-        sum_angle = alpha_rad
-        diff_angle = alpha_rad
+    alpha_negligible = alpha_rad <= beta_rad / 100
+    beta_negligible = ~alpha_negligible & (beta_rad <= alpha_rad / 100)
+    sum_angle = numpy.where(alpha_negligible, beta_rad, numpy.where(beta_negligible, alpha_rad, sum_angle))
+    diff_angle = numpy.where(alpha_negligible, beta_rad, numpy.where(beta_negligible, alpha_rad, diff_angle))
 
     # Determine theta range requiring aperture overlap computation, i.e. that with non-zero efficiency < 1.
-    theta_start = theta_rad[theta_rad <= diff_angle].size
-    theta_end = theta_rad[theta_rad < sum_angle].size
-
-    # Determine the collection efficiency array.
-    collection_efficiency = numpy.zeros_like(theta_rad)
-    collection_efficiency[:theta_start] = 1
-    if theta_end > theta_start:
-        theta_slice = theta_rad[theta_start:theta_end]
-        efficiency_slice = collection_efficiency[theta_start:theta_end]
+    full_overlap = theta_rad <= diff_angle
+    partial_overlap = ~full_overlap & (theta_rad < sum_angle)
 
+    # Determine the collection efficiency array. The overlap is evaluated everywhere and only used in the partial range.
+    with numpy.errstate(all="ignore"):
         # Start with the sum of the intersecting sector areas
-        efficiency_slice[...] = numpy.arccos((1 + beta_rad / theta_slice) * (theta_slice - beta_rad)/(2 * alpha_rad) + alpha_rad / (2 * theta_slice)) * alpha_rad ** 2
-        efficiency_slice[...] += numpy.arccos((1 + alpha_rad / theta_slice) * (theta_slice - alpha_rad)/(2 * beta_rad) + beta_rad / (2 * theta_slice)) * beta_rad ** 2
+        efficiency = numpy.arccos((1 + beta_rad / theta_rad) * (theta_rad - beta_rad)/(2 * alpha_rad) + alpha_rad / (2 * theta_rad)) * alpha_rad ** 2
+        efficiency += numpy.arccos((1 + alpha_rad / theta_rad) * (theta_rad - alpha_rad)/(2 * beta_rad) + beta_rad / (2 * theta_rad)) * beta_rad ** 2
 
         # Subtract the "directional" sector triangles to yield the area of the overlapping "lens" region of the two angular apertures
-        efficiency_slice[...] -= numpy.sqrt((sum_angle - theta_slice) * (sum_angle + theta_slice) * (theta_slice - diff_angle) * (theta_slice + diff_angle)) / 2
+        efficiency -= numpy.sqrt((sum_angle - theta_rad) * (sum_angle + theta_rad) * (theta_rad - diff_angle) * (theta_rad + diff_angle)) / 2
 
         # Divide by the smallest aperture angular area to yield a spectrum collection efficiency in the range (0, 1)
-        efficiency_slice[...] /= numpy.pi * min(alpha_rad, beta_rad) ** 2
+        efficiency /= numpy.pi * numpy.fmin(alpha_rad, beta_rad) ** 2
 
-    return collection_efficiency
+    collection_efficiency = numpy.where(full_overlap, 1.0, numpy.where(partial_overlap, efficiency, 0.0))
+
+    return typing.cast(DataArrayType, collection_efficiency)
 
 
 def energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int, subshell_index: int,
                                          edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
-                                         convergence_angle_rad: float, collection_angle_rad: float) -> DataArrayType:
+                                         convergence_angle_rad: float, collection_angle_rad: float,
+                                         gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> DataArrayType:
     """Return the energy differential cross section for the specified electron shell and experimental parameters.
 
-    Uses generalized_oscillator_strength and kohl_collection_efficiency functions.
+    Uses k_shell_hydrogenic_gos_q2, or the table of the shell in gos_database if it has one, and
+    kohl_collection_efficiencies functions.
 
     This algorithm is based on the Bethe theory formulation given by Egerton in chapter 3 of his book entitled
     Electron Energy-Loss Spectroscopy in the Electron Microscope (in its 3rd edition as of 2011).
@@ -202,12 +256,228 @@ def energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int,
 
     The returned differential cross-section value is in units of nm * nm / eV.
     """
-    assert beam_energy_eV > 0
-    assert edge_onset_eV > 0
-    assert edge_delta_eV > 0
-    assert convergence_angle_rad >= 0
-    assert collection_angle_rad > 0
+    return energy_diff_cross_sections_nm2_per_ev(atomic_number, shell_number, subshell_index, edge_onset_eV, edge_delta_eV,
+                                                 beam_energy_eV, convergence_angle_rad, collection_angle_rad,
+                                                 gos_database=gos_database)[0]
 
+
+def partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_index: int,
+                              edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
+                              convergence_angle_rad: float, collection_angle_rad: float,
+                              tolerance: typing.Optional[float] = None,
+                              gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> float:
+    """Return the partial cross section for the specified electron shell and experimental parameters.
+
+    Uses energy_diff_cross_section_nm2_per_ev function, or adaptive_partial_cross_section_nm2 to integrate a K shell on
+    the hydrogenic model to the relative tolerance if one is given.
+
+    The returned cross-section value is in units of nm * nm.
+    """
+    if tolerance is not None:
+        assert gos_database is None or gos_database.get_table(atomic_number, shell_number, subshell_index) is None
+        return adaptive_partial_cross_section_nm2(atomic_number, shell_number, subshell_index, edge_onset_eV, edge_delta_eV,
+                                                  beam_energy_eV, convergence_angle_rad, collection_angle_rad,
+                                                  tolerance).cross_section_nm2
+    return float(partial_cross_sections_nm2(atomic_number, shell_number, subshell_index, edge_onset_eV, edge_delta_eV,
+                                            beam_energy_eV, convergence_angle_rad, collection_angle_rad,
+                                            gos_database=gos_database))
+
+
+class CrossSectionParameters(typing.NamedTuple):
+    """Flat arrays of the shells and experimental parameters of a batch of cross-sections."""
+    atomic_number: DataArrayType
+    shell_number: DataArrayType
+    subshell_index: DataArrayType
+    edge_onset_eV: DataArrayType
+    edge_delta_eV: DataArrayType
+    beam_energy_eV: DataArrayType
+    convergence_angle_rad: DataArrayType
+    collection_angle_rad: DataArrayType
+
+    def take(self, indexes: DataArrayType) -> CrossSectionParameters:
+        return CrossSectionParameters(*(parameter[indexes] for parameter in self))
+
+
+def get_cross_section_parameters(atomic_number: numpy.typing.ArrayLike, shell_number: numpy.typing.ArrayLike,
+                                 subshell_index: numpy.typing.ArrayLike, edge_onset_eV: numpy.typing.ArrayLike,
+                                 edge_delta_eV: numpy.typing.ArrayLike, beam_energy_eV: numpy.typing.ArrayLike,
+                                 convergence_angle_rad: numpy.typing.ArrayLike,
+                                 collection_angle_rad: numpy.typing.ArrayLike) -> typing.Tuple[CrossSectionParameters, typing.Tuple[int, ...]]:
+    """Broadcast the parameters against each other and return them flattened, with the broadcast shape."""
+    arrays = numpy.broadcast_arrays(numpy.asarray(atomic_number, dtype=int), numpy.asarray(shell_number, dtype=int),
+                                    numpy.asarray(subshell_index, dtype=int), numpy.asarray(edge_onset_eV, dtype=numpy.float64),
+                                    numpy.asarray(edge_delta_eV, dtype=numpy.float64), numpy.asarray(beam_energy_eV, dtype=numpy.float64),
+                                    numpy.asarray(convergence_angle_rad, dtype=numpy.float64),
+                                    numpy.asarray(collection_angle_rad, dtype=numpy.float64))
+    return CrossSectionParameters(*(numpy.ravel(array) for array in arrays)), arrays[0].shape
+
+
+def energy_diff_cross_sections_nm2_per_ev(atomic_number: numpy.typing.ArrayLike, shell_number: numpy.typing.ArrayLike,
+                                          subshell_index: numpy.typing.ArrayLike, edge_onset_eV: numpy.typing.ArrayLike,
+                                          edge_delta_eV: numpy.typing.ArrayLike, beam_energy_eV: numpy.typing.ArrayLike,
+                                          convergence_angle_rad: numpy.typing.ArrayLike,
+                                          collection_angle_rad: numpy.typing.ArrayLike,
+                                          gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> typing.List[DataArrayType]:
+    """Return the energy differential cross sections for arrays of electron shells and experimental parameters.
+
+    The parameters are broadcast against each other and the cross-sections are returned in the order of the flattened
+    broadcast parameters. Each is sampled over its own energy window, so their lengths may differ; see
+    energy_diff_cross_section_nm2_per_ev.
+
+    Cross-sections of the same edge and beam energy, such as a sweep of the convergence or collection angle, share one
+    GOS evaluation on the union of their theta grids; their solid angle integrations are applied with one matrix
+    product. Each cross-section is integrated over its own theta grid, the grid of energy_diff_cross_section_nm2_per_ev,
+    so it does not depend on the other cross-sections of the batch.
+    """
+    parameters, shape = get_cross_section_parameters(atomic_number, shell_number, subshell_index, edge_onset_eV, edge_delta_eV,
+                                                     beam_energy_eV, convergence_angle_rad, collection_angle_rad)
+    energy_diff_sigmas: typing.List[DataArrayType] = [numpy.empty(0)] * parameters.atomic_number.shape[0]
+    for indexes, energyDiffSigma in _iterate_energy_diff_cross_sections(parameters, gos_database):
+        for index, energy_diff_sigma in zip(indexes, energyDiffSigma):
+            energy_diff_sigmas[index] = energy_diff_sigma
+    return energy_diff_sigmas
+
+
+def partial_cross_sections_nm2(atomic_number: numpy.typing.ArrayLike, shell_number: numpy.typing.ArrayLike,
+                               subshell_index: numpy.typing.ArrayLike, edge_onset_eV: numpy.typing.ArrayLike,
+                               edge_delta_eV: numpy.typing.ArrayLike, beam_energy_eV: numpy.typing.ArrayLike,
+                               convergence_angle_rad: numpy.typing.ArrayLike,
+                               collection_angle_rad: numpy.typing.ArrayLike,
+                               gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> DataArrayType:
+    """Return the partial cross sections for arrays of electron shells and experimental parameters.
+
+    The parameters are broadcast against each other and the returned array of cross-sections, in nm * nm, has the
+    broadcast shape. See energy_diff_cross_sections_nm2_per_ev.
+    """
+    parameters, shape = get_cross_section_parameters(atomic_number, shell_number, subshell_index, edge_onset_eV, edge_delta_eV,
+                                                     beam_energy_eV, convergence_angle_rad, collection_angle_rad)
+    partialCrossSection = numpy.empty(parameters.atomic_number.shape, dtype=numpy.float64)
+    for indexes, energyDiffSigma in _iterate_energy_diff_cross_sections(parameters, gos_database):
+        # Integrate over energy window to get partial cross-section
+        energySampleCount = energyDiffSigma.shape[-1]
+        energy_step = parameters.edge_delta_eV[indexes] / (energySampleCount - 1)
+        partialCrossSection[indexes] = scipy.integrate.trapezoid(energyDiffSigma, dx = energy_step[:, numpy.newaxis], axis = -1)
+    return numpy.reshape(partialCrossSection, shape)
+
+
+# the maximum number of scattering angle samples of the union of the theta grids of a group of cross-sections.
+MAX_SHARED_THETA_SAMPLE_COUNT = 4001
+
+
+def _iterate_energy_diff_cross_sections(parameters: CrossSectionParameters,
+                                        gos_database: typing.Optional[GOSDatabase.GOSDatabase]) -> typing.Iterator[typing.Tuple[DataArrayType, DataArrayType]]:
+    # yield the indexes and the energy differential cross-sections, with shape (m,n), of groups of the parameters
+    # which share the shell, edge and beam energy and differ only in their convergence and collection angles.
+    assert numpy.all(parameters.beam_energy_eV > 0)
+    assert numpy.all(parameters.edge_onset_eV > 0)
+    assert numpy.all(parameters.edge_delta_eV > 0)
+    assert numpy.all(parameters.convergence_angle_rad >= 0)
+    assert numpy.all(parameters.collection_angle_rad > 0)
+    assert numpy.all(parameters.atomic_number >= 1)
+    assert all(is_gos_available(*shell, gos_database) for shell in set(zip(parameters.atomic_number, parameters.shell_number, parameters.subshell_index))), \
+        "No GOS routine available for L, M, N, and O electron shells."
+
+    edges = numpy.stack([parameters.atomic_number, parameters.shell_number, parameters.subshell_index, parameters.edge_onset_eV,
+                         parameters.edge_delta_eV, parameters.beam_energy_eV], axis=-1)
+    _, edge_indexes = numpy.unique(edges, axis=0, return_inverse=True)
+    edge_indexes = numpy.ravel(edge_indexes)
+    for edge_index in range(int(numpy.amax(edge_indexes, initial=-1)) + 1):
+        indexes = numpy.flatnonzero(edge_indexes == edge_index)
+        yield indexes, _energy_diff_cross_sections(parameters.take(indexes), gos_database)
+
+
+def is_gos_available(atomic_number: int, shell_number: int, subshell_index: int,
+                     gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> bool:
+    """Return whether the GOS of the shell is in gos_database or can be computed on the hydrogenic model."""
+    if gos_database is not None and gos_database.get_table(atomic_number, shell_number, subshell_index) is not None:
+        return True
+    return shell_number == 1 and subshell_index == 1
+
+
+def _energy_diff_cross_sections(parameters: CrossSectionParameters, gos_database: typing.Optional[GOSDatabase.GOSDatabase]) -> DataArrayType:
+    # evaluate the energy differential cross-sections, with shape (m,energySampleCount), of m sets of parameters with
+    # the same shell, edge and beam energy.
+    #
+    # each cross-section is integrated over solid angle on its own theta grid, the grid of a single cross-section. the
+    # differential cross-section map, without the collection efficiency, is evaluated once on the union of the theta
+    # grids of a group of cross-sections, and the solid angle weights of each cross-section on its own grid, including
+    # the collection efficiency, are placed at the samples of its grid in a weight matrix, with shape
+    # (m,thetaSampleCount), applied to the map with one matrix product. cross-sections with the same maximum
+    # scattering angle have the same grid. the groups are limited to MAX_SHARED_THETA_SAMPLE_COUNT samples.
+    atomic_number = int(parameters.atomic_number[0])
+    shell_number = int(parameters.shell_number[0])
+    subshell_index = int(parameters.subshell_index[0])
+    edge_onset_eV = float(parameters.edge_onset_eV[0])
+    edge_delta_eV = float(parameters.edge_delta_eV[0])
+    beam_energy_eV = float(parameters.beam_energy_eV[0])
+
+    max_scattering_angles_rad, grid_indexes = numpy.unique(parameters.convergence_angle_rad + parameters.collection_angle_rad, return_inverse=True)
+    grid_indexes = numpy.ravel(grid_indexes)
+    sample_counts = [get_sample_counts(edge_delta_eV, max_angle_rad) for max_angle_rad in max_scattering_angles_rad]
+    energySampleCount = sample_counts[0][0]
+    theta_grids_rad = [numpy.linspace(0, max_angle_rad, thetaSampleCount, dtype = numpy.float64)
+                       for max_angle_rad, (_, thetaSampleCount) in zip(max_scattering_angles_rad, sample_counts)]
+
+    # Generate the energy loss array over the requested energy loss range
+    energies_eV = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount, dtype = numpy.float64)
+
+    energyDiffSigma = numpy.empty((parameters.atomic_number.shape[0], energySampleCount), dtype=numpy.float64)
+    grid_start = 0
+    while grid_start < len(theta_grids_rad):
+        grid_stop = grid_start + 1
+        group_sample_count = theta_grids_rad[grid_start].shape[0]
+        while grid_stop < len(theta_grids_rad) and group_sample_count + theta_grids_rad[grid_stop].shape[0] <= MAX_SHARED_THETA_SAMPLE_COUNT:
+            group_sample_count += theta_grids_rad[grid_stop].shape[0]
+            grid_stop += 1
+
+        # the union of the theta grids of the group and the index of each sample of each grid in it.
+        theta_rad, theta_indexes = numpy.unique(numpy.concatenate(theta_grids_rad[grid_start:grid_stop]), return_inverse=True)
+        thetaSampleCount = theta_rad.shape[0]
+
+        dSigma = double_diff_cross_section_nm2_per_ev_sr(atomic_number, shell_number, subshell_index, energies_eV, beam_energy_eV,
+                                                         theta_rad, gos_database)
+        dSigma *= 2 * numpy.pi * theta_rad.reshape(thetaSampleCount, 1)
+
+        # Integrate over solid angle out to collection angle to yield dSigma/dE,
+        # Apply collection efficiency factor to correct for convergence angle via the Kohl method.
+        indexes = numpy.flatnonzero((grid_indexes >= grid_start) & (grid_indexes < grid_stop))
+        weights = numpy.zeros((indexes.shape[0], thetaSampleCount), dtype=numpy.float64)
+        sample_offset = 0
+        for grid_index in range(grid_start, grid_stop):
+            theta_grid_rad = theta_grids_rad[grid_index]
+            rows = numpy.flatnonzero(grid_indexes[indexes] == grid_index)
+            columns = theta_indexes[sample_offset:sample_offset + theta_grid_rad.shape[0]]
+            weights[rows[:, numpy.newaxis], columns] = get_solid_angle_weights(theta_grid_rad, parameters.convergence_angle_rad[indexes[rows]],
+                                                                              parameters.collection_angle_rad[indexes[rows]])
+            sample_offset += theta_grid_rad.shape[0]
+        energyDiffSigma[indexes] = weights @ dSigma
+        grid_start = grid_stop
+
+    return energyDiffSigma
+
+
+def k_shell_double_diff_cross_section_nm2_per_ev_sr(atomic_number: int, energies_eV: numpy.typing.ArrayLike, beam_energy_eV: float,
+                                                    theta_rad: numpy.typing.ArrayLike) -> DataArrayType:
+    """Return the K-shell double differential cross section d2sigma / (dOmega dE) on the hydrogenic model.
+
+    The returned map has the scattering angles theta_rad along the 0-axis and the energy losses energies_eV along the
+    1-axis, and is in units of nm * nm / (eV * steradian).
+    """
+    return double_diff_cross_section_nm2_per_ev_sr(atomic_number, 1, 1, energies_eV, beam_energy_eV, theta_rad)
+
+
+def double_diff_cross_section_nm2_per_ev_sr(atomic_number: int, shell_number: int, subshell_index: int,
+                                            energies_eV: numpy.typing.ArrayLike, beam_energy_eV: float,
+                                            theta_rad: numpy.typing.ArrayLike,
+                                            gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None) -> DataArrayType:
+    """Return the double differential cross section d2sigma / (dOmega dE) of the shell.
+
+    The GOS is interpolated from the table of the shell in gos_database, if it has one, onto the Q^2 map, or else
+    computed on the hydrogenic model, which is only available for K shells.
+
+    The returned map has the scattering angles theta_rad along the 0-axis and the energy losses energies_eV along the
+    1-axis, and is in units of nm * nm / (eV * steradian).
+    """
     hBarC_eV_nm = 197.325
     electronRestEnergy_eV = 510999.0
     fineStructureConstant = 1 / 137.036
@@ -216,61 +486,213 @@ def energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int,
     beamGamma = 1 + beam_energy_eV / electronRestEnergy_eV
     beamBeta2 = 1 - 1 / beamGamma ** 2
 
-    max_scattering_angle_rad = convergence_angle_rad + collection_angle_rad
-    gos = generalized_oscillator_strength(atomic_number, shell_number, subshell_index,
-                                          edge_onset_eV, edge_delta_eV, beam_energy_eV, max_scattering_angle_rad)
-
-    energySampleCount = gos.shape[1]
-    thetaSampleCount = gos.shape[0]
-
     # Generate epsilon array (scaled energy-loss) = E/m0c^2 = E/Me over requested energy loss range
-    epsilon = numpy.linspace(edge_onset_eV, edge_onset_eV + edge_delta_eV, energySampleCount, dtype = numpy.float64) / electronRestEnergy_eV
+    epsilon = numpy.asarray(energies_eV, dtype = numpy.float64) / electronRestEnergy_eV
 
     # Generate corresponding phiE array = 1-k1/k0 ~= thetaE
     phiE = 1 - numpy.sqrt(1 - 2 * epsilon * (beamGamma - epsilon / 2) / (beamGamma ** 2 * beamBeta2))
 
-    # Generate appropriate theta array for maximum scattering angle
-    theta_rad = numpy.linspace(0, max_scattering_angle_rad, thetaSampleCount, dtype = numpy.float64)
-
     # Generate Q^2 map = K0^2[phiE^2 + 4(1-phiE)sin(theta/2)^2], where
     # Q = qa0, K0 = k0a0 = gamma0*beta0/alpha, and alpha = fine structure constant.
     # This is an exact reformulation of Egerton's equation 3.141, making approximations 3.144 and 3.146 unnecessary.
     # A complete 2D GOS map is generated thanks to Python broadcasting and judicious shaping of the thetaTerm array.
-    thetaTerm = 4 * numpy.sin(theta_rad.reshape(thetaSampleCount, 1) / 2) ** 2
+    theta_rad = numpy.asarray(theta_rad, dtype = numpy.float64)
+    thetaTerm = 4 * numpy.sin(theta_rad.reshape(-1, 1) / 2) ** 2
     Q2 = (phiE ** 2 + (1 - phiE) * thetaTerm) * beamBeta2 * (beamGamma / fineStructureConstant) ** 2
 
+    # Generate epsilonR array (energy-loss in Rydbergs) = E/Ry = 2*epsilon/alpha^2
+    epsilonR = 2 * epsilon / fineStructureConstant ** 2
+    gos_table = gos_database.get_table(atomic_number, shell_number, subshell_index) if gos_database is not None else None
+    if gos_table is not None:
+        gos = gos_table.get_gos(energies_eV, Q2)
+    else:
+        assert shell_number == 1 and subshell_index == 1, "No GOS routine available for L, M, N, and O electron shells."
+        gos = k_shell_hydrogenic_gos_q2(atomic_number, epsilonR, Q2)
+
     # Generate differential cross-section map = 2(1-phiE)(alpha*gamma0*a0)^2/((E/Me)Q^2) * df/dE, where a0 = Bohr radius.
     # This is a slightly reformulated, but exactly equivalent, version of Egerton's equation 3.26.
     dSigma = 2 * (1 - phiE) * (fineStructureConstant * beamGamma * bohrRadius_nm) ** 2 / (epsilon * Q2) * gos
 
-    # Integrate over solid angle out to collection angle to yield dSigma/dE,
-    # Apply collection efficiency factor to correct for convergence angle via the Kohl method.
-    collection_efficiency = kohl_collection_efficiency(theta_rad, convergence_angle_rad, collection_angle_rad)
-    dSigma *= 2 * numpy.pi * theta_rad.reshape(thetaSampleCount, 1) * collection_efficiency.reshape(thetaSampleCount, 1)
-    theta_step = max_scattering_angle_rad / (thetaSampleCount - 1)
-    energyDiffSigma = typing.cast(DataArrayType, scipy.integrate.trapezoid(dSigma, dx = theta_step, axis = 0))
+    return typing.cast(DataArrayType, dSigma)
 
-    return energyDiffSigma
 
+def get_solid_angle_weights(theta_rad: DataArrayType, alpha_rad: numpy.typing.ArrayLike, beta_rad: numpy.typing.ArrayLike) -> DataArrayType:
+    """Return the weights of the integration over solid angle, including the Kohl collection efficiency.
 
-def partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_index: int,
-                              edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
-                              convergence_angle_rad: float, collection_angle_rad: float) -> float:
-    """Return the partial cross section for the specified electron shell and experimental parameters.
-
-    Uses energy_diff_cross_section_nm2_per_ev function.
-
-    The returned cross-section value is in units of nm * nm.
+    theta_rad is the increasing 1-d array of n scattering angles, from 0, at which a function of the scattering angle
+    is sampled. The returned weights, with shape (m,n) for the m broadcast convergence and collection semi-angles,
+    integrate the function times the collection efficiency from 0 to the maximum scattering angle alpha_rad + beta_rad
+    with the trapezoidal rule. The function at a maximum scattering angle between two samples is interpolated linearly.
+    """
+    alpha_rad, beta_rad = (numpy.ravel(a) for a in numpy.broadcast_arrays(numpy.asarray(alpha_rad, dtype=numpy.float64), numpy.asarray(beta_rad, dtype=numpy.float64)))
+    thetaSampleCount = theta_rad.shape[0]
+    theta_steps = numpy.diff(theta_rad)
+    max_scattering_angle_rad = alpha_rad + beta_rad
+    rows = numpy.arange(max_scattering_angle_rad.shape[0])
+
+    # the samples below the maximum scattering angle and the length of the last, partial, interval.
+    inner_count = numpy.clip(numpy.searchsorted(theta_rad, max_scattering_angle_rad, side="left"), 1, thetaSampleCount - 1)
+    last_index = inner_count - 1
+    last_step = max_scattering_angle_rad - theta_rad[last_index]
+    last_fraction = last_step / theta_steps[last_index]
+
+    # trapezoidal weights of the full intervals between the inner samples and of the last interval.
+    interval_weights = numpy.where(numpy.arange(thetaSampleCount - 1) < last_index[:, numpy.newaxis], theta_steps / 2, 0.0)
+    weights = numpy.zeros((max_scattering_angle_rad.shape[0], thetaSampleCount), dtype=numpy.float64)
+    weights[:, :-1] += interval_weights
+    weights[:, 1:] += interval_weights
+    weights[rows, last_index] += last_step / 2
+
+    collection_efficiency = kohl_collection_efficiencies(theta_rad, alpha_rad, beta_rad)
+    weights *= collection_efficiency
+
+    # the value at the maximum scattering angle, interpolated between the samples around it.
+    end_efficiency = kohl_collection_efficiencies(max_scattering_angle_rad[:, numpy.newaxis], alpha_rad, beta_rad)[:, 0]
+    end_weight = last_step / 2 * end_efficiency
+    weights[rows, last_index] += end_weight * (1 - last_fraction)
+    weights[rows, last_index + 1] += end_weight * last_fraction
+
+    return weights
+
+
+# the number of Gauss-Legendre nodes of each panel of the adaptive quadrature and the most panels of one integral.
+GAUSS_LEGENDRE_ORDER = 6
+MAX_ADAPTIVE_PANEL_COUNT = 256
+
+_GAUSS_LEGENDRE_NODES, _GAUSS_LEGENDRE_WEIGHTS = numpy.polynomial.legendre.leggauss(GAUSS_LEGENDRE_ORDER)
+
+
+class AdaptivePartialCrossSection(typing.NamedTuple):
+    """A partial cross-section integrated to a tolerance, its estimated absolute error, both in units of nm * nm, and
+    the number of double differential cross-section evaluations used."""
+    cross_section_nm2: float
+    error_estimate_nm2: float
+    evaluation_count: int
+
+
+def adaptive_partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_index: int,
+                                       edge_onset_eV: float, edge_delta_eV: float, beam_energy_eV: float,
+                                       convergence_angle_rad: float, collection_angle_rad: float,
+                                       tolerance: float = 1e-3) -> AdaptivePartialCrossSection:
+    """Return the partial cross section integrated adaptively to the relative tolerance, with an error estimate.
+
+    Rather than integrating the GOS over a fixed grid of scattering angles and energy losses, as
+    partial_cross_section_nm2 does, the double differential cross-section is integrated over Gauss-Legendre panels
+    which are bisected where the integral has not converged. The angular integration is over log(1 + (theta/thetaE)^2),
+    with thetaE the characteristic angle at the edge onset, which samples the peak at thetaE densely and the tail
+    logarithmically; the solid angle is split where the Kohl collection efficiency has kinks. The energy integration is
+    split where the hydrogenic GOS changes from bound to free states.
+
+    The error estimate is the difference between each panel rule and the rule on its two halves, summed over the
+    panels, plus the estimated error of the angular integrals; it is conservative for smooth integrands.
     """
+    assert beam_energy_eV > 0
+    assert edge_onset_eV > 0
+    assert edge_delta_eV > 0
+    assert convergence_angle_rad >= 0
+    assert collection_angle_rad > 0
+    assert atomic_number >= 1
+    assert shell_number == 1, "No GOS routine available for L, M, N, and O electron shells."
+    assert subshell_index == 1
+    assert tolerance > 0
 
-    # Generate the energy differential cross-section array.
-    energyDiffSigma = energy_diff_cross_section_nm2_per_ev(atomic_number, shell_number, subshell_index,
-                                                           edge_onset_eV, edge_delta_eV, beam_energy_eV,
-                                                           convergence_angle_rad, collection_angle_rad)
+    electronRestEnergy_eV = 510999.0
+    fineStructureConstant = 1 / 137.036
+    rydbergEnergy_eV = 0.5 * electronRestEnergy_eV * fineStructureConstant ** 2
 
-    # Integrate over energy window to get partial cross-section
-    energySampleCount = energyDiffSigma.shape[0]
-    energy_step = edge_delta_eV / (energySampleCount - 1)
-    partialCrossSection = typing.cast(float, scipy.integrate.trapezoid(energyDiffSigma, dx = energy_step))
+    beamGamma = 1 + beam_energy_eV / electronRestEnergy_eV
+    beamBeta2 = 1 - 1 / beamGamma ** 2
+    thetaE = edge_onset_eV / (beamGamma * beamBeta2 * electronRestEnergy_eV)
 
-    return partialCrossSection
+    # the solid angle, in terms of x = log(1 + (theta/thetaE)^2), split where the collection efficiency has kinks.
+    max_scattering_angle_rad = convergence_angle_rad + collection_angle_rad
+    theta_breakpoints_rad = [0.0, max_scattering_angle_rad]
+    if 0 < convergence_angle_rad != collection_angle_rad:
+        theta_breakpoints_rad.insert(1, abs(convergence_angle_rad - collection_angle_rad))
+    x_breakpoints = [float(numpy.log1p((theta_rad / thetaE) ** 2)) for theta_rad in theta_breakpoints_rad]
+
+    def get_double_diff_cross_sections(x: DataArrayType, energies_eV: DataArrayType) -> DataArrayType:
+        # d2sigma/dOmega dE times the collection efficiency times dOmega/dx = pi thetaE^2 exp(x).
+        theta_rad = thetaE * numpy.sqrt(numpy.expm1(x))
+        dSigma = k_shell_double_diff_cross_section_nm2_per_ev_sr(atomic_number, energies_eV, beam_energy_eV, theta_rad)
+        collection_efficiency = kohl_collection_efficiency(theta_rad, convergence_angle_rad, collection_angle_rad)
+        return typing.cast(DataArrayType, dSigma * (numpy.pi * thetaE ** 2 * numpy.exp(x) * collection_efficiency)[:, numpy.newaxis])
+
+    evaluation_count = 0
+
+    def get_energy_diff_cross_sections(energies_eV: DataArrayType) -> DataArrayType:
+        # the energy differential cross-sections and the error estimates of their angular integrals, with shape (n,2).
+        nonlocal evaluation_count
+        energy_diff_sigma, energy_diff_sigma_error, count = _integrate_adaptively(lambda x: get_double_diff_cross_sections(x, energies_eV),
+                                                                                  x_breakpoints, numpy.array(tolerance / 10))
+        evaluation_count += count * energies_eV.shape[0]
+        return numpy.stack([energy_diff_sigma, energy_diff_sigma_error], axis=-1)
+
+    # the energy loss range, split where the GOS changes from bound to free states.
+    screenedZ2 = (atomic_number - 0.5) ** 2 if atomic_number > 1 else 1.0
+    energy_breakpoints_eV = [edge_onset_eV, edge_onset_eV + edge_delta_eV]
+    if edge_onset_eV < screenedZ2 * rydbergEnergy_eV < edge_onset_eV + edge_delta_eV:
+        energy_breakpoints_eV.insert(1, screenedZ2 * rydbergEnergy_eV)
+
+    # the tolerance controls the cross-section, but not the integrated error estimate of the angular integrals.
+    values, errors, _ = _integrate_adaptively(get_energy_diff_cross_sections, energy_breakpoints_eV, numpy.array([tolerance, numpy.inf]))
+    return AdaptivePartialCrossSection(float(values[0]), float(errors[0] + values[1]), evaluation_count)
+
+
+def _integrate_adaptively(fn: typing.Callable[[DataArrayType], DataArrayType], breakpoints: typing.Sequence[float],
+                          tolerance: DataArrayType) -> typing.Tuple[DataArrayType, DataArrayType, int]:
+    # integrate fn, which maps n nodes to an array with shape (n,m), over the increasing breakpoints with Gauss-Legendre
+    # panels, bisecting the panels with the largest errors until the estimated error of each of the m integrals is at
+    # most tolerance, broadcast to (m,), times its magnitude. return the integrals, their estimated errors and the
+    # number of nodes evaluated.
+    #
+    # each panel is integrated with the rule on its two halves, and its error estimated by the difference from the rule
+    # on the whole panel. a bisected panel becomes two panels whose whole rules are its halves, so only their halves
+    # are evaluated.
+    evaluation_count = 0
+
+    def integrate(panel_lows: DataArrayType, panel_highs: DataArrayType) -> DataArrayType:
+        # the rules on the panels, with shape (p,m), from one evaluation of fn.
+        nonlocal evaluation_count
+        half_widths = (panel_highs - panel_lows) / 2
+        x = (panel_lows + half_widths)[:, numpy.newaxis] + half_widths[:, numpy.newaxis] * _GAUSS_LEGENDRE_NODES
+        evaluation_count += x.size
+        values = fn(numpy.ravel(x)).reshape(x.shape + (-1,))
+        return typing.cast(DataArrayType, half_widths[:, numpy.newaxis] * numpy.einsum("j,pjm->pm", _GAUSS_LEGENDRE_WEIGHTS, values))
+
+    def integrate_halves(lows: DataArrayType, highs: DataArrayType) -> typing.Tuple[DataArrayType, DataArrayType]:
+        # the rules on the left and right halves of the panels, with shape (p,m).
+        mids = (lows + highs) / 2
+        integrals = integrate(numpy.concatenate([lows, mids]), numpy.concatenate([mids, highs]))
+        return integrals[:lows.shape[0]], integrals[lows.shape[0]:]
+
+    breakpoints_array = numpy.asarray(breakpoints, dtype=numpy.float64)
+    intervals = breakpoints_array[1:] > breakpoints_array[:-1]
+    lows, highs = breakpoints_array[:-1][intervals], breakpoints_array[1:][intervals]
+    # the whole rules and the halves of the initial panels from one evaluation of fn.
+    mids = (lows + highs) / 2
+    integrals = integrate(numpy.concatenate([lows, lows, mids]), numpy.concatenate([highs, mids, highs]))
+    wholes, lefts, rights = numpy.split(integrals, 3)
+    while True:
+        values = lefts + rights
+        errors = numpy.abs(values - wholes)
+        value = numpy.sum(values, axis=0)
+        error = numpy.sum(errors, axis=0)
+        allowed_error = tolerance * numpy.abs(value)
+        if numpy.all(error <= allowed_error) or lows.shape[0] >= MAX_ADAPTIVE_PANEL_COUNT:
+            return value, error, evaluation_count
+        # bisect the panels with errors near the largest, relative to the allowed error of each integral.
+        scaled_errors = numpy.amax(errors / numpy.fmax(allowed_error, numpy.finfo(numpy.float64).tiny), axis=-1)
+        split_indexes = numpy.argsort(-scaled_errors)[:MAX_ADAPTIVE_PANEL_COUNT - lows.shape[0]]
+        split_indexes = split_indexes[scaled_errors[split_indexes] >= scaled_errors[split_indexes[0]] / 2]
+        kept_indexes = numpy.setdiff1d(numpy.arange(lows.shape[0]), split_indexes)
+        mids = (lows[split_indexes] + highs[split_indexes]) / 2
+        split_lows = numpy.concatenate([lows[split_indexes], mids])
+        split_highs = numpy.concatenate([mids, highs[split_indexes]])
+        split_wholes = numpy.concatenate([lefts[split_indexes], rights[split_indexes]])
+        split_lefts, split_rights = integrate_halves(split_lows, split_highs)
+        lows = numpy.concatenate([lows[kept_indexes], split_lows])
+        highs = numpy.concatenate([highs[kept_indexes], split_highs])
+        wholes = numpy.concatenate([wholes[kept_indexes], split_wholes])
+        lefts = numpy.concatenate([lefts[kept_indexes], split_lefts])
+        rights = numpy.concatenate([rights[kept_indexes], split_rights])
@@ -3,49 +3,249 @@
 
     A library of functions for identifying and getting information about EELS ionization edges.
 
+    Edge onsets are found in whole spectrum images, or in single or summed spectra, at once: the logarithm of each
+    spectrum is smoothed and differentiated along the energy axis, and an onset is a maximum of the first derivative,
+    where the second derivative falls through zero, which rises above the slope of the background on either side. The
+    onsets are then matched against the edges of the periodic table, indexed by energy, within a tolerance and ranked
+    by their distance from the nominal binding energy.
 """
 
+from __future__ import annotations
+
 # standard libraries
-import collections
+import math
 import typing
 
-ElectronShell = collections.namedtuple("ElectronShell", ['atomic_number', 'shell_number', 'subshell_index'])
+# third party libraries
+import numpy
+import numpy.typing
+import scipy.ndimage
 
-class Singleton(type):
-    def __init__(cls, name: str, bases: typing.Tuple[typing.Type[typing.Any], ...], d: typing.Dict[str, typing.Any]) -> None:
-        super(Singleton, cls).__init__(name, bases, d)
-        cls.instance: typing.Any = None
+# local libraries
+from nion.eels_analysis import BackgroundModel
+from nion.eels_analysis import PeriodicTable
 
-    def __call__(cls, *args: typing.Any, **kw: typing.Any) -> typing.Any:
-        if cls.instance is None:
-            cls.instance = super(Singleton, cls).__call__(*args, **kw)
-        return cls.instance
 
+DataArrayType = numpy.typing.NDArray[typing.Any]
 
-class PeriodicTable(metaclass=Singleton):
-    def __init__(self) -> None:
-        pass
+ElectronShell = PeriodicTable.ElectronShell
 
-    def nominal_binding_energy_ev(self, electron_shell: ElectronShell) -> float:
-        return 0.0
+# the smallest intensity relative to the largest in a spectrum taken into the logarithm, so that channels without
+# counts do not produce onsets.
+MIN_RELATIVE_INTENSITY = 1e-4
 
+# the default smoothing of the spectra, which suppresses the noise of the derivatives and the fine structure of the edges.
+DEFAULT_SMOOTHING_EV = 2.0
 
-"""
-def candidate_edges(edge_onset_eV: float, max_offset_eV: float, primary_subshells_only: bool) -> list:
-    # Return a list of edges near the specified edge onset energy.
-    pass
 
-def edge_identity(edge_onset_eV: float, element_symbol: str, atomic_number: int) -> ElectronShell:
-    pass
+class EdgeCandidate(typing.NamedTuple):
+    """An edge matching an onset, its nominal binding energy, the offset of the binding energy from the onset, both in
+    eV, and the score of the match, between 0 and 1, which decreases with the offset relative to the tolerance."""
+    electron_shell: PeriodicTable.ElectronShell
+    edge_energy_eV: float
+    offset_eV: float
+    score: float
 
-def electron_shell(element_symbol: str, atomic_number: int, shell_number: int, subshell_index: int) -> ElectronShell:
-    pass
 
-def element_edges(element_symbol: str, atomic_number: int, shell_number: int) -> list:
-    pass
+class EdgeOnset(typing.NamedTuple):
+    """An edge onset found in a spectrum, its relative jump in intensity, the significance of the jump in units of its
+    noise, and its candidate edges, best first."""
+    onset_energy_eV: float
+    relative_jump: float
+    significance: float
+    candidates: typing.Sequence[EdgeCandidate]
 
-def nominal_edge_onset_eV(edge: ElectronShell) -> float:
-    # Return the electron binding energy for the given edge.
-    # Return value is in eV.
-    pass
-"""
+
+class EdgeOnsets(typing.NamedTuple):
+    """The edge onsets found in data with the navigation shape, as parallel arrays ordered by the flattened navigation
+    index of the spectrum of each onset, then by energy."""
+    navigation_shape: typing.Tuple[int, ...]
+    spectrum_indexes: DataArrayType
+    onset_energies_eV: DataArrayType
+    relative_jumps: DataArrayType
+    significances: DataArrayType
+
+
+def find_edge_onsets(data: numpy.typing.ArrayLike, energy_offset_eV: float, energy_scale_eV: float,
+                     smoothing_eV: typing.Optional[float] = None, min_relative_jump: float = 0.05,
+                     min_significance: float = 5.0, energy_interval_eV: typing.Optional[typing.Tuple[float, float]] = None,
+                     max_onset_count: typing.Optional[int] = None,
+                     chunk_size: typing.Optional[int] = None) -> EdgeOnsets:
+    """Return the edge onsets in the spectra of data, with the energy loss as its last axis.
+
+    The energy loss of channel i is energy_offset_eV + i * energy_scale_eV. The logarithm of each spectrum is smoothed
+    with a Gaussian of standard deviation smoothing_eV, by default DEFAULT_SMOOTHING_EV or two channels, whichever is
+    larger, and differentiated. A step in the logarithm of height h, which is a jump in intensity by the factor exp(h),
+    is a peak of the first derivative of height h / (smoothing_eV * sqrt(2 pi)) above the background slope, which is
+    estimated as the mean of the first derivative three standard deviations on either side of the peak. The
+    significance of h is h over its standard deviation, which is propagated from the local variance of the logarithm,
+    estimated from the squared differences of neighboring channels with outliers, such as the edges themselves, clipped.
+    Onsets whose relative jump, exp(h) - 1, is at least min_relative_jump, with at least min_significance, which are
+    inside energy_interval_eV if given, are returned, at most max_onset_count per spectrum, the largest jumps first. The
+    onset energies are interpolated between channels.
+
+    data may be a single spectrum, a summed spectrum, or a spectrum image of any navigation shape; chunk_size limits
+    the number of spectra processed at once.
+    """
+    data = numpy.asarray(data)
+    navigation_shape = tuple(data.shape[:-1])
+    channel_count = data.shape[-1]
+    spectra = data.reshape(-1, channel_count)
+    sigma = max((smoothing_eV / energy_scale_eV) if smoothing_eV is not None else max(DEFAULT_SMOOTHING_EV / energy_scale_eV, 2.0), 0.5)
+    # skip the channels near the ends, where the filters see the padding.
+    margin = int(math.ceil(3 * sigma))
+    first_channel, last_channel = margin, channel_count - 1 - margin
+    if energy_interval_eV is not None:
+        first_channel = max(first_channel, int(math.ceil((energy_interval_eV[0] - energy_offset_eV) / energy_scale_eV)))
+        last_channel = min(last_channel, int(math.floor((energy_interval_eV[1] - energy_offset_eV) / energy_scale_eV)))
+    spectrum_indexes_list = list()
+    onset_energies_list = list()
+    relative_jumps_list = list()
+    significances_list = list()
+    if last_channel > first_channel:
+        min_log_jump = math.log1p(min_relative_jump)
+        jump_scale = sigma * energy_scale_eV * math.sqrt(2 * math.pi)
+        # the variance of h per unit variance of the logarithm in each channel, for uncorrelated channels: the squared
+        # derivative filter, for the peak and the mean of the two baseline samples.
+        impulse = numpy.zeros((2 * int(math.ceil(4 * sigma)) + 1,))
+        impulse[impulse.shape[0] // 2] = 1.0
+        jump_variance_factor = 1.5 * (sigma * math.sqrt(2 * math.pi)) ** 2 * float(numpy.sum(scipy.ndimage.gaussian_filter1d(impulse, sigma, order=1) ** 2))
+        noise_sigma = 4 * sigma
+        for navigation_slice in BackgroundModel.iterate_navigation_chunks(spectra.shape[0], chunk_size):
+            block = spectra[navigation_slice].astype(numpy.float64)
+            floor = numpy.fmax(numpy.amax(block, axis=-1, keepdims=True) * MIN_RELATIVE_INTENSITY, numpy.finfo(numpy.float64).tiny)
+            log_block = numpy.log(numpy.fmax(block, floor))
+            d1 = scipy.ndimage.gaussian_filter1d(log_block, sigma, axis=-1, order=1, mode="nearest") / energy_scale_eV
+            d2 = scipy.ndimage.gaussian_filter1d(log_block, sigma, axis=-1, order=2, mode="nearest")
+            # the second derivative falls through zero between channel i and i + 1.
+            d2_window = d2[:, first_channel:last_channel + 1]
+            rows, channels = numpy.nonzero((d2_window[:, :-1] > 0) & (d2_window[:, 1:] <= 0))
+            channels = channels + first_channel
+            fractions = d2[rows, channels] / (d2[rows, channels] - d2[rows, channels + 1])
+            peak_d1 = d1[rows, channels] * (1 - fractions) + d1[rows, channels + 1] * fractions
+            baseline_d1 = 0.5 * (d1[rows, numpy.maximum(channels - margin, 0)] + d1[rows, numpy.minimum(channels + 1 + margin, channel_count - 1)])
+            log_jumps = (peak_d1 - baseline_d1) * jump_scale
+            found = log_jumps >= min_log_jump
+            rows, channels, fractions, log_jumps = rows[found], channels[found], fractions[found], log_jumps[found]
+            # the local variance of the logarithm, half the smoothed squared difference of neighboring channels,
+            # smoothed again after clipping the differences more than three standard deviations from the first pass.
+            squared_differences = numpy.square(numpy.diff(log_block[numpy.unique(rows)], axis=-1))
+            smoothed_squared_differences = scipy.ndimage.gaussian_filter1d(squared_differences, noise_sigma, axis=-1, mode="nearest")
+            smoothed_squared_differences = scipy.ndimage.gaussian_filter1d(numpy.fmin(squared_differences, 9 * smoothed_squared_differences), noise_sigma, axis=-1, mode="nearest")
+            noise_rows = numpy.searchsorted(numpy.unique(rows), rows)
+            log_jump_noises = numpy.sqrt(0.5 * smoothed_squared_differences[noise_rows, channels] * jump_variance_factor)
+            significances = log_jumps / numpy.fmax(log_jump_noises, numpy.finfo(numpy.float64).tiny)
+            significant = significances >= min_significance
+            spectrum_indexes_list.append(rows[significant] + navigation_slice.start)
+            onset_energies_list.append(energy_offset_eV + (channels[significant] + fractions[significant]) * energy_scale_eV)
+            relative_jumps_list.append(numpy.expm1(log_jumps[significant]))
+            significances_list.append(significances[significant])
+    spectrum_indexes = numpy.concatenate(spectrum_indexes_list) if spectrum_indexes_list else numpy.zeros((0,), dtype=numpy.intp)
+    onset_energies_eV = numpy.concatenate(onset_energies_list) if onset_energies_list else numpy.zeros((0,))
+    relative_jumps = numpy.concatenate(relative_jumps_list) if relative_jumps_list else numpy.zeros((0,))
+    significances = numpy.concatenate(significances_list) if significances_list else numpy.zeros((0,))
+    if max_onset_count is not None and spectrum_indexes.shape[0] > 0:
+        # rank the onsets of each spectrum by decreasing jump and keep the first max_onset_count.
+        order = numpy.lexsort((-relative_jumps, spectrum_indexes))
+        sorted_spectrum_indexes = spectrum_indexes[order]
+        group_starts = numpy.searchsorted(sorted_spectrum_indexes, sorted_spectrum_indexes, side="left")
+        kept = numpy.sort(order[numpy.arange(order.shape[0]) - group_starts < max_onset_count])
+        spectrum_indexes, onset_energies_eV, relative_jumps, significances = spectrum_indexes[kept], onset_energies_eV[kept], relative_jumps[kept], significances[kept]
+    return EdgeOnsets(navigation_shape, spectrum_indexes, onset_energies_eV, relative_jumps, significances)
+
+
+def match_edges(onset_energies_eV: numpy.typing.ArrayLike, tolerance_eV: float, primary_subshells_only: bool = True,
+                atomic_numbers: typing.Optional[typing.Collection[int]] = None,
+                max_candidate_count: typing.Optional[int] = None) -> typing.List[typing.List[EdgeCandidate]]:
+    """Return the candidate edges of each onset energy, the edges with binding energies within tolerance_eV, best first.
+
+    The candidates are ranked by their score, exp(-(offset / tolerance_eV)^2 / 2), with ties in the order of the
+    periodic table. If primary_subshells_only, only the lowest energy edge of each shell is matched, otherwise every
+    subshell is; atomic_numbers restricts the edges to those elements. At most max_candidate_count candidates are
+    returned for each onset.
+    """
+    onset_energies_eV = numpy.atleast_1d(numpy.asarray(onset_energies_eV, dtype=numpy.float64))
+    edge_energies, electron_shells = PeriodicTable.PeriodicTable().get_sorted_edges(primary_subshells_only)
+    edge_indexes = numpy.arange(edge_energies.shape[0])
+    if atomic_numbers is not None:
+        edge_indexes = edge_indexes[numpy.isin([electron_shell.atomic_number for electron_shell in electron_shells], list(atomic_numbers))]
+        edge_energies = edge_energies[edge_indexes]
+    # find the range of edges within the tolerance of every onset at once, then gather all the matches.
+    starts = numpy.searchsorted(edge_energies, onset_energies_eV - tolerance_eV, side="left")
+    stops = numpy.searchsorted(edge_energies, onset_energies_eV + tolerance_eV, side="right")
+    counts = stops - starts
+    onset_indexes = numpy.repeat(numpy.arange(onset_energies_eV.shape[0]), counts)
+    match_indexes = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(onset_indexes.shape[0])
+    offsets_eV = edge_energies[match_indexes] - onset_energies_eV[onset_indexes]
+    scores = numpy.exp(-0.5 * (offsets_eV / tolerance_eV) ** 2)
+    order = numpy.lexsort((match_indexes, -scores, onset_indexes))
+    candidates_list: typing.List[typing.List[EdgeCandidate]] = [list() for _ in range(onset_energies_eV.shape[0])]
+    for onset_index, match_index, offset_eV, score in zip(onset_indexes[order].tolist(), match_indexes[order].tolist(), offsets_eV[order].tolist(), scores[order].tolist()):
+        candidates = candidates_list[onset_index]
+        if max_candidate_count is None or len(candidates) < max_candidate_count:
+            candidates.append(EdgeCandidate(electron_shells[edge_indexes[match_index]], float(edge_energies[match_index]), offset_eV, score))
+    return candidates_list
+
+
+class EdgeIdentification:
+    """The edge onsets found in the spectra of a spectrum image, or in a single spectrum, with their candidate edges.
+
+    The onsets of the spectrum at a navigation index are returned by get_edge_onsets.
+    """
+
+    def __init__(self, edge_onsets: EdgeOnsets, candidates: typing.Sequence[typing.Sequence[EdgeCandidate]]) -> None:
+        assert len(candidates) == edge_onsets.onset_energies_eV.shape[0]
+        self.edge_onsets = edge_onsets
+        self.candidates = candidates
+
+    @property
+    def navigation_shape(self) -> typing.Tuple[int, ...]:
+        return self.edge_onsets.navigation_shape
+
+    @property
+    def onset_count(self) -> int:
+        return len(self.candidates)
+
+    def get_edge_onsets(self, navigation_index: typing.Sequence[int] = ()) -> typing.List[EdgeOnset]:
+        """Return the edge onsets of the spectrum at the navigation index, in increasing energy."""
+        spectrum_index = int(numpy.ravel_multi_index(tuple(navigation_index), self.navigation_shape)) if self.navigation_shape else 0
+        start = int(numpy.searchsorted(self.edge_onsets.spectrum_indexes, spectrum_index, side="left"))
+        stop = int(numpy.searchsorted(self.edge_onsets.spectrum_indexes, spectrum_index, side="right"))
+        return [EdgeOnset(float(self.edge_onsets.onset_energies_eV[i]), float(self.edge_onsets.relative_jumps[i]),
+                          float(self.edge_onsets.significances[i]), self.candidates[i]) for i in range(start, stop)]
+
+    def get_element_counts(self) -> typing.Dict[int, int]:
+        """Return the number of spectra in which each element, by atomic number, is the best candidate of an onset."""
+        spectra_by_element: typing.Dict[int, typing.Set[int]] = dict()
+        for spectrum_index, candidates in zip(self.edge_onsets.spectrum_indexes.tolist(), self.candidates):
+            if candidates:
+                spectra_by_element.setdefault(candidates[0].electron_shell.atomic_number, set()).add(spectrum_index)
+        return {atomic_number: len(spectra) for atomic_number, spectra in sorted(spectra_by_element.items())}
+
+
+def identify_edges(data: numpy.typing.ArrayLike, energy_offset_eV: float, energy_scale_eV: float,
+                   tolerance_eV: float = 10.0, *, smoothing_eV: typing.Optional[float] = None,
+                   min_relative_jump: float = 0.05, min_significance: float = 5.0,
+                   energy_interval_eV: typing.Optional[typing.Tuple[float, float]] = None,
+                   max_onset_count: typing.Optional[int] = None, primary_subshells_only: bool = True,
+                   atomic_numbers: typing.Optional[typing.Collection[int]] = None,
+                   max_candidate_count: typing.Optional[int] = 5,
+                   chunk_size: typing.Optional[int] = None) -> EdgeIdentification:
+    """Return the edge onsets in the spectra of data, with the energy loss as its last axis, and their candidate edges.
+
+    See find_edge_onsets for the detection of the onsets and match_edges for their candidates.
+    """
+    edge_onsets = find_edge_onsets(data, energy_offset_eV, energy_scale_eV, smoothing_eV, min_relative_jump,
+                                   min_significance, energy_interval_eV, max_onset_count, chunk_size)
+    candidates = match_edges(edge_onsets.onset_energies_eV, tolerance_eV, primary_subshells_only, atomic_numbers, max_candidate_count)
+    return EdgeIdentification(edge_onsets, candidates)
+
+
+def candidate_edges(edge_onset_eV: float, max_offset_eV: float, primary_subshells_only: bool = True) -> typing.List[EdgeCandidate]:
+    """Return the edges near the specified edge onset energy, best first."""
+    return match_edges([edge_onset_eV], max_offset_eV, primary_subshells_only)[0]
+
+
+def nominal_edge_onset_eV(edge: PeriodicTable.ElectronShell) -> typing.Optional[float]:
+    """Return the electron binding energy for the given edge, in eV, or None if it is unknown."""
+    return typing.cast(typing.Optional[float], PeriodicTable.PeriodicTable().nominal_binding_energy_ev(edge))
@@ -0,0 +1,116 @@
+"""
+    Fit Executor
+
+    Run per-spectrum fit functions over a stack of spectra on a thread or process pool.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import concurrent.futures
+import os
+import threading
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+# None
+
+
+DataArrayType = numpy.typing.NDArray[typing.Any]
+SpectrumFunctionType = typing.Callable[[DataArrayType], DataArrayType]
+
+
+class FitModelLike(typing.Protocol):
+    # thread_safe indicates the per-spectrum fit may run concurrently with itself on several threads.
+    # releases_gil indicates the per-spectrum fit spends most of its time outside the GIL (numpy, scipy), so that
+    # running it on threads gives a speedup.
+    thread_safe: bool
+    releases_gil: bool
+
+
+def _map_spectra(fn: SpectrumFunctionType, yss: DataArrayType, result_shape: typing.Tuple[int, ...], dtype: numpy.typing.DTypeLike) -> DataArrayType:
+    # apply fn to each spectrum (last axis) of yss and return the results stacked with shape yss.shape[:-1] + result_shape
+    result = numpy.empty(yss.shape[:-1] + result_shape, dtype=dtype)
+    for index in numpy.ndindex(*yss.shape[:-1]):
+        result[index] = fn(yss[index])
+    return result
+
+
+class FitExecutor:
+    """Split a stack of spectra with shape (m,L) into chunks and apply a per-spectrum function to each chunk.
+
+    The executor kind is "thread" or "process". Threads are used only for models declaring both thread_safe and
+    releases_gil; other models run serially. Processes are used for any model, but the function (and so the model)
+    must be picklable.
+
+    Results are written into the output in chunk order, so the output is the same regardless of the worker count.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: typing.Optional[int] = None, chunk_size: int = 1024) -> None:
+        assert kind in ("thread", "process")
+        assert chunk_size > 0
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.__executor: typing.Optional[concurrent.futures.Executor] = None
+        self.__lock = threading.RLock()
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # pools and locks are not picklable; models sent to a worker process carry the configuration only.
+        return {"kind": self.kind, "max_workers": self.max_workers, "chunk_size": self.chunk_size}
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        self.__init__(**state)  # type: ignore[misc]
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__executor:
+                self.__executor.shutdown()
+                self.__executor = None
+
+    def __get_executor(self) -> concurrent.futures.Executor:
+        with self.__lock:
+            if not self.__executor:
+                if self.kind == "process":
+                    self.__executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fit-executor")
+            return self.__executor
+
+    def is_parallel_for_model(self, model: FitModelLike) -> bool:
+        if self.max_workers < 2:
+            return False
+        if self.kind == "process":
+            return True
+        return bool(getattr(model, "thread_safe", False) and getattr(model, "releases_gil", False))
+
+    def map_spectra(self, model: FitModelLike, fn: SpectrumFunctionType, yss: DataArrayType,
+                    result_shape: typing.Tuple[int, ...], dtype: numpy.typing.DTypeLike = numpy.float64) -> DataArrayType:
+        """Apply fn to each spectrum of yss, with shape (...,L), returning an array with shape (...) + result_shape."""
+        m = int(numpy.prod(yss.shape[:-1], dtype=numpy.uint64))
+        if m <= self.chunk_size or not self.is_parallel_for_model(model):
+            return _map_spectra(fn, yss, result_shape, dtype)
+        navigation_shape = yss.shape[:-1]
+        yss = numpy.reshape(yss, (m, yss.shape[-1]))
+        result = numpy.empty((m,) + result_shape, dtype=dtype)
+        executor = self.__get_executor()
+        starts = range(0, m, self.chunk_size)
+        futures = [executor.submit(_map_spectra, fn, yss[start:start + self.chunk_size], result_shape, dtype) for start in starts]
+        for start, future in zip(starts, futures):
+            result[start:start + self.chunk_size] = future.result()
+        return numpy.reshape(result, navigation_shape + result_shape)
+
+
+_default_executor = FitExecutor()
+
+
+def get_default_executor() -> FitExecutor:
+    return _default_executor
+
+
+def set_default_executor(executor: FitExecutor) -> None:
+    global _default_executor
+    _default_executor = executor
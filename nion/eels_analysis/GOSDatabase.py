@@ -0,0 +1,199 @@
+"""
+    GOS Database
+
+    Tabulated generalized oscillator strengths (GOS) of electron shells versus energy loss and momentum transfer, stored
+    together in a binary file with an index header and memory-mapped when loaded, so that only the tables of the edges
+    being computed are read.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import json
+import pathlib
+import struct
+import typing
+
+# third party libraries
+import numpy
+import numpy.typing
+
+# local libraries
+# None
+
+
+DataArrayType = numpy.typing.NDArray[typing.Any]
+
+PathLike = typing.Union[str, pathlib.Path]
+
+ShellKeyType = typing.Tuple[int, int, int]
+
+# the file starts with the magic bytes and the length of the JSON header, which indexes the tables. the tables follow,
+# each aligned to DATA_ALIGNMENT bytes.
+MAGIC = b"NEELSGOS"
+FORMAT_VERSION = 1
+DATA_ALIGNMENT = 64
+
+# the smallest GOS interpolated, so that the logarithm of tables with zeros is finite.
+MIN_GOS_PER_EV = 1e-30
+
+
+class GOSTable:
+    """The generalized oscillator strength of one electron shell.
+
+    values is the GOS per unit energy loss, df/dE in units of 1 / eV, with the energy losses energies_eV, in increasing
+    order, along the 0-axis and the logarithms of the squared dimensionless momentum transfers, log((q a0)^2), in
+    increasing order, along the 1-axis. The axes need not be evenly spaced.
+
+    The GOS is interpolated linearly in the energy loss and in log((q a0)^2), and its logarithm is interpolated, which
+    follows the power law decrease at large momentum transfer. Momentum transfers below the table take the GOS of the
+    smallest, the optical limit; above the table the power law of the last two samples is continued, if it decreases.
+    Energy losses below the table, which are below the edge, have no GOS.
+    """
+
+    def __init__(self, atomic_number: int, shell_number: int, subshell_index: int, energies_eV: numpy.typing.ArrayLike,
+                 log_q2: numpy.typing.ArrayLike, values: DataArrayType) -> None:
+        self.atomic_number = int(atomic_number)
+        self.shell_number = int(shell_number)
+        self.subshell_index = int(subshell_index)
+        self.energies_eV = numpy.asarray(energies_eV, dtype=numpy.float64)
+        self.log_q2 = numpy.asarray(log_q2, dtype=numpy.float64)
+        self.values = values
+        assert self.energies_eV.ndim == 1 and self.energies_eV.shape[0] > 1 and numpy.all(numpy.diff(self.energies_eV) > 0)
+        assert self.log_q2.ndim == 1 and self.log_q2.shape[0] > 1 and numpy.all(numpy.diff(self.log_q2) > 0)
+        assert values.shape == (self.energies_eV.shape[0], self.log_q2.shape[0])
+        self.__log_values: typing.Optional[DataArrayType] = None
+        log_q2_steps = numpy.diff(self.log_q2)
+        self.__log_q2_step = float(numpy.mean(log_q2_steps)) if numpy.allclose(log_q2_steps, numpy.mean(log_q2_steps), rtol=1e-9, atol=0) else None
+
+    @property
+    def key(self) -> ShellKeyType:
+        return self.atomic_number, self.shell_number, self.subshell_index
+
+    def get_gos(self, energies_eV: numpy.typing.ArrayLike, Q2: numpy.typing.ArrayLike) -> DataArrayType:
+        """Return the interpolated GOS, in units of 1 / eV, at the energy losses and squared momentum transfers.
+
+        energies_eV is the 1-d array of energy losses and Q2 the squared dimensionless momentum transfers (q a0)^2, with
+        the energy loss as its last axis, like the Q^2 map of EELS_CrossSections.k_shell_hydrogenic_gos_q2. Raises
+        ValueError for energy losses above the table.
+        """
+        energies_eV = numpy.asarray(energies_eV, dtype=numpy.float64)
+        Q2 = numpy.asarray(Q2, dtype=numpy.float64)
+        if numpy.any(energies_eV > self.energies_eV[-1]):
+            raise ValueError(f"Energy loss {numpy.amax(energies_eV)} eV is above the GOS table of {self.key} (to {self.energies_eV[-1]} eV).")
+        if self.__log_values is None:
+            # reads the table, if it is memory-mapped.
+            self.__log_values = numpy.log(numpy.fmax(numpy.asarray(self.values, dtype=numpy.float64), MIN_GOS_PER_EV))
+        # interpolate the table to the energy losses first, giving one row of log values versus log_q2 per energy loss,
+        # then in log_q2 within the row of the energy loss of each column of Q2.
+        energy_indexes, energy_fractions = get_interpolation(self.energies_eV, energies_eV)
+        energy_fractions = energy_fractions[:, numpy.newaxis]
+        rows = self.__log_values[energy_indexes] * (1 - energy_fractions) + self.__log_values[energy_indexes + 1] * energy_fractions
+        log_Q2 = numpy.log(Q2)
+        if self.__log_q2_step is not None:
+            # evenly spaced axis, the usual case, without a search.
+            q_indexes = numpy.clip(((log_Q2 - self.log_q2[0]) / self.__log_q2_step).astype(int), 0, self.log_q2.shape[0] - 2)
+            q_fractions = (log_Q2 - self.log_q2[q_indexes]) / self.__log_q2_step
+        else:
+            q_indexes, q_fractions = get_interpolation(self.log_q2, log_Q2)
+        q_fractions = numpy.fmax(q_fractions, 0.0)
+        flat_indexes = q_indexes + numpy.arange(energies_eV.shape[0]) * self.log_q2.shape[0]
+        low_values = numpy.take(rows, flat_indexes)
+        slopes = numpy.take(rows, flat_indexes + 1) - low_values
+        beyond_table = q_fractions > 1.0
+        if numpy.any(beyond_table):
+            # continue the power law above the table only if it decreases.
+            slopes[beyond_table] = numpy.fmin(slopes[beyond_table], 0.0)
+        gos = numpy.exp(low_values + q_fractions * slopes)
+        gos[..., energies_eV < self.energies_eV[0]] = 0.0
+        return typing.cast(DataArrayType, gos)
+
+
+def get_interpolation(axis: DataArrayType, values: DataArrayType) -> typing.Tuple[DataArrayType, DataArrayType]:
+    """Return the index of the interval of the increasing axis containing each value and the fraction of the interval at the value.
+
+    Values outside the axis are in its first or last interval, with fractions below 0 or above 1.
+    """
+    indexes = numpy.clip(numpy.searchsorted(axis, values, side="right") - 1, 0, axis.shape[0] - 2)
+    return indexes, (values - axis[indexes]) / (axis[indexes + 1] - axis[indexes])
+
+
+class GOSDatabase:
+    """A collection of GOS tables, looked up by atomic number, shell number and subshell index."""
+
+    def __init__(self, tables: typing.Sequence[GOSTable]) -> None:
+        self.__tables = {table.key: table for table in tables}
+        assert len(self.__tables) == len(tables), "duplicate GOS tables"
+
+    @property
+    def shells(self) -> typing.List[ShellKeyType]:
+        return sorted(self.__tables.keys())
+
+    def get_table(self, atomic_number: int, shell_number: int, subshell_index: int) -> typing.Optional[GOSTable]:
+        return self.__tables.get((int(atomic_number), int(shell_number), int(subshell_index)))
+
+    def contains(self, atomic_number: int, shell_number: int, subshell_index: int, max_energy_eV: float) -> bool:
+        """Return whether the database has a table for the shell which extends to the energy loss."""
+        table = self.get_table(atomic_number, shell_number, subshell_index)
+        return table is not None and max_energy_eV <= table.energies_eV[-1]
+
+
+def write_gos_database(path: PathLike, tables: typing.Sequence[GOSTable]) -> None:
+    """Write the tables to a database file at path.
+
+    The JSON header indexes the tables by shell, with their axes and the offset of their float32 values in the data
+    that follows the header.
+    """
+    index: typing.List[typing.Dict[str, typing.Any]] = list()
+    offset = 0
+    for table in tables:
+        index.append({
+            "atomic_number": table.atomic_number,
+            "shell_number": table.shell_number,
+            "subshell_index": table.subshell_index,
+            "energies_eV": table.energies_eV.tolist(),
+            "log_q2": table.log_q2.tolist(),
+            "offset": offset,
+        })
+        offset += -(-table.values.size * 4 // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    header = {
+        "format": "nion.eels_analysis.gos_database",
+        "version": FORMAT_VERSION,
+        "dtype": numpy.dtype("<f4").str,
+        "tables": index,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    padding = -(len(MAGIC) + 8 + len(header_bytes)) % DATA_ALIGNMENT
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes) + padding))
+        f.write(header_bytes)
+        f.write(b" " * padding)
+        for table in tables:
+            data = numpy.ascontiguousarray(table.values, dtype=numpy.dtype("<f4")).tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % DATA_ALIGNMENT))
+
+
+def load_gos_database(path: PathLike) -> GOSDatabase:
+    """Return the database in the file at path. The tables are memory-mapped rather than read."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a GOS database.")
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has unsupported GOS database version {header.get('version')}.")
+    # map the data once; each table is a view of it, so the pages of a table are only read when it is interpolated.
+    data_offset = len(MAGIC) + 8 + header_length
+    dtype = numpy.dtype(header["dtype"])
+    data_size = (pathlib.Path(path).stat().st_size - data_offset) // dtype.itemsize
+    data = numpy.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=(data_size,)) if data_size > 0 else numpy.zeros((0,), dtype=dtype)
+    tables = list()
+    for entry in header["tables"]:
+        shape = (len(entry["energies_eV"]), len(entry["log_q2"]))
+        start = entry["offset"] // dtype.itemsize
+        values = data[start:start + shape[0] * shape[1]].reshape(shape)
+        tables.append(GOSTable(entry["atomic_number"], entry["shell_number"], entry["subshell_index"],
+                               entry["energies_eV"], entry["log_q2"], values))
+    return GOSDatabase(tables)
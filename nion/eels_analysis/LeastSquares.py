@@ -0,0 +1,172 @@
+"""
+    Least Squares
+
+    Solve many linear least squares problems sharing a basis, such as the background fits of the spectra of a spectrum
+    image, in batches.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import threading
+import typing
+
+# third party libraries
+import numpy
+import scipy.linalg
+
+# local libraries
+# None
+
+
+DataArrayType = numpy.typing.NDArray[typing.Any]
+
+
+class BatchedLeastSquares:
+    """Fit coefficients c minimizing |w * (y - B c)|^2 for each spectrum y of a stack, for a fixed basis B.
+
+    The basis has shape (L,p): one column per basis function evaluated at the L channels. Unweighted and uniformly
+    weighted fits of fully valid spectra use the QR factorization of the (weighted) basis, computed once and cached, so
+    that each chunk of spectra is solved with a single matrix product. Spectra with their own weights, a mask, or
+    non-finite channels are solved with batched normal equations, one small p x p system per spectrum; spectra with
+    fewer valid channels than basis functions have NaN coefficients.
+
+    rcond is the relative cutoff of the singular values of the basis below which the basis is treated as rank deficient
+    and the minimum norm solution is returned, as with numpy.linalg.lstsq.
+
+    Fits are computed in float64 unless another dtype is requested, for instance float32 for a basis which is well
+    conditioned in float32; the factorizations are always computed in float64.
+
+    The solver holds no state besides the cached factorizations, so it may be shared between threads.
+    """
+
+    def __init__(self, basis: numpy.typing.ArrayLike, rcond: typing.Optional[float] = None, chunk_size: int = 65536) -> None:
+        self.basis = numpy.asarray(basis, dtype=numpy.float64)
+        assert self.basis.ndim == 2
+        self.rcond = rcond if rcond is not None else numpy.finfo(numpy.float64).eps * max(self.basis.shape)
+        self.chunk_size = chunk_size
+        self.__lock = threading.RLock()
+        self.__solution_matrices: typing.Dict[bytes, DataArrayType] = dict()
+        # the products of the basis functions at each channel with shape (L,p*p), so that the normal matrices of a
+        # chunk of spectra are a single matrix product of the squared weights with this.
+        self.__basis_products = numpy.reshape(numpy.einsum("lp,lq->lpq", self.basis, self.basis), (self.channel_count, -1))
+        self.__matrices_by_dtype: typing.Dict[typing.Tuple[str, numpy.dtype[typing.Any]], DataArrayType] = dict()
+
+    @property
+    def channel_count(self) -> int:
+        return int(self.basis.shape[0])
+
+    @property
+    def basis_count(self) -> int:
+        return int(self.basis.shape[1])
+
+    def get_solution_matrix(self, weights: typing.Optional[DataArrayType] = None) -> DataArrayType:
+        """Return the (p,L) matrix mapping a spectrum to its coefficients for the channel weights, with shape (L)."""
+        key = weights.tobytes() if weights is not None else bytes()
+        with self.__lock:
+            solution_matrix = self.__solution_matrices.get(key)
+        if solution_matrix is None:
+            basis = self.basis * weights[:, numpy.newaxis] if weights is not None else self.basis
+            q, r = scipy.linalg.qr(basis, mode="economic")
+            diagonal = numpy.abs(numpy.diag(r))
+            if r.shape[0] == r.shape[1] and diagonal.size and numpy.amin(diagonal) > self.rcond * numpy.amax(diagonal):
+                solution_matrix = scipy.linalg.solve_triangular(r, q.T)
+            else:
+                solution_matrix = numpy.linalg.pinv(basis, rcond=self.rcond)
+            if weights is not None:
+                solution_matrix = solution_matrix * weights
+            with self.__lock:
+                # keep the unweighted factorization and the most recent weighted one.
+                if len(self.__solution_matrices) > 1:
+                    self.__solution_matrices = {k: v for k, v in self.__solution_matrices.items() if not k}
+                self.__solution_matrices[key] = solution_matrix
+        return solution_matrix
+
+    def fit(self, yss: numpy.typing.ArrayLike, weights: typing.Optional[numpy.typing.ArrayLike] = None,
+            mask: typing.Optional[numpy.typing.ArrayLike] = None, dtype: numpy.typing.DTypeLike = numpy.float64) -> DataArrayType:
+        """Return the coefficients, with shape (...,p), of the spectra yss, with shape (...,L).
+
+        weights are the channel weights w, with shape (L) for all spectra or (...,L) per spectrum. mask, with shape (L)
+        or (...,L), is True for the channels to fit. Non-finite channels are always excluded. The spectra are solved in
+        chunks of chunk_size, in dtype.
+        """
+        dtype = numpy.dtype(dtype)
+        yss = numpy.asarray(yss)
+        assert yss.shape[-1] == self.channel_count
+        navigation_shape = yss.shape[:-1]
+        yss_2d = numpy.reshape(yss, (-1, self.channel_count))
+        # weights for all spectra key the cached factorizations, so they are float64; per-spectrum weights are in dtype.
+        weights_array = numpy.asarray(weights) if weights is not None else None
+        if weights_array is not None:
+            weights_array = weights_array.astype(numpy.float64 if weights_array.ndim == 1 else dtype, copy=False)
+        mask_array = numpy.asarray(mask, dtype=bool) if mask is not None else None
+        coefficients = numpy.empty((yss_2d.shape[0], self.basis_count), dtype=dtype)
+        for start in range(0, yss_2d.shape[0], self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            coefficients[chunk] = self.__fit_chunk(yss_2d[chunk],
+                                                   self.__get_chunk(weights_array, navigation_shape, chunk),
+                                                   self.__get_chunk(mask_array, navigation_shape, chunk),
+                                                   dtype)
+        return numpy.reshape(coefficients, navigation_shape + (self.basis_count,))
+
+    def evaluate(self, coefficients: numpy.typing.ArrayLike, basis: typing.Optional[numpy.typing.ArrayLike] = None) -> DataArrayType:
+        """Return the fits, with shape (...,n), for the coefficients with shape (...,p), using basis with shape (n,p).
+
+        The basis defaults to the fitted basis.
+        """
+        basis_array = numpy.asarray(basis, dtype=numpy.float64) if basis is not None else self.basis
+        return typing.cast(DataArrayType, numpy.asarray(coefficients) @ basis_array.T)
+
+    def __get_matrix(self, name: str, matrix: DataArrayType, dtype: numpy.dtype[typing.Any]) -> DataArrayType:
+        # return the float64 matrix in dtype, converting it once.
+        key = (name, dtype)
+        with self.__lock:
+            matrix_in_dtype = self.__matrices_by_dtype.get(key)
+            if matrix_in_dtype is None:
+                matrix_in_dtype = matrix.astype(dtype, copy=False)
+                self.__matrices_by_dtype[key] = matrix_in_dtype
+        return matrix_in_dtype
+
+    def __get_chunk(self, array: typing.Optional[DataArrayType], navigation_shape: typing.Tuple[int, ...], chunk: slice) -> typing.Optional[DataArrayType]:
+        # return the rows of a per-spectrum array, with shape (...,L), for the chunk, or the array for all spectra.
+        if array is None or array.ndim == 1:
+            return array
+        return numpy.reshape(numpy.broadcast_to(array, navigation_shape + (self.channel_count,)), (-1, self.channel_count))[chunk]
+
+    def __fit_chunk(self, yss: DataArrayType, weights: typing.Optional[DataArrayType], mask: typing.Optional[DataArrayType],
+                    dtype: numpy.dtype[typing.Any]) -> DataArrayType:
+        finite = numpy.isfinite(yss)
+        all_finite = bool(numpy.all(finite))
+        if all_finite and (weights is None or weights.ndim == 1) and (mask is None or mask.ndim == 1):
+            if mask is not None:
+                weights = (weights if weights is not None else numpy.ones(self.channel_count)) * mask
+            return typing.cast(DataArrayType, yss.astype(dtype, copy=False) @ self.get_solution_matrix(weights).T.astype(dtype, copy=False))
+        # per-spectrum weights, masks or non-finite channels: solve the normal equations of each spectrum.
+        all_valid = all_finite and mask is None
+        valid = finite if mask is None else finite & numpy.broadcast_to(mask, yss.shape)
+        ys = yss.astype(dtype, copy=False) if all_valid else numpy.where(valid, yss, 0).astype(dtype, copy=False)
+        if weights is None:
+            w2 = valid.astype(dtype)
+        else:
+            w2 = numpy.square(numpy.broadcast_to(weights, yss.shape), dtype=dtype)
+            if not all_valid:
+                w2[~valid] = 0
+            ys = ys * w2
+        p = self.basis_count
+        normal_matrices = numpy.reshape(w2 @ self.__get_matrix("basis_products", self.__basis_products, dtype), (-1, p, p))
+        right_hand_sides = ys @ self.__get_matrix("basis", self.basis, dtype)
+        undetermined = numpy.count_nonzero(w2, axis=-1) < p
+        normal_matrices[undetermined] = numpy.identity(p)
+        try:
+            coefficients = numpy.linalg.solve(normal_matrices, right_hand_sides[..., numpy.newaxis])[..., 0]
+        except numpy.linalg.LinAlgError:
+            # a rank deficient basis over the valid channels; return the minimum norm solutions.
+            rcond = max(self.rcond ** 2, numpy.finfo(dtype).eps * p)
+            coefficients = numpy.einsum("mpq,mq->mp", numpy.linalg.pinv(normal_matrices, rcond=rcond, hermitian=True), right_hand_sides)
+        coefficients[undetermined] = numpy.nan
+        return typing.cast(DataArrayType, coefficients)
+
+
+def get_polynomial_basis(xs: numpy.typing.ArrayLike, deg: int) -> DataArrayType:
+    """Return the basis, with shape (L,deg+1), of the powers 0 to deg of xs."""
+    return typing.cast(DataArrayType, numpy.polynomial.polynomial.polyvander(numpy.asarray(xs, dtype=numpy.float64), deg))
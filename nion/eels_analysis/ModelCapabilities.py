@@ -0,0 +1,97 @@
+"""
+    Model Capabilities
+
+    Describe what the execution paths of a registered model support, and look up registered models by id.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import dataclasses
+import threading
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.utils import Registry
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelCapabilities:
+    """The capabilities of a background or zero loss peak model.
+
+    batched: the model fits all spectra at once (_perform_fits) rather than one spectrum at a time.
+    chunked: the fit of a spectrum is independent of the other spectra, so spectra can be fitted in blocks without
+        an extra pass over the data.
+    float32: float32 data is fitted and returned in float32 without an upcast copy.
+    analytic_integrals: the integral of the fit is computed in closed form (_perform_integrals) without evaluating the
+        fit for each channel.
+    coefficient_maps: the model supports coefficient maps (_perform_coefficient_fits).
+    thread_safe: the per-spectrum fit may run concurrently with itself on several threads.
+    releases_gil: the per-spectrum fit spends most of its time outside the GIL.
+    """
+    batched: bool = False
+    chunked: bool = True
+    float32: bool = False
+    analytic_integrals: bool = False
+    coefficient_maps: bool = False
+    thread_safe: bool = False
+    releases_gil: bool = False
+
+    @property
+    def parallel_threads(self) -> bool:
+        # whether running the per-spectrum fits on a thread pool gives a speedup.
+        return self.thread_safe and self.releases_gil
+
+
+# the precision policies for fitting: always float64 (the default), always float32, or float32 only for float32 data.
+PRECISIONS = ("float64", "float32", "data")
+
+
+def get_precision_dtype(precision: typing.Optional[str], data_dtype: typing.Optional[numpy.typing.DTypeLike]) -> numpy.dtype[typing.Any]:
+    """Return the dtype in which to fit data of data_dtype under the precision policy.
+
+    The fit windows are converted to this dtype before they are passed to the model, and models compute the fit in the
+    dtype they are passed, where it is numerically safe.
+    """
+    precision = precision or "float64"
+    assert precision in PRECISIONS
+    if precision == "float32" or (precision == "data" and numpy.dtype(data_dtype) == numpy.float32):
+        return numpy.dtype(numpy.float32)
+    return numpy.dtype(numpy.float64)
+
+
+class ModelIndex:
+    """An index of the registered components of a component type by their model id.
+
+    The index is rebuilt on the first lookup after a component of the type is registered or unregistered, so lookups
+    do not loop over the registry.
+    """
+
+    def __init__(self, component_type: str, model_id_attribute: str) -> None:
+        self.component_type = component_type
+        self.model_id_attribute = model_id_attribute
+        self.__lock = threading.RLock()
+        self.__models: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self.__component_registered_listener = Registry.listen_component_registered_event(self.__component_changed)
+        self.__component_unregistered_listener = Registry.listen_component_unregistered_event(self.__component_changed)
+
+    def __component_changed(self, component: Registry._ComponentType, component_types: typing.Set[str]) -> None:
+        if self.component_type in component_types:
+            with self.__lock:
+                self.__models = None
+
+    def __get_models(self) -> typing.Dict[str, typing.Any]:
+        with self.__lock:
+            if self.__models is None:
+                self.__models = {getattr(component, self.model_id_attribute): component for component in Registry.get_components_by_type(self.component_type)}
+            return self.__models
+
+    def get_model(self, model_id: str) -> typing.Optional[typing.Any]:
+        return self.__get_models().get(model_id)
+
+    @property
+    def model_ids(self) -> typing.List[str]:
+        return sorted(self.__get_models().keys())
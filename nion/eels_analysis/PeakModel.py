@@ -2,12 +2,16 @@ from __future__ import annotations
 
 # imports
 import copy
+import functools
 import gettext
 import numpy
 import typing
 
 # local libraries
 from nion.data import DataAndMetadata
+from nion.eels_analysis import BuiltInModels
+from nion.eels_analysis import FitExecutor
+from nion.eels_analysis import ModelCapabilities
 from nion.utils import Registry
 
 
@@ -16,21 +20,45 @@ DataArrayType = numpy.typing.NDArray[typing.Any]
 _ = gettext.gettext
 
 
+def _perform_fit_for_spectrum(zero_loss_peak_model: AbstractZeroLossPeakModel, z: int, ys: DataArrayType) -> DataArrayType:
+    return zero_loss_peak_model._perform_fit(ys, z)
+
+
 class AbstractZeroLossPeakModel:
+    # models implementing only _perform_fit can declare these to have their spectra fitted on a thread pool.
+    # see FitExecutor.FitModelLike.
+    thread_safe = False
+    releases_gil = False
+    # whether _perform_fits returns float32 fits of float32 spectra.
+    computes_in_float32 = False
+
     def __init__(self, zero_loss_peak_model_id: str, title: typing.Optional[str] = None) -> None:
         self.zero_loss_peak_model_id = zero_loss_peak_model_id
         self.title = title
-        self.package_title = _("EELS Analysis")
-
-    def fit_zero_loss_peak(self, *, spectrum_xdata: DataAndMetadata.DataAndMetadata, **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        self.package_title = BuiltInModels.PACKAGE_TITLE
+        # the executor for the per-spectrum _perform_fit fallback. None uses the shared default executor.
+        self.fit_executor: typing.Optional[FitExecutor.FitExecutor] = None
+
+    @property
+    def capabilities(self) -> ModelCapabilities.ModelCapabilities:
+        return ModelCapabilities.ModelCapabilities(
+            batched=type(self)._perform_fits is not AbstractZeroLossPeakModel._perform_fits,
+            float32=self.computes_in_float32,
+            thread_safe=self.thread_safe,
+            releases_gil=self.releases_gil)
+
+    def fit_zero_loss_peak(self, *, spectrum_xdata: DataAndMetadata.DataAndMetadata,
+                           precision: typing.Optional[str] = None,
+                           **kwargs: typing.Any) -> typing.Dict[str, typing.Any]:
+        # precision is the dtype policy of the fit; see ModelCapabilities.PRECISIONS. the default is float64.
         return {
-            "zero_loss_peak_model": self.__fit_zero_loss_peak(spectrum_xdata),
+            "zero_loss_peak_model": self.__fit_zero_loss_peak(spectrum_xdata, ModelCapabilities.get_precision_dtype(precision, spectrum_xdata.data_dtype)),
         }
 
-    def __fit_zero_loss_peak(self, spectrum_xdata: DataAndMetadata.DataAndMetadata) -> DataAndMetadata.DataAndMetadata:
+    def __fit_zero_loss_peak(self, spectrum_xdata: DataAndMetadata.DataAndMetadata, dtype: numpy.typing.DTypeLike) -> DataAndMetadata.DataAndMetadata:
         z = int(spectrum_xdata.dimensional_calibrations[-1].convert_from_calibrated_value(0.0))
         calibration = copy.deepcopy(spectrum_xdata.datum_dimensional_calibrations[0])
-        ys = spectrum_xdata.data
+        ys = spectrum_xdata._data_ex.astype(dtype, copy=False)
         if spectrum_xdata.is_navigable:
             calibrations = list(copy.deepcopy(spectrum_xdata.navigation_dimensional_calibrations)) + [calibration]
             yss = numpy.reshape(ys, (numpy.prod(ys.shape[:-1], dtype=numpy.uint64),) + (ys.shape[-1],))
@@ -53,10 +81,9 @@ class AbstractZeroLossPeakModel:
         # z is the index of the column of 0eV
         # return an ndarray of the fit with shape (m,L)
         # implement at least one of _perform_fits and _perform_fit
-        fit = numpy.empty(yss.shape)
-        for index in numpy.ndindex(yss.shape[:-1]):
-            fit[index] = self._perform_fit(yss[index], z)
-        return fit
+        fit_executor = self.fit_executor or FitExecutor.get_default_executor()
+        return fit_executor.map_spectra(self, functools.partial(_perform_fit_for_spectrum, self, z), yss, yss.shape[-1:],
+                                        ModelCapabilities.get_precision_dtype("data", yss.dtype))
 
     def _perform_fit(self, ys: DataArrayType, z: int) -> DataArrayType:
         # ys will be an array of y-values with shape (L)
@@ -67,6 +94,7 @@ class AbstractZeroLossPeakModel:
 
 
 class SimpleZeroLossPeakModel(AbstractZeroLossPeakModel):
+    computes_in_float32 = True
 
     def __init__(self, zero_loss_peak_model: str, title: typing.Optional[str] = None) -> None:
         super().__init__(zero_loss_peak_model, title)
@@ -74,11 +102,18 @@ class SimpleZeroLossPeakModel(AbstractZeroLossPeakModel):
     def _perform_fits(self, yss: DataArrayType, z: int) -> DataArrayType:
         left = max(0, z - 3)
         right = min(yss.shape[-1], z + 3)
-        result = numpy.zeros(yss.shape)
+        result = numpy.zeros(yss.shape, dtype=numpy.result_type(yss.dtype, numpy.float32))
         result[..., left:right] = yss[..., left:right]
         # print(f"{z=} {left=} {right=}")
         return result
 
 
+_zero_loss_peak_model_index = ModelCapabilities.ModelIndex("zlp-model", "zero_loss_peak_model_id")
+
+
+def get_zero_loss_peak_model(zero_loss_peak_model_id: str) -> typing.Optional[AbstractZeroLossPeakModel]:
+    return typing.cast(typing.Optional[AbstractZeroLossPeakModel], _zero_loss_peak_model_index.get_model(zero_loss_peak_model_id))
+
+
 # register models with the registry.
-Registry.register_component(SimpleZeroLossPeakModel("simple_peak_model", title=_("Simple")), {"zlp-model"})
+Registry.register_component(SimpleZeroLossPeakModel("simple_peak_model", title=BuiltInModels.BUILT_IN_ZERO_LOSS_PEAK_MODEL_TITLES["simple_peak_model"]), {"zlp-model"})
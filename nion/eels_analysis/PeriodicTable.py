@@ -3,12 +3,13 @@ from __future__ import annotations
 # standard libraries
 import fractions
 import json
-import operator
 import pkgutil
+import threading
 import typing
 
 # third party libraries
-# None
+import numpy
+import numpy.typing
 
 # local libraries
 # None
@@ -28,11 +29,42 @@ class Singleton(type):
 # shell_number === principle quantum number n, or K, L, M, N, O, P, etc.
 # subshell_index === EELS notation subshell
 # K = 1s, L1 = 2s, L2 = 2p1/2, L3 = 2p3/2, M1 = 3s, M2 = 3p1/2, M3 = 3p3/2, M4 = 3d1/2, M5 = 3d3/2, etc.
+#
+# electron shells are immutable and interned: constructing the same shell twice returns the same instance, so that
+# the edge lookups below do not allocate, and shells compare and hash by identity, which is by value.
 class ElectronShell:
-    def __init__(self, atomic_number: int, shell_number: int, subshell_index: int):
-        self.atomic_number = atomic_number
-        self.shell_number = shell_number
-        self.subshell_index = subshell_index
+    __slots__ = ("atomic_number", "shell_number", "subshell_index")
+
+    atomic_number: int
+    shell_number: int
+    subshell_index: int
+
+    __instances: typing.Dict[typing.Tuple[int, int, int], ElectronShell] = dict()
+    __instances_lock = threading.Lock()
+
+    def __new__(cls, atomic_number: int, shell_number: int, subshell_index: int) -> ElectronShell:
+        key = (int(atomic_number), int(shell_number), int(subshell_index))
+        electron_shell = cls.__instances.get(key)
+        if electron_shell is None:
+            with cls.__instances_lock:
+                electron_shell = cls.__instances.get(key)
+                if electron_shell is None:
+                    electron_shell = super().__new__(cls)
+                    object.__setattr__(electron_shell, "atomic_number", key[0])
+                    object.__setattr__(electron_shell, "shell_number", key[1])
+                    object.__setattr__(electron_shell, "subshell_index", key[2])
+                    cls.__instances[key] = electron_shell
+        return electron_shell
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        raise AttributeError(f"ElectronShell is immutable; cannot set {name}.")
+
+    def __reduce__(self) -> typing.Tuple[typing.Any, ...]:
+        # copies and unpickled shells are interned too.
+        return ElectronShell, (self.atomic_number, self.shell_number, self.subshell_index)
+
+    def __repr__(self) -> str:
+        return "ElectronShell({}, {}, {})".format(self.atomic_number, self.shell_number, self.subshell_index)
 
     def __str__(self) -> str:
         return "{}-{}".format(PeriodicTable().element_symbol(self.atomic_number), self.get_shell_str_in_eels_notation(True))
@@ -81,18 +113,54 @@ class PeriodicTable(metaclass=Singleton):
         json_data = pkgutil.get_data(__name__, "resources/edges.json")
         assert json_data is not None
         self.__edge_data: typing.Sequence[typing.Mapping[str, typing.Any]] = json.loads(json_data)
+        # index the elements by atomic number.
+        self.__elements: typing.Dict[int, typing.Mapping[str, typing.Any]] = {edge_data_item.get("z", 0): edge_data_item for edge_data_item in self.__edge_data}
+        # the lowest energy edge of each shell of each element, in shell order, and the edge labels once requested.
+        self.__shell_edges: typing.Dict[int, typing.List[typing.Tuple[ElectronShell, float]]] = dict()
+        self.__edges_lists: typing.Dict[int, typing.List[typing.Tuple[ElectronShell, str]]] = dict()
+        shell_edges_list: typing.List[typing.Tuple[ElectronShell, float]] = list()
+        subshell_edges_list: typing.List[typing.Tuple[ElectronShell, float]] = list()
+        for edge_data_item in self.__edge_data:
+            atomic_number = edge_data_item.get("z", 0)
+            shell_edges = self.__get_shell_edges(atomic_number, edge_data_item.get("edges", dict()))
+            self.__shell_edges[atomic_number] = [shell_edges[shell_number] for shell_number in sorted(shell_edges.keys())]
+            shell_edges_list.extend(shell_edges.values())
+            subshell_edges_list.extend((ElectronShell.from_eels_notation(atomic_number, eels_shell), energy) for eels_shell, energy in edge_data_item.get("edges", dict()).items())
+        # all shell edges sorted by energy, for bisection, with parallel arrays of the shells and their order in the
+        # data, which breaks ties in the distance from the center of an interval the way the former linear scan did.
+        edge_energies = numpy.array([energy for _, energy in shell_edges_list], dtype=numpy.float64)
+        order = numpy.argsort(edge_energies, kind="stable")
+        self.__edge_energies = edge_energies[order]
+        self.__edge_ordinals = order
+        self.__edge_shells: typing.List[ElectronShell] = [shell_edges_list[i][0] for i in order]
+        # and every subshell edge sorted by energy.
+        subshell_edge_energies = numpy.array([energy for _, energy in subshell_edges_list], dtype=numpy.float64)
+        subshell_order = numpy.argsort(subshell_edge_energies, kind="stable")
+        self.__subshell_edge_energies = subshell_edge_energies[subshell_order]
+        self.__subshell_edge_shells: typing.List[ElectronShell] = [subshell_edges_list[i][0] for i in subshell_order]
+
+    @staticmethod
+    def __get_shell_edges(atomic_number: int, edge_dict: typing.Mapping[str, float]) -> typing.Dict[int, typing.Tuple[ElectronShell, float]]:
+        # find lowest energy edge within each shell
+        edge_map: typing.Dict[int, typing.Tuple[ElectronShell, float]] = dict()
+        for eels_shell, energy in edge_dict.items():
+            electron_shell = ElectronShell.from_eels_notation(atomic_number, eels_shell)
+            base_electron_shell_energy = edge_map[electron_shell.shell_number][1] if electron_shell.shell_number in edge_map else 1E9
+            if energy < base_electron_shell_energy:
+                edge_map[electron_shell.shell_number] = (electron_shell, energy)
+        return edge_map
 
     def element_symbol(self, atomic_number: int) -> str:
-        for edge_data_item in self.__edge_data:
-            if edge_data_item.get("z", 0) == atomic_number:
-                return typing.cast(str, edge_data_item.get("symbol"))
-        raise IndexError()
+        edge_data_item = self.__elements.get(atomic_number)
+        if edge_data_item is None:
+            raise IndexError()
+        return typing.cast(str, edge_data_item.get("symbol"))
 
     def nominal_binding_energy_ev(self, electron_shell: ElectronShell) -> float:
-        for edge_data_item in self.__edge_data:
-            if edge_data_item.get("z", 0) == electron_shell.atomic_number:
-                return typing.cast(float, edge_data_item.get("edges", dict()).get(electron_shell.get_shell_str_in_eels_notation(True)))
-        raise IndexError()
+        edge_data_item = self.__elements.get(electron_shell.atomic_number)
+        if edge_data_item is None:
+            raise IndexError()
+        return typing.cast(float, edge_data_item.get("edges", dict()).get(electron_shell.get_shell_str_in_eels_notation(True)))
 
     def get_elements_list(self) -> typing.Tuple[typing.Tuple[int, str], ...]:
         """Return a list of tuples: atomic number, atomic symbol."""
@@ -100,38 +168,32 @@ class PeriodicTable(metaclass=Singleton):
 
     def get_edges_list(self, atomic_number: int) -> typing.Sequence[typing.Tuple[ElectronShell, str]]:
         """Return a list of tuples: electron shell (lowest energy within shell number), edge name (without subshell)."""
-        for edge_data_item in self.__edge_data:
-            if edge_data_item.get("z", 0) == atomic_number:
-                edge_dict = edge_data_item.get("edges", dict())
-                edge_map: typing.Dict[int, typing.Tuple[ElectronShell, float]] = dict()
-                for eels_shell, energy in edge_dict.items():
-                    electron_shell = ElectronShell.from_eels_notation(atomic_number, eels_shell)
-                    base_electron_shell_energy = edge_map[electron_shell.shell_number][1] if electron_shell.shell_number in edge_map else 1E9
-                    if energy < base_electron_shell_energy:
-                        edge_map[electron_shell.shell_number] = (electron_shell, energy)
-                return list((edge_map[key][0], edge_map[key][0].to_long_str()) for key in sorted(edge_map.keys()))
-        return list()
+        edges_list = self.__edges_lists.get(atomic_number)
+        if edges_list is None:
+            edges_list = [(electron_shell, electron_shell.to_long_str()) for electron_shell, _ in self.__shell_edges.get(atomic_number, list())]
+            self.__edges_lists[atomic_number] = edges_list
+        return list(edges_list)
 
     def find_edges_in_energy_interval(self, energy_interval_ev: typing.Tuple[float, float]) -> typing.List[ElectronShell]:
         """Return list of electron shells found within energy interval, sorted by distance from center."""
-        edges = list()  # typing.List[typing.Tuple[float, ElectronShell]]
+        start = int(numpy.searchsorted(self.__edge_energies, energy_interval_ev[0], side="left"))
+        stop = int(numpy.searchsorted(self.__edge_energies, energy_interval_ev[1], side="right"))
+        if stop <= start:
+            return list()
         energy_interval_center_ev = (energy_interval_ev[0] + energy_interval_ev[1]) * 0.5
-        for edge_data_item in self.__edge_data:
-            atomic_number = edge_data_item.get("z", 0)
-            edge_dict = edge_data_item.get("edges", dict())
-            # find lowest energy edge within each shell
-            edge_map: typing.Dict[int, typing.Tuple[ElectronShell, float]] = dict()
-            for eels_shell, energy in edge_dict.items():
-                electron_shell = ElectronShell.from_eels_notation(atomic_number, eels_shell)
-                base_electron_shell_energy = edge_map[electron_shell.shell_number][
-                    1] if electron_shell.shell_number in edge_map else 1E9
-                if energy < base_electron_shell_energy:
-                    edge_map[electron_shell.shell_number] = (electron_shell, energy)
-            for electron_shell, energy in edge_map.values():
-                if energy_interval_ev[0] <= energy <= energy_interval_ev[1]:
-                    edges.append((abs(energy_interval_center_ev - energy), electron_shell))
-        edges.sort(key=operator.itemgetter(0))
-        return [edge[1] for edge in edges]
+        distances = numpy.abs(energy_interval_center_ev - self.__edge_energies[start:stop])
+        order = numpy.lexsort((self.__edge_ordinals[start:stop], distances))
+        return [self.__edge_shells[start + i] for i in order]
+
+    def get_sorted_edges(self, primary_subshells_only: bool = True) -> typing.Tuple[numpy.typing.NDArray[numpy.float64], typing.Sequence[ElectronShell]]:
+        """Return the nominal binding energies of the edges of all elements in increasing order, and their electron shells.
+
+        If primary_subshells_only, only the lowest energy edge within each shell number is included, like
+        find_edges_in_energy_interval; otherwise every subshell is. The returned arrays must not be modified.
+        """
+        if primary_subshells_only:
+            return self.__edge_energies, self.__edge_shells
+        return self.__subshell_edge_energies, self.__subshell_edge_shells
 
 
 
@@ -7,15 +7,22 @@
 """
 
 # standard libraries
+import collections
 import copy
+import dataclasses
+import threading
 import numpy
 import numpy.typing
 import scipy.integrate
 import typing
 
+from nion.eels_analysis import CrossSectionCache
+from nion.eels_analysis import CrossSectionTable
 from nion.eels_analysis import CurveFitting
 from nion.eels_analysis import EELS_CrossSections
 from nion.eels_analysis import EELS_DataAnalysis
+from nion.eels_analysis import GOSDatabase
+from nion.eels_analysis import LeastSquares
 from nion.eels_analysis import PeriodicTable
 from nion.data import DataAndMetadata
 from nion.utils import Registry
@@ -172,29 +179,41 @@ def extract_signal_from_polynomial_background(data_and_metadata: DataAndMetadata
     return DataAndMetadata.new_data_and_metadata(data, data_and_metadata.intensity_calibration, data_and_metadata.dimensional_calibrations)
 
 
-def stacked_fit_linear_background(data: DataArrayType, signal_index: int, rcond: float = 1e-10) -> DataArrayType:
-    """Return the linear background using least squares for an ndarray with signal in last index.
+def get_linear_background_solver(signal_length: int, rcond: typing.Optional[float] = None) -> LeastSquares.BatchedLeastSquares:
+    """Return the least squares solver for the linear background y = m x + c over signal_length channels.
 
-    The outline for this implementation comes from:
-    http://stackoverflow.com/questions/30442377/how-to-solve-many-overdetermined-systems-of-linear-equations-using-vectorized-co
+    The coefficients are (m, c). The solver, and its factorization, is shared by all fits of the same length. The
+    solvers of the most recently used MAX_LINEAR_BACKGROUND_SOLVER_COUNT lengths are kept.
     """
+    key = (signal_length, rcond)
+    with _linear_background_solvers_lock:
+        solver = _linear_background_solvers.get(key)
+        if solver is not None:
+            _linear_background_solvers.move_to_end(key)
+            return solver
+        # using equation y = Ap where A = [[x 1]] and p = [[m], [c]], solve for p.
+        linear = numpy.arange(signal_length)
+        ones = numpy.ones((signal_length,))
+        solver = LeastSquares.BatchedLeastSquares(numpy.vstack([linear, ones]).T, rcond)
+        _linear_background_solvers[key] = solver
+        while len(_linear_background_solvers) > MAX_LINEAR_BACKGROUND_SOLVER_COUNT:
+            _linear_background_solvers.popitem(last=False)
+        return solver
 
-    assert signal_index == -1
-    signal_length = data.shape[signal_index]
 
-    # using equation y = Ap where A = [[x 1]] and p = [[m], [c]], solve for p.
-    linear = numpy.arange(signal_length)
-    ones = numpy.ones((signal_length,))
-    A: DataArrayType = numpy.vstack([linear, ones]).T
+MAX_LINEAR_BACKGROUND_SOLVER_COUNT = 16
 
-    # solve for p using svd. p will have the shape (n, 2) where n is the dimensions of the non-signal indexes of the data.
-    u, s, v = numpy.linalg.svd(A, full_matrices=False)
-    s_max = numpy.amax(s, axis=-1, keepdims=True)
-    s_min = rcond * s_max
-    inv_s = numpy.zeros_like(s)
-    inv_s[s >= s_min] = 1 / s[s >= s_min]
-    x = numpy.einsum('...ji,...j->...i', v, inv_s * numpy.einsum('...ji,...j->...i', u, data.conj()))
-    return typing.cast(DataArrayType, numpy.conj(x, x))
+_linear_background_solvers: collections.OrderedDict[typing.Tuple[int, typing.Optional[float]], LeastSquares.BatchedLeastSquares] = collections.OrderedDict()
+_linear_background_solvers_lock = threading.RLock()
+
+
+def stacked_fit_linear_background(data: DataArrayType, signal_index: int, rcond: float = 1e-10) -> DataArrayType:
+    """Return the linear background as m, c using least squares for an ndarray with signal in last index.
+
+    Non-finite values are excluded from the fit.
+    """
+    assert signal_index == -1
+    return get_linear_background_solver(data.shape[signal_index], rcond).fit(data)
 
 
 def stacked_linear_background(data: DataArrayType, signal_index: int) -> DataArrayType:
@@ -213,46 +232,13 @@ def stacked_linear_background(data: DataArrayType, signal_index: int) -> DataArr
     return typing.cast(DataArrayType, p[..., 0, numpy.newaxis] * linear[:] + p[..., 1, numpy.newaxis])
 
 
-def slow_fit_linear_background(data: DataArrayType, signal_index: int) -> DataArrayType:
-    """Return the linear background as m, c using least squares for an ndarray with signal in last index.
-
-    This implementaton also demonstrates how to convert a 1-d function to a stacked function.
-    """
-
-    # make reshaped data view
-    assert signal_index == -1
-    signal_length = data.shape[signal_index]
-    if len(data.shape) > 1:
-        reshaped_data = data.reshape(numpy.prod(data.shape[0:signal_index], dtype=numpy.uint64), signal_length)
-    else:
-        reshaped_data = data.reshape(1, signal_length)
-
-    # using equation y = Ap where A = [[x 1]] and p = [[m], [c]], solve for p.
-    linear = numpy.arange(signal_length)
-    ones = numpy.ones((signal_length,))
-    A: DataArrayType = numpy.vstack([linear, ones]).T
-
-    # solve for p. p will have the shape (n, 2) where n is the dimensions of the non-signal indexes of the data.
-    p: DataArrayType = numpy.array([numpy.linalg.lstsq(A, reshaped_data[k, ...], rcond=-1)[0] for k in range(reshaped_data.shape[0])])
-
-    # reshape and return
-    return p.reshape(data.shape[:signal_index] + (2,))
+# kept for compatibility; the batched fit replaces the former per spectrum fit.
+slow_fit_linear_background = stacked_fit_linear_background
 
 
 def slow_linear_background(data: DataArrayType, signal_index: int) -> DataArrayType:
     """Return the linear background using least squares for an ndarray with signal in last index."""
-
-    assert signal_index == -1
-    signal_length = data.shape[signal_index]
-
-    # using equation y = Ap where A = [[x 1]] and p = [[m], [c]], solve for p.
-    linear = numpy.arange(signal_length)
-
-    # solve for p. p will have the shape (n, 2) where n is the dimensions of the non-signal indexes of the data.
-    p = slow_fit_linear_background(data, signal_index)
-
-    # calculate the background by multiply and add
-    return typing.cast(DataArrayType, p[..., 0, numpy.newaxis] * linear[:] + p[..., 1, numpy.newaxis])
+    return stacked_linear_background(data, signal_index)
 
 
 def linear_background(data: DataArrayType, signal_index: int) -> DataArrayType:
@@ -279,40 +265,73 @@ def subtract_linear_background(data_and_metadata: DataAndMetadata.DataAndMetadat
     return DataAndMetadata.new_data_and_metadata(result, data_and_metadata.intensity_calibration, data_and_metadata.dimensional_calibrations)
 
 
-def calculate_background_signal(data_and_metadata: DataAndMetadata.DataAndMetadata, fit_ranges: typing.Sequence[DataArrayType], signal_range: DataArrayType) -> DataAndMetadata.DataAndMetadata:
-    """Calculate background from data and metadata with signal in first index."""
+@dataclasses.dataclass
+class SignalExtraction:
+    """The signal, background, background subtracted profile and signal integral of one background fit.
+
+    signal, background and subtracted cover the contiguous union of the fit and signal ranges (the profile range). Only
+    signal is a view into the source data; background and subtracted are new arrays computed by the fit. integral is the
+    background subtracted signal integrated over the signal range.
+    """
+    signal: DataAndMetadata.DataAndMetadata
+    background: DataAndMetadata.DataAndMetadata
+    subtracted: DataAndMetadata.DataAndMetadata
+    integral: DataArrayType
+
+
+def _get_profile_channel_range(signal_length: int, fit_ranges: typing.Sequence[DataArrayType], signal_range: DataArrayType) -> typing.Tuple[int, int]:
+    # return the channel range of the contiguous union of the fit ranges and the signal range, given as fractions.
+    max_channel = int(round(max([fit_range[1] * signal_length for fit_range in fit_ranges] + [signal_range[1] * signal_length])))
+    min_channel = int(round(min([fit_range[0] * signal_length for fit_range in fit_ranges] + [signal_range[0] * signal_length])))
+    return min_channel, max_channel
+
+
+def _get_profile_calibrations(data_and_metadata: DataAndMetadata.DataAndMetadata, min_channel: int, max_channel: int) -> DataAndMetadata.CalibrationListType:
+    # return the dimensional calibrations of the data over the channel range.
     signal_index = -1
+    dimensional_calibrations = copy.deepcopy(data_and_metadata.dimensional_calibrations)
+    original_calibration = copy.deepcopy(dimensional_calibrations[signal_index])
+    dimensional_calibrations[signal_index].offset = original_calibration.convert_to_calibrated_value(min_channel)
+    dimensional_calibrations[signal_index].scale = (original_calibration.convert_to_calibrated_value(max_channel) - dimensional_calibrations[signal_index].offset) / (max_channel - min_channel)
+    return dimensional_calibrations
 
-    signal_length = data_and_metadata.dimensional_shape[signal_index]
 
-    signal_range = (numpy.asarray(signal_range) * signal_length).astype(float)
+def extract_signal(data_and_metadata: DataAndMetadata.DataAndMetadata, fit_ranges: typing.Sequence[DataArrayType], signal_range: DataArrayType) -> SignalExtraction:
+    """Fit the background once and return the signal, background, subtracted profile and integral with signal in last index.
+
+    The fit and signal ranges are fractions of the signal length. This combines extract_original_signal and
+    calculate_background_signal, which each compute the profile range, and adds the subtracted profile and integral.
+    The signal is a view into the data, so modifying it modifies the data; the background and subtracted profile are
+    new arrays.
+    """
+    signal_index = -1
+
+    signal_length = data_and_metadata.dimensional_shape[signal_index]
 
     data = data_and_metadata.data
 
     # Fit within fit_range; calculate background within signal_range; subtract from source signal range
     signal_calibration = data_and_metadata.dimensional_calibrations[signal_index]
     spectral_range: DataArrayType = numpy.array([signal_calibration.convert_to_calibrated_value(0), signal_calibration.convert_to_calibrated_value(signal_length)])
-    edge_onset = signal_calibration.convert_to_calibrated_value(signal_range[0])
-    edge_delta = signal_calibration.convert_to_calibrated_value(signal_range[1]) - edge_onset
-    # bkgd_range = numpy.array([signal_calibration.convert_to_calibrated_value(fit_range0[0]), signal_calibration.convert_to_calibrated_value(fit_range0[1])])
+    edge_onset = signal_calibration.convert_to_calibrated_value(signal_range[0] * signal_length)
+    edge_delta = signal_calibration.convert_to_calibrated_value(signal_range[1] * signal_length) - edge_onset
     bkgd_ranges: DataArrayType = numpy.array([numpy.array([signal_calibration.convert_to_calibrated_value(fit_range[0] * signal_length), signal_calibration.convert_to_calibrated_value(fit_range[1] * signal_length)]) for fit_range in fit_ranges])
-    # print("d {} s {} e {} d {} b {}".format(data.shape if data is not None else None, spectral_range, edge_onset, edge_delta, bkgd_range))
     edge_map, edge_profile, bkgd_model, profile_range = EELS_DataAnalysis.core_loss_edge(data, spectral_range, edge_onset, edge_delta, bkgd_ranges)
 
-    # Squeeze the result
-    result = numpy.squeeze(bkgd_model)
+    min_channel, max_channel = _get_profile_channel_range(signal_length, fit_ranges, signal_range)
+    dimensional_calibrations = _get_profile_calibrations(data_and_metadata, min_channel, max_channel)
+    intensity_calibration = data_and_metadata.intensity_calibration
 
-    max_channel = int(round(max([fit_range[1] * signal_length for fit_range in fit_ranges] + [signal_range[1]])))
-    min_channel = int(round(min([fit_range[0] * signal_length for fit_range in fit_ranges] + [signal_range[0]])))
+    return SignalExtraction(
+        DataAndMetadata.new_data_and_metadata(data[..., min_channel:max_channel], intensity_calibration, dimensional_calibrations),
+        DataAndMetadata.new_data_and_metadata(numpy.reshape(bkgd_model, data.shape[:-1] + (-1,)), intensity_calibration, dimensional_calibrations),
+        DataAndMetadata.new_data_and_metadata(numpy.reshape(edge_profile, data.shape[:-1] + (-1,)), intensity_calibration, dimensional_calibrations),
+        numpy.reshape(edge_map, data.shape[:-1]))
 
-    data_shape_list = list(data_and_metadata.data_shape)
-    data_shape_list[signal_index] = max_channel - min_channel
-    data_shape = tuple(data_shape_list)
-    dimensional_calibrations = copy.deepcopy(data_and_metadata.dimensional_calibrations)
-    dimensional_calibrations[signal_index].offset = signal_calibration.convert_to_calibrated_value(min_channel)
-    dimensional_calibrations[signal_index].scale = (signal_calibration.convert_to_calibrated_value(max_channel) - dimensional_calibrations[signal_index].offset) / data_shape[signal_index]
 
-    return DataAndMetadata.new_data_and_metadata(result, data_and_metadata.intensity_calibration, dimensional_calibrations)
+def calculate_background_signal(data_and_metadata: DataAndMetadata.DataAndMetadata, fit_ranges: typing.Sequence[DataArrayType], signal_range: DataArrayType) -> DataAndMetadata.DataAndMetadata:
+    """Calculate background from data and metadata with signal in last index."""
+    return extract_signal(data_and_metadata, fit_ranges, signal_range).background
 
 
 def extract_original_signal(data_and_metadata: DataAndMetadata.DataAndMetadata, fit_ranges: typing.Sequence[DataArrayType], signal_range: DataArrayType) -> DataAndMetadata.DataAndMetadata:
@@ -320,22 +339,11 @@ def extract_original_signal(data_and_metadata: DataAndMetadata.DataAndMetadata,
 
     signal_length = data_and_metadata.dimensional_shape[signal_index]
 
-    signal_range = (numpy.asarray(signal_range) * signal_length).astype(float)
-
-    max_channel = int(round(max([fit_range[1] * signal_length for fit_range in fit_ranges] + [signal_range[1]])))
-    min_channel = int(round(min([fit_range[0] * signal_length for fit_range in fit_ranges] + [signal_range[0]])))
+    min_channel, max_channel = _get_profile_channel_range(signal_length, fit_ranges, signal_range)
 
     result = data_and_metadata.data[..., min_channel:max_channel]
 
-    data_shape_list = list(data_and_metadata.data_shape)
-    data_shape_list[signal_index] = max_channel - min_channel
-    data_shape = tuple(data_shape_list)
-    dimensional_calibrations = copy.deepcopy(data_and_metadata.dimensional_calibrations)
-    original_calibration = copy.deepcopy(dimensional_calibrations[signal_index])
-    dimensional_calibrations[signal_index].offset = original_calibration.convert_to_calibrated_value(min_channel)
-    dimensional_calibrations[signal_index].scale = (original_calibration.convert_to_calibrated_value(max_channel) - dimensional_calibrations[signal_index].offset) / data_shape[signal_index]
-
-    return DataAndMetadata.new_data_and_metadata(result, data_and_metadata.intensity_calibration, dimensional_calibrations)
+    return DataAndMetadata.new_data_and_metadata(result, data_and_metadata.intensity_calibration, _get_profile_calibrations(data_and_metadata, min_channel, max_channel))
 
 
 def make_signal_like(data_and_metadata_src: DataAndMetadata.DataAndMetadata, data_and_metadata_dst: DataAndMetadata.DataAndMetadata) -> typing.Optional[DataAndMetadata.DataAndMetadata]:
@@ -351,9 +359,8 @@ def make_signal_like(data_and_metadata_src: DataAndMetadata.DataAndMetadata, dat
     if data_and_metadata_src.dimensional_calibrations[signal_index].convert_to_calibrated_value(data_and_metadata_src.data_shape[signal_index]) > data_and_metadata_dst.dimensional_calibrations[signal_index].convert_to_calibrated_value(data_and_metadata_dst.data_shape[signal_index]):
         return None
 
-    data: DataArrayType = numpy.copy(data_and_metadata_dst.data)
+    data: DataArrayType = numpy.zeros_like(data_and_metadata_dst.data)
     index = int(data_and_metadata_dst.dimensional_calibrations[signal_index].convert_from_calibrated_value(data_and_metadata_src.dimensional_calibrations[signal_index].convert_to_calibrated_value(0)))
-    data[:] = 0
     data[index:index + data_and_metadata_src.data_shape[signal_index]] = data_and_metadata_src.data
 
     return DataAndMetadata.new_data_and_metadata(data, data_and_metadata_dst.intensity_calibration, data_and_metadata_dst.dimensional_calibrations)
@@ -418,13 +425,131 @@ class P1(typing.Protocol):
                                              collection_angle_rad: float) -> DataArrayType: ...
 
 
+# the cache of the cross-sections computed by the functions below, from the eels analysis service or the built-in
+# hydrogenic model. it is cleared when an eels analysis service is registered or unregistered.
+cross_section_cache = CrossSectionCache.CrossSectionCache()
+
+
+def _eels_analysis_service_changed(component: Registry._ComponentType, component_types: typing.Set[str]) -> None:
+    if "eels_analysis_service" in component_types:
+        cross_section_cache.clear()
+
+
+_eels_analysis_service_registered_listener = Registry.listen_component_registered_event(_eels_analysis_service_changed)
+_eels_analysis_service_unregistered_listener = Registry.listen_component_unregistered_event(_eels_analysis_service_changed)
+
+
+def get_cross_section_cache_statistics() -> CrossSectionCache.CrossSectionCacheStatistics:
+    """Return the hit and miss counts of the cross-section cache."""
+    return cross_section_cache.statistics
+
+
+def configure_cross_section_cache(*, max_size: typing.Optional[int] = None, tolerance: typing.Optional[float] = None) -> None:
+    """Set the number of cross-sections kept and the relative tolerance to which their parameters are rounded."""
+    cross_section_cache.configure(max_size=max_size, tolerance=tolerance)
+
+
+# the precomputed table of hydrogenic k-shell cross-sections used for the partial cross-sections inside it, if any.
+_cross_section_table: typing.Optional[CrossSectionTable.CrossSectionTable] = None
+
+
+def get_cross_section_table() -> typing.Optional[CrossSectionTable.CrossSectionTable]:
+    return _cross_section_table
+
+
+def set_cross_section_table(table: typing.Optional[CrossSectionTable.CrossSectionTable]) -> None:
+    """Set the table used for the hydrogenic partial cross-sections inside it, or None to compute them directly.
+
+    Partial cross-sections from the table differ from the directly computed ones by the accuracy of the table and the
+    discretization error of the direct computation; see CrossSectionTable.CrossSectionTable. The cache is cleared.
+    """
+    global _cross_section_table
+    _cross_section_table = table
+    cross_section_cache.clear()
+
+
+def load_cross_section_table(path: CrossSectionTable.PathLike) -> CrossSectionTable.CrossSectionTable:
+    """Load the table written by CrossSectionTable.write_cross_section_table at path and use it; see set_cross_section_table."""
+    table = CrossSectionTable.load_cross_section_table(path)
+    set_cross_section_table(table)
+    return table
+
+
+# the database of tabulated GOS used for the shells in it, such as L and M shells which have no hydrogenic model, if any.
+_gos_database: typing.Optional[GOSDatabase.GOSDatabase] = None
+
+
+def get_gos_database() -> typing.Optional[GOSDatabase.GOSDatabase]:
+    return _gos_database
+
+
+def set_gos_database(gos_database: typing.Optional[GOSDatabase.GOSDatabase]) -> None:
+    """Set the database of tabulated GOS used to compute the cross-sections of the shells in it, or None.
+
+    The tabulated GOS of a shell takes precedence over the hydrogenic model and the cross-section table, but not over
+    an eels analysis service. The cache is cleared.
+    """
+    global _gos_database
+    _gos_database = gos_database
+    cross_section_cache.clear()
+
+
+def load_gos_database(path: GOSDatabase.PathLike) -> GOSDatabase.GOSDatabase:
+    """Load the database written by GOSDatabase.write_gos_database at path and use it; see set_gos_database."""
+    gos_database = GOSDatabase.load_gos_database(path)
+    set_gos_database(gos_database)
+    return gos_database
+
+
+def _is_built_in_shell(atomic_number: int, shell_number: int, subshell_index: int, max_energy_ev: float) -> bool:
+    # whether the cross-sections of the shell up to the energy loss can be computed from the gos database or on the
+    # hydrogenic model, without an eels analysis service.
+    gos_database = _gos_database
+    if gos_database is not None and gos_database.get_table(atomic_number, shell_number, subshell_index) is not None:
+        return gos_database.contains(atomic_number, shell_number, subshell_index, max_energy_ev)
+    return shell_number == 1 and subshell_index == 1
+
+
+def _get_table_partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_index: int,
+                                         edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
+                                         convergence_angle_rad: float, collection_angle_rad: float) -> typing.Optional[float]:
+    # the partial cross-section from the table, or None if there is no table or it does not cover the parameters.
+    table = _cross_section_table
+    if table is None or shell_number != 1 or subshell_index != 1:
+        return None
+    gos_database = _gos_database
+    if gos_database is not None and gos_database.get_table(atomic_number, shell_number, subshell_index) is not None:
+        return None
+    return table.partial_cross_section_nm2(atomic_number, edge_onset_ev, edge_delta_ev, beam_energy_ev,
+                                           convergence_angle_rad, collection_angle_rad)
+
+
 def energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int, subshell_index: int,
                                          edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
                                          convergence_angle_rad: float, collection_angle_rad: float) -> DataArrayType:
     """Return the energy differential cross section for the specified electron shell and experimental parameters.
 
     The returned differential cross-section value is in units of nm * nm / eV.
+
+    Results are cached; see cross_section_cache.
     """
+    key = cross_section_cache.make_key("energy_diff_cross_section_nm2_per_ev", atomic_number, shell_number, subshell_index,
+                                       (edge_onset_ev, edge_delta_ev, beam_energy_ev, convergence_angle_rad, collection_angle_rad))
+
+    def compute() -> DataArrayType:
+        energy_diff_sigma = numpy.array(_energy_diff_cross_section_nm2_per_ev(atomic_number, shell_number, subshell_index,
+                                                                              edge_onset_ev, edge_delta_ev, beam_energy_ev,
+                                                                              convergence_angle_rad, collection_angle_rad))
+        energy_diff_sigma.flags.writeable = False
+        return energy_diff_sigma
+
+    # return a copy so that callers cannot modify the cached array.
+    return numpy.array(cross_section_cache.get_value(key, compute))
+
+
+def _energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int, subshell_index: int,
+                                          edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
+                                          convergence_angle_rad: float, collection_angle_rad: float) -> DataArrayType:
     energy_diff_sigma = None
     eels_analysis_service = Registry.get_component("eels_analysis_service")
     if energy_diff_sigma is None and hasattr(eels_analysis_service, "energy_diff_cross_section_nm2_per_ev"):
@@ -437,14 +562,15 @@ def energy_diff_cross_section_nm2_per_ev(atomic_number: int, shell_number: int,
             beam_energy_ev=beam_energy_ev,
             convergence_angle_rad=convergence_angle_rad,
             collection_angle_rad=collection_angle_rad)
-    if energy_diff_sigma is None and shell_number == 1 and subshell_index == 1:
-        # k edges only
+    if energy_diff_sigma is None and _is_built_in_shell(atomic_number, shell_number, subshell_index, edge_onset_ev + edge_delta_ev):
+        # k edges and the shells of the gos database only
         energy_diff_sigma = EELS_CrossSections.energy_diff_cross_section_nm2_per_ev(atomic_number, shell_number,
                                                                                     subshell_index,
                                                                                     edge_onset_ev, edge_delta_ev,
                                                                                     beam_energy_ev,
                                                                                     convergence_angle_rad,
-                                                                                    collection_angle_rad)
+                                                                                    collection_angle_rad,
+                                                                                    gos_database=_gos_database)
     assert energy_diff_sigma is not None, f"{atomic_number=} {shell_number=} {subshell_index=} / {eels_analysis_service}"
     return energy_diff_sigma
 
@@ -461,7 +587,19 @@ def partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_in
     """Returns the partial cross section.
 
     The return value units are nm * nm.
+
+    Results are cached; see cross_section_cache.
     """
+    key = cross_section_cache.make_key("partial_cross_section_nm2", atomic_number, shell_number, subshell_index,
+                                       (edge_onset_ev, edge_delta_ev, beam_energy_ev, convergence_angle_rad, collection_angle_rad))
+    return cross_section_cache.get_value(key, lambda: _partial_cross_section_nm2(atomic_number, shell_number, subshell_index,
+                                                                                 edge_onset_ev, edge_delta_ev, beam_energy_ev,
+                                                                                 convergence_angle_rad, collection_angle_rad))
+
+
+def _partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_index: int,
+                               edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
+                               convergence_angle_rad: float, collection_angle_rad: float) -> float:
     cross_section = None
     eels_analysis_service = Registry.get_component("eels_analysis_service")
     if cross_section is None and hasattr(eels_analysis_service, "partial_cross_section_nm2"):
@@ -475,14 +613,19 @@ def partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_in
                                                                                          collection_angle_rad=collection_angle_rad)
 
     if cross_section is None:
-        energy_diff_sigma = energy_diff_cross_section_nm2_per_ev(atomic_number=atomic_number,
-                                                                 shell_number=shell_number,
-                                                                 subshell_index=subshell_index,
-                                                                 edge_onset_ev=edge_onset_ev,
-                                                                 edge_delta_ev=edge_delta_ev,
-                                                                 beam_energy_ev=beam_energy_ev,
-                                                                 convergence_angle_rad=convergence_angle_rad,
-                                                                 collection_angle_rad=collection_angle_rad)
+        cross_section = _get_table_partial_cross_section_nm2(atomic_number, shell_number, subshell_index,
+                                                             edge_onset_ev, edge_delta_ev, beam_energy_ev,
+                                                             convergence_angle_rad, collection_angle_rad)
+
+    if cross_section is None:
+        energy_diff_sigma = _energy_diff_cross_section_nm2_per_ev(atomic_number=atomic_number,
+                                                                  shell_number=shell_number,
+                                                                  subshell_index=subshell_index,
+                                                                  edge_onset_ev=edge_onset_ev,
+                                                                  edge_delta_ev=edge_delta_ev,
+                                                                  beam_energy_ev=beam_energy_ev,
+                                                                  convergence_angle_rad=convergence_angle_rad,
+                                                                  collection_angle_rad=collection_angle_rad)
 
         # Integrate over energy window to get partial cross-section
         energy_sample_count = energy_diff_sigma.shape[0]
@@ -502,6 +645,93 @@ def partial_cross_section_nm2(atomic_number: int, shell_number: int, subshell_in
     return cross_section
 
 
+def _is_built_in_cross_section(parameters: EELS_CrossSections.CrossSectionParameters) -> bool:
+    # whether the cross-sections are computed by the built-in hydrogenic model or gos database rather than an eels
+    # analysis service.
+    eels_analysis_service = Registry.get_component("eels_analysis_service")
+    if hasattr(eels_analysis_service, "partial_cross_section_nm2") or hasattr(eels_analysis_service, "energy_diff_cross_section_nm2_per_ev"):
+        return False
+    max_energies_ev = parameters.edge_onset_eV + parameters.edge_delta_eV
+    return all(_is_built_in_shell(int(atomic_number), int(shell_number), int(subshell_index), float(max_energy_ev))
+               for atomic_number, shell_number, subshell_index, max_energy_ev in zip(parameters.atomic_number, parameters.shell_number, parameters.subshell_index, max_energies_ev))
+
+
+def _get_cross_section_keys(kind: str, parameters: EELS_CrossSections.CrossSectionParameters) -> typing.List[CrossSectionCache.CacheKeyType]:
+    return [cross_section_cache.make_key(kind, atomic_number, shell_number, subshell_index, experimental_parameters)
+            for atomic_number, shell_number, subshell_index, *experimental_parameters in zip(*parameters)]
+
+
+def _get_cross_section_arguments(parameters: EELS_CrossSections.CrossSectionParameters, index: int) -> typing.Tuple[typing.Any, ...]:
+    return (int(parameters.atomic_number[index]), int(parameters.shell_number[index]), int(parameters.subshell_index[index]),
+            float(parameters.edge_onset_eV[index]), float(parameters.edge_delta_eV[index]), float(parameters.beam_energy_eV[index]),
+            float(parameters.convergence_angle_rad[index]), float(parameters.collection_angle_rad[index]))
+
+
+def energy_diff_cross_sections_nm2_per_ev(atomic_number: numpy.typing.ArrayLike, shell_number: numpy.typing.ArrayLike,
+                                          subshell_index: numpy.typing.ArrayLike, edge_onset_ev: numpy.typing.ArrayLike,
+                                          edge_delta_ev: numpy.typing.ArrayLike, beam_energy_ev: numpy.typing.ArrayLike,
+                                          convergence_angle_rad: numpy.typing.ArrayLike,
+                                          collection_angle_rad: numpy.typing.ArrayLike) -> typing.List[DataArrayType]:
+    """Return the energy differential cross sections for arrays of electron shells and experimental parameters.
+
+    The parameters are broadcast against each other and the cross-sections are returned in the order of the flattened
+    broadcast parameters, in units of nm * nm / eV.
+
+    Cached cross-sections are reused. The others are computed by the eels analysis service, if one is registered, or
+    else together by the built-in hydrogenic model or from the gos database; see set_gos_database and
+    EELS_CrossSections.energy_diff_cross_sections_nm2_per_ev.
+    """
+    parameters, shape = EELS_CrossSections.get_cross_section_parameters(atomic_number, shell_number, subshell_index, edge_onset_ev, edge_delta_ev,
+                                                                        beam_energy_ev, convergence_angle_rad, collection_angle_rad)
+
+    def compute(indexes: typing.Sequence[int]) -> typing.List[DataArrayType]:
+        missing_parameters = parameters.take(numpy.asarray(indexes, dtype=int))
+        if _is_built_in_cross_section(missing_parameters):
+            energy_diff_sigmas = EELS_CrossSections.energy_diff_cross_sections_nm2_per_ev(*missing_parameters, gos_database=_gos_database)
+        else:
+            energy_diff_sigmas = [numpy.array(_energy_diff_cross_section_nm2_per_ev(*_get_cross_section_arguments(missing_parameters, i))) for i in range(len(indexes))]
+        for energy_diff_sigma in energy_diff_sigmas:
+            energy_diff_sigma.flags.writeable = False
+        return energy_diff_sigmas
+
+    keys = _get_cross_section_keys("energy_diff_cross_section_nm2_per_ev", parameters)
+    return [numpy.array(energy_diff_sigma) for energy_diff_sigma in cross_section_cache.get_values(keys, compute)]
+
+
+def partial_cross_sections_nm2(atomic_number: numpy.typing.ArrayLike, shell_number: numpy.typing.ArrayLike,
+                               subshell_index: numpy.typing.ArrayLike, edge_onset_ev: numpy.typing.ArrayLike,
+                               edge_delta_ev: numpy.typing.ArrayLike, beam_energy_ev: numpy.typing.ArrayLike,
+                               convergence_angle_rad: numpy.typing.ArrayLike,
+                               collection_angle_rad: numpy.typing.ArrayLike) -> DataArrayType:
+    """Return the partial cross sections for arrays of electron shells and experimental parameters.
+
+    The parameters are broadcast against each other and the returned array of cross-sections, in nm * nm, has the
+    broadcast shape.
+
+    Cached cross-sections are reused. The others are computed by the eels analysis service, if one is registered, or
+    else interpolated from the cross-section table, if one is set and covers them, or else together by the built-in
+    hydrogenic model or from the gos database; see set_cross_section_table, set_gos_database and
+    EELS_CrossSections.partial_cross_sections_nm2.
+    """
+    parameters, shape = EELS_CrossSections.get_cross_section_parameters(atomic_number, shell_number, subshell_index, edge_onset_ev, edge_delta_ev,
+                                                                        beam_energy_ev, convergence_angle_rad, collection_angle_rad)
+
+    def compute(indexes: typing.Sequence[int]) -> typing.List[float]:
+        missing_parameters = parameters.take(numpy.asarray(indexes, dtype=int))
+        if _is_built_in_cross_section(missing_parameters):
+            cross_sections = [_get_table_partial_cross_section_nm2(*_get_cross_section_arguments(missing_parameters, i)) for i in range(len(indexes))]
+            computed_indexes = numpy.array([i for i, cross_section in enumerate(cross_sections) if cross_section is None], dtype=int)
+            if computed_indexes.shape[0] > 0:
+                computed_cross_sections = EELS_CrossSections.partial_cross_sections_nm2(*missing_parameters.take(computed_indexes), gos_database=_gos_database)
+                for i, cross_section in zip(computed_indexes, computed_cross_sections):
+                    cross_sections[i] = float(cross_section)
+            return [float(typing.cast(float, cross_section)) for cross_section in cross_sections]
+        return [_partial_cross_section_nm2(*_get_cross_section_arguments(missing_parameters, i)) for i in range(len(indexes))]
+
+    keys = _get_cross_section_keys("partial_cross_section_nm2", parameters)
+    return numpy.reshape(numpy.array(cross_section_cache.get_values(keys, compute), dtype=numpy.float64), shape)
+
+
 # def relative_atomic_abundance(counts_edge: float, partial_cross_section_nm2: float) -> float:
 #     """Return the relative atomic concentration.
 #
@@ -0,0 +1,392 @@
+import typing
+import unittest
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.eels_analysis import BackgroundModel
+from nion.utils import Registry
+
+
+def generate_power_law_spectrum_image(shape: typing.Tuple[int, ...] = (5, 7), length: int = 400, seed: int = 0) -> DataAndMetadata.DataAndMetadata:
+    rng = numpy.random.default_rng(seed)
+    energies = 200.0 + 0.5 * numpy.arange(length)
+    amplitudes = rng.uniform(0.5, 2.0, shape + (1,)) * 1E9
+    exponents = rng.uniform(2.5, 3.5, shape + (1,))
+    data = amplitudes * energies ** -exponents
+    data = rng.poisson(data).astype(numpy.float32) + 1
+    dimensional_calibrations = [Calibration.Calibration() for _ in shape] + [Calibration.Calibration(offset=200.0, scale=0.5, units="eV")]
+    return DataAndMetadata.new_data_and_metadata(data,
+                                                 intensity_calibration=Calibration.Calibration(units="counts"),
+                                                 dimensional_calibrations=dimensional_calibrations,
+                                                 data_descriptor=DataAndMetadata.DataDescriptor(False, len(shape), 1))
+
+
+class TestBackgroundModel(unittest.TestCase):
+
+    def test_chunked_execution_matches_unchunked_for_all_models(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        fit_intervals = [(0.1, 0.2), (0.25, 0.3)]
+        signal_interval = (0.4, 0.6)
+        for background_model in Registry.get_components_by_type("background-model"):
+            with self.subTest(background_model_id=background_model.background_model_id):
+                fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval)["background_model"]
+                chunked_fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval, chunk_size=4)["background_model"]
+                self.assertEqual(fit.data_shape, chunked_fit.data_shape)
+                self.assertEqual(fit.dimensional_calibrations, chunked_fit.dimensional_calibrations)
+                self.assertTrue(numpy.allclose(fit.data, chunked_fit.data, rtol=1E-4))
+                subtracted = background_model.subtract_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals)["subtracted"]
+                chunked_subtracted = background_model.subtract_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, chunk_size=3)["subtracted"]
+                self.assertEqual(subtracted.data_shape, chunked_subtracted.data_shape)
+                self.assertTrue(numpy.allclose(subtracted.data, chunked_subtracted.data, rtol=1E-5))
+                integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval)["integrated"]
+                chunked_integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, chunk_size=8)["integrated"]
+                self.assertEqual(spectrum_image_xdata.navigation_dimension_shape, chunked_integrated.data_shape)
+                self.assertTrue(numpy.allclose(integrated.data, chunked_integrated.data, rtol=1E-4, atol=1E-1))
+
+    def test_polynomial_fit_plan_matches_polyfit_and_is_cached(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        xs = numpy.linspace(250.0, 300.0, 100, endpoint=False, dtype=numpy.float32)
+        fs = numpy.linspace(300.0, 350.0, 100, endpoint=False, dtype=numpy.float32)
+        yss = numpy.reshape(spectrum_image_xdata.data[..., 100:200], (-1, 100)).astype(numpy.float64)
+        for background_model_id in ("linear_background_model", "power_law_background_model", "poly2_log_background_model"):
+            with self.subTest(background_model_id=background_model_id):
+                background_model = typing.cast(BackgroundModel.PolynomialBackgroundModel, BackgroundModel.find_background_model_by_id(background_model_id))
+                background_model.fit_plan_cache.clear()
+                transform_data = background_model.transform or (lambda x: x)
+                untransform_data = background_model.untransform or (lambda x: x)
+                coefficients = numpy.polynomial.polynomial.polyfit(transform_data(xs.astype(numpy.float64)), transform_data(yss.T.astype(numpy.float64)), background_model.deg)
+                expected = untransform_data(numpy.polynomial.polynomial.polyval(transform_data(fs.astype(numpy.float64)), coefficients))
+                fit = background_model._perform_fits(xs, yss, fs, None)
+                self.assertTrue(numpy.allclose(expected, fit, rtol=1E-4))
+                background_model._perform_fits(xs, yss, fs, None)
+                self.assertEqual(1, len(background_model.fit_plan_cache))
+                self.assertEqual(1, background_model.fit_plan_cache.hits)
+                self.assertEqual(1, background_model.fit_plan_cache.misses)
+
+    def test_float32_precision_matches_float64_precision(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        fit_intervals = [(0.1, 0.2), (0.25, 0.3)]
+        signal_interval = (0.4, 0.6)
+        for background_model_id in ("linear_background_model", "power_law_background_model", "poly2_log_background_model", "power_law_two_area_background_model"):
+            with self.subTest(background_model_id=background_model_id):
+                background_model = BackgroundModel.find_background_model_by_id(background_model_id)
+                fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval)["background_model"]
+                fit32 = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval, precision="data")["background_model"]
+                self.assertEqual(numpy.float64, fit.data.dtype)
+                self.assertEqual(numpy.float32, fit32.data.dtype)
+                self.assertTrue(numpy.allclose(fit.data, fit32.data, rtol=1E-4, atol=1E-3))
+                integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=True)["integrated"]
+                integrated32 = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=True, precision="float32")["integrated"]
+                self.assertEqual(numpy.float32, integrated32.data.dtype)
+                self.assertTrue(numpy.allclose(integrated.data, integrated32.data, rtol=1E-4, atol=1E-1))
+
+    def test_float64_data_is_fitted_in_float64_with_data_precision(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(spectrum_image_xdata.data.astype(numpy.float64),
+                                                                     dimensional_calibrations=spectrum_image_xdata.dimensional_calibrations,
+                                                                     data_descriptor=spectrum_image_xdata.data_descriptor)
+        background_model = BackgroundModel.find_background_model_by_id("power_law_background_model")
+        fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=[(0.1, 0.3)], background_interval=(0.4, 0.6), precision="data")["background_model"]
+        self.assertEqual(numpy.float64, fit.data.dtype)
+
+    def test_polynomial_fit_plan_centers_abscissa_for_float32_fits(self) -> None:
+        # the log of the energies varies by a small fraction of its value over a fit window; without centering, the
+        # float32 normal equations of a quadratic in log(E) lose all precision.
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        xs = numpy.linspace(250.0, 300.0, 100, endpoint=False, dtype=numpy.float32)
+        fs = numpy.linspace(300.0, 350.0, 100, endpoint=False, dtype=numpy.float32)
+        yss = numpy.reshape(spectrum_image_xdata.data[..., 100:200], (-1, 100))
+        background_model = typing.cast(BackgroundModel.PolynomialBackgroundModel, BackgroundModel.find_background_model_by_id("poly2_log_background_model"))
+        fit = background_model._perform_fits(xs, yss.astype(numpy.float64), fs, None)
+        fit32 = background_model._perform_fits(xs, yss, fs, None)
+        self.assertEqual(numpy.float32, fit32.dtype)
+        self.assertTrue(numpy.allclose(fit, fit32, rtol=1E-4))
+        fit_plan = background_model.get_fit_plan(xs, fs)
+        us = (numpy.log(xs.astype(numpy.float64)) - fit_plan.center) / fit_plan.scale
+        self.assertAlmostEqual(-1.0, float(numpy.amin(us)), places=5)
+        self.assertAlmostEqual(1.0, float(numpy.amax(us)), places=5)
+
+    def test_fused_integration_matches_integration_of_subtracted_signal(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        fit_intervals = [(0.1, 0.3)]
+        signal_interval = (0.35, 0.7)
+        for background_model in Registry.get_components_by_type("background-model"):
+            with self.subTest(background_model_id=background_model.background_model_id):
+                integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval)["integrated"]
+                fused_integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=True)["integrated"]
+                self.assertEqual(integrated.data_shape, fused_integrated.data_shape)
+                self.assertTrue(numpy.allclose(integrated.data, fused_integrated.data, rtol=1E-4, atol=1E-1))
+
+    def test_weighted_polynomial_fit_matches_weighted_polyfit(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        xs = numpy.linspace(250.0, 300.0, 100, endpoint=False, dtype=numpy.float32)
+        fs = numpy.linspace(300.0, 350.0, 100, endpoint=False, dtype=numpy.float32)
+        yss = numpy.reshape(spectrum_image_xdata.data[..., 100:200], (-1, 100)).astype(numpy.float64)
+        for background_model_id in ("power_law_weighted_background_model", "poly2_log_weighted_background_model"):
+            with self.subTest(background_model_id=background_model_id):
+                background_model = typing.cast(BackgroundModel.PolynomialBackgroundModel, BackgroundModel.find_background_model_by_id(background_model_id))
+                self.assertTrue(background_model.weighted)
+                log_xs = numpy.log(xs.astype(numpy.float64))
+                expected = numpy.empty((yss.shape[0], fs.shape[0]))
+                for i, ys in enumerate(yss):
+                    # polyfit weights multiply the residuals, so pass the square root of the Poisson weights
+                    coefficients = numpy.polynomial.polynomial.polyfit(log_xs, numpy.log(ys), background_model.deg, w=numpy.sqrt(ys))
+                    expected[i] = numpy.exp(numpy.polynomial.polynomial.polyval(numpy.log(fs.astype(numpy.float64)), coefficients))
+                fit = background_model._perform_fits(xs, yss, fs, None)
+                self.assertTrue(numpy.allclose(expected, fit, rtol=1E-5))
+
+    def test_weighted_power_law_recovers_exact_power_law_and_ignores_empty_channels(self) -> None:
+        xs = numpy.linspace(300.0, 400.0, 100, endpoint=False)
+        yss = numpy.stack([1E10 * xs ** -3.0, 1E10 * xs ** -3.0, numpy.zeros_like(xs)])
+        yss[1, ::3] = 0
+        fit = BackgroundModel.find_background_model_by_id("power_law_weighted_background_model")._perform_fits(xs, yss, xs, None)
+        self.assertTrue(numpy.allclose(yss[0], fit[0], rtol=1E-8))
+        self.assertTrue(numpy.allclose(yss[0], fit[1], rtol=1E-8))
+        self.assertTrue(numpy.array_equal(numpy.zeros_like(xs), fit[2]))
+
+    def test_fit_quality_maps_match_residuals_of_fit_window(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        fit_intervals = [(0.1, 0.3)]
+        signal_interval = (0.35, 0.7)
+        for background_model_id in ("power_law_background_model", "power_law_fit_background_model", "power_law_two_area_background_model"):
+            with self.subTest(background_model_id=background_model_id):
+                background_model = BackgroundModel.find_background_model_by_id(background_model_id)
+                window_fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=(0.1, 0.3))["background_model"]
+                expected = BackgroundModel.get_fit_quality(spectrum_image_xdata.data[..., 40:120], window_fit.data)
+                result = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval, fit_quality=True, chunk_size=10)
+                fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval)["background_model"]
+                self.assertTrue(numpy.allclose(fit.data, result["background_model"].data, rtol=1E-5))
+                for fused in (False, True):
+                    integrate_result = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=fused, fit_quality=True)
+                    for i, key in enumerate(BackgroundModel.FIT_QUALITY_KEYS):
+                        self.assertEqual(spectrum_image_xdata.navigation_dimension_shape, result[key].data_shape)
+                        self.assertTrue(numpy.allclose(expected[..., i], result[key].data, rtol=1E-4))
+                        self.assertTrue(numpy.allclose(expected[..., i], integrate_result[key].data, rtol=1E-4))
+                # the spectra carry Poisson noise, so the chi-squared per channel of a good fit is close to 1
+                self.assertTrue(numpy.all(numpy.abs(result["chi_squared"].data - 1) < 0.5))
+
+    def test_fit_quality_of_single_spectrum(self) -> None:
+        spectrum_xdata = generate_power_law_spectrum_image()[2, 3]
+        result = BackgroundModel.find_background_model_by_id("power_law_background_model").integrate_signal(spectrum_xdata=spectrum_xdata, fit_intervals=[(0.1, 0.3)], signal_interval=(0.35, 0.7), fit_quality=True)
+        self.assertIn("integrated_value", result)
+        self.assertTrue(all(isinstance(result[key], float) for key in BackgroundModel.FIT_QUALITY_KEYS))
+        self.assertLess(result["residual_rms"], numpy.sqrt(numpy.amax(spectrum_xdata.data)) * 2)
+
+    def test_integrate_signals_matches_integrate_signal_for_each_job(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        jobs = [([(0.1, 0.2)], (0.3, 0.4)), ([(0.1, 0.2)], (0.25, 0.6)), ([(0.05, 0.1), (0.15, 0.2)], (0.5, 0.9)), ([(0.1, 0.2)], (0.7, 0.8))]
+        for background_model in Registry.get_components_by_type("background-model"):
+            with self.subTest(background_model_id=background_model.background_model_id):
+                integrated = background_model.integrate_signals(spectrum_xdata=spectrum_image_xdata, jobs=jobs, chunk_size=8)["integrated"]
+                self.assertEqual((len(jobs),) + spectrum_image_xdata.navigation_dimension_shape, integrated.data_shape)
+                self.assertTrue(integrated.is_sequence)
+                for index, (fit_intervals, signal_interval) in enumerate(jobs):
+                    expected = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, chunk_size=8, fused=True)["integrated"]
+                    self.assertTrue(numpy.allclose(expected.data, integrated.data[index], rtol=1E-4, atol=1E-1))
+
+    def test_coefficient_map_reconstructs_fitted_background(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image(shape=(6, 8))
+        fit_intervals = [(0.1, 0.2), (0.25, 0.3)]
+        background_interval = (0.1, 0.9)
+        for background_model_id in ("linear_background_model", "power_law_background_model", "power_law_weighted_background_model",
+                                    "power_law_nonlinear_background_model", "poly2_log_background_model", "power_law_two_area_background_model",
+                                    "exponential_two_area_background_model"):
+            with self.subTest(background_model_id=background_model_id):
+                background_model = BackgroundModel.find_background_model_by_id(background_model_id)
+                fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=background_interval)["background_model"]
+                coefficient_map = background_model.fit_coefficient_map(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=background_interval, chunk_size=7)["coefficient_map"]
+                self.assertEqual(background_model_id, coefficient_map.background_model_id)
+                self.assertEqual((6, 8), coefficient_map.navigation_dimension_shape)
+                self.assertLess(coefficient_map.nbytes * 20, fit.data.nbytes)
+                background = coefficient_map.get_background()
+                self.assertEqual(fit.data_shape, background.data_shape)
+                self.assertEqual(fit.dimensional_calibrations, background.dimensional_calibrations)
+                self.assertTrue(numpy.allclose(fit.data, background.data, rtol=1E-4))
+                partial_background = coefficient_map.get_background((slice(2, 5), 3))
+                self.assertEqual((3, fit.data_shape[-1]), partial_background.data_shape)
+                self.assertTrue(numpy.allclose(fit.data[2:5, 3], partial_background.data, rtol=1E-4))
+                mask = numpy.zeros((6, 8), dtype=bool)
+                mask[1:3, 4:7] = True
+                masked_background = coefficient_map.get_masked_background(mask)
+                self.assertTrue(numpy.allclose(numpy.sum(fit.data[mask], axis=0), masked_background.data, rtol=1E-4))
+
+    def test_coefficient_map_slices_navigation_calibrations(self) -> None:
+        coefficient_map = BackgroundModel.BackgroundCoefficientMap("linear_background_model", numpy.zeros((4, 5, 2)), numpy.arange(10.0),
+                                                                   Calibration.Calibration(units="eV"),
+                                                                   [Calibration.Calibration(1.0, 2.0, "nm"), Calibration.Calibration(0.0, 0.5, "nm")])
+        background = coefficient_map.get_background((slice(1, 4), slice(0, 5, 2)))
+        self.assertEqual((3, 3, 10), background.data_shape)
+        self.assertEqual(Calibration.Calibration(3.0, 2.0, "nm"), background.dimensional_calibrations[0])
+        self.assertEqual(Calibration.Calibration(0.0, 1.0, "nm"), background.dimensional_calibrations[1])
+        self.assertEqual(2, background.navigation_dimension_count)
+
+    def test_coefficient_map_is_not_supported_by_fitted_power_law(self) -> None:
+        with self.assertRaises(NotImplementedError):
+            BackgroundModel.find_background_model_by_id("power_law_fit_background_model").fit_coefficient_map(
+                spectrum_xdata=generate_power_law_spectrum_image(), fit_intervals=[(0.1, 0.2)], background_interval=(0.1, 0.9))
+
+    def test_nonlinear_power_law_recovers_exact_power_law(self) -> None:
+        xs = numpy.linspace(300.0, 400.0, 200, endpoint=False, dtype=numpy.float32)
+        fs = numpy.linspace(400.0, 500.0, 200, endpoint=False, dtype=numpy.float32)
+        amplitudes = numpy.array([1E10, 3E11, 5E9])
+        exponents = numpy.array([3.0, 3.5, 2.5])
+        yss = amplitudes[:, numpy.newaxis] * xs.astype(numpy.float64) ** -exponents[:, numpy.newaxis]
+        background_model = typing.cast(BackgroundModel.NonlinearPowerLawBackgroundModel, BackgroundModel.find_background_model_by_id("power_law_nonlinear_background_model"))
+        log_amplitudes, fitted_exponents, e0 = background_model.fit_power_law_parameters(xs, yss)
+        self.assertTrue(numpy.allclose(exponents, fitted_exponents, rtol=1E-6))
+        self.assertTrue(numpy.allclose(amplitudes * e0 ** -exponents, numpy.exp(log_amplitudes), rtol=1E-6))
+        fit = background_model._perform_fits(xs, yss, fs, None)
+        self.assertTrue(numpy.allclose(amplitudes[:, numpy.newaxis] * fs.astype(numpy.float64) ** -exponents[:, numpy.newaxis], fit, rtol=1E-5))
+
+    def test_nonlinear_power_law_reduces_residuals_of_log_log_fit(self) -> None:
+        spectrum_image_xdata = generate_power_law_spectrum_image()
+        yss = numpy.reshape(spectrum_image_xdata.data[..., 50:150], (-1, 100))
+        xs = numpy.linspace(225.0, 275.0, 100, endpoint=False, dtype=numpy.float32)
+        power_law_fit = BackgroundModel.find_background_model_by_id("power_law_background_model")._perform_fits(xs, yss, xs, None)
+        nonlinear_fit = BackgroundModel.find_background_model_by_id("power_law_nonlinear_background_model")._perform_fits(xs, yss, xs, None)
+        power_law_cost = numpy.sum(numpy.square(yss - power_law_fit), axis=-1)
+        nonlinear_cost = numpy.sum(numpy.square(yss - nonlinear_fit), axis=-1)
+        self.assertTrue(numpy.all(nonlinear_cost <= power_law_cost * (1 + 1E-6)))
+        self.assertTrue(numpy.any(nonlinear_cost < power_law_cost * 0.999))
+
+    def test_nonlinear_power_law_skips_spectra_without_positive_counts(self) -> None:
+        xs = numpy.linspace(300.0, 400.0, 100, endpoint=False)
+        yss = numpy.stack([1E9 * xs ** -3.0, numpy.zeros_like(xs)])
+        fit = BackgroundModel.find_background_model_by_id("power_law_nonlinear_background_model")._perform_fits(xs, yss, xs, None)
+        self.assertTrue(numpy.allclose(yss[0], fit[0]))
+        self.assertTrue(numpy.array_equal(numpy.zeros_like(xs), fit[1]))
+
+    def test_principal_components_match_svd(self) -> None:
+        rng = numpy.random.default_rng(0)
+        yss = (rng.standard_normal((200, 3)) * [10.0, 3.0, 1.0]) @ rng.standard_normal((3, 50))
+        yss += 1E-3 * rng.standard_normal(yss.shape)
+        yss -= numpy.mean(yss, axis=0)
+        components, singular_values = BackgroundModel.get_principal_components(lambda: iter((yss[:70], yss[70:])), 50, 3)
+        expected_singular_values, expected_components = numpy.linalg.svd(yss, full_matrices=False)[1:]
+        self.assertTrue(numpy.allclose(expected_singular_values[:3], singular_values, rtol=1E-6))
+        self.assertTrue(numpy.allclose(numpy.abs(numpy.sum(expected_components[:3] * components, axis=-1)), 1.0, atol=1E-6))
+
+    def test_principal_component_model_matches_linear_model_for_low_rank_data(self) -> None:
+        # a linear background of low rank data is the combination of the component backgrounds.
+        rng = numpy.random.default_rng(0)
+        energies = 200.0 + 0.5 * numpy.arange(400)
+        data = 100.0 + rng.uniform(0, 50, (6, 8, 1)) + rng.uniform(-0.1, 0.1, (6, 8, 1)) * (energies - 250)
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(data,
+                                                                     dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), Calibration.Calibration(offset=200.0, scale=0.5, units="eV")],
+                                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        pca_model = BackgroundModel.PrincipalComponentBackgroundModel("test_pca_background_model", BackgroundModel.find_background_model_by_id("linear_background_model"), 2)
+        fit_intervals = [(0.1, 0.3)]
+        background_interval = (0.35, 0.7)
+        expected = BackgroundModel.find_background_model_by_id("linear_background_model").fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=background_interval)["background_model"]
+        fit = pca_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=background_interval)["background_model"]
+        self.assertTrue(numpy.allclose(expected.data, fit.data, rtol=1E-8))
+        self.assertFalse(pca_model.capabilities.chunked)
+
+    def test_principal_component_model_reduces_noise_of_power_law_fit(self) -> None:
+        rng = numpy.random.default_rng(1)
+        energies = 200.0 + 0.5 * numpy.arange(400)
+        truth = rng.uniform(0.5, 2.0, (20, 20, 1)) * 3E7 * energies ** -rng.uniform(2.8, 3.2, (20, 20, 1))
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(rng.poisson(truth).astype(numpy.float32),
+                                                                     dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), Calibration.Calibration(offset=200.0, scale=0.5, units="eV")],
+                                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        fit_intervals = [(0.1, 0.3)]
+        background_interval = (0.35, 0.7)
+        start, stop = BackgroundModel.get_interval_pixel_range(400, background_interval)
+        errors = dict()
+        for background_model_id in ("power_law_background_model", "power_law_pca_background_model"):
+            fit = BackgroundModel.find_background_model_by_id(background_model_id).fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=background_interval)["background_model"]
+            errors[background_model_id] = numpy.sqrt(numpy.mean(numpy.square(fit.data - truth[..., start:stop])))
+        self.assertLess(errors["power_law_pca_background_model"], errors["power_law_background_model"] / 3)
+
+    def test_chunked_principal_component_map_with_summed_reference_matches_unchunked(self) -> None:
+        # a map is given the sum of the spectra as the reference; each chunk must use the components of all spectra.
+        rng = numpy.random.default_rng(2)
+        energies = 200.0 + 0.5 * numpy.arange(400)
+        truth = rng.uniform(0.5, 2.0, (12, 10, 1)) * 3E7 * energies ** -rng.uniform(2.8, 3.2, (12, 10, 1))
+        data = rng.poisson(truth).astype(numpy.float32)
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(data,
+                                                                     dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), Calibration.Calibration(offset=200.0, scale=0.5, units="eV")],
+                                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        eels_spectrum_xdata = DataAndMetadata.new_data_and_metadata(numpy.sum(data, axis=(0, 1)), dimensional_calibrations=[Calibration.Calibration(offset=200.0, scale=0.5, units="eV")])
+        background_model = BackgroundModel.find_background_model_by_id("power_law_pca_background_model")
+        fit_intervals = [(0.1, 0.3)]
+        signal_interval = (0.35, 0.7)
+        integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=eels_spectrum_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval)["integrated"]
+        for fused in (False, True):
+            with self.subTest(fused=fused):
+                chunked_integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=eels_spectrum_xdata, fit_intervals=fit_intervals,
+                                                                       signal_interval=signal_interval, chunk_size=16, fused=fused)["integrated"]
+                self.assertTrue(numpy.allclose(integrated.data, chunked_integrated.data, rtol=1E-5))
+        # the summed reference is scaled to the mean, so it fits the same backgrounds as the mean.
+        mean_spectrum_xdata = DataAndMetadata.new_data_and_metadata(numpy.mean(data, axis=(0, 1)), dimensional_calibrations=[Calibration.Calibration(offset=200.0, scale=0.5, units="eV")])
+        mean_integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=mean_spectrum_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval)["integrated"]
+        self.assertTrue(numpy.allclose(integrated.data, mean_integrated.data, rtol=1E-5))
+
+    def test_binned_fit_windows_are_bin_means(self) -> None:
+        rng = numpy.random.default_rng(0)
+        spectra = rng.uniform(0, 10, (6, 4, 50))
+        binned_yss, pixel_sums = BackgroundModel.get_binned_fit_windows(spectra, [(5, 10), (20, 25)], 2)
+        fit_windows = numpy.concatenate([spectra[..., 5:10], spectra[..., 20:25]], axis=-1)
+        expected = numpy.mean(numpy.reshape(fit_windows, (3, 2, 2, 2, 10)), axis=(1, 3))
+        self.assertTrue(numpy.allclose(numpy.reshape(expected, (-1, 10)), binned_yss))
+        self.assertTrue(numpy.allclose(numpy.ravel(numpy.sum(fit_windows, axis=-1)), pixel_sums))
+        self.assertEqual([0, 0, 1, 1, 0, 0, 1, 1, 2, 2, 3, 3], list(BackgroundModel.get_bin_indexes((3, 4), 2)))
+        # partial bins at the ends of the axes are the mean of the pixels they contain.
+        binned_yss = BackgroundModel.get_binned_fit_windows(spectra[:5, :3], [(5, 10)], 2)[0]
+        self.assertTrue(numpy.allclose(numpy.mean(spectra[4, 2, 5:10]), numpy.mean(binned_yss[-1])))
+
+    def test_binned_fit_matches_per_pixel_fit_for_scaled_spectra(self) -> None:
+        # spectra which differ only by a scale have the background of their bin, scaled by their fit window sum.
+        rng = numpy.random.default_rng(0)
+        energies = 200.0 + 0.5 * numpy.arange(400)
+        data = rng.uniform(0.5, 2.0, (5, 7, 1)) * 1E9 * energies ** -3.0
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(data,
+                                                                     dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), Calibration.Calibration(offset=200.0, scale=0.5, units="eV")],
+                                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        fit_intervals = [(0.1, 0.2), (0.25, 0.3)]
+        signal_interval = (0.4, 0.6)
+        background_model = BackgroundModel.find_background_model_by_id("power_law_background_model")
+        fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval)
+        binned_fit = background_model.fit_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval, binning=2, chunk_size=4, fit_quality=True)
+        self.assertTrue(numpy.allclose(fit["background_model"].data, binned_fit["background_model"].data, rtol=1E-6))
+        self.assertTrue(numpy.all(binned_fit["r_squared"].data > 0.999))
+        integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=True)["integrated"]
+        binned_integrated = background_model.integrate_signal(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval, fused=True, binning=3)["integrated"]
+        self.assertTrue(numpy.allclose(integrated.data, binned_integrated.data, atol=1E-3))
+        coefficient_map = background_model.fit_coefficient_map(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals, background_interval=signal_interval, binning=2)["coefficient_map"]
+        self.assertTrue(numpy.allclose(fit["background_model"].data, coefficient_map.get_background().data, rtol=1E-6))
+        self.assertTrue(numpy.allclose(fit["background_model"].data[1, 2], coefficient_map.get_background((1, 2)).data, rtol=1E-6))
+
+    def test_fit_plan_cache_evicts_least_recently_used_plan(self) -> None:
+        fit_plan_cache = BackgroundModel.FitPlanCache[int](max_size=2)
+        fit_plan_cache.get_plan("a", lambda: 1)
+        fit_plan_cache.get_plan("b", lambda: 2)
+        fit_plan_cache.get_plan("a", lambda: 3)
+        fit_plan_cache.get_plan("c", lambda: 4)
+        self.assertEqual(2, len(fit_plan_cache))
+        self.assertEqual(1, fit_plan_cache.get_plan("a", lambda: 5))
+        self.assertEqual(6, fit_plan_cache.get_plan("b", lambda: 6))
+
+    def test_fit_window_buffer_reuses_buffer_across_blocks(self) -> None:
+        spectra = numpy.random.default_rng(3).uniform(0, 100, (20, 50)).astype(numpy.float32)
+        fit_ranges = [(5, 10), (20, 30)]
+        fit_window_buffer = BackgroundModel.FitWindowBuffer(fit_ranges)
+        yss1 = fit_window_buffer.gather(spectra[0:8])
+        self.assertTrue(numpy.array_equal(numpy.concatenate([spectra[0:8, 5:10], spectra[0:8, 20:30]], axis=-1), yss1))
+        yss2 = fit_window_buffer.gather(spectra[8:14])
+        self.assertEqual((6, 15), yss2.shape)
+        self.assertTrue(numpy.shares_memory(yss1, yss2))
+        self.assertTrue(numpy.array_equal(numpy.concatenate([spectra[8:14, 5:10], spectra[8:14, 20:30]], axis=-1), yss2))
+        single_window_yss = BackgroundModel.FitWindowBuffer([(5, 10)]).gather(spectra)
+        self.assertTrue(numpy.shares_memory(spectra, single_window_yss))
+
+    def test_navigation_chunks_cover_navigation_range(self) -> None:
+        self.assertEqual([slice(0, 10)], list(BackgroundModel.iterate_navigation_chunks(10)))
+        self.assertEqual([slice(0, 4), slice(4, 8), slice(8, 10)], list(BackgroundModel.iterate_navigation_chunks(10, 4)))
+        self.assertEqual([slice(0, 10)], list(BackgroundModel.iterate_navigation_chunks(10, 100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy
+
+from nion.eels_analysis import CrossSectionCache
+from nion.eels_analysis import eels_analysis
+from nion.utils import Registry
+
+
+class CountingEELSAnalysisService:
+
+    def __init__(self) -> None:
+        self.call_count = 0
+
+    def partial_cross_section_nm2(self, atomic_number: int, shell_number: int, subshell_index: int,
+                                  edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
+                                  convergence_angle_rad: float, collection_angle_rad: float) -> float:
+        self.call_count += 1
+        return 1e-8 * atomic_number + 1e-12 * edge_delta_ev
+
+
+class TestCrossSectionCache(unittest.TestCase):
+
+    def test_least_recently_used_value_is_dropped(self) -> None:
+        cache = CrossSectionCache.CrossSectionCache(max_size=2)
+        keys = [cache.make_key("partial", 6, 1, 1, (284.0 + i, 50.0, 100000.0, 0.01, 0.02)) for i in range(3)]
+        cache.get_value(keys[0], lambda: 0)
+        cache.get_value(keys[1], lambda: 1)
+        self.assertEqual(0, cache.get_value(keys[0], lambda: -1))
+        cache.get_value(keys[2], lambda: 2)
+        # keys[1] was least recently used
+        self.assertEqual(-1, cache.get_value(keys[1], lambda: -1))
+        self.assertEqual(2, cache.get_value(keys[2], lambda: -1))
+        statistics = cache.statistics
+        self.assertEqual((2, 4, 2, 2), (statistics.hits, statistics.misses, statistics.size, statistics.max_size))
+        self.assertAlmostEqual(1 / 3, statistics.hit_rate)
+
+    def test_parameters_within_tolerance_share_a_key(self) -> None:
+        cache = CrossSectionCache.CrossSectionCache(tolerance=1e-6)
+        key = cache.make_key("partial", 6, 1, 1, (284.0, 50.0, 100000.0, 0.01, 0.0))
+        self.assertEqual(key, cache.make_key("partial", 6, 1, 1, (284.0 + 1e-9, 50.0, 100000.0 - 1e-6, 0.01 * (1 + 1e-9), 0.0)))
+        self.assertNotEqual(key, cache.make_key("partial", 6, 1, 1, (284.1, 50.0, 100000.0, 0.01, 0.0)))
+        self.assertNotEqual(key, cache.make_key("partial", 6, 1, 2, (284.0, 50.0, 100000.0, 0.01, 0.0)))
+        cache.configure(tolerance=1e-2)
+        self.assertEqual(cache.make_key("partial", 6, 1, 1, (284.0, 50.0, 100000.0, 0.01, 0.0)),
+                         cache.make_key("partial", 6, 1, 1, (284.1, 50.0, 100000.0, 0.01, 0.0)))
+
+    def test_partial_cross_section_from_service_is_cached(self) -> None:
+        service = CountingEELSAnalysisService()
+        Registry.register_component(service, {"eels_analysis_service"})
+        try:
+            eels_analysis.cross_section_cache.reset_statistics()
+            values = [eels_analysis.partial_cross_section_nm2(14, 1, 1, 1839.0, 100.0, 200000.0, 0.02, 0.05) for _ in range(3)]
+            self.assertEqual(1, service.call_count)
+            self.assertEqual(values[0], values[2])
+            statistics = eels_analysis.get_cross_section_cache_statistics()
+            self.assertEqual((2, 1), (statistics.hits, statistics.misses))
+            eels_analysis.partial_cross_section_nm2(14, 1, 1, 1839.0, 120.0, 200000.0, 0.02, 0.05)
+            self.assertEqual(2, service.call_count)
+        finally:
+            Registry.unregister_component(service, {"eels_analysis_service"})
+        # unregistering the service clears the values it computed.
+        self.assertEqual(0, eels_analysis.get_cross_section_cache_statistics().size)
+
+    def test_hydrogenic_differential_cross_section_is_cached_and_copied(self) -> None:
+        eels_analysis.cross_section_cache.reset_statistics()
+        parameters = (6, 1, 1, 284.0, 50.0, 100000.0, 0.01, 0.02)
+        energy_diff_sigma = eels_analysis.energy_diff_cross_section_nm2_per_ev(*parameters)
+        energy_diff_sigma[:] = 0.0
+        cached_energy_diff_sigma = eels_analysis.energy_diff_cross_section_nm2_per_ev(*parameters)
+        self.assertTrue(numpy.all(cached_energy_diff_sigma > 0.0))
+        self.assertEqual(1, eels_analysis.get_cross_section_cache_statistics().hits)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import pathlib
+import tempfile
+import unittest
+
+import numpy
+
+from nion.eels_analysis import CrossSectionTable
+from nion.eels_analysis import EELS_CrossSections
+from nion.eels_analysis import eels_analysis
+
+
+def make_grid() -> CrossSectionTable.CrossSectionTableGrid:
+    return CrossSectionTable.CrossSectionTableGrid(atomic_numbers=(6, 14), beam_energies_eV=(100000.0, 200000.0),
+                                                   theta_log_count=32, theta_linear_count=100, energy_count=32)
+
+
+class TestCrossSectionTable(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.__temporary_directory.name) / "cross_sections.bin"
+
+    def tearDown(self) -> None:
+        eels_analysis.set_cross_section_table(None)
+        self.__temporary_directory.cleanup()
+
+    def test_written_table_is_memory_mapped_with_grid_and_accuracy(self) -> None:
+        grid = make_grid()
+        written_table = CrossSectionTable.write_cross_section_table(self.path, grid, validation_count=4)
+        table = CrossSectionTable.load_cross_section_table(self.path)
+        self.assertIsInstance(table.values, numpy.memmap)
+        self.assertEqual(grid, table.grid)
+        self.assertEqual(grid.shape, table.values.shape)
+        self.assertTrue(numpy.array_equal(CrossSectionTable.generate_cross_section_table(grid), table.values, equal_nan=True))
+        self.assertIsNotNone(table.accuracy)
+        self.assertEqual(written_table.accuracy, table.accuracy)
+        self.assertLess(table.accuracy, 0.05)
+
+    def test_load_rejects_other_files(self) -> None:
+        self.path.write_bytes(b"not a cross-section table")
+        with self.assertRaises(ValueError):
+            CrossSectionTable.load_cross_section_table(self.path)
+
+    def test_interpolated_partial_cross_section_matches_reference(self) -> None:
+        table = CrossSectionTable.CrossSectionTable(make_grid(), CrossSectionTable.generate_cross_section_table(make_grid()), None)
+        for parameters in [(6, 284.0, 100.0, 100000.0, 0.0, 0.02), (14, 1839.0, 150.0, 150000.0, 0.03, 0.05)]:
+            cross_section = table.partial_cross_section_nm2(*parameters)
+            assert cross_section is not None
+            expected = CrossSectionTable.get_reference_partial_cross_section_nm2(*parameters)
+            self.assertAlmostEqual(1.0, cross_section / expected, delta=0.02)
+
+    def test_parameters_outside_table_are_not_interpolated(self) -> None:
+        table = CrossSectionTable.CrossSectionTable(make_grid(), CrossSectionTable.generate_cross_section_table(make_grid()), None)
+        self.assertIsNotNone(table.partial_cross_section_nm2(6, 284.0, 50.0, 100000.0, 0.01, 0.02))
+        self.assertIsNone(table.partial_cross_section_nm2(8, 532.0, 50.0, 100000.0, 0.01, 0.02))
+        self.assertIsNone(table.partial_cross_section_nm2(6, 284.0, 50.0, 300000.0, 0.01, 0.02))
+        self.assertIsNone(table.partial_cross_section_nm2(6, 284.0, 50.0, 100000.0, 0.1, 0.2))
+        self.assertIsNone(table.partial_cross_section_nm2(6, 100.0, 50.0, 100000.0, 0.01, 0.02))
+
+    def test_partial_cross_sections_use_table_inside_it(self) -> None:
+        CrossSectionTable.write_cross_section_table(self.path, make_grid(), validation_count=0)
+        table = eels_analysis.load_cross_section_table(self.path)
+        self.assertIs(table, eels_analysis.get_cross_section_table())
+        expected = table.partial_cross_section_nm2(6, 284.0, 50.0, 150000.0, 0.01, 0.03)
+        self.assertEqual(expected, eels_analysis.partial_cross_section_nm2(6, 1, 1, 284.0, 50.0, 150000.0, 0.01, 0.03))
+        # oxygen is not in the table and is computed directly.
+        cross_sections = eels_analysis.partial_cross_sections_nm2([6, 8], 1, 1, [284.0, 532.0], 50.0, 150000.0, 0.01, 0.03)
+        self.assertEqual(expected, cross_sections[0])
+        self.assertEqual(EELS_CrossSections.partial_cross_section_nm2(8, 1, 1, 532.0, 50.0, 150000.0, 0.01, 0.03), cross_sections[1])
+        eels_analysis.set_cross_section_table(None)
+        self.assertNotEqual(expected, eels_analysis.partial_cross_section_nm2(6, 1, 1, 284.0, 50.0, 150000.0, 0.01, 0.03))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+import numpy
+import numpy.typing
+
+from nion.eels_analysis import EELS_CrossSections
+from nion.eels_analysis import eels_analysis
+from nion.utils import Registry
+
+
+class TestCrossSections(unittest.TestCase):
+
+    def test_batched_partial_cross_sections_of_different_edges_match_scalar(self) -> None:
+        atomic_numbers = numpy.array([1, 5, 6, 8, 14, 26])
+        edge_onsets = numpy.array([13.6, 188.0, 284.0, 532.0, 1839.0, 7112.0])
+        edge_deltas = numpy.array([20.0, 30.0, 50.0, 150.0, 100.0, 500.0])
+        cross_sections = EELS_CrossSections.partial_cross_sections_nm2(atomic_numbers, 1, 1, edge_onsets, edge_deltas, 200000.0, 0.02, 0.03)
+        energy_diff_sigmas = EELS_CrossSections.energy_diff_cross_sections_nm2_per_ev(atomic_numbers, 1, 1, edge_onsets, edge_deltas, 200000.0, 0.02, 0.03)
+        self.assertEqual((6,), cross_sections.shape)
+        for i, (atomic_number, edge_onset, edge_delta) in enumerate(zip(atomic_numbers, edge_onsets, edge_deltas)):
+            expected = EELS_CrossSections.partial_cross_section_nm2(int(atomic_number), 1, 1, edge_onset, edge_delta, 200000.0, 0.02, 0.03)
+            self.assertAlmostEqual(1.0, cross_sections[i] / expected, places=12)
+            expected_energy_diff_sigma = EELS_CrossSections.energy_diff_cross_section_nm2_per_ev(int(atomic_number), 1, 1, edge_onset, edge_delta, 200000.0, 0.02, 0.03)
+            self.assertTrue(numpy.allclose(expected_energy_diff_sigma, energy_diff_sigmas[i], rtol=1e-12, atol=0))
+
+    def test_angle_sweep_shares_theta_grid_and_agrees_with_scalar(self) -> None:
+        convergence_angles = numpy.linspace(0.0, 0.04, 5)
+        collection_angles = numpy.linspace(0.005, 0.1, 12)
+        cross_sections = EELS_CrossSections.partial_cross_sections_nm2(6, 1, 1, 284.0, 100.0, 200000.0, convergence_angles[:, numpy.newaxis], collection_angles)
+        self.assertEqual((5, 12), cross_sections.shape)
+        expected = numpy.array([[EELS_CrossSections.partial_cross_section_nm2(6, 1, 1, 284.0, 100.0, 200000.0, alpha, beta) for beta in collection_angles] for alpha in convergence_angles])
+        self.assertTrue(numpy.allclose(expected, cross_sections, rtol=1e-12, atol=0))
+        # without convergence, a larger collection angle collects more, until the cross-section saturates and the
+        # differences are within the discretization error of the theta grid of each angle.
+        self.assertTrue(numpy.all(numpy.diff(cross_sections[0, :7]) > 0))
+
+    def test_wide_collection_angle_sweep_matches_scalar_for_each_angle(self) -> None:
+        # each cross-section is integrated on its own theta grid, whatever the other angles of the batch; the sweep
+        # needs more theta samples than one group of cross-sections shares.
+        convergence_angles = numpy.array([0.0, 0.001, 0.03])
+        collection_angles = numpy.geomspace(0.0002, 0.2, 40)
+        cross_sections = EELS_CrossSections.partial_cross_sections_nm2(6, 1, 1, 284.0, 50.0, 100000.0, convergence_angles[:, numpy.newaxis], collection_angles)
+        for i, alpha in enumerate(convergence_angles):
+            for j, beta in enumerate(collection_angles):
+                expected = EELS_CrossSections.partial_cross_section_nm2(6, 1, 1, 284.0, 50.0, 100000.0, alpha, beta)
+                self.assertAlmostEqual(1.0, cross_sections[i, j] / expected, places=12)
+        # a cross-section does not change with the other cross-sections of the batch.
+        self.assertEqual(float(cross_sections[1, 5]), float(EELS_CrossSections.partial_cross_sections_nm2(6, 1, 1, 284.0, 50.0, 100000.0, [0.001, 0.001], [collection_angles[5], 0.2])[0]))
+
+    def test_vectorized_kohl_collection_efficiency_matches_scalar(self) -> None:
+        theta = numpy.linspace(0.0, 0.08, 161)
+        alphas = numpy.array([0.0, 0.0001, 0.01, 0.03, 0.04])
+        betas = numpy.array([0.03, 0.03, 0.03, 0.01, 0.0002])
+        efficiencies = EELS_CrossSections.kohl_collection_efficiencies(theta, alphas, betas)
+        self.assertEqual((5, 161), efficiencies.shape)
+        for efficiency, alpha, beta in zip(efficiencies, alphas, betas):
+            expected = EELS_CrossSections.kohl_collection_efficiency(theta, alpha, beta)
+            self.assertTrue(numpy.allclose(expected, efficiency))
+            self.assertTrue(numpy.all((efficiency >= 0) & (efficiency <= 1)))
+
+    def test_batched_cross_sections_use_cache_and_service(self) -> None:
+        eels_analysis.cross_section_cache.clear()
+        eels_analysis.cross_section_cache.reset_statistics()
+        collection_angles = numpy.linspace(0.01, 0.05, 5)
+        cross_sections = eels_analysis.partial_cross_sections_nm2(6, 1, 1, 284.0, 50.0, 100000.0, 0.01, collection_angles)
+        self.assertTrue(numpy.array_equal(cross_sections, eels_analysis.partial_cross_sections_nm2(6, 1, 1, 284.0, 50.0, 100000.0, 0.01, collection_angles)))
+        self.assertEqual(cross_sections[2], eels_analysis.partial_cross_section_nm2(6, 1, 1, 284.0, 50.0, 100000.0, 0.01, collection_angles[2]))
+        statistics = eels_analysis.get_cross_section_cache_statistics()
+        self.assertEqual((6, 5), (statistics.hits, statistics.misses))
+
+        class EELSAnalysisService:
+            def partial_cross_section_nm2(self, atomic_number: int, shell_number: int, subshell_index: int,
+                                          edge_onset_ev: float, edge_delta_ev: float, beam_energy_ev: float,
+                                          convergence_angle_rad: float, collection_angle_rad: float) -> float:
+                return collection_angle_rad
+
+        service = EELSAnalysisService()
+        Registry.register_component(service, {"eels_analysis_service"})
+        try:
+            self.assertTrue(numpy.allclose(collection_angles, eels_analysis.partial_cross_sections_nm2(6, 1, 1, 284.0, 50.0, 100000.0, 0.01, collection_angles)))
+        finally:
+            Registry.unregister_component(service, {"eels_analysis_service"})
+
+    def test_adaptive_quadrature_evaluates_only_the_halves_of_bisected_panels(self) -> None:
+        node_counts = list()
+
+        def fn(x: numpy.typing.NDArray[numpy.float64]) -> numpy.typing.NDArray[numpy.float64]:
+            node_counts.append(x.shape[0])
+            return numpy.sqrt(x)[:, numpy.newaxis]
+
+        value, error, evaluation_count = EELS_CrossSections._integrate_adaptively(fn, [0.0, 1.0], numpy.array(1e-8))
+        self.assertAlmostEqual(2 / 3, float(value[0]), delta=1e-8)
+        self.assertLessEqual(float(error[0]), 1e-8)
+        self.assertEqual(sum(node_counts), evaluation_count)
+        # the whole panel and its halves, then the halves of the two panels of the panel at the singularity, the only
+        # panel bisected each time.
+        order = EELS_CrossSections.GAUSS_LEGENDRE_ORDER
+        self.assertEqual(3 * order, node_counts[0])
+        self.assertGreater(len(node_counts), 1)
+        self.assertEqual([4 * order] * (len(node_counts) - 1), node_counts[1:])
+
+    def test_adaptive_partial_cross_section_converges_within_its_error_estimate(self) -> None:
+        for parameters in [(6, 1, 1, 284.0, 50.0, 100000.0, 0.01, 0.03), (14, 1, 1, 1839.0, 200.0, 200000.0, 0.02, 0.005),
+                           (1, 1, 1, 13.6, 20.0, 200000.0, 0.0, 0.03)]:
+            result = EELS_CrossSections.adaptive_partial_cross_section_nm2(*parameters, tolerance=1e-3)
+            converged = EELS_CrossSections.adaptive_partial_cross_section_nm2(*parameters, tolerance=1e-9)
+            self.assertLessEqual(result.error_estimate_nm2, 1e-3 * result.cross_section_nm2)
+            self.assertLessEqual(abs(result.cross_section_nm2 - converged.cross_section_nm2), result.error_estimate_nm2)
+            self.assertLess(result.evaluation_count, converged.evaluation_count)
+            self.assertEqual(result.cross_section_nm2, EELS_CrossSections.partial_cross_section_nm2(*parameters, tolerance=1e-3))
+            # the fixed grid differs from the converged value by its discretization error, which is largest for the
+            # sharp hydrogen edge.
+            if parameters[0] > 1:
+                self.assertAlmostEqual(1.0, EELS_CrossSections.partial_cross_section_nm2(*parameters) / converged.cross_section_nm2, delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
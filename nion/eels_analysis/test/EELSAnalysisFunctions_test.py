@@ -130,6 +130,27 @@ class TestEELSAnalysisFunctions(unittest.TestCase):
         self.assertTrue(numpy.array_equal(expanded.data[200:500], numpy.ones((300, ))))
         self.assertTrue(numpy.array_equal(expanded.data[500:1000], numpy.zeros((500, ))))
 
+    def test_extract_signal_matches_separate_extraction_and_background(self) -> None:
+        calibration = Calibration.Calibration(200.0, 2.0, 'eV')
+        spectrum_length = 1000
+        xs = numpy.linspace(200.0, 2200.0, spectrum_length)
+        data = 1.0e8 * numpy.power(xs, -2.5) + numpy.random.default_rng(0).uniform(0, 1, spectrum_length)
+        data_and_metadata = DataAndMetadata.new_data_and_metadata(data, dimensional_calibrations=[calibration])
+        fit_ranges, signal_range = [(0.2, 0.3)], (0.4, 0.5)
+        extraction = eels_analysis.extract_signal(data_and_metadata, fit_ranges, signal_range)
+        signal = eels_analysis.extract_original_signal(data_and_metadata, fit_ranges, signal_range)
+        background = eels_analysis.calculate_background_signal(data_and_metadata, fit_ranges, signal_range)
+        self.assertTrue(numpy.array_equal(signal.data, extraction.signal.data))
+        self.assertTrue(numpy.shares_memory(extraction.signal.data, data_and_metadata.data))
+        self.assertFalse(numpy.shares_memory(extraction.background.data, data_and_metadata.data))
+        self.assertFalse(numpy.shares_memory(extraction.subtracted.data, data_and_metadata.data))
+        self.assertTrue(numpy.allclose(background.data, extraction.background.data))
+        self.assertTrue(numpy.allclose(extraction.signal.data - extraction.background.data, extraction.subtracted.data))
+        self.assertEqual(background.dimensional_calibrations, extraction.subtracted.dimensional_calibrations)
+        # the integral is over the signal range in calibrated units.
+        self.assertEqual((), numpy.shape(extraction.integral))
+        self.assertAlmostEqual(float(numpy.sum(extraction.subtracted.data[200:])) * calibration.scale, float(extraction.integral), delta=abs(float(extraction.integral)) * 0.05)
+
     def test_map_background_subtracted_signal_produces_correct_calibrations(self) -> None:
         calibration = Calibration.Calibration(200.0, 2.0, 'eV')
         calibration_y = Calibration.Calibration(101.0, 1.5, 'nm')
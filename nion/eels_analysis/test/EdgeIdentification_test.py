@@ -0,0 +1,74 @@
+import unittest
+
+import numpy
+import numpy.typing
+
+from nion.eels_analysis import EELS_EdgeIdentification
+from nion.eels_analysis import PeriodicTable
+
+
+ENERGY_OFFSET_EV = 200.0
+ENERGY_SCALE_EV = 0.5
+
+
+def make_spectra(edges: numpy.typing.NDArray[numpy.float64], jumps: numpy.typing.ArrayLike, seed: int = 0) -> numpy.typing.NDArray[numpy.float32]:
+    # power law background spectra with edges at the energies, edges[..., k] the presence of edge k in each spectrum.
+    energies = ENERGY_OFFSET_EV + numpy.arange(1024) * ENERGY_SCALE_EV
+    spectra = 1e5 * (energies / ENERGY_OFFSET_EV) ** -3 * numpy.ones(edges.shape[:-1] + (1,))
+    for k, (energy, jump) in enumerate(zip([284.2, 543.1], numpy.asarray(jumps))):
+        spectra = spectra + edges[..., k:k + 1] * jump * 1e5 * (energies / ENERGY_OFFSET_EV) ** -3 * (energies > energy)
+    return numpy.random.default_rng(seed).poisson(spectra).astype(numpy.float32)
+
+
+class TestEdgeIdentification(unittest.TestCase):
+
+    def test_edges_are_identified_in_each_spectrum(self) -> None:
+        edges = numpy.random.default_rng(1).random((12, 10, 2)) > 0.5
+        data = make_spectra(edges, (0.4, 0.3))
+        edge_identification = EELS_EdgeIdentification.identify_edges(data, ENERGY_OFFSET_EV, ENERGY_SCALE_EV, smoothing_eV=2.0, min_relative_jump=0.1)
+        self.assertEqual((12, 10), edge_identification.navigation_shape)
+        self.assertEqual(numpy.count_nonzero(edges), edge_identification.onset_count)
+        self.assertEqual({6: numpy.count_nonzero(edges[..., 0]), 8: numpy.count_nonzero(edges[..., 1])}, edge_identification.get_element_counts())
+        for navigation_index in numpy.ndindex(edges.shape[:-1]):
+            edge_onsets = edge_identification.get_edge_onsets(navigation_index)
+            expected = [s for s, present in zip(["C-K", "O-K"], edges[navigation_index]) if present]
+            self.assertEqual(expected, [str(edge_onset.candidates[0].electron_shell) for edge_onset in edge_onsets])
+            for edge_onset in edge_onsets:
+                self.assertAlmostEqual(edge_onset.candidates[0].edge_energy_eV, edge_onset.onset_energy_eV, delta=ENERGY_SCALE_EV)
+        # the relative jump of carbon; oxygen is on top of the carbon edge.
+        edge_onsets = edge_identification.get_edge_onsets(tuple(numpy.argwhere(edges[..., 0])[0]))
+        self.assertAlmostEqual(0.4, edge_onsets[0].relative_jump, delta=0.04)
+
+    def test_summed_spectrum_and_energy_interval(self) -> None:
+        data = make_spectra(numpy.ones((4, 4, 2)), (0.4, 0.3))
+        edge_identification = EELS_EdgeIdentification.identify_edges(numpy.sum(data, axis=(0, 1)), ENERGY_OFFSET_EV, ENERGY_SCALE_EV)
+        self.assertEqual((), edge_identification.navigation_shape)
+        self.assertEqual(["C-K", "O-K"], [str(edge_onset.candidates[0].electron_shell) for edge_onset in edge_identification.get_edge_onsets()])
+        edge_identification = EELS_EdgeIdentification.identify_edges(data, ENERGY_OFFSET_EV, ENERGY_SCALE_EV, energy_interval_eV=(400.0, 600.0), chunk_size=5)
+        self.assertEqual(["O-K"], [str(edge_onset.candidates[0].electron_shell) for edge_onset in edge_identification.get_edge_onsets((3, 2))])
+        edge_identification = EELS_EdgeIdentification.identify_edges(data, ENERGY_OFFSET_EV, ENERGY_SCALE_EV, max_onset_count=1)
+        self.assertEqual(["C-K"], [str(edge_onset.candidates[0].electron_shell) for edge_onset in edge_identification.get_edge_onsets((1, 1))])
+
+    def test_edges_are_matched_within_tolerance_by_offset(self) -> None:
+        candidates_list = EELS_EdgeIdentification.match_edges([283.0, 100000.0, 543.1], 5.0)
+        self.assertEqual(3, len(candidates_list))
+        self.assertEqual([], candidates_list[1])
+        self.assertEqual(PeriodicTable.ElectronShell(8, 1, 1), candidates_list[2][0].electron_shell)
+        for candidates in candidates_list:
+            scores = [candidate.score for candidate in candidates]
+            self.assertEqual(sorted(scores, reverse=True), scores)
+            self.assertTrue(all(abs(candidate.offset_eV) <= 5.0 for candidate in candidates))
+        # every subshell includes Ru-M4 which is above Ru-M5, the lowest of its shell.
+        primary_shells = [c.electron_shell for c in candidates_list[0]]
+        subshells = [c.electron_shell for c in EELS_EdgeIdentification.match_edges([283.0], 5.0, False, max_candidate_count=None)[0]]
+        self.assertNotIn(PeriodicTable.ElectronShell(44, 3, 4), primary_shells)
+        self.assertIn(PeriodicTable.ElectronShell(44, 3, 4), subshells)
+        self.assertTrue(set(primary_shells).issubset(subshells))
+        self.assertEqual([6], [c.electron_shell.atomic_number for c in EELS_EdgeIdentification.match_edges([283.0], 5.0, atomic_numbers=[6, 8])[0]])
+        self.assertEqual(1, len(EELS_EdgeIdentification.match_edges([283.0], 5.0, max_candidate_count=1)[0]))
+        self.assertEqual(EELS_EdgeIdentification.candidate_edges(283.0, 5.0), EELS_EdgeIdentification.match_edges([283.0], 5.0)[0])
+        self.assertEqual(284.2, EELS_EdgeIdentification.nominal_edge_onset_eV(PeriodicTable.ElectronShell(6, 1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
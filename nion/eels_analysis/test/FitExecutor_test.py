@@ -0,0 +1,71 @@
+import unittest
+
+import numpy
+
+from nion.eels_analysis import BackgroundModel
+from nion.eels_analysis import FitExecutor
+from nion.eels_analysis import PeakModel
+
+
+class MeanBackgroundModel(BackgroundModel.AbstractBackgroundModel):
+    thread_safe = True
+    releases_gil = True
+
+    def _perform_fit(self, xs: BackgroundModel.DataArrayType, ys: BackgroundModel.DataArrayType, fs: BackgroundModel.DataArrayType) -> BackgroundModel.DataArrayType:
+        return numpy.full(fs.shape, numpy.mean(ys))
+
+
+class MaximumZeroLossPeakModel(PeakModel.AbstractZeroLossPeakModel):
+    thread_safe = True
+    releases_gil = True
+
+    def _perform_fit(self, ys: PeakModel.DataArrayType, z: int) -> PeakModel.DataArrayType:
+        result = numpy.zeros(ys.shape)
+        result[z] = numpy.amax(ys)
+        return result
+
+
+class TestFitExecutor(unittest.TestCase):
+
+    def test_parallel_background_fits_match_serial_fits_in_order(self) -> None:
+        xs = numpy.linspace(100, 200, 50)
+        fs = numpy.linspace(200, 300, 80)
+        yss = numpy.random.default_rng(1).uniform(0, 100, (1000, 50))
+        background_model = MeanBackgroundModel("mean_background_model")
+        background_model.fit_executor = FitExecutor.FitExecutor(max_workers=1)
+        serial_fit = background_model._perform_fits(xs, yss, fs, None)
+        for kind in ("thread", "process"):
+            with self.subTest(kind=kind):
+                fit_executor = FitExecutor.FitExecutor(kind, max_workers=4, chunk_size=64)
+                try:
+                    background_model.fit_executor = fit_executor
+                    self.assertTrue(fit_executor.is_parallel_for_model(background_model))
+                    parallel_fit = background_model._perform_fits(xs, yss, fs, None)
+                finally:
+                    fit_executor.close()
+                self.assertEqual(serial_fit.shape, parallel_fit.shape)
+                self.assertTrue(numpy.array_equal(serial_fit, parallel_fit))
+                self.assertTrue(numpy.allclose(parallel_fit[:, 0], numpy.mean(yss, axis=-1)))
+
+    def test_parallel_zero_loss_peak_fits_match_serial_fits(self) -> None:
+        yss = numpy.random.default_rng(2).uniform(0, 100, (8, 100, 30))
+        zero_loss_peak_model = MaximumZeroLossPeakModel("maximum_peak_model")
+        serial_fit = zero_loss_peak_model._perform_fits(yss, 5)
+        fit_executor = FitExecutor.FitExecutor(max_workers=4, chunk_size=50)
+        try:
+            zero_loss_peak_model.fit_executor = fit_executor
+            parallel_fit = zero_loss_peak_model._perform_fits(yss, 5)
+        finally:
+            fit_executor.close()
+        self.assertEqual(yss.shape, parallel_fit.shape)
+        self.assertTrue(numpy.array_equal(serial_fit, parallel_fit))
+        self.assertTrue(numpy.array_equal(numpy.amax(yss, axis=-1), parallel_fit[..., 5]))
+
+    def test_models_not_declaring_thread_safety_run_serially_on_threads(self) -> None:
+        fit_executor = FitExecutor.FitExecutor(max_workers=4)
+        self.assertFalse(fit_executor.is_parallel_for_model(BackgroundModel.AbstractBackgroundModel("abstract_background_model")))
+        self.assertTrue(FitExecutor.FitExecutor("process", max_workers=4).is_parallel_for_model(BackgroundModel.AbstractBackgroundModel("abstract_background_model")))
+
+
+if __name__ == '__main__':
+    unittest.main()
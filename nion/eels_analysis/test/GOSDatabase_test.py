@@ -0,0 +1,96 @@
+import pathlib
+import tempfile
+import typing
+import unittest
+
+import numpy
+import numpy.typing
+
+from nion.eels_analysis import EELS_CrossSections
+from nion.eels_analysis import GOSDatabase
+from nion.eels_analysis import eels_analysis
+
+
+def make_hydrogenic_gos_table(atomic_number: int, shell_number: int, subshell_index: int,
+                              energies_eV: numpy.typing.NDArray[numpy.float64],
+                              log_q2: typing.Optional[numpy.typing.NDArray[numpy.float64]] = None) -> GOSDatabase.GOSTable:
+    # a table of the hydrogenic K-shell GOS, stored for any shell, to compare with the hydrogenic model.
+    log_q2 = log_q2 if log_q2 is not None else numpy.linspace(numpy.log(1e-4), numpy.log(1e5), 160)
+    epsilonR = energies_eV / (0.5 * 510999.0 / 137.036 ** 2)
+    gos = EELS_CrossSections.k_shell_hydrogenic_gos_q2(atomic_number, epsilonR, numpy.exp(log_q2)[:, numpy.newaxis] * numpy.ones_like(energies_eV))
+    return GOSDatabase.GOSTable(atomic_number, shell_number, subshell_index, energies_eV, log_q2, gos.T.astype(numpy.float32))
+
+
+class TestGOSDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.__temporary_directory.name) / "gos.bin"
+        self.tables = [make_hydrogenic_gos_table(6, 2, 1, numpy.geomspace(280.0, 1200.0, 96)),
+                       make_hydrogenic_gos_table(14, 1, 1, numpy.geomspace(1800.0, 4000.0, 64))]
+
+    def tearDown(self) -> None:
+        eels_analysis.set_gos_database(None)
+        self.__temporary_directory.cleanup()
+
+    def test_written_database_is_memory_mapped_and_indexed_by_shell(self) -> None:
+        GOSDatabase.write_gos_database(self.path, self.tables)
+        gos_database = GOSDatabase.load_gos_database(self.path)
+        self.assertEqual([(6, 2, 1), (14, 1, 1)], gos_database.shells)
+        self.assertIsNone(gos_database.get_table(6, 1, 1))
+        for table in self.tables:
+            loaded_table = gos_database.get_table(*table.key)
+            assert loaded_table is not None
+            self.assertIsInstance(loaded_table.values.base, numpy.memmap)
+            self.assertTrue(numpy.array_equal(table.values, loaded_table.values))
+            self.assertTrue(numpy.array_equal(table.energies_eV, loaded_table.energies_eV))
+            self.assertTrue(numpy.array_equal(table.log_q2, loaded_table.log_q2))
+        self.assertTrue(gos_database.contains(6, 2, 1, 1000.0))
+        self.assertFalse(gos_database.contains(6, 2, 1, 1300.0))
+        self.path.write_bytes(b"not a GOS database")
+        with self.assertRaises(ValueError):
+            GOSDatabase.load_gos_database(self.path)
+
+    def test_interpolated_gos_matches_tabulated_model(self) -> None:
+        unevenly_spaced_log_q2 = numpy.concatenate([numpy.linspace(numpy.log(1e-4), 0.0, 50), numpy.geomspace(0.05, numpy.log(1e5), 150)])
+        for table in (self.tables[0], make_hydrogenic_gos_table(6, 2, 1, numpy.geomspace(280.0, 1200.0, 96), unevenly_spaced_log_q2)):
+            energies_eV = numpy.array([250.0, 300.0, 412.5, 1000.0])
+            Q2 = numpy.geomspace(1e-5, 1e6, 50)[:, numpy.newaxis] * numpy.ones_like(energies_eV)
+            gos = table.get_gos(energies_eV, Q2)
+            epsilonR = energies_eV / (0.5 * 510999.0 / 137.036 ** 2)
+            expected = EELS_CrossSections.k_shell_hydrogenic_gos_q2(6, epsilonR, Q2)
+            # below the table, the edge has no GOS; inside it, the interpolation and the power law continuation hold.
+            self.assertTrue(numpy.all(gos[:, 0] == 0.0))
+            self.assertTrue(numpy.allclose(expected[:, 1:], gos[:, 1:], rtol=0.02, atol=0))
+            with self.assertRaises(ValueError):
+                table.get_gos(numpy.array([1300.0]), numpy.ones((1, 1)))
+
+    def test_tabulated_shell_cross_section_matches_hydrogenic_model(self) -> None:
+        gos_database = GOSDatabase.GOSDatabase(self.tables)
+        parameters = (284.0, 100.0, 200000.0, 0.01, 0.03)
+        cross_section = EELS_CrossSections.partial_cross_section_nm2(6, 2, 1, *parameters, gos_database=gos_database)
+        expected = EELS_CrossSections.partial_cross_section_nm2(6, 1, 1, *parameters)
+        self.assertAlmostEqual(1.0, cross_section / expected, delta=0.005)
+        energy_diff_sigma = EELS_CrossSections.energy_diff_cross_section_nm2_per_ev(6, 2, 1, *parameters, gos_database=gos_database)
+        expected_energy_diff_sigma = EELS_CrossSections.energy_diff_cross_section_nm2_per_ev(6, 1, 1, *parameters)
+        self.assertTrue(numpy.allclose(expected_energy_diff_sigma, energy_diff_sigma, rtol=0.01, atol=0))
+        gos = EELS_CrossSections.generalized_oscillator_strength(6, 2, 1, 284.0, 100.0, 200000.0, 0.03, gos_database=gos_database)
+        expected_gos = EELS_CrossSections.generalized_oscillator_strength(6, 1, 1, 284.0, 100.0, 200000.0, 0.03)
+        self.assertTrue(numpy.allclose(expected_gos, gos, rtol=0.01, atol=0))
+
+    def test_cross_sections_of_shells_in_database_are_computed_without_service(self) -> None:
+        GOSDatabase.write_gos_database(self.path, self.tables)
+        gos_database = eels_analysis.load_gos_database(self.path)
+        self.assertIs(gos_database, eels_analysis.get_gos_database())
+        expected = EELS_CrossSections.partial_cross_section_nm2(6, 2, 1, 284.0, 100.0, 200000.0, 0.01, 0.03, gos_database=gos_database)
+        self.assertEqual(expected, eels_analysis.partial_cross_section_nm2(6, 2, 1, 284.0, 100.0, 200000.0, 0.01, 0.03))
+        cross_sections = eels_analysis.partial_cross_sections_nm2([6, 6, 14], [2, 1, 1], 1, [284.0, 284.0, 1839.0], 100.0, 200000.0, 0.01, 0.03)
+        self.assertEqual(expected, cross_sections[0])
+        self.assertEqual(EELS_CrossSections.partial_cross_section_nm2(6, 1, 1, 284.0, 100.0, 200000.0, 0.01, 0.03), cross_sections[1])
+        self.assertEqual(EELS_CrossSections.partial_cross_section_nm2(14, 1, 1, 1839.0, 100.0, 200000.0, 0.01, 0.03, gos_database=gos_database), cross_sections[2])
+        energy_diff_sigma = eels_analysis.energy_diff_cross_section_nm2_per_ev(6, 2, 1, 284.0, 100.0, 200000.0, 0.01, 0.03)
+        self.assertEqual(101, energy_diff_sigma.shape[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+import numpy
+
+from nion.eels_analysis import LeastSquares
+from nion.eels_analysis import eels_analysis
+
+
+class TestLeastSquares(unittest.TestCase):
+
+    def test_fit_matches_lstsq_for_any_basis(self) -> None:
+        rng = numpy.random.default_rng(0)
+        xs = numpy.linspace(1.0, 2.0, 40)
+        basis = numpy.stack([numpy.ones_like(xs), numpy.log(xs), numpy.exp(-xs)], axis=-1)
+        yss = rng.standard_normal((3, 5, 40))
+        solver = LeastSquares.BatchedLeastSquares(basis, chunk_size=4)
+        coefficients = solver.fit(yss)
+        expected = numpy.linalg.lstsq(basis, numpy.reshape(yss, (-1, 40)).T, rcond=None)[0].T
+        self.assertEqual((3, 5, 3), coefficients.shape)
+        self.assertTrue(numpy.allclose(numpy.reshape(expected, (3, 5, 3)), coefficients))
+        self.assertTrue(numpy.allclose(solver.evaluate(coefficients), numpy.reshape(numpy.reshape(expected, (-1, 3)) @ basis.T, (3, 5, 40))))
+
+    def test_fit_with_weights_matches_weighted_lstsq(self) -> None:
+        rng = numpy.random.default_rng(0)
+        basis = LeastSquares.get_polynomial_basis(numpy.linspace(0.0, 1.0, 30), 2)
+        yss = rng.standard_normal((6, 30))
+        weights = rng.uniform(0.5, 2.0, (6, 30))
+        solver = LeastSquares.BatchedLeastSquares(basis)
+        for fit_weights in (weights[0], weights):
+            with self.subTest(per_spectrum=fit_weights.ndim > 1):
+                coefficients = solver.fit(yss, weights=fit_weights)
+                for ys, ws, cs in zip(yss, numpy.broadcast_to(fit_weights, yss.shape), coefficients):
+                    expected = numpy.linalg.lstsq(basis * ws[:, numpy.newaxis], ys * ws, rcond=None)[0]
+                    self.assertTrue(numpy.allclose(expected, cs))
+
+    def test_fit_in_float32_matches_float64(self) -> None:
+        rng = numpy.random.default_rng(0)
+        basis = LeastSquares.get_polynomial_basis(numpy.linspace(-1.0, 1.0, 50), 2)
+        yss = (basis @ rng.uniform(1.0, 2.0, (3, 8)) + 0.01 * rng.standard_normal((50, 8))).T.astype(numpy.float32)
+        weights = rng.uniform(0.5, 2.0, (8, 50))
+        solver = LeastSquares.BatchedLeastSquares(basis)
+        for fit_weights in (None, weights[0], weights):
+            with self.subTest(weights=None if fit_weights is None else fit_weights.ndim):
+                coefficients32 = solver.fit(yss, weights=fit_weights, dtype=numpy.float32)
+                coefficients64 = solver.fit(yss, weights=fit_weights)
+                self.assertEqual(numpy.float32, coefficients32.dtype)
+                self.assertEqual(numpy.float64, coefficients64.dtype)
+                self.assertTrue(numpy.allclose(coefficients64, coefficients32, rtol=1e-4, atol=1e-4))
+
+    def test_fit_excludes_masked_and_non_finite_channels(self) -> None:
+        rng = numpy.random.default_rng(0)
+        xs = numpy.linspace(0.0, 1.0, 20)
+        basis = LeastSquares.get_polynomial_basis(xs, 1)
+        yss = 2.0 + 3.0 * xs + 0.01 * rng.standard_normal((4, 20))
+        clean_coefficients = LeastSquares.BatchedLeastSquares(basis).fit(yss)
+        yss[0, 5] = numpy.nan
+        yss[1, 7] = numpy.inf
+        mask = numpy.ones((4, 20), dtype=bool)
+        mask[2, 10:] = False
+        yss[2, 10:] = 1000.0
+        mask[3, 1:] = False
+        coefficients = LeastSquares.BatchedLeastSquares(basis).fit(yss, mask=mask)
+        for index, valid in ((0, numpy.isfinite(yss[0])), (1, numpy.isfinite(yss[1])), (2, mask[2])):
+            expected = numpy.linalg.lstsq(basis[valid], yss[index, valid], rcond=None)[0]
+            self.assertTrue(numpy.allclose(expected, coefficients[index]))
+            self.assertTrue(numpy.allclose(clean_coefficients[index], coefficients[index], atol=0.05))
+        # one valid channel cannot determine a line.
+        self.assertTrue(numpy.all(numpy.isnan(coefficients[3])))
+
+    def test_channel_mask_for_all_spectra_uses_factorization(self) -> None:
+        rng = numpy.random.default_rng(0)
+        basis = LeastSquares.get_polynomial_basis(numpy.linspace(0.0, 1.0, 20), 1)
+        yss = rng.standard_normal((5, 20))
+        mask = numpy.arange(20) % 3 != 0
+        coefficients = LeastSquares.BatchedLeastSquares(basis).fit(yss, mask=mask)
+        expected = numpy.linalg.lstsq(basis[mask], yss[:, mask].T, rcond=None)[0].T
+        self.assertTrue(numpy.allclose(expected, coefficients))
+
+    def test_rank_deficient_basis_returns_minimum_norm_solution(self) -> None:
+        rng = numpy.random.default_rng(0)
+        xs = numpy.linspace(0.0, 1.0, 10)
+        basis = numpy.stack([xs, xs, numpy.ones_like(xs)], axis=-1)
+        yss = rng.standard_normal((3, 10))
+        coefficients = LeastSquares.BatchedLeastSquares(basis).fit(yss)
+        expected = numpy.linalg.lstsq(basis, yss.T, rcond=None)[0].T
+        self.assertTrue(numpy.allclose(expected, coefficients))
+
+    def test_linear_background_fits_match_lstsq(self) -> None:
+        rng = numpy.random.default_rng(0)
+        data = rng.uniform(0, 100, (4, 5, 16))
+        linear_basis = numpy.stack([numpy.arange(16), numpy.ones(16)], axis=-1)
+        expected = numpy.reshape(numpy.linalg.lstsq(linear_basis, numpy.reshape(data, (-1, 16)).T, rcond=None)[0].T, (4, 5, 2))
+        self.assertTrue(numpy.allclose(expected, eels_analysis.stacked_fit_linear_background(data, -1)))
+        self.assertTrue(numpy.allclose(expected, eels_analysis.slow_fit_linear_background(data, -1)))
+        self.assertEqual((2,), eels_analysis.slow_fit_linear_background(data[0, 0], -1).shape)
+        self.assertIs(eels_analysis.stacked_fit_linear_background, eels_analysis.slow_fit_linear_background)
+        self.assertIs(eels_analysis.get_linear_background_solver(16), eels_analysis.get_linear_background_solver(16))
+
+    def test_linear_background_solvers_of_least_recently_used_lengths_are_evicted(self) -> None:
+        solver_16 = eels_analysis.get_linear_background_solver(16)
+        solver_100 = eels_analysis.get_linear_background_solver(100)
+        for signal_length in range(101, 100 + eels_analysis.MAX_LINEAR_BACKGROUND_SOLVER_COUNT - 1):
+            eels_analysis.get_linear_background_solver(signal_length)
+        # the solver of length 16 is used again, so the solver of length 100 is the least recently used.
+        self.assertIs(solver_16, eels_analysis.get_linear_background_solver(16))
+        eels_analysis.get_linear_background_solver(1000)
+        self.assertEqual(eels_analysis.MAX_LINEAR_BACKGROUND_SOLVER_COUNT, len(eels_analysis._linear_background_solvers))
+        self.assertIs(solver_16, eels_analysis.get_linear_background_solver(16))
+        self.assertIsNot(solver_100, eels_analysis.get_linear_background_solver(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.eels_analysis import BackgroundModel
+from nion.eels_analysis import ModelCapabilities
+from nion.eels_analysis import PeakModel
+from nion.utils import Registry
+
+
+class TestModelCapabilities(unittest.TestCase):
+
+    def test_background_model_capabilities_describe_execution_paths(self) -> None:
+        power_law_capabilities = BackgroundModel.find_background_model_by_id("power_law_background_model").capabilities
+        self.assertTrue(power_law_capabilities.batched)
+        self.assertTrue(power_law_capabilities.chunked)
+        self.assertFalse(power_law_capabilities.analytic_integrals)
+        self.assertTrue(power_law_capabilities.coefficient_maps)
+        linear_capabilities = BackgroundModel.find_background_model_by_id("linear_background_model").capabilities
+        self.assertTrue(linear_capabilities.analytic_integrals)
+        fitted_power_law_capabilities = BackgroundModel.find_background_model_by_id("power_law_fit_background_model").capabilities
+        self.assertFalse(fitted_power_law_capabilities.chunked)
+        self.assertFalse(fitted_power_law_capabilities.coefficient_maps)
+        self.assertTrue(BackgroundModel.find_background_model_by_id("power_law_two_area_background_model").capabilities.float32)
+        abstract_capabilities = BackgroundModel.AbstractBackgroundModel("abstract_background_model").capabilities
+        self.assertEqual(ModelCapabilities.ModelCapabilities(), abstract_capabilities)
+        self.assertFalse(abstract_capabilities.parallel_threads)
+
+    def test_zero_loss_peak_model_capabilities(self) -> None:
+        zero_loss_peak_model = PeakModel.get_zero_loss_peak_model("simple_peak_model")
+        assert zero_loss_peak_model
+        self.assertTrue(zero_loss_peak_model.capabilities.batched)
+        self.assertIsNone(PeakModel.get_zero_loss_peak_model("unknown_peak_model"))
+
+    def test_precision_dtype_follows_policy(self) -> None:
+        self.assertEqual(numpy.float64, ModelCapabilities.get_precision_dtype(None, numpy.float32))
+        self.assertEqual(numpy.float32, ModelCapabilities.get_precision_dtype("float32", numpy.float64))
+        self.assertEqual(numpy.float32, ModelCapabilities.get_precision_dtype("data", numpy.float32))
+        self.assertEqual(numpy.float64, ModelCapabilities.get_precision_dtype("data", numpy.uint16))
+
+    def test_zero_loss_peak_fit_follows_precision(self) -> None:
+        zero_loss_peak_model = PeakModel.get_zero_loss_peak_model("simple_peak_model")
+        assert zero_loss_peak_model
+        data = numpy.random.default_rng(0).poisson(100, (4, 5, 64)).astype(numpy.float32)
+        spectrum_image_xdata = DataAndMetadata.new_data_and_metadata(data,
+                                                                     dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), Calibration.Calibration(offset=-10.0, units="eV")],
+                                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        fit = zero_loss_peak_model.fit_zero_loss_peak(spectrum_xdata=spectrum_image_xdata)["zero_loss_peak_model"]
+        fit32 = zero_loss_peak_model.fit_zero_loss_peak(spectrum_xdata=spectrum_image_xdata, precision="data")["zero_loss_peak_model"]
+        self.assertEqual(numpy.float64, fit.data.dtype)
+        self.assertEqual(numpy.float32, fit32.data.dtype)
+        self.assertTrue(numpy.array_equal(fit.data, fit32.data))
+        self.assertTrue(zero_loss_peak_model.capabilities.float32)
+
+    def test_model_index_follows_registration(self) -> None:
+        background_model = BackgroundModel.AbstractBackgroundModel("test_registered_background_model")
+        self.assertIsNone(BackgroundModel.get_background_model("test_registered_background_model"))
+        Registry.register_component(background_model, {"background-model"})
+        try:
+            self.assertIs(background_model, BackgroundModel.get_background_model("test_registered_background_model"))
+        finally:
+            Registry.unregister_component(background_model, {"background-model"})
+        self.assertIsNone(BackgroundModel.get_background_model("test_registered_background_model"))
+        with self.assertRaises(IndexError):
+            BackgroundModel.find_background_model_by_id("test_registered_background_model")
+
+
+if __name__ == '__main__':
+    unittest.main()
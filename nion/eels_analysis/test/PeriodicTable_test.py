@@ -2,11 +2,15 @@
 # cd EELSAnalysis
 # python -m unittest test/core_loss_edge_test.py
 
+import copy
 import fractions
 import os
+import pickle
 import sys
 import unittest
 
+import numpy
+
 sys.path.append(os.path.dirname(os.path.realpath(os.path.join(__file__, "..", ".."))))
 
 from nion.eels_analysis import PeriodicTable
@@ -31,5 +35,47 @@ class TestLibrary(unittest.TestCase):
             self.assertEqual(electron_shell.subshell_label, subshell_labels[subshell_index])
             self.assertEqual(electron_shell.spin_fraction, fractions.Fraction(spin_numerators[subshell_index], 2))
 
+    def test_electron_shells_are_interned_and_immutable(self) -> None:
+        electron_shell = PeriodicTable.ElectronShell(6, 1, 1)
+        self.assertIs(electron_shell, PeriodicTable.ElectronShell(6, 1, 1))
+        self.assertIs(electron_shell, PeriodicTable.ElectronShell.from_eels_notation(6, "K"))
+        self.assertIs(electron_shell, copy.deepcopy(electron_shell))
+        self.assertIs(electron_shell, pickle.loads(pickle.dumps(electron_shell)))
+        self.assertIsNot(electron_shell, PeriodicTable.ElectronShell(6, 2, 1))
+        self.assertFalse(hasattr(electron_shell, "__dict__"))
+        with self.assertRaises(AttributeError):
+            electron_shell.atomic_number = 7  # type: ignore
+        self.assertIs(electron_shell, PeriodicTable.PeriodicTable().find_edges_in_energy_interval((280.0, 290.0))[0])
+
+    def test_edges_in_energy_interval_are_sorted_by_distance_from_center(self) -> None:
+        periodic_table = PeriodicTable.PeriodicTable()
+        for energy_interval_ev in [(250.0, 350.0), (0.0, 10.0), (284.2, 284.2), (1000.0, 1100.0), (5000.0, 6000.0), (300.0, 200.0)]:
+            # compare with every lowest edge of every shell of every element.
+            expected = list()
+            for atomic_number, _ in periodic_table.get_elements_list():
+                for electron_shell, _ in periodic_table.get_edges_list(atomic_number):
+                    energy = periodic_table.nominal_binding_energy_ev(electron_shell)
+                    if energy_interval_ev[0] <= energy <= energy_interval_ev[1]:
+                        expected.append((abs(energy - sum(energy_interval_ev) / 2), energy, electron_shell))
+            electron_shells = periodic_table.find_edges_in_energy_interval(energy_interval_ev)
+            self.assertEqual({s for _, _, s in expected}, set(electron_shells))
+            distances = [abs(periodic_table.nominal_binding_energy_ev(s) - sum(energy_interval_ev) / 2) for s in electron_shells]
+            self.assertEqual(sorted(distances), distances)
+        self.assertEqual([PeriodicTable.ElectronShell(6, 1, 1)], periodic_table.find_edges_in_energy_interval((284.2, 284.2)))
+
+    def test_element_lookups(self) -> None:
+        periodic_table = PeriodicTable.PeriodicTable()
+        self.assertEqual("C", periodic_table.element_symbol(6))
+        with self.assertRaises(IndexError):
+            periodic_table.element_symbol(0)
+        self.assertEqual(284.2, periodic_table.nominal_binding_energy_ev(PeriodicTable.ElectronShell(6, 1, 1)))
+        self.assertIsNone(periodic_table.nominal_binding_energy_ev(PeriodicTable.ElectronShell(6, 4, 1)))
+        self.assertEqual([(PeriodicTable.ElectronShell(6, 1, 1), "C-K 284.2 eV")], list(periodic_table.get_edges_list(6)))
+        for primary_subshells_only in (True, False):
+            edge_energies, electron_shells = periodic_table.get_sorted_edges(primary_subshells_only)
+            self.assertTrue(numpy.all(numpy.diff(edge_energies) >= 0))
+            self.assertEqual([periodic_table.nominal_binding_energy_ev(s) for s in electron_shells], edge_energies.tolist())
+        self.assertLess(len(periodic_table.get_sorted_edges(True)[1]), len(periodic_table.get_sorted_edges(False)[1]))
+
 if __name__ == '__main__':
     unittest.main()
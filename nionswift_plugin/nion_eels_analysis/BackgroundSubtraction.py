@@ -6,15 +6,15 @@ import numpy
 import typing
 
 # local libraries
+from nion.data import Calibration
 from nion.data import Core
 from nion.data import DataAndMetadata
 from nion.eels_analysis import BackgroundModel
+from nion.eels_analysis import ModelCapabilities
 from nion.swift.model import DataStructure
 from nion.swift.model import Graphics
 from nion.swift.model import Symbolic
-from nion.swift.model import Schema
 from nion.swift import Facade
-from nion.utils import Registry
 
 
 _ = gettext.gettext
@@ -29,12 +29,30 @@ def normalized_interval(interval: tuple[float, float]) -> tuple[float, float]:
     return min(interval), max(interval)
 
 
+# the number of spectra fitted at once when mapping spectrum images.
+MAPPING_CHUNK_SIZE = 16384
+
+# the precision policy of new mapping computations: float32 spectrum images are fitted in float32 and produce float32
+# maps. see ModelCapabilities.PRECISIONS. computations without a precision input fit in float64.
+MAPPING_PRECISION = "data"
+
+
+def get_chunk_size(capabilities: ModelCapabilities.ModelCapabilities) -> typing.Optional[int]:
+    """Return the chunk size for fitting a spectrum image with a model with the capabilities.
+
+    Fitting in chunks bounds the memory used for the intermediate results. Models whose fits depend on all spectra
+    would need an extra pass over the data for chunking, so those fit all spectra at once.
+    """
+    return MAPPING_CHUNK_SIZE if capabilities.chunked else None
+
+
 class EELSFitBackground:
     label = _("EELS Fit Background")
     inputs = {
         "eels_spectrum_data_item": {"label": _("EELS Spectrum")},
         "background_model": {"label": _("Background Model"), "entity_id": "background_model"},
         "fit_interval_graphics": {"label": _("Fit")},
+        "precision": {"label": _("Precision")},
         }
     outputs = {
         "background": {"label": _("Background")},
@@ -62,12 +80,13 @@ class EELSFitBackground:
         background_xdata = None
         subtracted_xdata = None
         background_model_id = background_model.structure_type
-        for component in Registry.get_components_by_type("background-model"):
-            if background_model_id == component.background_model_id:
-                fit_result = component.fit_background(spectrum_xdata=spectrum_xdata, fit_intervals=fit_intervals, background_interval=signal_interval)
-                background_xdata = fit_result["background_model"]
-                # use 'or' to avoid doing subtraction if subtracted_spectrum already present
-                subtracted_xdata = fit_result.get("subtracted_spectrum", None) or Core.calibrated_subtract_spectrum(spectrum_xdata, background_xdata)
+        component = BackgroundModel.get_background_model(background_model_id)
+        if component:
+            fit_result = component.fit_background(spectrum_xdata=spectrum_xdata, fit_intervals=fit_intervals, background_interval=signal_interval,
+                                                  precision=kwargs.get("precision"))
+            background_xdata = fit_result["background_model"]
+            # use 'or' to avoid doing subtraction if subtracted_spectrum already present
+            subtracted_xdata = fit_result.get("subtracted_spectrum", None) or Core.calibrated_subtract_spectrum(spectrum_xdata, background_xdata)
         if background_xdata is None:
             background_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros_like(signal_xdata.data), intensity_calibration=signal_xdata.intensity_calibration, dimensional_calibrations=signal_xdata.dimensional_calibrations)
         if subtracted_xdata is None:
@@ -88,6 +107,7 @@ class EELSSubtractBackground:
         "spectrum_image_data_item": {"label": _("EELS Image")},
         "background_model": {"label": _("Background Model"), "entity_id": "background_model"},
         "fit_interval_graphics": {"label": _("Fit")},
+        "precision": {"label": _("Precision")},
         }
     outputs = {
         "subtracted": {"label": _("EELS Background Subtracted")},
@@ -108,10 +128,12 @@ class EELSSubtractBackground:
             fit_intervals.append(normalized_interval(fit_interval_graphic.interval))
         subtracted_xdata = None
         background_model_id = background_model.structure_type
-        for component in Registry.get_components_by_type("background-model"):
-            if background_model_id == component.background_model_id:
-                integrate_result = component.subtract_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals)
-                subtracted_xdata = integrate_result["subtracted"]
+        component = BackgroundModel.get_background_model(background_model_id)
+        if component:
+            integrate_result = component.subtract_background(spectrum_xdata=spectrum_image_xdata, fit_intervals=fit_intervals,
+                                                             chunk_size=get_chunk_size(component.capabilities),
+                                                             precision=kwargs.get("precision"))
+            subtracted_xdata = integrate_result["subtracted"]
         if subtracted_xdata is None:
             subtracted_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros(spectrum_image_xdata.navigation_dimension_shape), dimensional_calibrations=spectrum_image_xdata.navigation_dimensional_calibrations)
         self.__subtracted_xdata = subtracted_xdata
@@ -128,6 +150,8 @@ class EELSMapBackgroundSubtractedSignal:
         "background_model": {"label": _("Background Model"), "entity_id": "background_model"},
         "fit_interval_graphics": {"label": _("Fit")},
         "signal_interval_graphic": {"label": _("Signal")},
+        "precision": {"label": _("Precision")},
+        "binning": {"label": _("Binning")},
         }
     outputs = {
         "map": {"label": _("EELS Signal")},
@@ -160,10 +184,12 @@ class EELSMapBackgroundSubtractedSignal:
         signal_interval = normalized_interval(signal_interval_graphic.interval)
         mapped_xdata = None
         background_model_id = background_model.structure_type
-        for component in Registry.get_components_by_type("background-model"):
-            if background_model_id == component.background_model_id:
-                integrate_result = component.integrate_signal(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=eels_spectrum_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval)
-                mapped_xdata = integrate_result["integrated"]
+        component = BackgroundModel.get_background_model(background_model_id)
+        if component:
+            integrate_result = component.integrate_signal(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=eels_spectrum_xdata, fit_intervals=fit_intervals, signal_interval=signal_interval,
+                                                          fused=True, chunk_size=get_chunk_size(component.capabilities),
+                                                          precision=kwargs.get("precision"), binning=kwargs.get("binning") or 1)
+            mapped_xdata = integrate_result["integrated"]
         if mapped_xdata is None:
             mapped_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros(spectrum_image_xdata.navigation_dimension_shape), dimensional_calibrations=spectrum_image_xdata.navigation_dimensional_calibrations)
         self.__mapped_xdata = mapped_xdata
@@ -172,7 +198,67 @@ class EELSMapBackgroundSubtractedSignal:
         self.computation.set_referenced_xdata("map", self.__mapped_xdata)
 
 
-def add_background_subtraction_computation(api: Facade.API_1, library: Facade.Library, display_item: Facade.Display, data_item: Facade.DataItem, intervals: typing.Sequence[Facade.Graphic]) -> None:
+class EELSMapBackgroundSubtractedSignals:
+    label = _("EELS Map Background Subtracted Signals")
+    inputs = {
+        "spectrum_image_data_item": {"label": _("EELS Image")},
+        "eels_spectrum_data_item": {"label": _("EELS Spectrum")},
+        "background_model": {"label": _("Background Model"), "entity_id": "background_model"},
+        "fit_interval_graphics": {"label": _("Fit")},
+        "signal_interval_graphics": {"label": _("Signals")},
+        "precision": {"label": _("Precision")},
+        }
+    outputs = {
+        "map": {"label": _("EELS Signals")},
+    }
+
+    def __init__(self, computation: Facade.Computation, **kwargs: typing.Any) -> None:
+        self.computation = computation
+
+    def execute(self, **kwargs: typing.Any) -> None:
+        spectrum_image_data_item = typing.cast(Facade.DataItem, kwargs["spectrum_image_data_item"])
+        background_model = typing.cast(Facade.DataStructure, kwargs["background_model"])
+        fit_interval_graphics = typing.cast(typing.Sequence[Facade.Graphic], kwargs["fit_interval_graphics"])
+        signal_interval_graphics = typing.cast(typing.Sequence[Facade.Graphic], kwargs["signal_interval_graphics"])
+        eels_spectrum_data_item = typing.cast(typing.Optional[Facade.DataItem], kwargs.get("eels_spectrum_data_item"))
+        assert spectrum_image_data_item.xdata
+        assert spectrum_image_data_item.xdata.is_datum_1d
+        assert spectrum_image_data_item.xdata.is_navigable
+        assert spectrum_image_data_item.xdata.datum_dimensional_calibrations[0].units == "eV"
+        spectrum_image_xdata = spectrum_image_data_item.xdata
+        eels_spectrum_xdata: typing.Optional[DataAndMetadata.DataAndMetadata] = None
+        if eels_spectrum_data_item:
+            eels_spectrum_xdata = eels_spectrum_data_item.xdata
+            assert eels_spectrum_xdata
+            assert eels_spectrum_xdata.is_datum_1d
+            assert eels_spectrum_xdata.datum_dimensional_calibrations[0].units == "eV"
+        # fit_interval_graphics.interval returns normalized coordinates. create calibrated intervals.
+        fit_intervals: typing.List[BackgroundModel.BackgroundInterval] = list()
+        for fit_interval_graphic in fit_interval_graphics:
+            fit_intervals.append(normalized_interval(fit_interval_graphic.interval))
+        # all signals share the fit intervals, so the background is fitted once for all of them.
+        jobs = [(fit_intervals, normalized_interval(signal_interval_graphic.interval)) for signal_interval_graphic in signal_interval_graphics]
+        mapped_xdata = None
+        background_model_id = background_model.structure_type
+        component = BackgroundModel.get_background_model(background_model_id)
+        if component:
+            integrate_result = component.integrate_signals(spectrum_xdata=spectrum_image_xdata, eels_spectrum_xdata=eels_spectrum_xdata, jobs=jobs,
+                                                           chunk_size=get_chunk_size(component.capabilities),
+                                                           precision=kwargs.get("precision"))
+            mapped_xdata = integrate_result["integrated"]
+        if mapped_xdata is None:
+            mapped_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros((len(jobs),) + tuple(spectrum_image_xdata.navigation_dimension_shape)),
+                                                                 dimensional_calibrations=[Calibration.Calibration()] + list(spectrum_image_xdata.navigation_dimensional_calibrations),
+                                                                 data_descriptor=DataAndMetadata.DataDescriptor(True, 0, spectrum_image_xdata.navigation_dimension_count))
+        self.__mapped_xdata = mapped_xdata
+
+    def commit(self) -> None:
+        self.computation.set_referenced_xdata("map", self.__mapped_xdata)
+
+
+def add_background_subtraction_computation(api: Facade.API_1, library: Facade.Library, display_item: Facade.Display, data_item: Facade.DataItem, intervals: typing.Sequence[Facade.Graphic],
+                                           precision: typing.Optional[str] = None) -> None:
+    # precision is the precision input of the computation, if any; see ModelCapabilities.PRECISIONS.
     background = api.library.create_data_item()
     signal = api.library.create_data_item()
 
@@ -180,12 +266,15 @@ def add_background_subtraction_computation(api: Facade.API_1, library: Facade.Li
     library._document_model.append_data_structure(background_model)
     background_model.source = background._data_item
 
+    inputs: typing.Dict[str, typing.Any] = {
+        "eels_spectrum_data_item": data_item,
+        "background_model": api._new_api_object(background_model),
+        "fit_interval_graphics": intervals,
+    }
+    if precision is not None:
+        inputs["precision"] = precision
     api.library.create_computation("eels.background_subtraction3",
-                                   inputs={
-                                       "eels_spectrum_data_item": data_item,
-                                       "background_model": api._new_api_object(background_model),
-                                       "fit_interval_graphics": intervals,
-                                   },
+                                   inputs=inputs,
                                    outputs={
                                        "background": background,
                                        "subtracted": signal}
@@ -240,6 +329,7 @@ def subtract_background(api: Facade.API_1, window: Facade.DocumentWindow) -> Non
                                     "spectrum_image_data_item": spectrum_image,
                                     "fit_interval_graphics": fit_interval_graphics,
                                     "background_model": background_model,
+                                    "precision": MAPPING_PRECISION,
                                 },
                                 outputs={
                                     "subtracted": subtracted
@@ -280,6 +370,48 @@ def use_signal_for_map(api: Facade.API_1, window: Facade.DocumentWindow) -> None
                                     "fit_interval_graphics": fit_interval_graphics,
                                     "signal_interval_graphic": signal_interval_graphic,
                                     "background_model": background_model,
+                                    "precision": MAPPING_PRECISION,
+                                },
+                                outputs={
+                                    "map": map
+                                }
+                            )
+                            window.display_data_item(map)
+                    break
+
+
+def use_signals_for_map(api: Facade.API_1, window: Facade.DocumentWindow) -> None:
+    # map all selected signal intervals of a background subtraction in one pass, as a sequence of maps.
+    target_display = window.target_display
+    target_intervals = [graphic for graphic in target_display.selected_graphics if graphic.graphic_type == "interval-graphic"] if target_display else list()
+    if target_display and target_intervals:
+        target_display_item_data_items = target_display._display_item.data_items
+        for computation in api.library._document_model.computations:
+            if computation.processing_id == "eels.background_subtraction3":
+                if computation.get_input("eels_spectrum_data_item") in target_display_item_data_items and computation.get_output("subtracted") in target_display_item_data_items:
+                    eels_spectrum_data_item = computation.get_input("eels_spectrum_data_item")
+                    eels_spectrum_data_item = api._new_api_object(eels_spectrum_data_item)
+                    fit_interval_graphics = computation.get_input("fit_interval_graphics")
+                    signal_interval_graphics = [g for g in target_intervals if g._graphic not in fit_interval_graphics]
+                    fit_interval_graphics = [api._new_api_object(g) for g in fit_interval_graphics]
+                    background_model = computation.get_input("background_model")
+                    background_model = api._new_api_object(background_model)
+                    source_data_items = api.library._document_model.get_source_data_items(eels_spectrum_data_item._data_item)
+                    if len(source_data_items) == 1 and signal_interval_graphics:
+                        source_data_metadata = source_data_items[0].data_metadata
+                        assert source_data_metadata
+                        if source_data_metadata.is_navigable and source_data_metadata.datum_dimension_count == 1:
+                            spectrum_image = api._new_api_object(source_data_items[0])
+                            map = api.library.create_data_item_from_data(numpy.zeros((len(signal_interval_graphics),) + tuple(spectrum_image._data_item.xdata.navigation_dimension_shape)))
+                            api.library.create_computation(
+                                "eels.mapping_multiple",
+                                inputs={
+                                    "spectrum_image_data_item": spectrum_image,
+                                    "eels_spectrum_data_item": eels_spectrum_data_item,
+                                    "fit_interval_graphics": fit_interval_graphics,
+                                    "signal_interval_graphics": signal_interval_graphics,
+                                    "background_model": background_model,
+                                    "precision": MAPPING_PRECISION,
                                 },
                                 outputs={
                                     "map": map
@@ -292,21 +424,5 @@ def use_signal_for_map(api: Facade.API_1, window: Facade.DocumentWindow) -> None
 ComputationCallable = typing.Callable[[Symbolic._APIComputation], Symbolic.ComputationHandlerLike]
 Symbolic.register_computation_type("eels.background_subtraction3", typing.cast(ComputationCallable, EELSFitBackground))
 Symbolic.register_computation_type("eels.mapping3", typing.cast(ComputationCallable, EELSMapBackgroundSubtractedSignal))
+Symbolic.register_computation_type("eels.mapping_multiple", typing.cast(ComputationCallable, EELSMapBackgroundSubtractedSignals))
 Symbolic.register_computation_type("eels.subtract_background", typing.cast(ComputationCallable, EELSSubtractBackground))
-
-BackgroundModelEntity = Schema.entity("background_model", None, None, {})
-
-
-def component_registered(component: Registry._ComponentType, component_types: typing.Set[str]) -> None:
-    if "background-model" in component_types:
-        # when a background model is registered, create an empty (for now) entity type, and register it with the data
-        # structure so that an entity for use with the UI and computations can be created when the data structure loads.
-        background_model_entity = Schema.entity(component.background_model_id, BackgroundModelEntity, None, {})
-        DataStructure.DataStructure.register_entity(background_model_entity, entity_name=component.title, entity_package_name=component.package_title)
-
-
-_component_registered_listener = Registry.listen_component_registered_event(component_registered)
-
-# handle any components that have already been registered.
-for component in Registry.get_components_by_type("background-model"):
-    component_registered(component, {"background-model"})
@@ -25,8 +25,6 @@ from nion.swift.model import DataStructure
 from nion.swift.model import DisplayItem
 from nion.swift.model import DocumentModel
 from nion.swift.model import Graphics
-from nion.swift.model import Model
-from nion.swift.model import Schema
 from nion.swift.model import Symbolic
 from nion.utils import Geometry
 
@@ -44,11 +42,12 @@ class EELSBackgroundSubtraction:
         eels_xdata_xdata = eels_xdata.xdata
         assert eels_xdata_xdata
         eels_spectrum_xdata = xd.sum_region(eels_xdata_xdata, region.mask_xdata_with_shape(eels_xdata_xdata.data_shape[0:2]))
-        signal = eels_analysis.make_signal_like(eels_analysis.extract_original_signal(eels_spectrum_xdata, [fit_interval], signal_interval), eels_spectrum_xdata)
-        background_xdata = eels_analysis.make_signal_like(eels_analysis.calculate_background_signal(eels_spectrum_xdata, [fit_interval], signal_interval), eels_spectrum_xdata)
-        assert signal
+        # fit the background once for the background and the subtracted profile.
+        signal_extraction = eels_analysis.extract_signal(eels_spectrum_xdata, [fit_interval], signal_interval)
+        background_xdata = eels_analysis.make_signal_like(signal_extraction.background, eels_spectrum_xdata)
+        subtracted_xdata = eels_analysis.make_signal_like(signal_extraction.subtracted, eels_spectrum_xdata)
         assert background_xdata
-        subtracted_xdata = signal - background_xdata
+        assert subtracted_xdata
         # vstack will return a sequence; convert the sequence to an image
         self.__xdata = xd.redimension(xd.vstack((eels_spectrum_xdata, background_xdata, subtracted_xdata)), DataAndMetadata.DataDescriptor(False, 0, 2))
 
@@ -264,49 +263,6 @@ async def map_new_edge(document_controller: DocumentController.DocumentControlle
     document_controller.show_display_item(map_display_item)
 
 
-ElementalMappingEdgeEntity = Schema.entity("elemental_mapping_edge", None, None, {
-    "atomic_number": Schema.prop(Schema.INT),
-    "shell_number": Schema.prop(Schema.INT),
-    "subshell_index": Schema.prop(Schema.INT),
-    "fit_interval": Schema.fixed_tuple([Schema.prop(Schema.FLOAT), Schema.prop(Schema.FLOAT)]),
-    "signal_interval": Schema.fixed_tuple([Schema.prop(Schema.FLOAT), Schema.prop(Schema.FLOAT)]),
-})
-
-
-ElementalMappingEdgeRefEntity = Schema.entity("elemental_mapping_edge_ref", None, None, {
-    "spectrum_image": Schema.reference(Model.DataItem),
-    "edge": Schema.reference(ElementalMappingEdgeEntity),
-    "data": Schema.reference(Model.DataItem),
-    "pick_region": Schema.reference(Model.Graphic),
-})
-
-def transform_elemental_mapping_edge_ref_entity_forward(d: typing.Dict[str, typing.Any]) -> Schema.PersistentDictType:
-    # we want to use references that are just uuids, not typed.
-    if "spectrum_image" in d:
-        d["spectrum_image"] = d["spectrum_image"]["uuid"]
-    if "edge" in d:
-        d["edge"] = d["edge"]["uuid"]
-    if "data" in d:
-        d["data"] = d["data"]["uuid"]
-    if "pick_region" in d:
-        d["pick_region"] = d["pick_region"]["uuid"]
-    return d
-
-def transform_elemental_mapping_edge_ref_entity_backward(d: typing.Dict[str, typing.Any]) -> Schema.PersistentDictType:
-    # transform references back to the typed references used in the past for backwards compatibility.
-    if "spectrum_image" in d:
-        d["spectrum_image"] = {"version": 1, "type": "data_item", "uuid": d["spectrum_image"]}
-    if "edge" in d:
-        d["edge"] = {"version": 1, "type": "structure", "uuid": d["edge"]}
-    if "data" in d:
-        d["data"] = {"version": 1, "type": "data_item", "uuid": d["data"]}
-    if "pick_region" in d:
-        d["pick_region"] = {"version": 1, "type": "graphic", "uuid": d["pick_region"]}
-    return d
-
-ElementalMappingEdgeRefEntity.transform(transform_elemental_mapping_edge_ref_entity_forward, transform_elemental_mapping_edge_ref_entity_backward)
-
-
 class ElementalMappingEdge:
     def __init__(self, *, data_structure: typing.Optional[DataStructure.DataStructure] = None,
                  electron_shell: typing.Optional[PeriodicTable.ElectronShell] = None,
@@ -682,5 +638,3 @@ class ElementalMappingController:
 ComputationCallable = typing.Callable[[Symbolic._APIComputation], Symbolic.ComputationHandlerLike]
 Symbolic.register_computation_type("eels.background_subtraction11", typing.cast(ComputationCallable, EELSBackgroundSubtraction))
 Symbolic.register_computation_type("eels.mapping", typing.cast(ComputationCallable, EELSMapping))
-DataStructure.DataStructure.register_entity(ElementalMappingEdgeEntity, entity_name="ElementalMappingEdge", entity_package_name="EELSAnalysis")
-DataStructure.DataStructure.register_entity(ElementalMappingEdgeRefEntity, entity_name="ElementalMappingEdgeRef", entity_package_name="EELSAnalysis")
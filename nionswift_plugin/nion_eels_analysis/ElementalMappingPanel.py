@@ -11,7 +11,6 @@ import typing
 
 from nion.swift import DocumentController
 from nion.swift import Panel
-from nion.swift import Workspace
 from nion.swift.model import DataItem
 from nion.swift.model import DisplayItem
 from nion.swift.model import Persistence
@@ -242,6 +241,3 @@ class ElementalMappingPanel(Panel.Panel):
             self.__button_group = None
         # continue up the chain
         super().close()
-
-workspace_manager = Workspace.WorkspaceManager()
-workspace_manager.register_panel(ElementalMappingPanel, "elemental-mapping-panel", _("Elemental Mappings"), ["left", "right"], "left")
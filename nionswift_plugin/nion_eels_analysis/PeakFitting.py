@@ -8,11 +8,10 @@ import typing
 # local libraries
 from nion.data import Core
 from nion.data import DataAndMetadata
+from nion.eels_analysis import PeakModel
 from nion.swift.model import DataStructure
 from nion.swift.model import Symbolic
-from nion.swift.model import Schema
 from nion.swift import Facade
-from nion.utils import Registry
 
 
 _ = gettext.gettext
@@ -23,6 +22,7 @@ class FitZeroLossPeak:
     inputs = {
         "eels_spectrum_data_item": {"label": _("EELS Spectrum")},
         "zlp_model": {"label": _("Zero Loss Peak Model"), "entity_id": "zlp_model"},
+        "precision": {"label": _("Precision")},
         }
     outputs = {
         "zero_loss_peak": {"label": _("Background")},
@@ -43,12 +43,12 @@ class FitZeroLossPeak:
         model_xdata = None
         subtracted_xdata = None
         zero_loss_peak_model_id = zlp_model.structure_type
-        for component in Registry.get_components_by_type("zlp-model"):
-            if zero_loss_peak_model_id == component.zero_loss_peak_model_id:
-                fit_result = component.fit_zero_loss_peak(spectrum_xdata=spectrum_xdata)
-                model_xdata = fit_result["zero_loss_peak_model"]
-                # use 'or' to avoid doing subtraction if subtracted_spectrum already present
-                subtracted_xdata = fit_result.get("subtracted_spectrum", None) or Core.calibrated_subtract_spectrum(spectrum_xdata, model_xdata)
+        component = PeakModel.get_zero_loss_peak_model(zero_loss_peak_model_id)
+        if component:
+            fit_result = component.fit_zero_loss_peak(spectrum_xdata=spectrum_xdata, precision=kwargs.get("precision"))
+            model_xdata = fit_result["zero_loss_peak_model"]
+            # use 'or' to avoid doing subtraction if subtracted_spectrum already present
+            subtracted_xdata = fit_result.get("subtracted_spectrum", None) or Core.calibrated_subtract_spectrum(spectrum_xdata, model_xdata)
         if model_xdata is None:
             model_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros_like(eels_spectrum_xdata.data), intensity_calibration=eels_spectrum_xdata.intensity_calibration, dimensional_calibrations=eels_spectrum_xdata.dimensional_calibrations)
         if subtracted_xdata is None:
@@ -63,7 +63,9 @@ class FitZeroLossPeak:
         self.computation.set_referenced_xdata("subtracted", self.__subtracted_xdata)
 
 
-def add_peak_fitting_computation(api: Facade.API_1, library: Facade.Library, display_item: Facade.Display, data_item: Facade.DataItem) -> None:
+def add_peak_fitting_computation(api: Facade.API_1, library: Facade.Library, display_item: Facade.Display, data_item: Facade.DataItem,
+                                 precision: typing.Optional[str] = None) -> None:
+    # precision is the precision input of the computation, if any; see ModelCapabilities.PRECISIONS.
     zero_loss_peak = api.library.create_data_item()
     signal = api.library.create_data_item()
 
@@ -71,11 +73,14 @@ def add_peak_fitting_computation(api: Facade.API_1, library: Facade.Library, dis
     library._document_model.append_data_structure(zlp_model)
     zlp_model.source = zero_loss_peak._data_item
 
+    inputs: typing.Dict[str, typing.Any] = {
+        "eels_spectrum_data_item": data_item,
+        "zlp_model": api._new_api_object(zlp_model),
+    }
+    if precision is not None:
+        inputs["precision"] = precision
     api.library.create_computation("eels.fit_zlp",
-                                   inputs={
-                                       "eels_spectrum_data_item": data_item,
-                                       "zlp_model": api._new_api_object(zlp_model),
-                                   },
+                                   inputs=inputs,
                                    outputs={
                                        "zero_loss_peak": zero_loss_peak,
                                        "subtracted": signal}
@@ -100,20 +105,3 @@ def fit_zero_loss_peak(api: Facade.API_1, window: Facade.DocumentWindow) -> None
 
 ComputationCallable = typing.Callable[[Symbolic._APIComputation], Symbolic.ComputationHandlerLike]
 Symbolic.register_computation_type("eels.fit_zlp", typing.cast(ComputationCallable, FitZeroLossPeak))
-
-ZeroLossPeakModel = Schema.entity("zlp_model", None, None, {})
-
-
-def component_registered(component: Registry._ComponentType, component_types: typing.Set[str]) -> None:
-    if "zlp-model" in component_types:
-        # when a background model is registered, create an empty (for now) entity type, and register it with the data
-        # structure so that an entity for use with the UI and computations can be created when the data structure loads.
-        zlp_model_entity = Schema.entity(component.zero_loss_peak_model_id, ZeroLossPeakModel, None, {})
-        DataStructure.DataStructure.register_entity(zlp_model_entity, entity_name=component.title, entity_package_name=component.package_title)
-
-
-_component_registered_listener = Registry.listen_component_registered_event(component_registered)
-
-# handle any components that have already been registered.
-for component in Registry.get_components_by_type("zlp-model"):
-    component_registered(component, {"zlp-model"})
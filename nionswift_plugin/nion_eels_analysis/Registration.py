@@ -0,0 +1,237 @@
+"""
+    Registration
+
+    Register the computation types, data structure entities and panels of the plug-in when it loads, without importing
+    the modules which implement them. Those modules, and the analysis library and scipy which they import, are imported
+    when a computation or panel is first created or a menu item first runs.
+"""
+
+from __future__ import annotations
+
+# standard libraries
+import gettext
+import importlib
+import pkgutil
+import sys
+import types
+import typing
+import xml.etree.ElementTree
+
+# third party libraries
+import numpy
+import numpy.typing
+
+# local libraries
+from nion.eels_analysis import BuiltInModels
+from nion.swift import DocumentController
+from nion.swift import Panel
+from nion.swift.model import ColorMaps
+from nion.swift.model import DataStructure
+from nion.swift.model import Model
+from nion.swift.model import Persistence
+from nion.swift.model import Schema
+from nion.swift.model import Symbolic
+from nion.utils import Registry
+
+_ = gettext.gettext
+
+ComputationCallable = typing.Callable[[Symbolic._APIComputation], Symbolic.ComputationHandlerLike]
+
+
+def import_plugin_module(module_name: str) -> types.ModuleType:
+    """Return the module of the plug-in, importing it on first use."""
+    return importlib.import_module(f"{__package__}.{module_name}")
+
+
+def call_plugin_function(module_name: str, function_name: str, *args: typing.Any) -> typing.Any:
+    """Call the function of the plug-in module, importing it on first use. Used for menu items."""
+    return getattr(import_plugin_module(module_name), function_name)(*args)
+
+
+class LazyComputationType:
+    """A computation type registered in place of its class until the module defining the class is imported.
+
+    Creating a computation handler, or reading an attribute of the class such as its label, inputs or outputs, imports
+    the module, which registers the class itself in place of this when it is imported.
+    """
+
+    def __init__(self, module_name: str, class_name: str) -> None:
+        self.module_name = module_name
+        self.class_name = class_name
+
+    def resolve(self) -> ComputationCallable:
+        return typing.cast(ComputationCallable, getattr(import_plugin_module(self.module_name), self.class_name))
+
+    def __call__(self, api_computation: Symbolic._APIComputation) -> Symbolic.ComputationHandlerLike:
+        return self.resolve()(api_computation)
+
+    def __getattr__(self, name: str) -> typing.Any:
+        # only called for attributes not found on this object.
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+def get_computation_type(module_name: str, class_name: str) -> ComputationCallable:
+    """Return the computation class if its module has been imported, otherwise a lazy computation type for it."""
+    module = sys.modules.get(f"{__package__}.{module_name}")
+    if module is not None:
+        return typing.cast(ComputationCallable, getattr(module, class_name))
+    return LazyComputationType(module_name, class_name)
+
+
+# the computation types registered when the plug-in loads, so that documents with these computations load. the module
+# and class implementing each is imported when a computation is first created.
+COMPUTATION_TYPES: typing.Mapping[str, typing.Tuple[str, str]] = {
+    "eels.background_subtraction3": ("BackgroundSubtraction", "EELSFitBackground"),
+    "eels.mapping3": ("BackgroundSubtraction", "EELSMapBackgroundSubtractedSignal"),
+    "eels.mapping_multiple": ("BackgroundSubtraction", "EELSMapBackgroundSubtractedSignals"),
+    "eels.subtract_background": ("BackgroundSubtraction", "EELSSubtractBackground"),
+    "eels.background_subtraction11": ("ElementalMappingController", "EELSBackgroundSubtraction"),
+    "eels.mapping": ("ElementalMappingController", "EELSMapping"),
+    "eels.fit_zlp": ("PeakFitting", "FitZeroLossPeak"),
+    "eels.measure_temperature": ("Thermometry", "MeasureTemperature"),
+    "eels.thickness_mapping": ("ThicknessMap", "EELSThicknessMapping"),
+}
+
+# the computation types registered through the API when the menu extension is created.
+LIVE_COMPUTATION_TYPES: typing.Mapping[str, typing.Tuple[str, str]] = {
+    "nion.eels_analysis.measure_thickness": ("LiveThickness", "MeasureThickness"),
+    "nion.eels_analysis.measure_zlp": ("LiveZLP", "MeasureZLP"),
+}
+
+for computation_type_id, (module_name, class_name) in COMPUTATION_TYPES.items():
+    Symbolic.register_computation_type(computation_type_id, get_computation_type(module_name, class_name))
+
+
+# background and zero loss peak models are registered as components by nion.eels_analysis BackgroundModel and
+# PeakModel. each model has an empty (for now) entity type registered with the data structure so that an entity for use
+# with the UI and computations can be created when the data structure loads. the entities of the built-in models,
+# declared in BuiltInModels, are registered here without importing the models; other models are registered as
+# their components are.
+BackgroundModelEntity = Schema.entity("background_model", None, None, {})
+
+ZeroLossPeakModelEntity = Schema.entity("zlp_model", None, None, {})
+
+_model_entities: typing.Dict[str, Schema.EntityType] = dict()
+
+
+def register_model_entity(model_id: str, base_entity: Schema.EntityType, title: typing.Optional[str], package_title: typing.Optional[str]) -> None:
+    # register the entity of each model once; the built-in models are registered again when their module is imported.
+    if model_id not in _model_entities:
+        model_entity = Schema.entity(model_id, base_entity, None, {})
+        _model_entities[model_id] = model_entity
+        DataStructure.DataStructure.register_entity(model_entity, entity_name=title, entity_package_name=package_title)
+
+
+def component_registered(component: Registry._ComponentType, component_types: typing.Set[str]) -> None:
+    if "background-model" in component_types:
+        register_model_entity(component.background_model_id, BackgroundModelEntity, component.title, component.package_title)
+    if "zlp-model" in component_types:
+        register_model_entity(component.zero_loss_peak_model_id, ZeroLossPeakModelEntity, component.title, component.package_title)
+
+
+for model_id, title in BuiltInModels.BUILT_IN_BACKGROUND_MODEL_TITLES.items():
+    register_model_entity(model_id, BackgroundModelEntity, title, BuiltInModels.PACKAGE_TITLE)
+
+for model_id, title in BuiltInModels.BUILT_IN_ZERO_LOSS_PEAK_MODEL_TITLES.items():
+    register_model_entity(model_id, ZeroLossPeakModelEntity, title, BuiltInModels.PACKAGE_TITLE)
+
+_component_registered_listener = Registry.listen_component_registered_event(component_registered)
+
+# handle any components that have already been registered.
+for component in Registry.get_components_by_type("background-model"):
+    component_registered(component, {"background-model"})
+
+for component in Registry.get_components_by_type("zlp-model"):
+    component_registered(component, {"zlp-model"})
+
+
+# the entities of the elemental mapping edges, used by ElementalMappingController.
+ElementalMappingEdgeEntity = Schema.entity("elemental_mapping_edge", None, None, {
+    "atomic_number": Schema.prop(Schema.INT),
+    "shell_number": Schema.prop(Schema.INT),
+    "subshell_index": Schema.prop(Schema.INT),
+    "fit_interval": Schema.fixed_tuple([Schema.prop(Schema.FLOAT), Schema.prop(Schema.FLOAT)]),
+    "signal_interval": Schema.fixed_tuple([Schema.prop(Schema.FLOAT), Schema.prop(Schema.FLOAT)]),
+})
+
+
+ElementalMappingEdgeRefEntity = Schema.entity("elemental_mapping_edge_ref", None, None, {
+    "spectrum_image": Schema.reference(Model.DataItem),
+    "edge": Schema.reference(ElementalMappingEdgeEntity),
+    "data": Schema.reference(Model.DataItem),
+    "pick_region": Schema.reference(Model.Graphic),
+})
+
+def transform_elemental_mapping_edge_ref_entity_forward(d: typing.Dict[str, typing.Any]) -> Schema.PersistentDictType:
+    # we want to use references that are just uuids, not typed.
+    if "spectrum_image" in d:
+        d["spectrum_image"] = d["spectrum_image"]["uuid"]
+    if "edge" in d:
+        d["edge"] = d["edge"]["uuid"]
+    if "data" in d:
+        d["data"] = d["data"]["uuid"]
+    if "pick_region" in d:
+        d["pick_region"] = d["pick_region"]["uuid"]
+    return d
+
+def transform_elemental_mapping_edge_ref_entity_backward(d: typing.Dict[str, typing.Any]) -> Schema.PersistentDictType:
+    # transform references back to the typed references used in the past for backwards compatibility.
+    if "spectrum_image" in d:
+        d["spectrum_image"] = {"version": 1, "type": "data_item", "uuid": d["spectrum_image"]}
+    if "edge" in d:
+        d["edge"] = {"version": 1, "type": "structure", "uuid": d["edge"]}
+    if "data" in d:
+        d["data"] = {"version": 1, "type": "data_item", "uuid": d["data"]}
+    if "pick_region" in d:
+        d["pick_region"] = {"version": 1, "type": "graphic", "uuid": d["pick_region"]}
+    return d
+
+ElementalMappingEdgeRefEntity.transform(transform_elemental_mapping_edge_ref_entity_forward, transform_elemental_mapping_edge_ref_entity_backward)
+
+DataStructure.DataStructure.register_entity(ElementalMappingEdgeEntity, entity_name="ElementalMappingEdge", entity_package_name="EELSAnalysis")
+DataStructure.DataStructure.register_entity(ElementalMappingEdgeRefEntity, entity_name="ElementalMappingEdgeRef", entity_package_name="EELSAnalysis")
+
+
+def create_elemental_mapping_panel(document_controller: DocumentController.DocumentController, panel_id: str,
+                                   properties: typing.Optional[Persistence.PersistentDictType]) -> Panel.Panel:
+    return typing.cast(Panel.Panel, import_plugin_module("ElementalMappingPanel").ElementalMappingPanel(document_controller, panel_id, properties))
+
+
+Panel.PanelManager().register_panel(create_elemental_mapping_panel, "elemental-mapping-panel", _("Elemental Mappings"), ["left", "right"], "left")
+
+
+class ColorMapResource(ColorMaps.ColorMap):
+    """A color map read from the resources of the plug-in when its data is first used.
+
+    Swift generates the lookup table of a color map description as soon as it is registered, which is most of the cost
+    of a color map, so the color map is added directly and its table generated when a display first uses it.
+    """
+
+    def __init__(self, color_map_id: str, name: str, resource_path: str) -> None:
+        self.color_map_id = color_map_id
+        self.name = name
+        self.resource_path = resource_path
+        self.__data: typing.Optional[numpy.typing.NDArray[numpy.uint8]] = None
+
+    @property
+    def data(self) -> numpy.typing.NDArray[numpy.uint8]:
+        if self.__data is None:
+            xml_bytes = pkgutil.get_data(__name__, self.resource_path)
+            assert xml_bytes is not None
+            tree_root = xml.etree.ElementTree.fromstring(xml_bytes.decode("utf-8"))
+            points: typing.List[typing.Dict[str, typing.Union[float, typing.Tuple[int, int, int]]]] = list()
+            for point in list(tree_root)[0]:
+                if "x" in point.attrib:
+                    points.append({key: float(point.attrib[key]) for key in ("x", "r", "g", "b")})
+            self.__data = ColorMaps.generate_lookup_array_from_points(points, 256)
+        return self.__data
+
+    @data.setter
+    def data(self, data: numpy.typing.NDArray[numpy.uint8]) -> None:
+        self.__data = data
+
+
+def register_color_map(color_map_id: str, name: str, resource_path: str) -> None:
+    ColorMaps.add_color_map(ColorMapResource(color_map_id, name, resource_path))
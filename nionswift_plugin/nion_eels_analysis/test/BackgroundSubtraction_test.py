@@ -83,6 +83,29 @@ class TestBackgroundSubtraction(unittest.TestCase):
             self.assertEqual(0, len(document_model.data_structures))
             self.assertEqual(0, len(document_model.computations))
 
+    def test_background_subtraction_computation_precision_selects_fit_dtype(self) -> None:
+        for precision, dtype in ((None, numpy.float64), ("data", numpy.float32)):
+            with self.subTest(precision=precision), TestContext.create_memory_context() as profile_context:
+                document_controller = profile_context.create_document_controller_with_application()
+                document_model = document_controller.document_model
+                data_item = self.__create_spectrum()
+                document_model.append_data_item(data_item)
+                display_item = document_model.get_display_item_for_data_item(data_item)
+                interval = Graphics.IntervalGraphic()
+                interval.start = 0.2
+                interval.end = 0.3
+                display_item.add_graphic(interval)
+                api = Facade.get_api("~1.0", "~1.0")
+                library = api.library
+                api_data_item = library.data_items[0]
+                api_display_item = api_data_item.display
+                BackgroundSubtraction.add_background_subtraction_computation(api, library, api_display_item, api_data_item,
+                                                                             copy.copy(api_display_item.graphics), precision=precision)
+                document_model.recompute_all()
+                document_controller.periodic()
+                self.assertFalse(any(computation.error_text for computation in document_model.computations))
+                self.assertEqual(dtype, document_model.data_items[1].data.dtype)
+
     def test_background_subtraction_computation_is_removed_when_background_removed(self) -> None:
         with TestContext.create_memory_context() as profile_context:
             document_controller = profile_context.create_document_controller_with_application()
@@ -350,6 +373,60 @@ class TestBackgroundSubtraction(unittest.TestCase):
             self.assertEqual(6, len(document_model.data_items))
             self.assertIn("(EELS Map Background Subtracted Signal)", document_model.data_items[5].title)
 
+    def test_signals_map_computation(self) -> None:
+        with TestContext.create_memory_context() as profile_context:
+            document_controller = profile_context.create_document_controller_with_application()
+            document_model = document_controller.document_model
+            peak_xdata = generate_peak_data()
+            si_data = numpy.empty((4, 5, peak_xdata.data.shape[0]), dtype=numpy.float32)
+            for i in range(si_data.shape[0]):
+                for j in range(si_data.shape[1]):
+                    si_data[i, j] = generate_peak_data(add_noise=True)
+            si_xdata = DataAndMetadata.new_data_and_metadata(
+                si_data,
+                intensity_calibration=peak_xdata.intensity_calibration,
+                dimensional_calibrations=[Calibration.Calibration(), Calibration.Calibration(), peak_xdata.dimensional_calibrations[-1]],
+                data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1)
+            )
+            si_data_item = DataItem.new_data_item(si_xdata)
+            document_model.append_data_item(si_data_item)
+            si_display_item = document_model.get_display_item_for_data_item(si_data_item)
+            data_item = document_model.get_pick_new(si_display_item, si_data_item)
+            document_model.recompute_all()
+            document_controller.periodic()
+            display_item = document_model.get_display_item_for_data_item(data_item)
+            fit_interval = Graphics.IntervalGraphic()
+            fit_interval.start = 0.2
+            fit_interval.end = 0.3
+            display_item.add_graphic(fit_interval)
+            for start in (0.4, 0.6, 0.8):
+                signal_interval = Graphics.IntervalGraphic()
+                signal_interval.start = start
+                signal_interval.end = start + 0.1
+                display_item.add_graphic(signal_interval)
+            display_panel = document_controller.selected_display_panel
+            display_panel.set_display_panel_display_item(display_item)
+            api = Facade.get_api("~1.0", "~1.0")
+            BackgroundSubtraction.add_background_subtraction_computation(api, Facade.Library(document_model),
+                                                                         Facade.Display(display_item), Facade.DataItem(data_item),
+                                                                         [Facade.Graphic(fit_interval)])
+            document_model.recompute_all()
+            document_controller.periodic()
+            self.assertFalse(any(computation.error_text for computation in document_model.computations))
+            # the first graphic is the pick region; select the three signal intervals.
+            display_item.graphic_selection.set(2)
+            display_item.graphic_selection.add(3)
+            display_item.graphic_selection.add(4)
+            BackgroundSubtraction.use_signals_for_map(api, Facade.DocumentWindow(document_controller))
+            document_model.recompute_all()
+            document_controller.periodic()
+            self.assertFalse(any(computation.error_text for computation in document_model.computations))
+            self.assertEqual(5, len(document_model.data_items))
+            map_data_item = document_model.data_items[4]
+            self.assertIn("(EELS Map Background Subtracted Signals)", map_data_item.title)
+            self.assertEqual((3, 4, 5), map_data_item.xdata.data_shape)
+            self.assertTrue(map_data_item.xdata.is_sequence)
+
 
 if __name__ == '__main__':
     unittest.main()
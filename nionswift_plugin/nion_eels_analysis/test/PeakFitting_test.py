@@ -56,6 +56,23 @@ class TestBackgroundSubtraction(unittest.TestCase):
             self.assertEqual(0, len(document_model.data_structures))
             self.assertEqual(0, len(document_model.computations))
 
+    def test_peak_fitting_computation_with_data_precision_keeps_float32(self) -> None:
+        with TestContext.create_memory_context() as profile_context:
+            document_controller = profile_context.create_document_controller_with_application()
+            document_model = document_controller.document_model
+            data_item = self.__create_spectrum()
+            document_model.append_data_item(data_item)
+            api = Facade.get_api("~1.0", "~1.0")
+            library = api.library
+            api_data_item = library.data_items[0]
+            PeakFitting.add_peak_fitting_computation(api, library, api_data_item.display, api_data_item, precision="data")
+            document_model.recompute_all()
+            document_controller.periodic()
+            self.assertFalse(any(computation.error_text for computation in document_model.computations))
+            zero_loss_peak_data_item, subtracted_data_item = document_model.data_items[1:]
+            self.assertEqual(numpy.float32, zero_loss_peak_data_item.data.dtype)
+            self.assertEqual(numpy.float32, subtracted_data_item.data.dtype)
+
     def test_peak_fitting_computation_is_removed_when_peak_removed(self) -> None:
         with TestContext.create_memory_context() as profile_context:
             document_controller = profile_context.create_document_controller_with_application()
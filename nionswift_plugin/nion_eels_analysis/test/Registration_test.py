@@ -0,0 +1,115 @@
+# standard libraries
+import ast
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import typing
+import unittest
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.eels_analysis import BackgroundModel
+from nion.eels_analysis import BuiltInModels
+from nion.eels_analysis import PeakModel
+from nion.swift.model import ColorMaps
+from nion.swift.model import DataStructure
+from nion.swift.model import Symbolic
+from nion.utils import Registry
+
+from .. import Registration
+
+
+# the modules which are imported when a computation or menu item is first used rather than when the plug-in loads.
+DEFERRED_MODULES = [
+    "nion.eels_analysis.BackgroundModel",
+    "nion.eels_analysis.eels_analysis",
+    "nion.eels_analysis.ZLP_Analysis",
+    "nionswift_plugin.nion_eels_analysis.AlignZLP",
+    "nionswift_plugin.nion_eels_analysis.BackgroundSubtraction",
+    "nionswift_plugin.nion_eels_analysis.ElementalMappingController",
+    "nionswift_plugin.nion_eels_analysis.ElementalMappingPanel",
+    "nionswift_plugin.nion_eels_analysis.LiveThickness",
+    "nionswift_plugin.nion_eels_analysis.LiveZLP",
+    "nionswift_plugin.nion_eels_analysis.PeakFitting",
+    "nionswift_plugin.nion_eels_analysis.Thermometry",
+    "nionswift_plugin.nion_eels_analysis.ThicknessMap",
+]
+
+
+class TestRegistration(unittest.TestCase):
+
+    def test_plugin_registers_without_importing_implementations(self) -> None:
+        code = "\n".join([
+            "import json, sys",
+            "import nionswift_plugin.nion_eels_analysis",
+            "from nion.swift.model import DataStructure, Symbolic",
+            "print(json.dumps({'modules': sorted(m for m in sys.modules if m in " + repr(DEFERRED_MODULES) + "),",
+            "                  'computation_types': sorted(Symbolic._computation_types.keys()),",
+            "                  'entities': sorted(DataStructure.DataStructure.entity_types.keys())}))",
+        ])
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        registered = json.loads(result.stdout.splitlines()[-1])
+        self.assertEqual([], registered["modules"])
+        self.assertTrue(set(Registration.COMPUTATION_TYPES.keys()).issubset(registered["computation_types"]))
+        self.assertTrue({"power_law_background_model", "simple_peak_model", "elemental_mapping_edge", "elemental_mapping_edge_ref"}.issubset(registered["entities"]))
+
+    def test_built_in_model_entities_match_registered_models(self) -> None:
+        background_models = {c.background_model_id: c.title for c in Registry.get_components_by_type("background-model") if c.__module__ == BackgroundModel.__name__}
+        self.assertEqual(background_models, dict(BuiltInModels.BUILT_IN_BACKGROUND_MODEL_TITLES))
+        zero_loss_peak_models = {c.zero_loss_peak_model_id: c.title for c in Registry.get_components_by_type("zlp-model") if c.__module__ == PeakModel.__name__}
+        self.assertEqual(zero_loss_peak_models, dict(BuiltInModels.BUILT_IN_ZERO_LOSS_PEAK_MODEL_TITLES))
+        for model_id in BuiltInModels.BUILT_IN_BACKGROUND_MODEL_TITLES:
+            self.assertEqual(Registration.BackgroundModelEntity, DataStructure.DataStructure.entity_types[model_id].base)
+        for model_id in BuiltInModels.BUILT_IN_ZERO_LOSS_PEAK_MODEL_TITLES:
+            self.assertEqual(Registration.ZeroLossPeakModelEntity, DataStructure.DataStructure.entity_types[model_id].base)
+
+    def test_lazy_computation_type_resolves_to_class(self) -> None:
+        lazy_computation_type = Registration.LazyComputationType("PeakFitting", "FitZeroLossPeak")
+        computation_class = lazy_computation_type.resolve()
+        self.assertEqual(getattr(computation_class, "label"), getattr(lazy_computation_type, "label"))
+        self.assertEqual(getattr(computation_class, "inputs"), getattr(lazy_computation_type, "inputs"))
+        with self.assertRaises(AttributeError):
+            getattr(lazy_computation_type, "__missing__")
+        # once imported, the module registers the class itself.
+        self.assertIs(computation_class, Symbolic._computation_types["eels.fit_zlp"])
+        self.assertIs(computation_class, Registration.get_computation_type("PeakFitting", "FitZeroLossPeak"))
+
+    def test_computation_types_registered_by_modules_are_registered_at_load(self) -> None:
+        # the computation types registered by each module when it is imported, Symbolic for documents and the api for
+        # the live computations, must be registered when the plug-in loads for documents using them to recompute.
+        registered: typing.Dict[str, typing.Dict[str, typing.Tuple[str, str]]] = {"Symbolic": dict(), "api": dict()}
+        for path in pathlib.Path(Registration.__file__).parent.glob("*.py"):
+            if path.stem in ("__init__", "Registration"):
+                continue
+            for node in ast.walk(ast.parse(path.read_text())):
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "register_computation_type":
+                    assert isinstance(node.func.value, ast.Name)
+                    computation_type_id, computation_class = node.args
+                    assert isinstance(computation_type_id, ast.Constant)
+                    if isinstance(computation_class, ast.Call):  # typing.cast(ComputationCallable, ComputationClass)
+                        computation_class = computation_class.args[1]
+                    assert isinstance(computation_class, ast.Name)
+                    registered[node.func.value.id][computation_type_id.value] = path.stem, computation_class.id
+        self.assertIn("eels.thickness_mapping", registered["Symbolic"])
+        self.assertEqual(registered["Symbolic"], dict(Registration.COMPUTATION_TYPES))
+        self.assertEqual(registered["api"], dict(Registration.LIVE_COMPUTATION_TYPES))
+
+    def test_color_map_resource_matches_color_map_description(self) -> None:
+        color_map = Registration.ColorMapResource("test-color-map", "Test", "resources/color_maps/sqe_bgyw.xml")
+        xml_bytes = (pathlib.Path(Registration.__file__).parent / color_map.resource_path).read_bytes()
+        ColorMaps.load_color_map_xml_str(xml_bytes.decode("utf-8"), "Test", "test-color-map-description")
+        try:
+            self.assertIsInstance(color_map, ColorMaps.ColorMap)
+            numpy.testing.assert_array_equal(ColorMaps.color_maps["test-color-map-description"].data, color_map.data)
+            self.assertIs(color_map.data, color_map.data)
+        finally:
+            ColorMaps.color_maps.pop("test-color-map-description")
+
+
+if __name__ == '__main__':
+    unittest.main()